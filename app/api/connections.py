@@ -2,7 +2,7 @@
 API endpoints per la gestione delle connessioni database
 """
 from typing import Dict, List
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Request
 from fastapi.responses import JSONResponse
 import json
 from pathlib import Path
@@ -22,8 +22,11 @@ from app.core.config import get_connections_config
 router = APIRouter()
 
 
-def get_connection_service():
-    """Dependency injection per ConnectionService"""
+def get_connection_service(request: Request):
+    """Dependency injection per ConnectionService (istanza condivisa dal lifespan se disponibile)"""
+    connection_service = getattr(request.app.state, 'connection_service', None)
+    if connection_service is not None:
+        return connection_service
     return ConnectionService()
 
 
@@ -8,6 +8,8 @@ from loguru import logger
 
 from app.core.config import get_settings
 from app.services.scheduler_service import SchedulerService
+from app.services.query_executor import get_query_executor
+from app.services.connection_governor import get_connection_governor
 from pathlib import Path
 
 router = APIRouter()
@@ -118,7 +120,8 @@ async def scheduler_status(request: Request):
             "history": status.get("history", []),
             "success_count": status.get("success_count", 0),
             "fail_count": status.get("fail_count", 0),
-            "avg_duration_sec": status.get("avg_duration_sec", 0)
+            "avg_duration_sec": status.get("avg_duration_sec", 0),
+            "executor": status.get("executor")
         }
     except Exception as e:
         logger.error(f"Errore nel recupero stato scheduler: {e}")
@@ -126,3 +129,35 @@ async def scheduler_status(request: Request):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Errore nel recupero stato scheduler: {str(e)}"
         )
+
+
+@router.get("/query-executor", summary="Stato pool esecuzione query")
+async def query_executor_status(request: Request):
+    """
+    Restituisce worker, code e contatori per connessione del pool di esecuzione query
+    """
+    try:
+        executor = getattr(request.app.state, "query_executor", None) or get_query_executor()
+        return executor.get_stats()
+    except Exception as e:
+        logger.error(f"Errore nel recupero stato pool query: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Errore nel recupero stato pool query: {str(e)}"
+        )
+
+
+@router.get("/connection-governor", summary="Stato governatore connessioni")
+async def connection_governor_status():
+    """
+    Connessioni in uso, attese e tempi di attesa per connessione, ambiente e tipo di lavoro
+    (interattivo/schedulato) rispetto ai budget configurati
+    """
+    try:
+        return get_connection_governor().get_stats()
+    except Exception as e:
+        logger.error(f"Errore nel recupero stato governatore connessioni: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Errore nel recupero stato governatore connessioni: {str(e)}"
+        )
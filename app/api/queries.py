@@ -1,23 +1,32 @@
 """
 API endpoints per la gestione e l'esecuzione delle query
 """
+import asyncio
+import json
 from typing import List, Dict, Any
 from fastapi import APIRouter, HTTPException, Depends, Query, status, Request
 from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from loguru import logger
 
-from app.services.query_service import QueryService
+from app.services.query_service import QueryService, QueryExecutionError
+from app.services.query_executor import QueryExecutor, QueryQueueFullError, get_query_executor
+from app.services.query_job_service import QueryJobResultsReleased, QueryJobService, get_query_job_service
+from app.services.export_service import ARROW_FORMATS, CSV_END, CsvChunkChannel, export_query_to_file, stream_csv_export
 from app.models.queries import (
     QueryListResponse,
     QueryInfo,
     QueryExecutionRequest,
-    QueryExecutionResult
+    QueryExecutionResult,
+    QueryJobStatus,
+    QueryJobPage,
+    ResultFormat
 )
 from app.models.queries import ExportRequest
-import io
-import pandas as pd
 from datetime import datetime
+from pathlib import Path
 from app.core.config import get_settings
 
 
@@ -28,24 +37,45 @@ class UpdateQueryPayload(dict):
 router = APIRouter()
 
 
-def get_query_service():
-    """Dependency injection per QueryService"""
+def get_query_service(request: Request):
+    """Dependency injection per QueryService (istanza condivisa dal lifespan se disponibile)"""
+    query_service = getattr(request.app.state, 'query_service', None)
+    if query_service is not None:
+        return query_service
     return QueryService()
 
 
+def get_executor(request: Request) -> QueryExecutor:
+    """Dependency injection per il pool di esecuzione query (condiviso dal lifespan se disponibile)"""
+    executor = getattr(request.app.state, 'query_executor', None)
+    if executor is not None:
+        return executor
+    return get_query_executor()
+
+
+def get_job_service(request: Request) -> QueryJobService:
+    """Dependency injection per i job query asincroni (condiviso dal lifespan se disponibile)"""
+    job_service = getattr(request.app.state, 'query_job_service', None)
+    if job_service is not None:
+        return job_service
+    return get_query_job_service()
+
+
 @router.get("/", response_model=QueryListResponse, summary="Lista query")
 async def get_queries(
+    include_aliases: bool = Query(False, description="Includi i collegamenti .lnk (es. cartella Schedulazioni)"),
     query_service: QueryService = Depends(get_query_service)
 ):
     """
     Ottiene la lista di tutte le query SQL disponibili
     """
     try:
-        queries = query_service.get_queries()
+        queries = query_service.get_queries(include_aliases=include_aliases)
         
         return QueryListResponse(
             queries=queries,
-            total_count=len(queries)
+            total_count=len(queries),
+            version=query_service.catalog.version
         )
         
     except Exception as e:
@@ -56,6 +86,75 @@ async def get_queries(
         )
 
 
+@router.get("/events", summary="Notifiche variazioni catalogo query (Server-Sent Events)")
+async def query_catalog_events(request: Request, query_service: QueryService = Depends(get_query_service)):
+    """
+    Canale push delle variazioni del catalogo: evento `hello` con la versione corrente,
+    poi un evento `catalog` per ogni insieme di query aggiunte, modificate o rimosse
+    (`resync` se il client resta indietro e deve ricaricare la lista).
+    """
+    events = getattr(request.app.state, 'query_catalog_events', None)
+    if events is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Notifiche del catalogo query non attive"
+        )
+    queue = events.subscribe()
+
+    async def _body():
+        try:
+            yield f"event: hello\ndata: {json.dumps({'version': query_service.catalog.version})}\n\n"
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Keep-alive per proxy e browser
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event}\ndata: {data}\n\n"
+        finally:
+            events.unsubscribe(queue)
+
+    return StreamingResponse(
+        _body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/executions", summary="Esecuzioni recenti (tracce)")
+async def list_executions(
+    limit: int = Query(50, ge=1, le=1000, description="Numero massimo di esecuzioni"),
+    query_service: QueryService = Depends(get_query_service)
+):
+    """
+    Ultime esecuzioni registrate nel buffer delle tracce, più recenti per prime
+    (attivo con QUERY_TRACE_ENABLED=true o DEBUG=true)
+    """
+    traces = query_service.traces
+    return {
+        "enabled": traces.enabled,
+        "max_entries": traces.max_entries,
+        "executions": [t.to_dict(include_statements=False) for t in traces.recent(limit)],
+    }
+
+
+@router.get("/executions/{request_id}", summary="Traccia di un'esecuzione")
+async def get_execution(request_id: str, query_service: QueryService = Depends(get_query_service)):
+    """
+    Statement inviati al database (testo, bind, esito, durata) e diagnostica dell'esecuzione
+    """
+    trace = query_service.traces.get(request_id)
+    if trace is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Esecuzione non trovata: {request_id}"
+        )
+    return trace.to_dict()
+
+
 @router.get("/{filename}", response_model=QueryInfo, summary="Dettagli query")
 async def get_query(
     filename: str,
@@ -88,7 +187,8 @@ async def get_query(
 @router.post("/execute", response_model=QueryExecutionResult, summary="Esegui query")
 async def execute_query(
     request: QueryExecutionRequest,
-    query_service: QueryService = Depends(get_query_service)
+    query_service: QueryService = Depends(get_query_service),
+    executor: QueryExecutor = Depends(get_executor)
 ):
     """
     Esegue una query con i parametri specificati
@@ -96,7 +196,8 @@ async def execute_query(
     try:
         logger.info(f"Esecuzione query {request.query_filename} su connessione {request.connection_name}")
         
-        result = query_service.execute_query(request)
+        # Esecuzione sul pool dedicato: l'event loop resta libero durante le query lente
+        result = await executor.run(request.connection_name, query_service.execute_query, request)
         
         if not result.success:
             # Restituisce l'errore ma non solleva un'eccezione HTTP
@@ -105,6 +206,9 @@ async def execute_query(
         
         return result
         
+    except QueryQueueFullError as e:
+        logger.warning(f"Query {request.query_filename} rifiutata: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         logger.error(f"Errore nell'esecuzione della query {request.query_filename}: {e}")
         raise HTTPException(
@@ -113,6 +217,70 @@ async def execute_query(
         )
 
 
+@router.post("/jobs", response_model=QueryJobStatus, summary="Avvia query asincrona")
+async def submit_query_job(
+    request: QueryExecutionRequest,
+    job_service: QueryJobService = Depends(get_job_service)
+):
+    """
+    Accoda l'esecuzione della query e restituisce subito l'id del job da interrogare
+    """
+    try:
+        logger.info(f"Job query {request.query_filename} su connessione {request.connection_name}")
+        return job_service.submit(request)
+    except QueryQueueFullError as e:
+        logger.warning(f"Job query {request.query_filename} rifiutato: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error(f"Errore nell'avvio del job query {request.query_filename}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Errore interno nell'avvio del job query"
+        )
+
+
+@router.get("/jobs/{job_id}", response_model=QueryJobStatus, summary="Stato query asincrona")
+async def get_query_job(job_id: str, job_service: QueryJobService = Depends(get_job_service)):
+    """
+    Stato del job: righe lette finora, tempo trascorso, eventuale errore
+    """
+    job_status = job_service.get_status(job_id)
+    if not job_status:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job non trovato o scaduto: {job_id}")
+    return job_status
+
+
+@router.get("/jobs/{job_id}/results", response_model=QueryJobPage, summary="Risultati query asincrona")
+async def get_query_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    format: ResultFormat = Query(ResultFormat.RECORDS, description="records, rows (array per riga) o columns (array per colonna)"),
+    job_service: QueryJobService = Depends(get_job_service)
+):
+    """
+    Restituisce una pagina dei risultati del job
+    """
+    try:
+        page = job_service.get_page(job_id, offset=offset, limit=limit, result_format=format)
+    except QueryJobResultsReleased as e:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e))
+    if not page:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job non trovato o scaduto: {job_id}")
+    return page
+
+
+@router.delete("/jobs/{job_id}", response_model=QueryJobStatus, summary="Annulla query asincrona")
+async def cancel_query_job(job_id: str, job_service: QueryJobService = Depends(get_job_service)):
+    """
+    Annulla il job; se la query è in esecuzione viene interrotta sul database
+    """
+    job_status = await run_in_threadpool(job_service.cancel, job_id)
+    if not job_status:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job non trovato o scaduto: {job_id}")
+    return job_status
+
+
 @router.put("/{filename}/update", summary="Aggiorna contenuto query")
 async def update_query(filename: str, payload: Dict[str, Any], query_service: QueryService = Depends(get_query_service)):
     try:
@@ -181,10 +349,13 @@ async def lint_query(filename: str, payload: Dict[str, Any], query_service: Quer
 @router.post("/export", summary="Export query results (server-side)")
 async def export_query(
     request: ExportRequest,
-    query_service: QueryService = Depends(get_query_service)
+    query_service: QueryService = Depends(get_query_service),
+    executor: QueryExecutor = Depends(get_executor)
 ):
     """
-    Genera e restituisce il file di export (CSV o XLSX) usando pandas sul server.
+    Genera e restituisce il file di export (CSV, XLSX, Parquet o Arrow IPC) sul server.
+    XLSX/Parquet/Arrow vengono scritti in streaming dal cursore (memoria costante); il CSV
+    viene inviato al client mentre la query è in corso, compresso gzip se `compress`.
     """
     try:
         # Esegui la query senza limit per ottenere il dataset completo
@@ -194,92 +365,109 @@ async def export_query(
             parameters=request.parameters,
             limit=None
         )
-        result = query_service.execute_query(exec_req)
+        export_format = (request.export_format or 'excel').lower()
+        if export_format == 'csv':
+            return await _stream_csv_export(request, exec_req, query_service, executor)
+        if export_format in ARROW_FORMATS:
+            file_format, media_type = export_format, ARROW_FORMATS[export_format]
+        else:
+            file_format, media_type = 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+        # Query e scrittura avvengono insieme sul pool query, le righe vanno dal cursore al file
+        result, final_path = await executor.run(request.connection_name, _write_file_export, query_service, request, exec_req, file_format)
         if not result.success:
             logger.error(f"Export fallito: {result.error_message}")
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=result.error_message or 'Errore esecuzione query')
-
-        # Costruisci DataFrame pandas dal risultato
-        try:
-            # result.data is expected to be a list of dicts with column keys
-            df = pd.DataFrame(result.data if result.data is not None else [])
-            # Ensure columns order matches column_names if provided
-            if getattr(result, 'column_names', None):
-                cols = result.column_names
-                # keep only existing columns in dataframe and in given order
-                cols_existing = [c for c in cols if c in df.columns]
-                df = df[cols_existing] if cols_existing else df
-        except Exception as e:
-            logger.exception(f"Errore costruzione DataFrame per export: {e}")
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Errore trasformazione risultati per export')
-
-        # Usa la stessa logica del SchedulerService: scrive su file in Export/_tmp poi sposta il file
-        from app.core.config import get_settings
-        from pathlib import Path
-        import time
-        settings = get_settings()
-        export_dir = Path(settings.export_dir)
-        tmp_dir = export_dir / '_tmp'
-        tmp_dir.mkdir(parents=True, exist_ok=True)
-        # filename base
-        base_name = request.query_filename.replace('.sql', '')
-        timestamp = datetime.now().strftime('%Y-%m-%d_%H%M%S')
-
-        if request.export_format and request.export_format.lower() == 'csv':
-            # scrivi CSV su file temporaneo e poi sposta
-            temp_path = tmp_dir / f"{base_name}_{timestamp}.csv.tmp.csv"
-            final_path = export_dir / f"{base_name}_{timestamp}.csv"
-            csv_text = df.to_csv(index=False, sep=';', encoding='utf-8')
-            logger.info(f"[EXPORT] START_WRITE temp={temp_path}")
-            with open(temp_path, 'w', encoding='utf-8', newline='') as f:
-                f.write(csv_text)
-            size = temp_path.stat().st_size
-            logger.info(f"[EXPORT] END_WRITE duration=0 size={size}B")
-            size = temp_path.stat().st_size
-            logger.info(f"[EXPORT] START_WRITE temp={temp_path}")
-            logger.info(f"[EXPORT] END_WRITE duration=0 size={size}B")
-            try:
-                temp_path.replace(final_path)
-                logger.info(f"[EXPORT] MOVE_OK {temp_path} -> {final_path}")
-            except Exception:
-                logger.exception("[EXPORT] Errore nel muovere il file csv temporaneo")
-
-            # stream file
-            media_type = 'text/csv'
-            filename = final_path.name
-            headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
-            return StreamingResponse(open(final_path, 'rb'), media_type=media_type, headers=headers)
-        else:
-            temp_path = tmp_dir / f"{base_name}_{timestamp}.xlsx.tmp.xlsx"
-            final_path = export_dir / f"{base_name}_{timestamp}.xlsx"
-            logger.info(f"[EXPORT] START_WRITE temp={temp_path}")
-            try:
-                # scrittura su file come fa lo scheduler
-                df.to_excel(temp_path, index=False)
-                duration = 0.0
-                size = temp_path.stat().st_size
-                logger.info(f"[EXPORT] END_WRITE duration={duration}s size={size}B")
-                try:
-                    temp_path.replace(final_path)
-                    logger.info(f"[EXPORT] MOVE_OK {temp_path} -> {final_path}")
-                except Exception:
-                    logger.exception("[EXPORT] Errore nel muovere il file temporaneo xlsx")
-            except Exception as e:
-                logger.exception(f"Errore generazione file xlsx: {e}")
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Errore generazione file xlsx')
-
-            media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            filename = final_path.name
-            headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
-            return StreamingResponse(open(final_path, 'rb'), media_type=media_type, headers=headers)
+        headers = {'Content-Disposition': f'attachment; filename="{final_path.name}"'}
+        return StreamingResponse(open(final_path, 'rb'), media_type=media_type, headers=headers)
 
     except HTTPException:
         raise
+    except QueryQueueFullError as e:
+        logger.warning(f"Export {request.query_filename} rifiutato: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         logger.exception(f"Errore nell'export della query {request.query_filename}: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Errore interno export')
 
 
+def _export_paths(request: ExportRequest, extension: str):
+    """Percorsi (temporaneo in Export/_tmp, finale in Export) per il file di export"""
+    settings = get_settings()
+    export_dir = Path(settings.export_dir)
+    tmp_dir = export_dir / '_tmp'
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    base_name = request.query_filename.replace('.sql', '')
+    timestamp = datetime.now().strftime('%Y-%m-%d_%H%M%S')
+    return tmp_dir / f"{base_name}_{timestamp}.{extension}.tmp.{extension}", export_dir / f"{base_name}_{timestamp}.{extension}"
+
+
+def _move_export_file(temp_path: Path, final_path: Path) -> None:
+    try:
+        temp_path.replace(final_path)
+        logger.info(f"[EXPORT] MOVE_OK {temp_path} -> {final_path}")
+    except Exception:
+        logger.exception(f"[EXPORT] Errore nel muovere il file temporaneo {temp_path}")
+
+
+def _write_file_export(query_service: QueryService, request: ExportRequest, exec_req: QueryExecutionRequest, file_format: str):
+    """Esegue la query scrivendo le righe in streaming sul file (xlsx, parquet, arrow), poi lo sposta
+    nella cartella export. Restituisce (risultato senza dati, percorso finale).
+    """
+    temp_path, final_path = _export_paths(request, file_format)
+    logger.info(f"[EXPORT] START_WRITE temp={temp_path}")
+    result, write_seconds = export_query_to_file(query_service, exec_req, temp_path, file_format)
+    if result.success:
+        logger.info(f"[EXPORT] END_WRITE duration={write_seconds:.2f}s size={temp_path.stat().st_size}B rows={result.row_count}")
+        _move_export_file(temp_path, final_path)
+    return result, final_path
+
+
+async def _stream_csv_export(request: ExportRequest, exec_req: QueryExecutionRequest,
+                             query_service: QueryService, executor: QueryExecutor) -> StreamingResponse:
+    """Invia il CSV in streaming: le righe passano dal cursore (sul pool query) alla risposta HTTP.
+    Con `save_to_disk` gli stessi byte vengono salvati anche nella cartella export.
+    """
+    extension = 'csv.gz' if request.compress else 'csv'
+    temp_path, final_path = _export_paths(request, extension)
+    channel = CsvChunkChannel(asyncio.get_running_loop())
+    future = executor.submit(
+        request.connection_name, stream_csv_export, query_service, exec_req, channel,
+        request.compress, temp_path if request.save_to_disk else None, final_path
+    )
+    # Export mai avviato (es. pool arrestato): sblocca chi attende sul canale
+    future.add_done_callback(
+        lambda f: channel.put_nowait(QueryExecutionError("Export annullato")) if f.cancelled() else None
+    )
+    logger.info(f"[EXPORT] START_STREAM csv={request.query_filename} gzip={request.compress} save={request.save_to_disk}")
+
+    # Attende l'avvio della query: gli errori iniziali restituiscono ancora un 500
+    first = await channel.get()
+    if isinstance(first, Exception):
+        channel.close()
+        logger.error(f"Export fallito: {first}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(first) or 'Errore esecuzione query')
+
+    async def _body():
+        try:
+            while True:
+                item = await channel.get()
+                if item is CSV_END:
+                    break
+                if isinstance(item, Exception):
+                    # Intestazioni già inviate: si può solo interrompere la risposta
+                    raise item
+                yield item
+        finally:
+            channel.close()
+
+    media_type = 'application/gzip' if request.compress else 'text/csv'
+    headers = {'Content-Disposition': f'attachment; filename="{final_path.name}"'}
+    # Il background gira anche se il client si disconnette prima che il body venga iterato
+    # (in quel caso il finally di _body non viene mai eseguito)
+    return StreamingResponse(_body(), media_type=media_type, headers=headers, background=BackgroundTask(channel.close))
+
+
 @router.post("/validate", summary="Valida parametri query")
 async def validate_query_parameters(
     request: Request,
@@ -311,7 +499,8 @@ async def validate_query_parameters(
                     parameters = _json.loads(params_raw)
                 except Exception:
                     parameters = {}
-        query_info = query_service.get_query(filename)
+        # Lettura del file query fuori dall'event loop
+        query_info = await run_in_threadpool(query_service.get_query, filename)
 
         if not query_info:
             raise HTTPException(
@@ -7,8 +7,9 @@ import json
 from app.core.config import get_settings
 from pathlib import Path
 from app.services.scheduler_service import SchedulerService
-from apscheduler.triggers.cron import CronTrigger
+from app.services.scheduler_history import get_scheduler_history_store
 import asyncio
+import os
 from typing import Dict, Any
 from fastapi import Body
 from app.models.scheduling import SchedulingItem
@@ -98,13 +99,7 @@ async def update_scheduling(idx: int, request: Request, payload: Dict[str, Any]
     except Exception:
         scheduling[idx] = item.dict()
     try:
-        cf = settings.connections_file
-        with open(cf, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        data['scheduling'] = scheduling
-        with open(cf, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, default=str)
-        settings.scheduling = scheduling
+        _save_scheduling(settings, scheduling)
         reload_scheduler_jobs(request)
         resp = {"message": "Schedulazione aggiornata", "scheduling": scheduling}
         if cron_normalized:
@@ -122,13 +117,7 @@ async def delete_scheduling(idx: int, request: Request):
         raise HTTPException(status_code=404, detail="Indice schedulazione non trovato")
     removed = scheduling.pop(idx)
     try:
-        cf = settings.connections_file
-        with open(cf, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        data['scheduling'] = scheduling
-        with open(cf, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, default=str)
-        settings.scheduling = scheduling
+        _save_scheduling(settings, scheduling)
         # ricarica jobs
         reload_scheduler_jobs(request)
         return {"message": "Schedulazione rimossa", "removed": removed, "scheduling": scheduling}
@@ -151,7 +140,7 @@ async def preview_filename(payload: Dict[str, Any] = Body(...)):
             payload = {k: v for k, v in payload.items() if k != 'exec_dt'}
 
         item = SchedulingItem(**payload)
-        fname = item.render_filename(exec_dt)
+        fname = item.render_output_filename(exec_dt)
         return {"filename": fname}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -160,129 +149,43 @@ async def preview_filename(payload: Dict[str, Any] = Body(...)):
 # Endpoint per lo storico schedulazioni
 @router.get("/history", summary="Storico schedulazioni (ultimi 30 giorni)")
 async def get_scheduler_history():
-    export_dir = Path(get_settings().export_dir)
-    history_path = export_dir / "scheduler_history.json"
-    if not history_path.exists():
-        return {"history": [], "total_count": 0}
+    from datetime import datetime, timedelta
     try:
-        with open(history_path, "r", encoding="utf-8") as f:
-            history_all = json.load(f)
-        # Applica filtro ultimi 30 giorni lato API
-        from datetime import datetime, timedelta
+        # Filtro ultimi 30 giorni sull'indice per timestamp; eventi senza timestamp inclusi per compatibilità
         cutoff = datetime.now() - timedelta(days=30)
-        history = []
-        for h in history_all:
-            try:
-                ts = h.get("timestamp")
-                if ts:
-                    dt = datetime.fromisoformat(ts)
-                    if dt >= cutoff:
-                        history.append(h)
-                else:
-                    # se timestamp mancante, includi per compatibilità
-                    history.append(h)
-            except Exception:
-                # se parsing timestamp fallisce, includi comunque
-                history.append(h)
+        history = await asyncio.to_thread(
+            get_scheduler_history_store().query, since=cutoff, include_undated=True
+        )
         return {"history": history, "total_count": len(history)}
     except Exception as e:
         return JSONResponse(status_code=500, content={"detail": f"Errore lettura storico: {e}"})
 
 
+def _save_scheduling(settings, scheduling) -> None:
+    """Persiste l'elenco schedulazioni in connections.json (solo se cambiato, con scrittura atomica)
+    e aggiorna la copia in memoria. Le altre chiavi del file restano invariate."""
+    cf = Path(settings.connections_file)
+    with open(cf, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    serialized = json.loads(json.dumps(scheduling, default=str))
+    if data.get('scheduling') != serialized:
+        data['scheduling'] = serialized
+        tmp = cf.with_name(f"{cf.name}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, default=str)
+        os.replace(tmp, cf)
+    settings.scheduling = scheduling
+
+
 def reload_scheduler_jobs(request: Request):
+    """Allinea i job dello scheduler alle schedulazioni: tocca solo i job aggiunti, modificati o rimossi"""
     # Se il TestClient non ha il service nello state, esci silenziosamente
     if not hasattr(request.app.state, 'scheduler_service'):
         return
     scheduler_service = request.app.state.scheduler_service
     if not getattr(scheduler_service, 'scheduler', None):
         return
-    try:
-        scheduler_service.scheduler.remove_all_jobs()
-    except Exception:
-        pass
-    scheduling = getattr(scheduler_service.settings, 'scheduling', [])
-    # Impostazioni robuste
-    def _to_int(val, default):
-        try:
-            return int(str(val))
-        except Exception:
-            return default
-    misfire = _to_int(getattr(scheduler_service.settings, 'scheduler_misfire_grace_time_sec', 900), 900)
-    coalesce_enabled = str(getattr(scheduler_service.settings, 'scheduler_coalesce_enabled', 'true')).lower() == 'true'
-    for sched in scheduling:
-        try:
-            # Respect scheduling_mode: if 'cron' use cron_expression, otherwise build from hour/minute/days
-            mode = sched.get('scheduling_mode', 'classic')
-            if mode == 'cron' and sched.get('cron_expression'):
-                try:
-                    trigger = CronTrigger.from_crontab(sched.get('cron_expression'))
-                except Exception:
-                    # fallback: try to parse as cron kwargs or skip
-                    trigger = None
-                    logger.exception(f"Impossibile parsare cron_expression per sched: {sched.get('cron_expression')}")
-            else:
-                trigger_args = {}
-                if sched.get('hour') is not None:
-                    trigger_args['hour'] = sched.get('hour')
-                if sched.get('minute') is not None:
-                    trigger_args['minute'] = sched.get('minute')
-                # il campo 'second' non è supportato in configurazione dashboard; ignora eventuali valori
-                days = sched.get('days_of_week')
-                if days:
-                    trigger_args['day_of_week'] = ','.join(str(d) for d in days)
-                # if no trigger args, leave trigger None and skip
-                trigger = CronTrigger(**trigger_args) if trigger_args else None
-
-            if not trigger:
-                logger.warning(f"Schedulazione priva di trigger valido per job {sched.get('query')}, skipping")
-                continue
-
-            scheduler_service.scheduler.add_job(
-                scheduler_service.run_scheduled_query,
-                trigger,
-                args=[sched],
-                name=f"Export {sched.get('query')} on {sched.get('connection')}",
-                misfire_grace_time=misfire,
-                coalesce=coalesce_enabled
-            )
-        except Exception:
-            logger.exception(f"Impossibile aggiungere job per sched: {sched}")
-    # Cleanup job
-    try:
-        # Esegui direttamente la coroutine con AsyncIOScheduler invece di usare create_task
-        scheduler_service.scheduler.add_job(
-            scheduler_service.cleanup_old_exports,
-            CronTrigger(hour=7, minute=0),
-            name="Cleanup old exports",
-            misfire_grace_time=misfire,
-            coalesce=coalesce_enabled
-        )
-    except Exception:
-        logger.exception("Impossibile aggiungere job cleanup_old_exports")
-
-    # Daily report job: deve essere ri-aggiunto anche durante reload, altrimenti si perde dopo update/delete schedulazioni
-    try:
-        if getattr(scheduler_service.settings, 'daily_report_enabled', False):
-            cron = getattr(scheduler_service.settings, 'daily_report_cron', None)
-            if cron:
-                try:
-                    dr_trigger = CronTrigger.from_crontab(cron)
-                except Exception:
-                    logger.warning(f"[DAILY_REPORT] Cron non valido '{cron}', fallback su daily_reports_hour")
-                    dr_trigger = CronTrigger(hour=getattr(scheduler_service.settings, 'daily_reports_hour', 6), minute=0)
-            else:
-                dr_trigger = CronTrigger(hour=getattr(scheduler_service.settings, 'daily_reports_hour', 6), minute=0)
-
-            # Usa funzione sincrona _daily_report_job del service
-            scheduler_service.scheduler.add_job(
-                scheduler_service._daily_report_job if hasattr(scheduler_service, '_daily_report_job') else (lambda: None),
-                dr_trigger,
-                name="Daily report schedulazioni",
-                misfire_grace_time=misfire,
-                coalesce=coalesce_enabled
-            )
-    except Exception:
-        logger.exception("[DAILY_REPORT] Errore durante ri-configurazione job giornaliero nel reload")
+    return scheduler_service.sync_jobs()
 
 
 @router.post("/scheduling", summary="Aggiungi una nuova schedulazione")
@@ -313,14 +216,7 @@ async def add_scheduling(request: Request, payload: Dict[str, Any] = Body(...)):
         scheduling.append(item.dict())
     # persist su file connections.json
     try:
-        cf = settings.connections_file
-        with open(cf, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        data['scheduling'] = scheduling
-        with open(cf, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, default=str)
-        # aggiorna in-memory
-        settings.scheduling = scheduling
+        _save_scheduling(settings, scheduling)
         # ricarica jobs (solo se presente lo scheduler service)
         try:
             reload_scheduler_jobs(request)
@@ -360,34 +256,22 @@ async def cleanup_test(request: Request, payload: Dict[str, Any] | None = Body(N
         if not dry_run and to_remove_idx:
             # crea nuovo elenco senza gli elementi rimossi
             new_sched = [s for i, s in enumerate(sched) if i not in to_remove_idx]
-            # persisti su connections.json
-            cf = settings.connections_file
-            with open(cf, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            data['scheduling'] = new_sched
-            with open(cf, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, default=str)
-            # aggiorna in-memory
-            settings.scheduling = new_sched
+            # persisti su connections.json e aggiorna in-memory
+            _save_scheduling(settings, new_sched)
             # ricarica i job
             try:
                 reload_scheduler_jobs(request)
             except Exception:
                 logger.warning('reload_scheduler_jobs non eseguito durante cleanup-test')
-            # ripulisci storico
-            export_dir = Path(get_settings().export_dir)
-            history_path = export_dir / "scheduler_history.json"
+            # ripulisci storico (persistente e finestra in memoria dello scheduler)
             try:
-                if history_path.exists():
-                    with open(history_path, 'r', encoding='utf-8') as f:
-                        history = json.load(f)
-                    filtered = []
-                    for h in history:
-                        q = h.get('query', '') or ''
-                        if not re.match(pattern, q, flags=re.IGNORECASE):
-                            filtered.append(h)
-                    with open(history_path, 'w', encoding='utf-8') as f:
-                        json.dump(filtered, f, indent=2)
+                get_scheduler_history_store().delete_matching(pattern)
+                scheduler_service = getattr(request.app.state, 'scheduler_service', None)
+                if scheduler_service is not None:
+                    scheduler_service.execution_history[:] = [
+                        h for h in scheduler_service.execution_history
+                        if not re.match(pattern, h.get('query', '') or '', flags=re.IGNORECASE)
+                    ]
             except Exception as e:
                 logger.warning(f"Ripulitura storico fallita: {e}")
         return {
@@ -53,6 +53,8 @@ class DatabaseConfig(BaseModel):
     db_type: str
     description: str
     params: Dict[str, Any]
+    # Opzioni pool per connessione (Oracle: mode, min, max, ping_interval, stmtcachesize, drcp, cclass, purity, ...)
+    pool: Optional[Dict[str, Any]] = None
     
     def get_connection_string(self, env_vars: Dict[str, str]) -> str:
         """
@@ -131,6 +133,8 @@ class ConnectionsConfig(BaseModel):
     environments: List[str]
     connections: List[DatabaseConfig]
     kafka_connections: Optional[Dict[str, KafkaConnectionConfig]] = None
+    # Budget connessioni del processo: default_connection, default_environment, environments{}, connections{}
+    connection_budgets: Optional[Dict[str, Any]] = None
     
     def get_connection_by_name(self, name: str) -> Optional[DatabaseConfig]:
         """Trova una connessione per nome"""
@@ -174,6 +178,59 @@ class Settings(BaseSettings):
     # Export settings
     export_retention_days: int = 30
     export_compression: bool = True
+
+    # Fetch query: righe per round-trip (arraysize/prefetchrows Oracle) e per blocco in streaming
+    query_fetch_arraysize: int = 1000
+    query_fetch_prefetchrows: int = 1000
+    # Pool esecuzione query API: worker totali, esecuzioni contemporanee e coda massima per connessione
+    query_executor_workers: int = 8
+    query_executor_per_connection: int = 2
+    query_executor_max_queue: int = 20
+    # Job query asincroni: conservazione risultati dopo la fine (secondi)
+    query_job_ttl_sec: int = 1800
+    # Righe conservate in memoria per job query (oltre: risultato troncato con has_more; 0 = illimitato)
+    query_job_max_rows: int = 200000
+    # Parametri &PARAM come bind variable (Oracle/PostgreSQL): un solo cursore per file query
+    query_bind_variables: bool = True
+    # Parametri lista in IN (&LISTA) come array: tipo collezione Oracle e numero massimo di elementi per bind
+    query_list_collection_type: str = "SYS.ODCIVARCHAR2LIST"
+    query_list_collection_max: int = 32767
+    # Catalogo query: intervallo minimo tra due scansioni della cartella Query (secondi)
+    query_catalog_rescan_sec: int = 5
+    # Watcher cartella Query: notifiche del file system (polling se non disponibili) e push ai client UI
+    query_watcher_enabled: bool = True
+    query_watcher_poll_sec: int = 2
+    query_watcher_force_polling: bool = False
+    # Tracce delle esecuzioni recenti in memoria (API /api/queries/executions); con DEBUG salvate in logs/query_traces
+    query_trace_enabled: bool = False
+    query_trace_max_entries: int = 100
+    # Pool Oracle: "native" (oracledb.create_pool, ping solo delle sessioni inattive da ping_interval)
+    # o "sqlalchemy" (QueuePool con pre-ping a ogni checkout); sovrascrivibili per connessione con "pool"
+    oracle_pool_mode: str = "native"
+    oracle_pool_min: int = 1
+    oracle_pool_max: int = 8
+    oracle_pool_increment: int = 1
+    oracle_pool_ping_interval_sec: int = 60
+    oracle_pool_wait_timeout_sec: int = 30
+    oracle_stmtcachesize: int = 50
+    # Istruzioni eseguite alla creazione di ogni sessione Oracle, separate da | (es. ALTER SESSION SET ...)
+    oracle_session_statements: Optional[str] = None
+    # Governatore connessioni: budget di default (0 = illimitato; sovrascrivibili in connections.json
+    # con "connection_budgets"), peso delle richieste interattive rispetto allo scheduler e attesa massima
+    connection_budget_default: int = 8
+    connection_budget_environment_default: int = 0
+    connection_governor_interactive_weight: int = 2
+    connection_governor_wait_timeout_sec: int = 60
+    # Warm-up all'avvio degli engine degli ambienti indicati (separati da |, default: default_environment)
+    # e verifica periodica delle connessioni attive (0 = solo warm-up); warm-up connections 0 = dimensione pool
+    connection_warmup_enabled: bool = False
+    connection_warmup_environments: Optional[str] = None
+    connection_warmup_connections: int = 0
+    connection_probe_interval_sec: int = 300
+    connection_probe_timeout_sec: int = 10
+    # Attesa massima per stabilire una connessione al database (Oracle tcp_connect_timeout,
+    # PostgreSQL connect_timeout, SQL Server timeout)
+    db_connect_timeout_sec: int = 10
     
     # Scheduler settings
     scheduler_timezone: str = "Europe/Rome"
@@ -181,6 +238,9 @@ class Settings(BaseSettings):
     # Robustezza scheduler: coalesce (accorpa esecuzioni perse) e finestra misfire (tolleranza in secondi)
     scheduler_coalesce_enabled: bool = True
     scheduler_misfire_grace_time_sec: int = 900
+    # Esecutore job: worker totali e job contemporanei per connessione (gli altri restano in coda per priorità)
+    scheduler_max_workers: int = 4
+    scheduler_connection_slots: int = 2
     # Daily report configurazione (recap giornaliero schedulazioni)
     daily_report_enabled: bool = False
     daily_report_cron: str | None = None  # es. "0 19 * * *"; se assente usa daily_reports_hour
@@ -233,6 +293,10 @@ class Settings(BaseSettings):
     scheduler_retry_enabled: bool = True
     scheduler_retry_delay_minutes: int = 30
     scheduler_retry_max_attempts: int = 3
+    # Pipeline depends_on: esiti dei job a monte validi per il join entro questa finestra (ore)
+    scheduler_dependency_window_hours: int = 12
+    # Storico esecuzioni (export_dir/scheduler_history.db): giorni di conservazione (0 = illimitato)
+    scheduler_history_retention_days: int = 90
     
     # Security
     secret_key: str = "your-secret-key-change-in-production"
@@ -277,6 +341,7 @@ def get_settings() -> Settings:
                     item.setdefault('output_date_format', s.get('output_date_format', '%Y-%m-%d'))
                     item.setdefault('output_offset_days', s.get('output_offset_days', 0))
                     item.setdefault('output_compress_gz', s.get('output_compress_gz', False))
+                    item.setdefault('output_format', s.get('output_format', 'xlsx'))
                     item.setdefault('sharing_mode', s.get('sharing_mode', 'filesystem'))
                     # default export dir from settings
                     item.setdefault('output_dir', s.get('output_dir', str(_settings.export_dir)))
@@ -332,6 +397,22 @@ def get_connections_config() -> ConnectionsConfig:
     return _connections_config
 
 
+def load_connections_config(path: Path) -> ConnectionsConfig:
+    """Legge e valida un file connections.json"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return ConnectionsConfig(**data)
+
+
+def reload_connections_config() -> ConnectionsConfig:
+    """Rilegge connections.json e sostituisce la configurazione condivisa (file modificato)"""
+    global _connections_config
+    config = load_connections_config(get_settings().connections_file)
+    _connections_config = config
+    logger.info(f"Configurazioni connessioni ricaricate: {len(config.connections)} connessioni")
+    return config
+
+
 def get_kafka_config() -> Optional[Dict[str, Any]]:
     """
     Ottiene la configurazione Kafka combinando settings e connections.json
@@ -14,7 +14,12 @@ import os
 import re
 
 from app.core.config import setup_logging, get_settings, get_connections_config
-from app.services.connection_service import ConnectionService
+from app.services.connection_service import ConnectionService, get_engine_registry
+from app.services.connection_prober import ConnectionProber
+from app.services.query_service import QueryService
+from app.services.query_executor import get_query_executor, shutdown_query_executor
+from app.services.query_job_service import QueryJobService
+from app.services.query_watcher import QueryCatalogEvents, QueryCatalogWatcher
 from app.services.scheduler_service import SchedulerService
 from app.api import connections, queries, scheduler as scheduler_api, monitoring, logs as logs_api, reports as reports_api, settings as settings_api, system as system_api, kafka as kafka_api
 from app.api.queries import setup_error_handlers
@@ -34,13 +39,51 @@ async def lifespan(app: FastAPI):
         settings = get_settings()
         connections_config = get_connections_config()
         
+        # Registro engine unico per processo: API, scheduler e tool condividono gli stessi pool
+        engine_registry = get_engine_registry()
+        connection_service = ConnectionService(engine_registry=engine_registry)
+        query_service = QueryService(connection_service=connection_service)
+        # Pool dedicato alle query API: l'event loop non esegue mai SQL
+        query_executor = get_query_executor()
+        query_job_service = QueryJobService(query_service=query_service, executor=query_executor)
+        
+        # Catalogo query: variazioni inoltrate alla UI; il watcher sostituisce le scansioni periodiche
+        query_catalog_events = QueryCatalogEvents(asyncio.get_running_loop())
+        query_service.catalog.add_listener(query_catalog_events.publish)
+        app.state.query_catalog_events = query_catalog_events
+        if settings.query_watcher_enabled:
+            query_watcher = QueryCatalogWatcher(
+                query_service.catalog,
+                settings.query_dir,
+                poll_interval_sec=settings.query_watcher_poll_sec,
+                force_polling=settings.query_watcher_force_polling
+            )
+            query_watcher.start()
+            app.state.query_watcher = query_watcher
+        
+        # Warm-up engine e verifica periodica: lo stato delle connessioni riflette verifiche reali
+        if settings.connection_warmup_enabled or settings.connection_probe_interval_sec > 0:
+            connection_prober = ConnectionProber(
+                connection_service,
+                interval_sec=settings.connection_probe_interval_sec,
+                timeout_sec=settings.connection_probe_timeout_sec,
+                environments=(settings.connection_warmup_environments or "").split("|"),
+                warmup_connections=settings.connection_warmup_connections
+            )
+            await connection_prober.start(warm_up=settings.connection_warmup_enabled)
+            app.state.connection_prober = connection_prober
+        
         # Avvia il servizio scheduler
-        scheduler_service = SchedulerService()
+        scheduler_service = SchedulerService(query_service=query_service)
         await scheduler_service.start()
         
         # Salva i servizi nell'app state
+        app.state.engine_registry = engine_registry
+        app.state.connection_service = connection_service
+        app.state.query_service = query_service
+        app.state.query_executor = query_executor
+        app.state.query_job_service = query_job_service
         app.state.scheduler_service = scheduler_service
-        app.state.connection_service = ConnectionService()
         
         logger.info("✅ PSTT Tool avviato correttamente")
         logger.info(f"📊 Configurate {len(connections_config.connections)} connessioni database")
@@ -59,6 +102,25 @@ async def lifespan(app: FastAPI):
                 await app.state.scheduler_service.stop()
         except Exception as e:
             logger.error(f"Errore durante l'arresto: {e}")
+        try:
+            if getattr(app.state, 'connection_prober', None) is not None:
+                await app.state.connection_prober.stop()
+        except Exception as e:
+            logger.error(f"Errore nell'arresto della verifica connessioni: {e}")
+        try:
+            if getattr(app.state, 'query_watcher', None) is not None:
+                app.state.query_watcher.stop()
+        except Exception as e:
+            logger.error(f"Errore nell'arresto del watcher query: {e}")
+        try:
+            shutdown_query_executor()
+        except Exception as e:
+            logger.error(f"Errore nell'arresto del pool query: {e}")
+        try:
+            if hasattr(app.state, 'engine_registry'):
+                app.state.engine_registry.dispose_all()
+        except Exception as e:
+            logger.error(f"Errore nel rilascio degli engine database: {e}")
         logger.info("✅ PSTT Tool arrestato correttamente")
 
 
@@ -34,6 +34,8 @@ class DatabaseConnection(BaseModel):
     status: ConnectionStatus = Field(default=ConnectionStatus.DISCONNECTED, description="Stato connessione")
     last_connected: Optional[datetime] = Field(default=None, description="Ultimo collegamento riuscito")
     last_error: Optional[str] = Field(default=None, description="Ultimo errore riscontrato")
+    last_checked: Optional[datetime] = Field(default=None, description="Ultima verifica (probe o test)")
+    response_time_ms: Optional[float] = Field(default=None, description="Tempo di risposta dell'ultima verifica")
     
     model_config = ConfigDict(use_enum_values=True)
     
@@ -41,12 +41,22 @@ class QueryInfo(BaseModel):
     size_bytes: int = Field(default=0, description="Dimensione file in bytes")
 
 
+class ResultFormat(str, Enum):
+    """Formato delle righe nel payload dei risultati"""
+    RECORDS = "records"   # data: lista di oggetti {colonna: valore}
+    ROWS = "rows"         # rows: lista di array nell'ordine di column_names
+    COLUMNS = "columns"   # columns: {colonna: array di valori}
+
+
 class QueryExecutionRequest(BaseModel):
     """Richiesta di esecuzione query"""
     query_filename: str = Field(..., description="Nome del file query da eseguire")
     connection_name: str = Field(..., description="Nome della connessione da usare")
     parameters: Dict[str, Any] = Field(default={}, description="Valori dei parametri")
     limit: Optional[int] = Field(default=None, description="Limite righe risultato (None = nessun limite)")
+    result_format: ResultFormat = Field(default=ResultFormat.RECORDS, description="Formato delle righe nel risultato: records, rows, columns")
+    bind_variables: Optional[bool] = Field(default=None, description="Parametri come bind variable (None = impostazione QUERY_BIND_VARIABLES)")
+    request_id: Optional[str] = Field(default=None, description="Identificativo dell'esecuzione (generato se assente), chiave della traccia")
 
 
 class QueryExecutionResult(BaseModel):
@@ -58,15 +68,63 @@ class QueryExecutionResult(BaseModel):
     row_count: int
     column_names: List[str] = Field(default=[])
     data: List[Dict[str, Any]] = Field(default=[])
+    rows: Optional[List[List[Any]]] = Field(default=None, description="Righe come array (result_format=rows)")
+    columns: Optional[Dict[str, List[Any]]] = Field(default=None, description="Valori per colonna (result_format=columns)")
+    has_more: bool = Field(default=False, description="True se il risultato è stato troncato al limite richiesto")
     error_message: Optional[str] = None
     executed_at: datetime = Field(default_factory=datetime.utcnow)
     parameters_used: Dict[str, Any] = Field(default={})
+    request_id: Optional[str] = Field(default=None, description="Identificativo dell'esecuzione (vedi /api/queries/executions)")
+
+
+class QueryJobState(str, Enum):
+    """Stati di un job di esecuzione query asincrono"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class QueryJobStatus(BaseModel):
+    """Stato di avanzamento di un job query asincrono"""
+    job_id: str
+    query_filename: str
+    connection_name: str
+    status: QueryJobState
+    row_count: int = Field(default=0, description="Righe lette finora")
+    elapsed_ms: float = Field(default=0, description="Tempo trascorso dall'avvio (o durata totale)")
+    column_names: List[str] = Field(default=[])
+    has_more: bool = False
+    error_message: Optional[str] = None
+    submitted_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = Field(default=None, description="Scadenza dei risultati conservati")
+
+    model_config = ConfigDict(use_enum_values=True)
+
+
+class QueryJobPage(BaseModel):
+    """Pagina di risultati di un job query completato"""
+    job_id: str
+    status: QueryJobState
+    offset: int
+    limit: int
+    total_rows: int
+    column_names: List[str] = Field(default=[])
+    data: List[Dict[str, Any]] = Field(default=[])
+    rows: Optional[List[List[Any]]] = Field(default=None, description="Righe come array (format=rows)")
+    columns: Optional[Dict[str, List[Any]]] = Field(default=None, description="Valori per colonna (format=columns)")
+
+    model_config = ConfigDict(use_enum_values=True)
 
 
 class QueryListResponse(BaseModel):
     """Risposta API per lista query"""
     queries: List[QueryInfo]
     total_count: int
+    version: Optional[int] = Field(default=None, description="Versione del catalogo query")
 
 
 class ExportRequest(BaseModel):
@@ -74,8 +132,9 @@ class ExportRequest(BaseModel):
     query_filename: str
     connection_name: str
     parameters: Dict[str, Any] = Field(default={})
-    export_format: str = Field(default="excel", description="Formato export: excel, csv")
-    compress: bool = Field(default=True, description="Se comprimere il file")
+    export_format: str = Field(default="excel", description="Formato export: excel, csv, parquet, arrow")
+    compress: bool = Field(default=True, description="Se comprimere il file (CSV: stream gzip)")
+    save_to_disk: bool = Field(default=True, description="Se salvare una copia del file nella cartella export")
 
 
 class ExportResult(BaseModel):
@@ -1,7 +1,7 @@
 """
 Modelli per la schedulazione automatica delle query
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List, Literal
 from datetime import datetime, date, timedelta
 from enum import Enum
@@ -14,11 +14,23 @@ class SharingMode(str, Enum):
     KAFKA = "kafka"
 
 
+# Estensione file per formato di output delle schedulazioni
+OUTPUT_EXTENSIONS = {
+    'xlsx': '.xlsx',
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+
+
 class SchedulingItem(BaseModel):
     query: str = Field(..., description="Nome file query da schedulare")
     connection: str = Field(..., description="Nome connessione database")
     enabled: bool = Field(default=True, description="Job attivo/disattivo")
     description: Optional[str] = Field(None, description="Descrizione job")
+    priority: Literal['high', 'normal', 'low'] = Field('normal', description="Priorità in coda quando worker o slot della connessione sono occupati")
+    # Pipeline: il job parte quando tutte le schedulazioni indicate (per nome o file query) sono riuscite
+    name: Optional[str] = Field(None, description="Nome della schedulazione, referenziabile in depends_on")
+    depends_on: Optional[List[str]] = Field(None, description="Schedulazioni a monte (nome o file query); se valorizzato il job non usa l'orario")
 
     # Pianificazione: modalità 'classic' (giorni,hour,minute) o 'cron'
     scheduling_mode: Literal['classic', 'cron'] = Field('classic', description="Modalità di scheduling: 'classic' o 'cron'")
@@ -38,6 +50,7 @@ class SchedulingItem(BaseModel):
     output_date_format: Optional[str] = Field("%Y-%m-%d", description="Formato data per {date}")
     output_offset_days: Optional[int] = Field(0, description="Offset giorni applicato per {date}, es: -1 per ieri")
     output_compress_gz: Optional[bool] = Field(False, description="Comprimi file in formato .gz")
+    output_format: Literal['xlsx', 'parquet', 'arrow'] = Field('xlsx', description="Formato file: xlsx, parquet o arrow (Arrow IPC)")
 
     # Condivisione file
     sharing_mode: SharingMode = Field(SharingMode.FILESYSTEM, description="Modalità di condivisione: filesystem o email")
@@ -56,6 +69,16 @@ class SchedulingItem(BaseModel):
     kafka_include_metadata: Optional[bool] = Field(True, description="Includi metadata nel messaggio Kafka")
     kafka_connection: Optional[str] = Field(None, description="Nome connessione Kafka da connections.json")
 
+    @field_validator('depends_on', mode='before')
+    @classmethod
+    def _split_depends_on(cls, value):
+        """Accetta lista o stringa separata da pipe |; lista vuota = nessuna dipendenza"""
+        if isinstance(value, str):
+            value = value.split('|')
+        if value:
+            value = [str(v).strip() for v in value if str(v).strip()]
+        return value or None
+
     def _build_token_replacements(self, exec_dt: Optional[datetime] = None) -> dict:
         """Costruisce dizionario di sostituzione token comuni.
 
@@ -109,6 +132,24 @@ class SchedulingItem(BaseModel):
         
         return fname
 
+    def render_output_filename(self, exec_dt: Optional[datetime] = None) -> str:
+        """Nome file di output con estensione coerente con output_format.
+
+        Le estensioni note (.xls, .xlsx, .parquet, .arrow) vengono sostituite; senza
+        estensione viene aggiunta; altre estensioni esplicite restano invariate.
+        """
+        fname = self.render_filename(exec_dt)
+        ext = OUTPUT_EXTENSIONS.get(self.output_format, '.xlsx')
+        if fname.endswith(ext):
+            return fname
+        last = fname.split('/')[-1]
+        if '.' not in last:
+            return fname + ext
+        base, _, current = fname.rpartition('.')
+        if '.' + current.lower() in ('.xls',) + tuple(OUTPUT_EXTENSIONS.values()):
+            return base + ext
+        return fname
+
 
 class SchedulingHistoryItem(BaseModel):
     query: str
@@ -0,0 +1,291 @@
+"""
+Governatore delle connessioni database del processo.
+
+Ogni utilizzo di una connessione (query da UI/API, export, job schedulati, test)
+prende un "lease" prima del checkout dal pool: il lease viene concesso solo se
+restano posti nel budget della connessione e in quello del suo ambiente
+(collaudo/certificazione/produzione). Così il tetto di connessioni verso un
+database vale per l'intero processo, qualunque sia l'engine o il chiamante.
+
+Chi non trova posto attende in coda per tipo di lavoro: "interactive" (UI/API)
+e "scheduled" (scheduler). Quando un lease viene rilasciato le code vengono
+servite a turno pesato (`interactive_weight` concessioni interattive per ogni
+concessione schedulata), così i job notturni non affamano la UI e viceversa.
+
+Budget in connections.json (chiave facoltativa, 0 = illimitato):
+    "connection_budgets": {
+        "default_connection": 8,
+        "environments": {"produzione": 8, "collaudo": 12},
+        "connections": {"C00-CDG-Produzione": 6}
+    }
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Mapping, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import get_settings
+
+
+WORKLOADS = ("interactive", "scheduled")
+
+# Tipo di lavoro del thread corrente (impostato dallo scheduler con run_as_workload)
+_current_workload: contextvars.ContextVar[str] = contextvars.ContextVar("pstt_workload", default="interactive")
+
+
+class ConnectionBudgetTimeout(RuntimeError):
+    """Nessun posto libero nel budget della connessione/ambiente entro il tempo massimo"""
+
+
+def current_workload() -> str:
+    return _current_workload.get()
+
+
+def run_as_workload(workload: str, fn: Callable[..., Any], *args: Any) -> Any:
+    """Esegue `fn(*args)` nel thread corrente con il tipo di lavoro indicato"""
+    token = _current_workload.set(workload)
+    try:
+        return fn(*args)
+    finally:
+        _current_workload.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("connection", "environment", "workload", "event", "enqueued_at", "granted")
+
+    def __init__(self, connection: str, environment: str, workload: str):
+        self.connection = connection
+        self.environment = environment
+        self.workload = workload
+        self.event = threading.Event()
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class _Counters:
+    """Contatori per connessione, ambiente o tipo di lavoro"""
+
+    __slots__ = ("checked_out", "waiting", "granted", "timeouts", "total_wait_ms", "max_wait_ms", "peak")
+
+    def __init__(self):
+        self.checked_out = 0
+        self.waiting = 0
+        self.granted = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.peak = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "checked_out": self.checked_out,
+            "waiting": self.waiting,
+            "peak": self.peak,
+            "granted": self.granted,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait_ms / self.granted, 2) if self.granted else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+
+class ConnectionGovernor:
+    """Budget di connessioni per connessione e per ambiente con code eque tra UI e scheduler"""
+
+    def __init__(self, budget_provider: Optional[Callable[[], Optional[Mapping[str, Any]]]] = None,
+                 default_connection_budget: int = 8, default_environment_budget: int = 0,
+                 interactive_weight: int = 2, wait_timeout_sec: float = 60.0):
+        self._budget_provider = budget_provider or (lambda: None)
+        self.default_connection_budget = max(0, int(default_connection_budget))
+        self.default_environment_budget = max(0, int(default_environment_budget))
+        self.interactive_weight = max(1, int(interactive_weight))
+        self.wait_timeout_sec = max(0.0, float(wait_timeout_sec))
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[_Waiter]] = {w: deque() for w in WORKLOADS}
+        self._connections: Dict[str, _Counters] = {}
+        self._environments: Dict[str, _Counters] = {}
+        self._workloads: Dict[str, _Counters] = {w: _Counters() for w in WORKLOADS}
+        self._interactive_credits = self.interactive_weight
+
+    def budgets(self, connection_name: str, environment: str) -> Tuple[int, int]:
+        """Budget (connessione, ambiente) correnti; 0 = illimitato"""
+        try:
+            config = self._budget_provider() or {}
+        except Exception as e:
+            logger.warning(f"[GOVERNOR] Budget non leggibili, uso i default: {e}")
+            config = {}
+        connection_budget = (config.get("connections") or {}).get(
+            connection_name, config.get("default_connection", self.default_connection_budget)
+        )
+        environment_budget = (config.get("environments") or {}).get(
+            environment, config.get("default_environment", self.default_environment_budget)
+        )
+        return _as_budget(connection_budget), _as_budget(environment_budget)
+
+    @contextmanager
+    def lease(self, connection_name: str, environment: Optional[str] = None, workload: Optional[str] = None,
+              timeout: Optional[float] = None) -> Iterator[None]:
+        """Riserva un posto per la durata del blocco with (solleva ConnectionBudgetTimeout)"""
+        environment = environment or ""
+        self.acquire(connection_name, environment, workload, timeout)
+        try:
+            yield
+        finally:
+            self.release(connection_name, environment)
+
+    def acquire(self, connection_name: str, environment: str = "", workload: Optional[str] = None,
+                timeout: Optional[float] = None) -> float:
+        """Attende un posto nel budget; restituisce l'attesa in millisecondi"""
+        workload = workload if workload in WORKLOADS else current_workload()
+        timeout = self.wait_timeout_sec if timeout is None else timeout
+        waiter = _Waiter(connection_name, environment, workload)
+        with self._lock:
+            conn = self._connections.setdefault(connection_name, _Counters())
+            env = self._environments.setdefault(environment, _Counters())
+            # Nessun sorpasso: si entra subito solo se nessuno attende sulle stesse risorse
+            if conn.waiting == 0 and env.waiting == 0 and self._fits(waiter):
+                self._grant(waiter)
+                return 0.0
+            self._queues[workload].append(waiter)
+            conn.waiting += 1
+            env.waiting += 1
+            self._workloads[workload].waiting += 1
+        logger.debug(f"[GOVERNOR] {connection_name}: attesa posto ({workload})")
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.granted:
+                    self._dequeue(waiter)
+                    conn.timeouts += 1
+                    self._workloads[workload].timeouts += 1
+                    # L'uscita dalla coda può sbloccare chi era dietro su altre risorse
+                    self._grant_waiting()
+                    budget_conn, budget_env = self.budgets(connection_name, environment)
+                    raise ConnectionBudgetTimeout(
+                        f"Nessuna connessione disponibile per {connection_name} entro {timeout:.0f}s "
+                        f"(in uso {conn.checked_out}/{budget_conn or '∞'}, "
+                        f"ambiente {environment or '-'} {env.checked_out}/{budget_env or '∞'})"
+                    )
+        return (time.monotonic() - waiter.enqueued_at) * 1000
+
+    def release(self, connection_name: str, environment: str = "") -> None:
+        with self._lock:
+            conn = self._connections.get(connection_name)
+            env = self._environments.get(environment or "")
+            if conn is not None and conn.checked_out > 0:
+                conn.checked_out -= 1
+            if env is not None and env.checked_out > 0:
+                env.checked_out -= 1
+            self._grant_waiting()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Lease in uso, attese e tempi per connessione, ambiente e tipo di lavoro"""
+        with self._lock:
+            connections = {name: c.to_dict() for name, c in self._connections.items()}
+            environments = {name: c.to_dict() for name, c in self._environments.items()}
+            workloads = {name: c.to_dict() for name, c in self._workloads.items()}
+            checked_out = sum(c.checked_out for c in self._connections.values())
+            waiting = sum(len(q) for q in self._queues.values())
+        # Budget letti fuori dal lock (provider su connections.json); 0 = illimitato
+        for name, data in connections.items():
+            data["budget"] = self.budgets(name, "")[0]
+        for name, data in environments.items():
+            data["budget"] = self.budgets("", name)[1]
+        return {
+            "checked_out": checked_out,
+            "waiting": waiting,
+            "interactive_weight": self.interactive_weight,
+            "wait_timeout_sec": self.wait_timeout_sec,
+            "connections": connections,
+            "environments": environments,
+            "workloads": workloads,
+        }
+
+    def _fits(self, waiter: _Waiter) -> bool:
+        budget_conn, budget_env = self.budgets(waiter.connection, waiter.environment)
+        conn = self._connections[waiter.connection]
+        env = self._environments[waiter.environment]
+        return (not budget_conn or conn.checked_out < budget_conn) and (not budget_env or env.checked_out < budget_env)
+
+    def _grant(self, waiter: _Waiter) -> None:
+        # Chiamato con self._lock acquisito
+        waited_ms = (time.monotonic() - waiter.enqueued_at) * 1000
+        for counters in (self._connections[waiter.connection], self._environments[waiter.environment],
+                         self._workloads[waiter.workload]):
+            counters.checked_out += 1
+            counters.peak = max(counters.peak, counters.checked_out)
+            counters.granted += 1
+            counters.total_wait_ms += waited_ms
+            counters.max_wait_ms = max(counters.max_wait_ms, waited_ms)
+        waiter.granted = True
+        waiter.event.set()
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        self._queues[waiter.workload].remove(waiter)
+        self._connections[waiter.connection].waiting -= 1
+        self._environments[waiter.environment].waiting -= 1
+        self._workloads[waiter.workload].waiting -= 1
+
+    def _grant_waiting(self) -> None:
+        """Concede i posti liberi alle code, a turno pesato tra interattivo e schedulato"""
+        while True:
+            candidates = {w: self._first_fitting(w) for w in WORKLOADS}
+            interactive, scheduled = candidates["interactive"], candidates["scheduled"]
+            if interactive is None and scheduled is None:
+                return
+            if interactive is not None and (scheduled is None or self._interactive_credits > 0):
+                chosen = interactive
+                if scheduled is not None:
+                    self._interactive_credits -= 1
+            else:
+                chosen = scheduled
+                self._interactive_credits = self.interactive_weight
+            self._dequeue(chosen)
+            self._grant(chosen)
+
+    def _first_fitting(self, workload: str) -> Optional[_Waiter]:
+        # In ordine di arrivo; chi attende su una risorsa piena non blocca chi usa altre connessioni
+        blocked = set()
+        for waiter in self._queues[workload]:
+            key = (waiter.connection, waiter.environment)
+            if key in blocked:
+                continue
+            if self._fits(waiter):
+                return waiter
+            blocked.add(key)
+        return None
+
+
+def _as_budget(value: Any) -> int:
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+_connection_governor: Optional[ConnectionGovernor] = None
+_connection_governor_lock = threading.Lock()
+
+
+def get_connection_governor() -> ConnectionGovernor:
+    """Ottiene il governatore connessioni condiviso (singleton)"""
+    global _connection_governor
+    if _connection_governor is None:
+        with _connection_governor_lock:
+            if _connection_governor is None:
+                from app.services.connection_service import get_connection_directory
+
+                def _budgets() -> Optional[Mapping[str, Any]]:
+                    return get_connection_directory().config.connection_budgets
+
+                settings = get_settings()
+                _connection_governor = ConnectionGovernor(
+                    budget_provider=_budgets,
+                    default_connection_budget=getattr(settings, "connection_budget_default", 8),
+                    default_environment_budget=getattr(settings, "connection_budget_environment_default", 0),
+                    interactive_weight=getattr(settings, "connection_governor_interactive_weight", 2),
+                    wait_timeout_sec=getattr(settings, "connection_governor_wait_timeout_sec", 60),
+                )
+    return _connection_governor
@@ -0,0 +1,175 @@
+"""
+Warm-up degli engine e verifica periodica delle connessioni.
+
+All'avvio (se abilitato) crea gli engine delle connessioni degli ambienti
+indicati (di default `default_environment` di connections.json) e apre in
+parallelo le connessioni iniziali del pool, così la prima query dell'utente non
+paga la creazione delle sessioni. In seguito esegue a intervalli la query di
+test sulle connessioni con engine attivo: gli esiti alimentano lo stato
+esposto da /api/connections (connected/error, ultimo errore, latenza).
+
+Le verifiche prendono il posto dal governatore come lavoro "scheduled", quindi
+non tolgono connessioni alle richieste da interfaccia. Girano in parallelo e la
+query di test è limitata lato driver a `timeout_sec` (Oracle call_timeout,
+PostgreSQL statement_timeout): un host irraggiungibile non blocca le altre.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Optional, Sequence
+
+from loguru import logger
+from sqlalchemy import text
+
+from app.services.connection_governor import run_as_workload
+from app.services.connection_service import ConnectionService, get_connection_health
+from app.services.oracle_pool import native_pool
+
+
+class ConnectionProber:
+    """Warm-up all'avvio e probe periodico delle connessioni database"""
+
+    def __init__(self, connection_service: ConnectionService, interval_sec: float = 300,
+                 timeout_sec: float = 10, environments: Optional[Sequence[str]] = None,
+                 warmup_connections: int = 0, max_workers: int = 4):
+        self.connection_service = connection_service
+        self.interval_sec = max(0.0, float(interval_sec))
+        self.timeout_sec = max(1.0, float(timeout_sec))
+        self.environments = [e.strip() for e in (environments or []) if e and e.strip()]
+        self.warmup_connections = max(0, int(warmup_connections))
+        self.max_workers = max(1, int(max_workers))
+        self._health = get_connection_health()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, warm_up: bool = True) -> None:
+        """Avvia warm-up e probe in background (non blocca l'avvio dell'applicazione)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(warm_up))
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self, warm_up: bool) -> None:
+        try:
+            if warm_up:
+                await asyncio.to_thread(run_as_workload, "scheduled", self.warm_up)
+            while self.interval_sec > 0:
+                await asyncio.sleep(self.interval_sec)
+                await asyncio.to_thread(run_as_workload, "scheduled", self.probe_once)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[PROBE] Verifica connessioni interrotta: {e}")
+
+    def warm_up_targets(self) -> List[str]:
+        """Connessioni degli ambienti da preriscaldare, nell'ordine di connections.json"""
+        environments = self.environments or [self.connection_service.get_default_environment()]
+        descriptors = self.connection_service.get_descriptors()
+        return [name for env in environments for name, d in descriptors.items() if d.environment == env]
+
+    def warm_up(self) -> None:
+        """Crea gli engine e apre le connessioni iniziali dei pool"""
+        targets = self.warm_up_targets()
+        if not targets:
+            logger.info("[PROBE] Nessuna connessione da preriscaldare")
+            return
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(targets)), thread_name_prefix="warmup") as pool:
+            results = list(pool.map(self._warm_up_connection, targets))
+        ready = sum(1 for ok in results if ok)
+        logger.info(
+            f"🔥 Warm-up connessioni: {ready}/{len(targets)} pronte "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+
+    def probe_once(self) -> None:
+        """Esegue in parallelo la query di test sulle connessioni con engine attivo"""
+        targets = list(self.connection_service.get_active_connections())
+        if not targets:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(targets)), thread_name_prefix="probe") as pool:
+            list(pool.map(lambda name: run_as_workload("scheduled", self._probe, name), targets))
+
+    def _warm_up_connection(self, connection_name: str) -> bool:
+        engine = self.connection_service.get_engine(connection_name)
+        if engine is None:
+            self._health.record(connection_name, False, error="Impossibile creare l'engine database")
+            return False
+        count = self._warm_up_size(connection_name, engine)
+        if count <= 1:
+            return self._probe(connection_name)
+        # Le connessioni restano aperte finché tutte sono state ottenute: il pool sale a `count`
+        barrier = threading.Barrier(count)
+        with ThreadPoolExecutor(max_workers=count, thread_name_prefix=f"warmup-{connection_name}") as pool:
+            results = list(pool.map(lambda _: run_as_workload("scheduled", self._probe, connection_name, barrier),
+                                    range(count)))
+        return any(results)
+
+    def _warm_up_size(self, connection_name: str, engine) -> int:
+        if self.warmup_connections:
+            count = self.warmup_connections
+        else:
+            oracle_pool = native_pool(engine)
+            if oracle_pool is not None:
+                count = oracle_pool.min
+            else:
+                size = getattr(engine.pool, "size", None)
+                count = size() if callable(size) else 1
+        budget = self.connection_service.get_connection_budget(connection_name)
+        return max(1, min(count, budget) if budget else count)
+
+    def _probe(self, connection_name: str, barrier: Optional[threading.Barrier] = None) -> bool:
+        engine = self.connection_service.get_engine(connection_name)
+        descriptor = self.connection_service.get_descriptor(connection_name)
+        if engine is None or descriptor is None:
+            return False
+        started = time.perf_counter()
+        try:
+            with self.connection_service.lease(connection_name, timeout=self.timeout_sec), engine.connect() as conn, \
+                    self._call_timeout(conn):
+                conn.execute(text(descriptor.test_query)).fetchone()
+                latency_ms = (time.perf_counter() - started) * 1000
+                if barrier is not None:
+                    try:
+                        barrier.wait(self.timeout_sec)
+                    except threading.BrokenBarrierError:
+                        pass
+        except Exception as e:
+            if barrier is not None:
+                barrier.abort()
+            self._health.record(connection_name, False, (time.perf_counter() - started) * 1000, str(e))
+            logger.warning(f"[PROBE] {connection_name} non raggiungibile: {e}")
+            return False
+        self._health.record(connection_name, True, latency_ms)
+        return True
+
+    @contextmanager
+    def _call_timeout(self, conn):
+        """Limita la query di test a timeout_sec lato driver; la sessione torna al pool senza limite"""
+        timeout_ms = int(self.timeout_sec * 1000)
+        dialect = conn.dialect.name
+        if dialect == "oracle":
+            driver_connection = conn.connection.driver_connection
+            previous = driver_connection.call_timeout
+            driver_connection.call_timeout = timeout_ms
+            try:
+                yield
+            finally:
+                try:
+                    driver_connection.call_timeout = previous
+                except Exception:
+                    pass  # sessione già chiusa dal driver dopo il timeout
+            return
+        if dialect == "postgresql":
+            # SET LOCAL vale solo per la transazione del probe, annullata alla chiusura della connessione
+            conn.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+        yield
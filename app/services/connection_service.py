@@ -2,14 +2,26 @@
 Servizio per la gestione delle connessioni database
 """
 import time
-from typing import Dict, Optional, Any
+import threading
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Optional, Any, Callable, List, Mapping, Tuple
 from datetime import datetime
-from sqlalchemy import create_engine, text, Engine
+from sqlalchemy import create_engine, event, text, Engine
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.pool import QueuePool
 from loguru import logger
 
-from app.core.config import get_connections_config, get_env_vars
+from app.core.config import (
+    ConnectionsConfig,
+    DatabaseConfig,
+    get_env_vars,
+    get_settings,
+    load_connections_config,
+    reload_connections_config,
+)
+from app.services.connection_governor import ConnectionGovernor, get_connection_governor
+from app.services.oracle_pool import create_native_engine, native_pool, native_pool_status, oracle_pool_options
 from app.models.connections import (
     DatabaseConnection, 
     ConnectionStatus, 
@@ -18,19 +30,300 @@ from app.models.connections import (
 )
 
 
+class EngineRegistry:
+    """Registro process-wide degli engine SQLAlchemy.
+
+    Un solo engine (e quindi un solo pool) per connessione, condiviso da tutte le
+    istanze di ConnectionService: i limiti del pool valgono per l'intero processo.
+    Il ciclo di vita è gestito dal lifespan dell'applicazione (dispose_all allo shutdown).
+    """
+
+    def __init__(self):
+        self._engines: Dict[str, Engine] = {}
+        self._lock = threading.Lock()
+        self._creation_locks: Dict[str, threading.Lock] = {}
+
+    def __contains__(self, connection_name: str) -> bool:
+        return connection_name in self._engines
+
+    def get(self, connection_name: str) -> Optional[Engine]:
+        """Restituisce l'engine registrato per la connessione (None se assente)"""
+        return self._engines.get(connection_name)
+
+    def names(self) -> List[str]:
+        """Nomi delle connessioni con engine attivo"""
+        return list(self._engines.keys())
+
+    def get_or_create(self, connection_name: str, factory: Callable[[], Optional[Engine]]) -> Optional[Engine]:
+        """Restituisce l'engine esistente o lo crea con `factory`.
+
+        La creazione è serializzata per connessione: richieste concorrenti sulla stessa
+        connessione attendono il primo engine invece di crearne uno ciascuna.
+        """
+        engine = self._engines.get(connection_name)
+        if engine is not None:
+            return engine
+        with self._lock:
+            creation_lock = self._creation_locks.setdefault(connection_name, threading.Lock())
+        with creation_lock:
+            engine = self._engines.get(connection_name)
+            if engine is not None:
+                return engine
+            engine = factory()
+            if engine is not None:
+                with self._lock:
+                    self._engines[connection_name] = engine
+            return engine
+
+    def dispose(self, connection_name: str) -> bool:
+        """Rimuove e chiude l'engine di una connessione"""
+        with self._lock:
+            engine = self._engines.pop(connection_name, None)
+        if engine is None:
+            return False
+        self._dispose_engine(connection_name, engine)
+        return True
+
+    def dispose_all(self) -> None:
+        """Chiude tutti gli engine registrati"""
+        for connection_name in self.names():
+            self.dispose(connection_name)
+
+    def _dispose_engine(self, connection_name: str, engine: Engine) -> None:
+        try:
+            engine.dispose()
+        except Exception as e:
+            logger.warning(f"Errore nel rilascio engine {connection_name}: {e}")
+
+
+# Singleton del registro engine
+_engine_registry: Optional[EngineRegistry] = None
+_engine_registry_lock = threading.Lock()
+
+
+def get_engine_registry() -> EngineRegistry:
+    """Ottiene il registro engine condiviso dal processo (singleton)"""
+    global _engine_registry
+    if _engine_registry is None:
+        with _engine_registry_lock:
+            if _engine_registry is None:
+                _engine_registry = EngineRegistry()
+    return _engine_registry
+
+
+class ConnectionDescriptor:
+    """Descrittore immutabile di una connessione configurata (calcolato una volta per versione di connections.json)"""
+
+    __slots__ = ("name", "environment", "db_type", "description", "params", "config", "test_query", "_model")
+
+    def __init__(self, config: DatabaseConfig):
+        db_type = (config.db_type or "").lower()
+        try:
+            # Modello API validato una sola volta; per chiamata si copia con lo stato runtime
+            model = DatabaseConnection(
+                name=config.name,
+                environment=config.environment,
+                db_type=config.db_type,
+                description=config.description or "",
+                params=dict(config.params),
+            )
+        except Exception as e:
+            logger.error(f"Connessione {config.name} non valida in connections.json: {e}")
+            model = None
+        values = {
+            "name": config.name,
+            "environment": config.environment,
+            "db_type": db_type,
+            "description": config.description or "",
+            "params": MappingProxyType(dict(config.params)),
+            "config": config,
+            "test_query": "SELECT 1 FROM DUAL" if db_type == "oracle" else "SELECT 1",
+            "_model": model,
+        }
+        for key, value in values.items():
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("ConnectionDescriptor è immutabile")
+
+    def signature(self) -> Tuple:
+        """Parametri che determinano l'engine: se cambiano l'engine va ricreato"""
+        return (
+            self.db_type,
+            tuple(sorted((k, repr(v)) for k, v in self.params.items())),
+            repr(getattr(self.config, "pool", None)),
+        )
+
+    def to_connection(self, runtime: Optional[Dict[str, Any]] = None) -> Optional[DatabaseConnection]:
+        """Modello API con lo stato runtime (copia superficiale, nessuna validazione)"""
+        if self._model is None:
+            return None
+        return self._model.model_copy(update=runtime) if runtime else self._model.model_copy()
+
+
+class ConnectionDirectory:
+    """Descrittori delle connessioni indicizzati per nome.
+
+    L'indice viene ricostruito solo quando connections.json cambia (mtime/dimensione,
+    verificati al massimo ogni `check_interval_sec`); le letture restituiscono lo
+    snapshot corrente senza lock né scansioni. Alla ricostruzione gli engine delle
+    connessioni rimosse o con parametri cambiati vengono rilasciati.
+    """
+
+    def __init__(self, path: Path, loader: Optional[Callable[[Path], ConnectionsConfig]] = None,
+                 check_interval_sec: float = 1.0, registry: Optional[EngineRegistry] = None):
+        self.path = Path(path)
+        self._loader = loader or load_connections_config
+        self.check_interval_sec = max(0.0, float(check_interval_sec))
+        self._registry = registry
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._config: Optional[ConnectionsConfig] = None
+        self._descriptors: Mapping[str, ConnectionDescriptor] = MappingProxyType({})
+        self.version = 0
+
+    @property
+    def config(self) -> ConnectionsConfig:
+        self._refresh_if_changed()
+        return self._config
+
+    def descriptors(self) -> Mapping[str, ConnectionDescriptor]:
+        """Snapshot nome -> descrittore, nell'ordine di connections.json"""
+        self._refresh_if_changed()
+        return self._descriptors
+
+    def get(self, connection_name: Optional[str]) -> Optional[ConnectionDescriptor]:
+        if not connection_name:
+            return None
+        return self.descriptors().get(connection_name)
+
+    def invalidate(self) -> None:
+        """Forza la verifica del file al prossimo accesso"""
+        self._checked_at = 0.0
+        self._stamp = None
+
+    def _refresh_if_changed(self) -> None:
+        now = time.monotonic()
+        if self._config is not None and now - self._checked_at < self.check_interval_sec:
+            return
+        with self._lock:
+            if self._config is not None and now - self._checked_at < self.check_interval_sec:
+                return
+            self._checked_at = now
+            try:
+                st = self.path.stat()
+                stamp = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamp = None
+            if self._config is not None and stamp == self._stamp:
+                return
+            try:
+                config = self._loader(self.path)
+            except Exception as e:
+                if self._config is None:
+                    raise
+                # File in modifica o non valido: resta in uso lo snapshot precedente
+                logger.warning(f"connections.json non ricaricato, uso la configurazione precedente: {e}")
+                return
+            self._rebuild(config, stamp)
+
+    def _rebuild(self, config: ConnectionsConfig, stamp: Optional[Tuple[int, int]]) -> None:
+        descriptors: Dict[str, ConnectionDescriptor] = {}
+        for conn_config in config.connections:
+            descriptors.setdefault(conn_config.name, ConnectionDescriptor(conn_config))
+        previous = self._descriptors
+        self._config = config
+        self._descriptors = MappingProxyType(descriptors)
+        self._stamp = stamp
+        self.version += 1
+        if self._registry is None or not previous:
+            return
+        for name, old in previous.items():
+            new = descriptors.get(name)
+            if new is None or new.signature() != old.signature():
+                if self._registry.dispose(name):
+                    logger.info(f"Engine {name} rilasciato: connessione modificata in connections.json")
+
+
+class ConnectionHealth:
+    """Esito delle ultime verifiche reali (probe periodico, warm-up, test) per connessione"""
+
+    def __init__(self):
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, connection_name: str, success: bool, response_time_ms: Optional[float] = None,
+               error: Optional[str] = None) -> None:
+        now = datetime.utcnow()
+        with self._lock:
+            previous = self._records.get(connection_name, {})
+            self._records[connection_name] = {
+                "status": (ConnectionStatus.CONNECTED if success else ConnectionStatus.ERROR).value,
+                "last_connected": now if success else previous.get("last_connected"),
+                "last_error": None if success else error,
+                "last_checked": now,
+                "response_time_ms": round(response_time_ms, 2) if response_time_ms is not None else None,
+            }
+
+    def runtime(self, connection_name: str, has_engine: bool) -> Optional[Dict[str, Any]]:
+        """Campi runtime del modello API; senza engine una connessione non è mai "connected" """
+        record = self._records.get(connection_name)
+        if record is None:
+            return None
+        if not has_engine and record["status"] == ConnectionStatus.CONNECTED.value:
+            return {**record, "status": ConnectionStatus.DISCONNECTED.value}
+        return record
+
+    def forget(self, connection_name: str) -> None:
+        with self._lock:
+            self._records.pop(connection_name, None)
+
+
+_connection_health = ConnectionHealth()
+
+
+def get_connection_health() -> ConnectionHealth:
+    """Stato delle verifiche di connessione condiviso dal processo"""
+    return _connection_health
+
+
+# Singleton dell'indice connessioni
+_connection_directory: Optional[ConnectionDirectory] = None
+_connection_directory_lock = threading.Lock()
+
+
+def get_connection_directory() -> ConnectionDirectory:
+    """Ottiene l'indice connessioni condiviso dal processo (singleton)"""
+    global _connection_directory
+    if _connection_directory is None:
+        with _connection_directory_lock:
+            if _connection_directory is None:
+                _connection_directory = ConnectionDirectory(
+                    get_settings().connections_file,
+                    # Mantiene allineata anche la configurazione condivisa di get_connections_config
+                    loader=lambda _path: reload_connections_config(),
+                    registry=get_engine_registry(),
+                )
+    return _connection_directory
+
+
 class ConnectionService:
     """Servizio per la gestione delle connessioni database"""
     
-    def __init__(self):
-        self._engines: Dict[str, Engine] = {}
+    def __init__(self, engine_registry: Optional[EngineRegistry] = None,
+                 directory: Optional[ConnectionDirectory] = None,
+                 governor: Optional[ConnectionGovernor] = None):
+        self._registry = engine_registry or get_engine_registry()
+        self._directory = directory or get_connection_directory()
+        self._governor = governor or get_connection_governor()
+        self._health = get_connection_health()
         self._current_connection: Optional[str] = None
-        self._connections_config = None
         self._env_vars: Dict[str, str] = {}
         
         try:
-            self._connections_config = get_connections_config()
             self._env_vars = get_env_vars()
-            self._current_connection = self._connections_config.default_connection
+            self._current_connection = self._directory.config.default_connection
             logger.info(f"ConnectionService inizializzato - connessione di default: {self._current_connection}")
         except Exception as e:
             logger.error(f"Errore nell'inizializzazione ConnectionService: {e}")
@@ -40,30 +333,11 @@ class ConnectionService:
         """Ottiene tutte le connessioni disponibili"""
         try:
             connections = {}
-            for conn_config in self._connections_config.connections:
-                # Determina lo status della connessione
-                status = ConnectionStatus.DISCONNECTED
-                last_connected = None
-                last_error = None
-                
-                if conn_config.name in self._engines:
-                    status = ConnectionStatus.CONNECTED
-                    last_connected = datetime.utcnow()
-                
-                connection = DatabaseConnection(
-                    name=conn_config.name,
-                    environment=conn_config.environment,
-                    db_type=conn_config.db_type,
-                    description=conn_config.description,
-                    params=conn_config.params,
-                    status=status,
-                    last_connected=last_connected,
-                    last_error=last_error
-                )
-                connections[conn_config.name] = connection
-            
+            for name, descriptor in self._directory.descriptors().items():
+                connection = descriptor.to_connection(self._health.runtime(name, name in self._registry))
+                if connection is not None:
+                    connections[name] = connection
             return connections
-            
         except Exception as e:
             logger.error(f"Errore nel recupero delle connessioni: {e}")
             raise
@@ -71,11 +345,43 @@ class ConnectionService:
     def get_connection(self, connection_name: str) -> Optional[DatabaseConnection]:
         """Ottiene una connessione specifica per nome"""
         try:
-            connections = self.get_connections()
-            return connections.get(connection_name)
+            descriptor = self._directory.get(connection_name)
+            if descriptor is None:
+                return None
+            return descriptor.to_connection(self._health.runtime(connection_name, connection_name in self._registry))
         except Exception as e:
             logger.error(f"Errore nel recupero della connessione {connection_name}: {e}")
             return None
+
+    def get_descriptor(self, connection_name: str) -> Optional[ConnectionDescriptor]:
+        """Descrittore immutabile della connessione (None se non configurata)"""
+        return self._directory.get(connection_name)
+
+    def lease(self, connection_name: str, timeout: Optional[float] = None):
+        """Posto nel budget del governatore per usare la connessione (context manager)"""
+        descriptor = self._directory.get(connection_name)
+        environment = descriptor.environment if descriptor is not None else ""
+        return self._governor.lease(connection_name, environment, timeout=timeout)
+
+    def get_descriptors(self) -> Mapping[str, ConnectionDescriptor]:
+        """Descrittori di tutte le connessioni configurate"""
+        return self._directory.descriptors()
+
+    def get_default_environment(self) -> str:
+        return self._directory.config.default_environment
+
+    def get_active_connections(self) -> List[str]:
+        """Connessioni con engine già creato nel registro del processo"""
+        return self._registry.names()
+
+    def get_connection_budget(self, connection_name: str) -> int:
+        """Budget del governatore per la connessione (0 = illimitato)"""
+        descriptor = self._directory.get(connection_name)
+        return self._connection_budget(descriptor) if descriptor is not None else 0
+
+    def get_governor_stats(self) -> Dict[str, Any]:
+        """Lease in uso e tempi di attesa del governatore connessioni"""
+        return self._governor.get_stats()
     
     def get_current_connection(self) -> Optional[str]:
         """Ottiene il nome della connessione corrente"""
@@ -84,7 +390,7 @@ class ConnectionService:
     def set_current_connection(self, connection_name: str) -> bool:
         """Imposta la connessione corrente"""
         try:
-            if connection_name in [conn.name for conn in self._connections_config.connections]:
+            if self._directory.get(connection_name) is not None:
                 self._current_connection = connection_name
                 logger.info(f"Connessione corrente impostata a: {connection_name}")
                 return True
@@ -104,12 +410,11 @@ class ConnectionService:
                 logger.error("Nessuna connessione specificata o corrente disponibile")
                 return None
             
-            # Se l'engine esiste già, restituiscilo
-            if target_connection in self._engines:
-                return self._engines[target_connection]
-            
-            # Crea un nuovo engine
-            return self._create_engine(target_connection)
+            # Riusa l'engine condiviso dal processo, creandolo solo al primo utilizzo
+            return self._registry.get_or_create(
+                target_connection,
+                lambda: self._create_engine(target_connection)
+            )
             
         except Exception as e:
             logger.error(f"Errore nel recupero dell'engine per {target_connection}: {e}")
@@ -118,27 +423,22 @@ class ConnectionService:
     def _create_engine(self, connection_name: str) -> Optional[Engine]:
         """Crea un nuovo engine SQLAlchemy per la connessione"""
         try:
-            # Trova la configurazione della connessione
-            conn_config = None
-            for config in self._connections_config.connections:
-                if config.name == connection_name:
-                    conn_config = config
-                    break
-            
-            if not conn_config:
+            descriptor = self._directory.get(connection_name)
+            if descriptor is None:
                 logger.error(f"Configurazione connessione non trovata: {connection_name}")
                 return None
+            conn_config = descriptor.config
             
             # Gestione speciale per Oracle con oracledb
             if conn_config.db_type.lower() == "oracle":
-                return self._create_oracle_engine(conn_config, connection_name)
+                return self._create_oracle_engine(conn_config, connection_name, self._connection_budget(descriptor))
             else:
                 # Per PostgreSQL, SQL Server, etc. usa la connection string standard
                 connection_string = conn_config.get_connection_string(self._env_vars)
                 logger.info(f"🔗 Connection string per {connection_name}: {self._safe_connection_string(connection_string)}")
                 
                 # Configurazione pool in base al tipo di database
-                pool_config = self._get_pool_config(conn_config.db_type)
+                pool_config = self._get_pool_config(conn_config.db_type, self._connection_budget(descriptor))
                 
                 # Crea l'engine
                 engine = create_engine(
@@ -148,7 +448,6 @@ class ConnectionService:
                     future=True  # Usa la nuova API di SQLAlchemy 2.0
                 )
                 
-                self._engines[connection_name] = engine
                 logger.info(f"✅ Engine creato per connessione: {connection_name}")
                 
                 return engine
@@ -159,8 +458,10 @@ class ConnectionService:
             logger.error(f"Dettagli completi: {e}")
             return None
     
-    def _create_oracle_engine(self, conn_config, connection_name: str) -> Optional[Engine]:
-        """Crea engine Oracle usando oracledb con DSN approach - versione semplificata"""
+    def _create_oracle_engine(self, conn_config, connection_name: str, budget: int = 0) -> Optional[Engine]:
+        """Crea engine Oracle con oracledb: pool nativo (default) o QueuePool SQLAlchemy.
+        Nessuna connessione di prova: il primo utilizzo (o test_connection) verifica le credenziali.
+        """
         try:
             import oracledb
             
@@ -186,40 +487,33 @@ class ConnectionService:
             logger.info(f"🔗 Connessione Oracle a {host}:{port}")
             logger.info(f"🌐 Service Name: {service_name}")
             logger.info(f"👤 Utente: {username}")
+
+            options = oracle_pool_options(getattr(conn_config, 'pool', None))
+            if budget:
+                # Il pool non apre più sessioni di quante il governatore ne conceda
+                options["max"] = min(int(options["max"]), budget)
+            if options["mode"] == "native":
+                engine = create_native_engine(
+                    oracledb,
+                    {"user": username, "password": password, "host": host, "port": port, "service_name": service_name,
+                     "tcp_connect_timeout": float(getattr(get_settings(), "db_connect_timeout_sec", 10))},
+                    options,
+                    connection_name,
+                )
+                self._install_fetch_tuning(engine)
+                logger.info(f"✅ Engine Oracle (pool oracledb) creato con successo per {connection_name}")
+                return engine
             
             # Costruisci DSN con oracledb.makedsn
             dsn = oracledb.makedsn(host, port, service_name=service_name)
             logger.debug(f"🌐 DSN Oracle: {dsn}")
             
-            # Test connessione DIRETTA con oracledb (senza SQLAlchemy)
-            try:
-                test_conn = oracledb.connect(
-                    user=username,
-                    password=password,
-                    dsn=dsn
-                )
-                with test_conn:
-                    cursor = test_conn.cursor()
-                    cursor.execute("SELECT 1 FROM DUAL")
-                    cursor.fetchone()
-                logger.info("✅ Test connessione Oracle diretta riuscita")
-            except Exception as e:
-                logger.error(f"❌ Test connessione Oracle diretta fallita: {e}")
-                raise
-            
             # Costruisci connection string SQLAlchemy per oracledb - SENZA parametri extra
             connection_string = f"oracle+oracledb://{username}:{password}@{dsn}"
             
             # Configurazione pool Oracle OTTIMIZZATA - previene connessioni stale
-            pool_config = {
-                "poolclass": QueuePool,
-                "pool_size": 3,
-                "max_overflow": 5,
-                "pool_pre_ping": True,  # CRITICO: testa connessioni prima dell'uso
-                "pool_recycle": 1800,   # 30min invece di 1h per evitare stale connections
-                "pool_timeout": 30,      # Timeout attesa connessione dal pool
-                # NO connect_args per evitare conflitti con oracledb
-            }
+            # (pool_pre_ping, recycle 30min, pool_size 3 + overflow fino al budget della connessione)
+            pool_config = self._get_pool_config("oracle", budget)
             
             # Crea l'engine con configurazione ottimizzata
             engine = create_engine(
@@ -229,8 +523,8 @@ class ConnectionService:
                 echo_pool="debug",  # Log operazioni pool per diagnostica
                 future=True
             )
+            self._install_fetch_tuning(engine)
             
-            self._engines[connection_name] = engine
             logger.info(f"✅ Engine Oracle creato con successo per {connection_name}")
             
             return engine
@@ -244,6 +538,26 @@ class ConnectionService:
             logger.error(traceback.format_exc())
             return None
     
+    def _install_fetch_tuning(self, engine: Engine) -> None:
+        """Imposta arraysize/prefetchrows sui cursori Oracle prima di ogni execute.
+        I default arrivano dai settings; una singola esecuzione può sovrascriverli con
+        execution_options(fetch_arraysize=..., fetch_prefetchrows=...).
+        """
+        settings = get_settings()
+        default_arraysize = getattr(settings, "query_fetch_arraysize", 1000)
+        default_prefetchrows = getattr(settings, "query_fetch_prefetchrows", 1000)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _tune_cursor(conn, cursor, statement, parameters, context, executemany):
+            if executemany:
+                return
+            options = context.execution_options if context is not None else {}
+            try:
+                cursor.arraysize = int(options.get("fetch_arraysize") or default_arraysize)
+                cursor.prefetchrows = int(options.get("fetch_prefetchrows") or default_prefetchrows)
+            except Exception as e:
+                logger.debug(f"Tuning cursore Oracle non applicato: {e}")
+
     def _safe_connection_string(self, connection_string: str) -> str:
         """Oscura password nella connection string per logging sicuro"""
         if ":" in connection_string and "@" in connection_string:
@@ -255,8 +569,15 @@ class ConnectionService:
                     return f"{user_part}:***@{parts[1]}"
         return connection_string
     
-    def _get_pool_config(self, db_type: str) -> Dict[str, Any]:
-        """Ottiene la configurazione del pool per tipo di database"""
+    def _connection_budget(self, descriptor: ConnectionDescriptor) -> int:
+        """Connessioni contemporanee concesse dal governatore alla connessione (0 = illimitato)"""
+        return self._governor.budgets(descriptor.name, descriptor.environment)[0]
+
+    def _get_pool_config(self, db_type: str, budget: int = 0) -> Dict[str, Any]:
+        """Ottiene la configurazione del pool per tipo di database.
+        Con un budget la capacità del pool (pool_size + max_overflow) coincide con il budget.
+        """
+        connect_timeout = int(getattr(get_settings(), "db_connect_timeout_sec", 10))
         base_config = {
             "poolclass": QueuePool,
             "pool_size": 5,
@@ -273,24 +594,28 @@ class ConnectionService:
                 "pool_pre_ping": True,  # CRITICO per Oracle
                 "pool_recycle": 1800,   # 30min
                 "pool_timeout": 30,
-                # oracledb moderno NON supporta encoding/nencoding
-                "connect_args": {}
+                # oracledb moderno NON supporta encoding/nencoding: solo il timeout di connessione TCP
+                "connect_args": {"tcp_connect_timeout": float(connect_timeout)}
             })
         elif db_type.lower() == "postgresql":
             base_config.update({
                 "connect_args": {
                     "client_encoding": "utf8",
-                    "connect_timeout": 30
+                    "connect_timeout": connect_timeout
                 }
             })
         elif db_type.lower() == "sqlserver":
             base_config.update({
                 "connect_args": {
-                    "timeout": 30,
+                    "timeout": connect_timeout,
                     "TrustServerCertificate": "yes"
                 }
             })
         
+        if budget:
+            base_config["pool_size"] = min(base_config["pool_size"], budget)
+            base_config["max_overflow"] = budget - base_config["pool_size"]
+        
         return base_config
     
     def test_connection(self, connection_name: str) -> ConnectionTest:
@@ -298,8 +623,8 @@ class ConnectionService:
         start_time = time.time()
         
         try:
-            # Ottiene l'engine (creandolo se necessario)
-            engine = self._create_engine(connection_name)
+            # Ottiene l'engine condiviso (creandolo se necessario)
+            engine = self.get_engine(connection_name)
             
             if not engine:
                 return ConnectionTest(
@@ -311,16 +636,14 @@ class ConnectionService:
             # Esegue una query di test
             test_query = self._get_test_query(connection_name)
             
-            with engine.connect() as conn:
+            with self.lease(connection_name), engine.connect() as conn:
                 result = conn.execute(text(test_query))
                 result.fetchone()  # Forza l'esecuzione
             
             response_time = (time.time() - start_time) * 1000
             
-            # Salva l'engine se il test ha successo
-            self._engines[connection_name] = engine
-            
             logger.info(f"Test connessione riuscito per {connection_name} in {response_time:.2f}ms")
+            self._health.record(connection_name, True, response_time)
             
             return ConnectionTest(
                 connection_name=connection_name,
@@ -335,10 +658,7 @@ class ConnectionService:
             logger.error(f"Test connessione fallito per {connection_name}: {error_msg}")
             logger.error(f"Tipo errore SQLAlchemy: {type(e).__name__}")
             logger.error(f"Dettagli: {e}")
-            
-            # Rimuovi l'engine se esiste
-            if connection_name in self._engines:
-                del self._engines[connection_name]
+            self._health.record(connection_name, False, response_time, error_msg)
             
             return ConnectionTest(
                 connection_name=connection_name,
@@ -354,6 +674,7 @@ class ConnectionService:
             logger.error(f"Test connessione fallito per {connection_name}: {error_msg}")
             logger.error(f"Tipo errore: {type(e).__name__}")
             logger.error(f"Dettagli completi: {e}")
+            self._health.record(connection_name, False, response_time, error_msg)
             
             return ConnectionTest(
                 connection_name=connection_name,
@@ -364,37 +685,13 @@ class ConnectionService:
     
     def _get_test_query(self, connection_name: str) -> str:
         """Ottiene la query di test appropriata per il tipo di database"""
-        try:
-            conn_config = None
-            for config in self._connections_config.connections:
-                if config.name == connection_name:
-                    conn_config = config
-                    break
-            
-            if not conn_config:
-                return "SELECT 1"
-            
-            db_type = conn_config.db_type.lower()
-            
-            if db_type == "oracle":
-                return "SELECT 1 FROM DUAL"
-            elif db_type == "postgresql":
-                return "SELECT 1"
-            elif db_type == "sqlserver":
-                return "SELECT 1"
-            else:
-                return "SELECT 1"
-                
-        except Exception as e:
-            logger.error(f"Errore nella determinazione query di test: {e}")
-            return "SELECT 1"
+        descriptor = self._directory.get(connection_name)
+        return descriptor.test_query if descriptor is not None else "SELECT 1"
     
     def close_connection(self, connection_name: str) -> bool:
         """Chiude una connessione specifica"""
         try:
-            if connection_name in self._engines:
-                self._engines[connection_name].dispose()
-                del self._engines[connection_name]
+            if self._registry.dispose(connection_name):
                 logger.info(f"Connessione chiusa: {connection_name}")
                 return True
             return False
@@ -405,7 +702,7 @@ class ConnectionService:
     def close_all_connections(self):
         """Chiude tutte le connessioni aperte"""
         try:
-            for connection_name in list(self._engines.keys()):
+            for connection_name in self._registry.names():
                 self.close_connection(connection_name)
             logger.info("Tutte le connessioni sono state chiuse")
         except Exception as e:
@@ -414,10 +711,14 @@ class ConnectionService:
     def get_pool_status(self, connection_name: str) -> Dict[str, Any]:
         """Ottiene lo stato del connection pool per diagnostica"""
         try:
-            if connection_name not in self._engines:
+            engine = self._registry.get(connection_name)
+            if engine is None:
                 return {"error": "Connessione non trovata"}
             
-            engine = self._engines[connection_name]
+            oracle_pool = native_pool(engine)
+            if oracle_pool is not None:
+                return {"connection_name": connection_name, **native_pool_status(oracle_pool)}
+
             pool = engine.pool
             
             return {
@@ -431,10 +732,3 @@ class ConnectionService:
         except Exception as e:
             logger.error(f"Errore nel recupero stato pool {connection_name}: {e}")
             return {"error": str(e)}
-    
-    def __del__(self):
-        """Destructor - chiude tutte le connessioni"""
-        try:
-            self.close_all_connections()
-        except:
-            pass
@@ -1,4 +1,3 @@
-import json
 from datetime import datetime, date, timedelta
 from pathlib import Path
 from typing import Optional, List, Dict
@@ -7,11 +6,12 @@ from email.message import EmailMessage
 from loguru import logger
 
 from app.core.config import get_settings
+from app.services.scheduler_history import get_scheduler_history_store
 
 
 class DailyReportService:
     """Genera e invia il report giornaliero delle schedulazioni.
-    - Legge `scheduler_history.json` da `export_dir`
+    - Legge dallo storico scheduler (indice per timestamp) solo la finestra richiesta
     - Filtra per la data richiesta
     - Costruisce un corpo email HTML con riepilogo e dettagli
     - Invia via SMTP ai destinatari configurati (pipe-separated)
@@ -19,13 +19,12 @@ class DailyReportService:
 
     def __init__(self):
         self.settings = get_settings()
-        self.history_path = Path(self.settings.export_dir) / "scheduler_history.json"
+        self.history_store = get_scheduler_history_store(Path(self.settings.export_dir))
 
-    def _load_history(self) -> List[Dict]:
+    def _load_history(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict]:
+        # Eventi senza timestamp inclusi: i filtri sotto ricadono su start_date
         try:
-            if self.history_path.exists():
-                with open(self.history_path, "r", encoding="utf-8") as f:
-                    return json.load(f) or []
+            return self.history_store.query(since=since, until=until, include_undated=True)
         except Exception as e:
             logger.error(f"[DAILY_REPORT] Errore lettura history: {e}")
         return []
@@ -174,9 +173,10 @@ class DailyReportService:
     def generate(self, day: Optional[date] = None) -> Dict[str, str]:
         # Se viene fornita una data esplicita, mantiene il comportamento "giornaliero".
         # Se day è None, estrae le esecuzioni delle ultime 24 ore rispetto all'istante corrente.
-        hist = self._load_history()
         if day is not None:
             d = day
+            day_start = datetime.combine(d, datetime.min.time())
+            hist = self._load_history(day_start, day_start + timedelta(days=1))
             items = self._filter_by_date(hist, d)
             body_html = self._build_html(d, items)
             return {
@@ -186,6 +186,7 @@ class DailyReportService:
             }
         else:
             now = datetime.now()
+            hist = self._load_history(now - timedelta(hours=24))
             items = self._filter_by_last_hours(hist, now, hours=24)
             # Manteniamo il titolo con la data odierna per compatibilità visuale
             d = now.date()
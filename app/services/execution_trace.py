@@ -0,0 +1,190 @@
+"""
+Tracce delle esecuzioni query recenti, in memoria e su richiesta.
+
+Sostituiscono i file Query/tmp/tmp*.txt e *_diagnostics.txt: ogni esecuzione
+registra gli statement effettivamente inviati al database (testo, bind, esito,
+durata) e le righe di diagnostica in un buffer circolare indicizzato per
+request id, consultabile via API. Nessuna scrittura su disco durante
+l'esecuzione; con DEBUG attivo la traccia viene salvata alla fine in
+logs/query_traces/<request_id>.txt (un file per richiesta, nessuna collisione
+tra esecuzioni concorrenti).
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from app.core.config import get_settings
+
+
+_SQL_PREVIEW_CHARS = 20000
+_VALUE_PREVIEW_CHARS = 200
+_SAFE_ID = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class ExecutionTrace:
+    """Traccia di una singola esecuzione: statement eseguiti e diagnostica"""
+
+    def __init__(self, request_id: str, query_filename: str, connection_name: str):
+        self.request_id = request_id
+        self.query_filename = query_filename
+        self.connection_name = connection_name
+        self.started_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.statements: List[Dict[str, Any]] = []
+        self.diagnostics: List[str] = []
+        self._started_monotonic = time.monotonic()
+        self._duration_ms: Optional[float] = None
+
+    def statement(self, entry: Dict[str, Any], status: str, duration_ms: float, error: Optional[str] = None) -> None:
+        """Registra l'esito di uno statement (testo e bind come inviati al database)"""
+        sql = entry.get("sql") or ""
+        self.statements.append({
+            "step": entry.get("step"),
+            "is_select": entry.get("is_select"),
+            "sql": sql if len(sql) <= _SQL_PREVIEW_CHARS else sql[:_SQL_PREVIEW_CHARS] + " ...",
+            "binds": {k: _preview(v) for k, v in (entry.get("params") or {}).items()},
+            "status": status,
+            "duration_ms": round(duration_ms, 1),
+            "error": error,
+        })
+
+    def note(self, line: str) -> None:
+        self.diagnostics.append(line)
+
+    def finish(self, error: Optional[str] = None) -> None:
+        self._duration_ms = (time.monotonic() - self._started_monotonic) * 1000
+        self.finished_at = datetime.now()
+        self.status = "failed" if error else "success"
+        self.error = error
+
+    def to_dict(self, include_statements: bool = True) -> Dict[str, Any]:
+        data = {
+            "request_id": self.request_id,
+            "query_filename": self.query_filename,
+            "connection_name": self.connection_name,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration_ms": round(self._duration_ms, 1) if self._duration_ms is not None else None,
+            "statement_count": len(self.statements),
+            "error": self.error,
+        }
+        if include_statements:
+            data["statements"] = list(self.statements)
+            data["diagnostics"] = list(self.diagnostics)
+        return data
+
+    def to_text(self) -> str:
+        """Formato testuale per il salvataggio su disco in modalità debug"""
+        lines = [
+            f"REQUEST_ID={self.request_id}",
+            f"QUERY={self.query_filename}",
+            f"CONNECTION={self.connection_name}",
+            f"STATUS={self.status}",
+            f"STARTED_AT={self.started_at.isoformat()}",
+        ]
+        if self.error:
+            lines.append(f"ERROR={self.error}")
+        for stmt in self.statements:
+            lines.append("")
+            lines.append(f"-- step {stmt['step']} | {stmt['status']} | {stmt['duration_ms']}ms"
+                         + (f" | {stmt['error']}" if stmt["error"] else ""))
+            if stmt["binds"]:
+                lines.append(f"-- binds: {stmt['binds']}")
+            lines.append(stmt["sql"] + ";")
+        if self.diagnostics:
+            lines.append("")
+            lines.extend(self.diagnostics)
+        return "\n".join(lines) + "\n"
+
+
+class ExecutionTraceBuffer:
+    """Buffer circolare delle tracce più recenti, indicizzato per request id"""
+
+    def __init__(self, max_entries: int = 100, enabled: bool = False, debug_dir: Optional[Path] = None):
+        self.max_entries = max(1, int(max_entries))
+        self.enabled = enabled
+        # Cartella di salvataggio delle tracce concluse (solo con DEBUG attivo)
+        self.debug_dir = Path(debug_dir) if debug_dir else None
+        self._traces: "OrderedDict[str, ExecutionTrace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, request_id: str, query_filename: str, connection_name: str) -> Optional[ExecutionTrace]:
+        """Nuova traccia nel buffer; None se le tracce sono disattivate"""
+        if not self.enabled:
+            return None
+        trace = ExecutionTrace(request_id, query_filename, connection_name)
+        with self._lock:
+            self._traces.pop(request_id, None)
+            self._traces[request_id] = trace
+            while len(self._traces) > self.max_entries:
+                self._traces.popitem(last=False)
+        return trace
+
+    def finish(self, trace: Optional[ExecutionTrace], error: Optional[str] = None) -> None:
+        if trace is None:
+            return
+        trace.finish(error)
+        if self.debug_dir is not None:
+            self._flush(trace)
+
+    def get(self, request_id: str) -> Optional[ExecutionTrace]:
+        with self._lock:
+            return self._traces.get(request_id)
+
+    def recent(self, limit: int = 50) -> List[ExecutionTrace]:
+        """Tracce più recenti per prime"""
+        with self._lock:
+            traces = list(self._traces.values())
+        return traces[::-1][:max(0, int(limit))]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._traces.clear()
+
+    def _flush(self, trace: ExecutionTrace) -> None:
+        try:
+            self.debug_dir.mkdir(parents=True, exist_ok=True)
+            path = self.debug_dir / f"{_SAFE_ID.sub('_', trace.request_id)}.txt"
+            path.write_text(trace.to_text(), encoding="utf-8")
+        except Exception as e:
+            logger.error(f"[QUERY_TRACE][{trace.request_id}] Impossibile salvare la traccia: {e}")
+
+
+def _preview(value: Any) -> Any:
+    """Valore di una bind in forma compatta (le liste riportano solo la dimensione)"""
+    values = getattr(value, "values", None)
+    if isinstance(values, (list, tuple)):
+        return f"<lista {len(values)} elementi>"
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    text = str(value)
+    return text if len(text) <= _VALUE_PREVIEW_CHARS else text[:_VALUE_PREVIEW_CHARS] + "..."
+
+
+_execution_traces: Optional[ExecutionTraceBuffer] = None
+_execution_traces_lock = threading.Lock()
+
+
+def get_execution_traces() -> ExecutionTraceBuffer:
+    """Ottiene il buffer delle tracce condiviso (singleton)"""
+    global _execution_traces
+    if _execution_traces is None:
+        with _execution_traces_lock:
+            if _execution_traces is None:
+                settings = get_settings()
+                debug = getattr(settings, "debug", False) is True
+                _execution_traces = ExecutionTraceBuffer(
+                    max_entries=getattr(settings, "query_trace_max_entries", 100),
+                    enabled=getattr(settings, "query_trace_enabled", False) is True or debug,
+                    debug_dir=Path(settings.log_dir) / "query_traces" if debug else None,
+                )
+    return _execution_traces
@@ -0,0 +1,593 @@
+"""
+Export dei risultati query su file (XLSX, Parquet, Arrow IPC, CSV).
+
+Le righe vengono lette dal cursore a blocchi (QueryService.stream_query) e scritte
+direttamente nel file, senza passare da liste di dizionari o DataFrame pandas:
+l'occupazione di memoria resta costante qualunque sia il numero di righe.
+
+Per il CSV le righe vengono anche inoltrate mentre sono lette: CsvChunkChannel
+collega il worker del pool query (che legge il cursore e produce i blocchi CSV,
+eventualmente compressi gzip) alla risposta HTTP sull'event loop, così il client
+riceve i primi byte mentre il database sta ancora inviando righe.
+"""
+import asyncio
+import csv
+import io
+import threading
+import time
+import zlib
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import xlsxwriter
+from loguru import logger
+
+from app.models.queries import QueryExecutionRequest, QueryExecutionResult
+from app.services.query_service import QueryExecutionError
+
+
+# Limite Excel: 1.048.576 righe per foglio, compresa l'intestazione
+EXCEL_MAX_ROWS = 1048576
+
+# Oltre 15 cifre significative Excel perde precisione: questi interi vengono scritti come testo
+_MAX_EXACT_INT = 10 ** 15
+
+
+class XlsxStreamWriter:
+    """Writer XLSX a memoria costante (xlsxwriter in modalità constant_memory).
+
+    Ogni riga viene scritta su disco appena ricevuta; al raggiungimento del
+    limite di righe di Excel viene aperto un nuovo foglio (Sheet2, Sheet3, ...)
+    con la stessa intestazione. I valori mantengono il tipo: numeri (int, float,
+    Decimal) come celle numeriche, date e timestamp come celle data formattate.
+    """
+
+    def __init__(self, path, column_names: Sequence[str], max_rows_per_sheet: int = EXCEL_MAX_ROWS):
+        self.path = Path(path)
+        self.column_names = [str(c) for c in column_names]
+        self.max_rows_per_sheet = max(2, int(max_rows_per_sheet))
+        self.rows_written = 0
+        self.sheet_count = 0
+        self.write_seconds = 0.0
+        self._workbook = xlsxwriter.Workbook(str(self.path), {
+            'constant_memory': True,
+            'remove_timezone': True,
+            'strings_to_numbers': False,
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+        })
+        self._header_format = self._workbook.add_format({'bold': True})
+        self._datetime_format = self._workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+        self._date_format = self._workbook.add_format({'num_format': 'yyyy-mm-dd'})
+        self._time_format = self._workbook.add_format({'num_format': 'hh:mm:ss'})
+        self._worksheet = None
+        self._sheet_row = 0
+        self._new_sheet()
+
+    def _new_sheet(self) -> None:
+        self.sheet_count += 1
+        self._worksheet = self._workbook.add_worksheet(f"Sheet{self.sheet_count}")
+        for col, name in enumerate(self.column_names):
+            self._worksheet.write_string(0, col, name, self._header_format)
+        self._sheet_row = 1
+        if self.sheet_count > 1:
+            logger.info(f"[EXPORT] Limite righe foglio raggiunto, nuovo foglio Sheet{self.sheet_count}")
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        """Scrive un blocco di righe (sequenze di valori nell'ordine delle colonne)"""
+        started = time.perf_counter()
+        for row in rows:
+            if self._sheet_row >= self.max_rows_per_sheet:
+                self._new_sheet()
+            for col, value in enumerate(row):
+                self._write_cell(self._sheet_row, col, value)
+            self._sheet_row += 1
+            self.rows_written += 1
+        self.write_seconds += time.perf_counter() - started
+
+    def _write_cell(self, row: int, col: int, value: Any) -> None:
+        ws = self._worksheet
+        if value is None:
+            return
+        if isinstance(value, bool):
+            ws.write_boolean(row, col, value)
+        elif isinstance(value, int):
+            if abs(value) >= _MAX_EXACT_INT:
+                ws.write_string(row, col, str(value))
+            else:
+                ws.write_number(row, col, value)
+        elif isinstance(value, float):
+            if value != value or value in (float('inf'), float('-inf')):
+                ws.write_string(row, col, str(value))
+            else:
+                ws.write_number(row, col, value)
+        elif isinstance(value, Decimal):
+            # NUMBER Oracle: interi lunghi (es. barcode) restano testo per non perdere cifre
+            if not value.is_finite() or (value == value.to_integral_value() and abs(value) >= _MAX_EXACT_INT):
+                ws.write_string(row, col, str(value))
+            else:
+                ws.write_number(row, col, float(value))
+        elif isinstance(value, datetime):
+            ws.write_datetime(row, col, value, self._datetime_format)
+        elif isinstance(value, date):
+            ws.write_datetime(row, col, value, self._date_format)
+        elif isinstance(value, dt_time):
+            ws.write_datetime(row, col, value, self._time_format)
+        elif isinstance(value, timedelta):
+            ws.write_string(row, col, str(value))
+        elif isinstance(value, str):
+            ws.write_string(row, col, value)
+        elif isinstance(value, (bytes, bytearray)):
+            ws.write_string(row, col, value.hex())
+        else:
+            # LOB e tipi non gestiti: testo
+            read = getattr(value, 'read', None)
+            ws.write_string(row, col, str(read() if callable(read) else value))
+
+    def close(self) -> None:
+        started = time.perf_counter()
+        self._workbook.close()
+        self.write_seconds += time.perf_counter() - started
+
+
+# Tipi DB-API (oracledb DbType.name / OID PostgreSQL) -> tipo Arrow; NUMBER viene gestito a parte
+_ORACLE_ARROW_TYPES = {
+    'DB_TYPE_BINARY_FLOAT': 'float64',
+    'DB_TYPE_BINARY_DOUBLE': 'float64',
+    'DB_TYPE_BINARY_INTEGER': 'int64',
+    'DB_TYPE_DATE': 'timestamp_s',
+    'DB_TYPE_TIMESTAMP': 'timestamp_us',
+    'DB_TYPE_TIMESTAMP_TZ': 'timestamp_us',
+    'DB_TYPE_TIMESTAMP_LTZ': 'timestamp_us',
+    'DB_TYPE_VARCHAR': 'string',
+    'DB_TYPE_NVARCHAR': 'string',
+    'DB_TYPE_CHAR': 'string',
+    'DB_TYPE_NCHAR': 'string',
+    'DB_TYPE_LONG': 'string',
+    'DB_TYPE_CLOB': 'string',
+    'DB_TYPE_NCLOB': 'string',
+    'DB_TYPE_ROWID': 'string',
+    'DB_TYPE_RAW': 'binary',
+    'DB_TYPE_LONG_RAW': 'binary',
+    'DB_TYPE_BLOB': 'binary',
+    'DB_TYPE_BOOLEAN': 'bool',
+}
+_POSTGRES_ARROW_TYPES = {
+    16: 'bool', 20: 'int64', 21: 'int64', 23: 'int64', 700: 'float64', 701: 'float64',
+    1082: 'date', 1114: 'timestamp_us', 1184: 'timestamp_us', 25: 'string', 1042: 'string', 1043: 'string',
+    17: 'binary',
+}
+
+# Formati Arrow supportati: estensione file -> media type
+ARROW_FORMATS = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return pyarrow
+    except ImportError as e:
+        raise QueryExecutionError("Libreria pyarrow non installata. Installa con: pip install pyarrow") from e
+
+
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _arrow_type(pa, name: str):
+    return {
+        'bool': pa.bool_(),
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'date': pa.date32(),
+        'timestamp_s': pa.timestamp('s'),
+        'timestamp_us': pa.timestamp('us'),
+        'string': pa.string(),
+        'binary': pa.binary(),
+    }[name]
+
+
+def _type_from_description(pa, entry, values: Sequence[Any] = ()) -> Optional[Any]:
+    """Tipo Arrow da una voce di cursor.description (None se non determinabile).
+    I numerici senza precisione (NUMBER, numeric) vengono tipizzati dai valori del primo blocco.
+    """
+    if not entry or len(entry) < 2 or entry[1] is None:
+        return None
+    type_code = entry[1]
+    precision = entry[4] if len(entry) > 4 else None
+    scale = entry[5] if len(entry) > 5 else None
+    type_name = getattr(type_code, 'name', None)
+    if type_name == 'DB_TYPE_NUMBER' or (isinstance(type_code, int) and type_code == 1700):
+        return _numeric_type(pa, precision, scale, values)
+    if type_name in _ORACLE_ARROW_TYPES:
+        return _arrow_type(pa, _ORACLE_ARROW_TYPES[type_name])
+    if isinstance(type_code, int) and type_code in _POSTGRES_ARROW_TYPES:
+        return _arrow_type(pa, _POSTGRES_ARROW_TYPES[type_code])
+    return None
+
+
+def _numeric_type(pa, precision: Optional[int], scale: Optional[int], values: Sequence[Any]):
+    """NUMBER(p,s) / numeric(p,s): int64 o decimal esatto, mai float64 (ID e importi senza arrotondamenti)"""
+    if precision and 0 < precision <= 38 and scale is not None and 0 <= scale <= 38:
+        if scale == 0 and precision <= 18:
+            return pa.int64()
+        return pa.decimal128(max(precision, scale), scale)
+    # NUMBER senza precisione (precision 0, scale -127) o numeric non vincolato: tipo dai valori
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, int) and not isinstance(v, bool) and _INT64_MIN <= v <= _INT64_MAX
+                       for v in present):
+        return pa.int64()
+    integer_digits, fraction_digits = 1, 0
+    for value in present:
+        try:
+            sign, digits, exponent = Decimal(value if isinstance(value, (int, Decimal)) else str(value)).as_tuple()
+        except (ArithmeticError, TypeError, ValueError):
+            return pa.string()
+        if not isinstance(exponent, int):
+            return pa.string()  # NaN / Infinity
+        fraction_digits = max(fraction_digits, -exponent)
+        integer_digits = max(integer_digits, len(digits) + exponent)
+    if not present or integer_digits + fraction_digits > 38:
+        return pa.string()
+    return pa.decimal128(38, fraction_digits)
+
+
+def _type_from_values(pa, values: List[Any]):
+    """Tipo Arrow dedotto dai valori (driver senza tipi nella description, es. SQLite)"""
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            kinds.add('bool')
+        elif isinstance(value, int):
+            kinds.add('int64')
+        elif isinstance(value, (float, Decimal)):
+            kinds.add('float64')
+        elif isinstance(value, datetime):
+            kinds.add('timestamp_us')
+        elif isinstance(value, date):
+            kinds.add('date')
+        elif isinstance(value, (bytes, bytearray)):
+            kinds.add('binary')
+        else:
+            kinds.add('string')
+    if kinds == {'int64', 'float64'}:
+        return pa.float64()
+    if len(kinds) == 1:
+        return _arrow_type(pa, kinds.pop())
+    return pa.string()
+
+
+def _arrow_value(value: Any, arrow_type, pa) -> Any:
+    if value is None:
+        return None
+    read = getattr(value, 'read', None)
+    if callable(read):
+        value = read()
+    if pa.types.is_string(arrow_type) and not isinstance(value, str):
+        return value.isoformat() if isinstance(value, (datetime, date)) else str(value)
+    if pa.types.is_decimal(arrow_type) and not isinstance(value, Decimal):
+        return Decimal(str(value))
+    if pa.types.is_floating(arrow_type) and isinstance(value, Decimal):
+        return float(value)
+    if pa.types.is_timestamp(arrow_type) and isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+class ArrowStreamWriter:
+    """Writer Parquet / Arrow IPC a blocchi (un record batch per blocco di fetch).
+
+    Lo schema è ricavato da cursor.description (NUMBER, DATE, TIMESTAMP Oracle
+    diventano int64/decimal e timestamp; NUMBER senza precisione è tipizzato dai
+    valori del primo blocco); per i driver che non espongono i tipi viene dedotto
+    dai valori del primo blocco di righe.
+    """
+
+    def __init__(self, path, column_names: Sequence[str], file_format: str = 'parquet',
+                 description: Optional[List[tuple]] = None):
+        if file_format not in ARROW_FORMATS:
+            raise ValueError(f"Formato Arrow non supportato: {file_format}")
+        self._pa = _import_pyarrow()
+        self.path = Path(path)
+        self.file_format = file_format
+        self.column_names = [str(c) for c in column_names]
+        self.rows_written = 0
+        self.write_seconds = 0.0
+        self._description = description
+        self._schema = None
+        self._writer = None
+
+    def _build_schema(self, rows: List[Sequence[Any]]) -> None:
+        pa = self._pa
+        fields = []
+        for i, name in enumerate(self.column_names):
+            entry = self._description[i] if self._description and i < len(self._description) else None
+            values = [row[i] for row in rows]
+            arrow_type = _type_from_description(pa, entry, values) or _type_from_values(pa, values)
+            fields.append(pa.field(name, arrow_type))
+        self._schema = pa.schema(fields)
+        if self.file_format == 'parquet':
+            self._writer = pa.parquet.ParquetWriter(str(self.path), self._schema, compression='snappy')
+        else:
+            self._writer = pa.ipc.new_file(str(self.path), self._schema)
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        """Scrive un blocco di righe come record batch"""
+        started = time.perf_counter()
+        rows = list(rows)
+        if self._schema is None:
+            self._build_schema(rows)
+        if rows:
+            pa = self._pa
+            arrays = []
+            for i, field in enumerate(self._schema):
+                values = [_arrow_value(row[i] if i < len(row) else None, field.type, pa) for row in rows]
+                try:
+                    arrays.append(pa.array(values, type=field.type))
+                except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError) as e:
+                    raise QueryExecutionError(f"Valore non compatibile con il tipo {field.type} della colonna {field.name}: {e}") from e
+            # Parquet: un row group per blocco di fetch; Arrow IPC: un record batch
+            self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self._schema))
+            self.rows_written += len(rows)
+        self.write_seconds += time.perf_counter() - started
+
+    def close(self) -> None:
+        started = time.perf_counter()
+        if self._schema is None:
+            # Nessuna riga: file con il solo schema
+            self._build_schema([])
+        self._writer.close()
+        self.write_seconds += time.perf_counter() - started
+
+
+# Formati file per export e schedulazioni
+EXPORT_FILE_FORMATS = ('xlsx',) + tuple(ARROW_FORMATS)
+
+
+def create_file_writer(path, column_names: Sequence[str], file_format: str = 'xlsx',
+                       description: Optional[List[tuple]] = None, max_rows_per_sheet: int = EXCEL_MAX_ROWS):
+    """Crea il writer a blocchi per il formato richiesto (xlsx, parquet, arrow)"""
+    if file_format == 'xlsx':
+        return XlsxStreamWriter(path, column_names, max_rows_per_sheet=max_rows_per_sheet)
+    return ArrowStreamWriter(path, column_names, file_format=file_format, description=description)
+
+
+def write_records(path, column_names: Optional[List[str]], records: List[Dict[str, Any]],
+                  file_format: str = 'xlsx', max_rows_per_sheet: int = EXCEL_MAX_ROWS):
+    """Scrive su file un risultato già materializzato (lista di dizionari, es. QueryExecutionResult.data)"""
+    columns = list(column_names or [])
+    if not columns and records:
+        columns = list(records[0].keys())
+    writer = create_file_writer(path, columns, file_format, max_rows_per_sheet=max_rows_per_sheet)
+    try:
+        writer.write_rows([record.get(c) for c in columns] for record in records)
+    finally:
+        writer.close()
+    return writer
+
+
+def export_query_to_file(query_service, request: QueryExecutionRequest, path, file_format: str = 'xlsx',
+                         max_rows_per_sheet: int = EXCEL_MAX_ROWS) -> Tuple[QueryExecutionResult, float]:
+    """Esegue la query e scrive le righe in streaming sul file indicato (xlsx, parquet, arrow).
+
+    Restituisce (risultato senza dati, secondi spesi in scrittura). In caso di errore
+    il file parziale viene rimosso e il risultato riporta success=False.
+    """
+    started = time.perf_counter()
+    path = Path(path)
+    writer = None
+    try:
+        with query_service.stream_query(request) as stream:
+            writer = create_file_writer(
+                path, stream.column_names, file_format,
+                description=getattr(stream, 'description', None), max_rows_per_sheet=max_rows_per_sheet,
+            )
+            try:
+                for batch in stream.iter_batches():
+                    writer.write_rows(batch)
+            finally:
+                writer.close()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        sheets = f" fogli={writer.sheet_count}" if file_format == 'xlsx' else ""
+        logger.info(
+            f"[EXPORT] {file_format.upper()} {request.query_filename}: righe={writer.rows_written}{sheets} "
+            f"durata={elapsed_ms:.0f}ms scrittura={writer.write_seconds:.2f}s"
+        )
+        return QueryExecutionResult(
+            query_filename=request.query_filename,
+            connection_name=request.connection_name,
+            column_names=writer.column_names,
+            data=[],
+            row_count=writer.rows_written,
+            execution_time_ms=elapsed_ms,
+            success=True,
+        ), writer.write_seconds
+    except Exception as e:
+        message = str(e) if isinstance(e, QueryExecutionError) else f"Errore generico: {str(e)}"
+        logger.error(f"[EXPORT] Export {file_format.upper()} {request.query_filename} fallito: {message}")
+        try:
+            path.unlink(missing_ok=True)
+        except Exception:
+            pass
+        return QueryExecutionResult(
+            query_filename=request.query_filename,
+            connection_name=request.connection_name,
+            column_names=[],
+            data=[],
+            row_count=0,
+            execution_time_ms=(time.perf_counter() - started) * 1000,
+            success=False,
+            error_message=message,
+        ), writer.write_seconds if writer else 0.0
+
+
+class ExportAborted(Exception):
+    """Export interrotto: il client ha chiuso la connessione"""
+
+
+# Marcatore di fine stream nel canale CSV
+CSV_END = object()
+
+
+class CsvChunkChannel:
+    """Canale limitato tra il thread che legge il cursore e l'event loop che invia la risposta.
+
+    Il produttore si blocca quando il consumer è indietro di `maxsize` blocchi
+    (backpressure verso il database); se il consumer chiude il canale, la put
+    successiva solleva ExportAborted e la lettura del cursore si interrompe.
+    Se il consumer non preleva nulla per `stall_timeout` secondi (client sparito
+    prima dell'invio della risposta) la put solleva comunque ExportAborted, così
+    connessione, worker e lease non restano occupati.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int = 8, stall_timeout: float = 300.0):
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, int(maxsize)))
+        self._closed = threading.Event()
+        self.stall_timeout = stall_timeout
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def put(self, item: Any) -> None:
+        """Invia un elemento dal thread produttore (bloccante finché c'è posto)"""
+        if self.closed:
+            raise ExportAborted()
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+        started = time.monotonic()
+        while True:
+            try:
+                future.result(timeout=min(0.5, self.stall_timeout))
+                return
+            except FutureTimeoutError:
+                stalled = time.monotonic() - started >= self.stall_timeout
+                if self.closed or stalled:
+                    future.cancel()
+                    if stalled:
+                        logger.warning(f"[EXPORT] Nessuna lettura dal client da {self.stall_timeout:.0f}s: export interrotto")
+                        self.close()
+                    raise ExportAborted()
+
+    def put_nowait(self, item: Any) -> None:
+        """Invia un elemento senza attendere (per segnalazioni di errore da callback)"""
+        def _put() -> None:
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                pass
+        try:
+            self._loop.call_soon_threadsafe(_put)
+        except RuntimeError:
+            # Event loop già chiuso
+            pass
+
+    async def get(self) -> Any:
+        return await self._queue.get()
+
+    def close(self) -> None:
+        self._closed.set()
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    read = getattr(value, 'read', None)
+    if callable(read):
+        return read()
+    return value
+
+
+def iter_csv_chunks(column_names: Sequence[str], batches: Iterable[Sequence[Sequence[Any]]],
+                    compress: bool = False, delimiter: str = ';') -> Iterator[bytes]:
+    """Converte blocchi di righe in blocchi CSV UTF-8 (intestazione compresa).
+    Con `compress` l'output è un unico stream gzip prodotto in modo incrementale.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator='\n')
+
+    def _drain() -> bytes:
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(column_names)
+    chunk = _drain()
+    if chunk:
+        yield chunk
+    for batch in batches:
+        writer.writerows([_csv_value(v) for v in row] for row in batch)
+        chunk = _drain()
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+def stream_csv_export(query_service, request: QueryExecutionRequest, channel: CsvChunkChannel,
+                      compress: bool = False, tmp_path=None, final_path=None) -> int:
+    """Esegue la query e invia il CSV al canale blocco per blocco (da eseguire sul pool query).
+
+    Il primo elemento inviato è la lista dei nomi colonna (query avviata), poi i
+    blocchi di byte e infine CSV_END; un errore viene inviato come eccezione. Se
+    `tmp_path` è indicato, gli stessi byte vengono scritti su disco e il file viene
+    spostato in `final_path` a export completato. Restituisce il numero di righe.
+    """
+    started = time.perf_counter()
+    tmp_path = Path(tmp_path) if tmp_path else None
+    row_count = 0
+    tee = None
+    try:
+        with query_service.stream_query(request) as stream:
+            channel.put(list(stream.column_names))
+            if tmp_path:
+                tee = open(tmp_path, 'wb')
+            for chunk in iter_csv_chunks(stream.column_names, stream.iter_batches(), compress=compress):
+                if tee:
+                    tee.write(chunk)
+                channel.put(chunk)
+            row_count = stream.row_count
+        if tee:
+            tee.close()
+            tee = None
+            Path(tmp_path).replace(final_path)
+            logger.info(f"[EXPORT] MOVE_OK {tmp_path} -> {final_path}")
+        logger.info(
+            f"[EXPORT] CSV {request.query_filename}: righe={row_count} gzip={compress} "
+            f"durata={(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+        channel.put(CSV_END)
+        return row_count
+    except ExportAborted:
+        logger.warning(f"[EXPORT] CSV {request.query_filename} interrotto dal client")
+        raise
+    except Exception as e:
+        message = str(e) if isinstance(e, QueryExecutionError) else f"Errore generico: {str(e)}"
+        logger.error(f"[EXPORT] Export CSV {request.query_filename} fallito: {message}")
+        if not channel.closed:
+            try:
+                channel.put(QueryExecutionError(message))
+            except ExportAborted:
+                pass
+        raise
+    finally:
+        if tee:
+            tee.close()
+        if tmp_path and tmp_path.exists():
+            try:
+                tmp_path.unlink()
+            except Exception:
+                pass
@@ -0,0 +1,164 @@
+"""
+Pool nativo oracledb per gli engine Oracle.
+
+In modalità "native" l'engine SQLAlchemy non gestisce un proprio pool
+(NullPool) ma prende le connessioni da `oracledb.create_pool`: le sessioni
+vengono verificate solo se inattive da più di `ping_interval` secondi (niente
+round trip di pre-ping a ogni checkout), lo statement cache è per sessione e le
+istruzioni di inizializzazione (ALTER SESSION ...) girano una sola volta alla
+creazione della sessione tramite session_callback. Con DRCP le sessioni
+arrivano dal pool lato server (server_type=pooled, cclass/purity).
+
+Le opzioni arrivano dai settings (ORACLE_POOL_*) e possono essere sovrascritte
+per singola connessione con la chiave "pool" in connections.json, es.:
+    "pool": {"max": 4, "drcp": true, "cclass": "PSTT", "purity": "self"}
+"""
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from loguru import logger
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.pool import NullPool
+
+from app.core.config import get_settings
+
+
+POOL_MODES = ("native", "sqlalchemy")
+
+# Pool oracledb associato a ogni engine nativo (per stato e chiusura)
+_native_pools: "weakref.WeakKeyDictionary[Engine, Any]" = weakref.WeakKeyDictionary()
+
+# Intervallo di ritentativo della chiusura di un pool dismesso con connessioni in uso
+RETIRE_POLL_SEC = 5.0
+
+
+def oracle_pool_options(overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """Opzioni del pool Oracle: default dai settings, sovrascritti dalla chiave "pool" della connessione"""
+    settings = get_settings()
+    options: Dict[str, Any] = {
+        "mode": getattr(settings, "oracle_pool_mode", "native"),
+        "min": getattr(settings, "oracle_pool_min", 1),
+        "max": getattr(settings, "oracle_pool_max", 8),
+        "increment": getattr(settings, "oracle_pool_increment", 1),
+        "ping_interval": getattr(settings, "oracle_pool_ping_interval_sec", 60),
+        "wait_timeout": getattr(settings, "oracle_pool_wait_timeout_sec", 30),
+        "stmtcachesize": getattr(settings, "oracle_stmtcachesize", 50),
+        "session_statements": getattr(settings, "oracle_session_statements", None),
+        "drcp": False,
+        "cclass": None,
+        "purity": "self",
+    }
+    options.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    mode = str(options["mode"] or "native").lower()
+    if mode not in POOL_MODES:
+        logger.warning(f"Modalità pool Oracle non valida '{mode}': uso native")
+        mode = "native"
+    options["mode"] = mode
+    options["session_statements"] = _statement_list(options["session_statements"])
+    return options
+
+
+def session_callback(statements: List[str]) -> Optional[Callable[[Any, Optional[str]], None]]:
+    """Callback eseguita da oracledb solo quando crea una nuova sessione (non a ogni acquire)"""
+    if not statements:
+        return None
+
+    def _init_session(connection, requested_tag) -> None:
+        cursor = connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    return _init_session
+
+
+def create_native_engine(oracledb, connect_params: Dict[str, Any], options: Dict[str, Any],
+                         connection_name: str) -> Engine:
+    """Engine SQLAlchemy (NullPool) alimentato da oracledb.create_pool"""
+    pool_kwargs: Dict[str, Any] = dict(
+        min=max(0, int(options["min"])),
+        max=max(1, int(options["max"])),
+        increment=max(1, int(options["increment"])),
+        ping_interval=int(options["ping_interval"]),
+        stmtcachesize=max(0, int(options["stmtcachesize"])),
+        getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+        wait_timeout=max(0, int(float(options["wait_timeout"]) * 1000)),
+        session_callback=session_callback(options["session_statements"]),
+        **connect_params,
+    )
+    if options.get("drcp"):
+        pool_kwargs["server_type"] = "pooled"
+        pool_kwargs["cclass"] = options.get("cclass") or "PSTT_TOOL"
+        pool_kwargs["purity"] = oracledb.PURITY_NEW if str(options.get("purity")).lower() == "new" else oracledb.PURITY_SELF
+    pool = oracledb.create_pool(**pool_kwargs)
+    logger.info(
+        f"🏊 Pool oracledb per {connection_name}: min={pool_kwargs['min']} max={pool_kwargs['max']} "
+        f"ping_interval={pool_kwargs['ping_interval']}s stmtcache={pool_kwargs['stmtcachesize']}"
+        + (f" DRCP cclass={pool_kwargs['cclass']}" if options.get("drcp") else "")
+    )
+    engine = create_engine("oracle+oracledb://", creator=pool.acquire, poolclass=NullPool, future=True)
+    _native_pools[engine] = pool
+
+    @event.listens_for(engine, "engine_disposed")
+    def _close_pool(disposed_engine) -> None:
+        retire_pool(pool, connection_name)
+
+    return engine
+
+
+def retire_pool(pool, connection_name: str) -> None:
+    """Chiude il pool senza interrompere le sessioni in uso.
+
+    Con connessioni ancora occupate (query di altri utenti o job in corso) il pool
+    resta aperto e la chiusura viene ritentata ogni RETIRE_POLL_SEC secondi, finché
+    l'ultima connessione non è rientrata.
+    """
+    try:
+        pool.close()
+        logger.info(f"Pool oracledb {connection_name} chiuso")
+        return
+    except Exception as e:
+        try:
+            busy = pool.busy
+        except Exception:
+            busy = 0
+        if not busy:
+            logger.warning(f"Errore nella chiusura del pool oracledb {connection_name}: {e}")
+            return
+    logger.info(f"Pool oracledb {connection_name} in dismissione: {busy} connessioni ancora in uso")
+    timer = threading.Timer(RETIRE_POLL_SEC, retire_pool, args=(pool, connection_name))
+    timer.daemon = True
+    timer.start()
+
+
+def native_pool(engine: Engine) -> Optional[Any]:
+    """Pool oracledb dell'engine (None se l'engine usa il pool SQLAlchemy)"""
+    return _native_pools.get(engine)
+
+
+def native_pool_status(pool) -> Dict[str, Any]:
+    """Stato del pool oracledb nello stesso formato di get_pool_status"""
+    opened = pool.opened
+    busy = pool.busy
+    return {
+        "pool_mode": "native",
+        "pool_size": pool.max,
+        "min": pool.min,
+        "opened": opened,
+        "checked_in": opened - busy,
+        "checked_out": busy,
+        "overflow": 0,
+        "status": "healthy" if busy < pool.max else "warning",
+    }
+
+
+def _statement_list(value: Any) -> List[str]:
+    """Istruzioni di sessione da lista o stringa separata da |"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split("|")
+    return [s.strip().rstrip(";").strip() for s in value if isinstance(s, str) and s.strip()]
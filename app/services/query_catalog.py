@@ -0,0 +1,417 @@
+"""
+Catalogo in memoria dei file query (.sql).
+
+Indicizza i file per nome e conserva il QueryInfo già parsato, associato alla
+chiave (percorso, mtime, dimensione): un file viene riletto e riparsato solo se
+cambia. La lista e la ricerca per nome non percorrono più la cartella Query a ogni
+richiesta; la scansione (solo stat, senza lettura dei file invariati) viene
+ripetuta al massimo ogni `rescan_interval_sec` secondi per rilevare file nuovi o
+rimossi, oppure subito quando un nome richiesto non è presente nell'indice.
+
+Quando il catalogo è sorvegliato da un watcher (`watched = True`) le scansioni
+periodiche e quelle su nome sconosciuto non vengono più eseguite: l'indice è
+aggiornato da `refresh()` sui soli percorsi modificati.
+
+I collegamenti (.lnk di Windows e link simbolici a file .sql) sono risolti una
+sola volta, finché il collegamento non cambia, e indicizzati con il contenuto del
+file di destinazione e la sottocartella del collegamento. Ogni variazione viene
+notificata ai listener registrati con `add_listener()`.
+"""
+import os
+import stat
+import struct
+import threading
+import time
+from pathlib import Path, PureWindowsPath
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from app.models.queries import QueryInfo
+
+
+# Cartelle di lavoro escluse dal catalogo
+_EXCLUDED_DIRS = ("tmp", "_tmp")
+
+# Shell link (MS-SHLLINK): dimensione header e flag usati
+_LNK_HEADER_SIZE = 0x4C
+_LNK_HAS_ID_LIST = 0x01
+_LNK_HAS_LINK_INFO = 0x02
+_LNK_HAS_NAME = 0x04
+_LNK_HAS_RELATIVE_PATH = 0x08
+_LNK_IS_UNICODE = 0x80
+_LNK_VOLUME_ID_AND_LOCAL_BASE_PATH = 0x01
+
+
+def read_shell_link(path: Path) -> Tuple[Optional[str], Optional[str]]:
+    """Legge un collegamento .lnk di Windows: restituisce (percorso locale, percorso relativo)"""
+    data = Path(path).read_bytes()
+    if len(data) < _LNK_HEADER_SIZE or struct.unpack_from("<I", data, 0)[0] != _LNK_HEADER_SIZE:
+        raise ValueError("header shell link non valido")
+    flags = struct.unpack_from("<I", data, 20)[0]
+    pos = _LNK_HEADER_SIZE
+    if flags & _LNK_HAS_ID_LIST:
+        pos += 2 + struct.unpack_from("<H", data, pos)[0]
+
+    local_path = None
+    if flags & _LNK_HAS_LINK_INFO:
+        info_size, header_size, info_flags, _, base_offset, _, suffix_offset = struct.unpack_from("<7I", data, pos)
+        if info_flags & _LNK_VOLUME_ID_AND_LOCAL_BASE_PATH:
+            if header_size >= 0x24:
+                base_unicode, suffix_unicode = struct.unpack_from("<2I", data, pos + 28)
+                local_path = _read_utf16z(data, pos + base_unicode) + _read_utf16z(data, pos + suffix_unicode)
+            else:
+                local_path = _read_ansiz(data, pos + base_offset) + _read_ansiz(data, pos + suffix_offset)
+        pos += info_size
+
+    relative_path = None
+    unicode = bool(flags & _LNK_IS_UNICODE)
+    for flag in (_LNK_HAS_NAME, _LNK_HAS_RELATIVE_PATH):
+        if not flags & flag:
+            continue
+        count = struct.unpack_from("<H", data, pos)[0]
+        size = count * 2 if unicode else count
+        text = data[pos + 2:pos + 2 + size].decode("utf-16-le" if unicode else "cp1252", errors="replace")
+        pos += 2 + size
+        if flag == _LNK_HAS_RELATIVE_PATH:
+            relative_path = text
+    return local_path or None, relative_path or None
+
+
+def _read_ansiz(data: bytes, offset: int) -> str:
+    end = data.index(b"\x00", offset)
+    return data[offset:end].decode("cp1252", errors="replace")
+
+
+def _read_utf16z(data: bytes, offset: int) -> str:
+    end = offset
+    while data[end:end + 2] != b"\x00\x00":
+        end += 2
+    return data[offset:end].decode("utf-16-le", errors="replace")
+
+
+class CatalogChange:
+    """Variazione del catalogo: query nuove o modificate e query rimosse"""
+
+    __slots__ = ("version", "upserted", "removed")
+
+    def __init__(self, version: int, upserted: List[QueryInfo], removed: List[QueryInfo]):
+        self.version = version
+        self.upserted = upserted
+        self.removed = removed
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "upserted": [q.model_dump(mode="json") for q in self.upserted],
+            "removed": [{"filename": q.filename, "subdirectory": q.subdirectory} for q in self.removed],
+        }
+
+
+class _CatalogEntry:
+    """File indicizzato: chiave di validità (mtime, size) e QueryInfo parsato"""
+
+    __slots__ = ("path", "mtime_ns", "size", "info", "alias", "shortcut", "target", "target_name", "source")
+
+    def __init__(self, path: Path, mtime_ns: int, size: int, info: Optional[QueryInfo],
+                 shortcut: bool = False, alias: bool = False):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.info = info
+        self.shortcut = shortcut          # collegamento .lnk (escluso dalla lista predefinita)
+        self.alias = alias or shortcut    # .lnk o link simbolico
+        self.target: Optional[Path] = None
+        self.target_name: Optional[str] = None
+        self.source: Optional[QueryInfo] = None
+
+
+class QueryCatalog:
+    """Indice nome file -> QueryInfo con invalidazione incrementale"""
+
+    def __init__(self, parser: Callable[[Path], Optional[QueryInfo]], rescan_interval_sec: float = 5.0):
+        self._parser = parser
+        self.rescan_interval_sec = max(0.0, float(rescan_interval_sec))
+        self.watched = False
+        self.version = 0
+        self._root: Optional[Path] = None
+        self._entries: Dict[str, _CatalogEntry] = {}
+        self._by_name: Dict[str, str] = {}
+        self._sorted: List[QueryInfo] = []
+        self._sorted_all: List[QueryInfo] = []
+        self._last_scan: Optional[float] = None
+        self._listeners: List[Callable[[CatalogChange], None]] = []
+        self._pending: List[CatalogChange] = []
+        self._lock = threading.RLock()
+        self.parse_count = 0
+        self.scan_count = 0
+
+    def list(self, root: Path, include_aliases: bool = False) -> List[QueryInfo]:
+        """Query del catalogo ordinate per nome file (con i collegamenti .lnk se richiesto)"""
+        with self._lock:
+            self._ensure_fresh(root)
+            result = list(self._sorted_all if include_aliases else self._sorted)
+        self._flush()
+        return result
+
+    def get(self, root: Path, filename: str) -> Optional[QueryInfo]:
+        """QueryInfo per nome file (senza percorso, case-insensitive)"""
+        entry = self._lookup(root, filename)
+        return entry.info if entry else None
+
+    def find_path(self, root: Path, filename: str) -> Optional[Path]:
+        """Percorso del file per nome; per i collegamenti il file di destinazione"""
+        entry = self._lookup(root, filename)
+        return Path(entry.info.full_path) if entry and entry.info else None
+
+    def invalidate(self, path: Optional[Path] = None) -> None:
+        """Segnala una modifica: senza percorso l'intero catalogo viene riscansionato al prossimo accesso"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._last_scan = None
+            else:
+                entry = self._entries.get(str(path))
+                if entry is not None:
+                    entry.mtime_ns = -1
+                if not self.watched:
+                    self._last_scan = None
+
+    def refresh(self, root: Path, paths: Optional[Iterable[Path]] = None) -> None:
+        """Riallinea l'indice: solo i percorsi indicati oppure, senza percorsi, l'intera cartella"""
+        with self._lock:
+            root = Path(root)
+            if self._root != root or self._last_scan is None or paths is None:
+                self._reset(root)
+                self._scan()
+            else:
+                self._refresh_paths(paths)
+        self._flush()
+
+    def add_listener(self, listener: Callable[[CatalogChange], None]) -> None:
+        """Registra una funzione chiamata a ogni variazione del catalogo"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[CatalogChange], None]) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _lookup(self, root: Path, filename: str) -> Optional[_CatalogEntry]:
+        name = (filename or "").lower()
+        with self._lock:
+            self._ensure_fresh(root)
+            key = self._by_name.get(name)
+            if key is not None and not self._validate(key):
+                # File modificato o rimosso non ancora notificato: riallinea quel percorso
+                if self.watched:
+                    self._refresh_paths([self._entries[key].path])
+                else:
+                    self._scan()
+                key = self._by_name.get(name)
+            elif key is None and not self.watched:
+                # Nome sconosciuto: senza watcher riallinea subito l'indice
+                self._scan()
+                key = self._by_name.get(name)
+            entry = self._entries.get(key) if key else None
+        self._flush()
+        return entry
+
+    def _reset(self, root: Path) -> None:
+        if self._root != root:
+            self._root = root
+            self._entries.clear()
+            self._by_name.clear()
+            self._sorted = []
+            self._sorted_all = []
+            self._last_scan = None
+
+    def _ensure_fresh(self, root: Path) -> None:
+        self._reset(Path(root))
+        if self._last_scan is None:
+            self._scan()
+        elif not self.watched and time.monotonic() - self._last_scan >= self.rescan_interval_sec:
+            self._scan()
+
+    def _validate(self, key: str) -> bool:
+        """Controlla con una sola stat che il file indicizzato non sia cambiato"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        try:
+            st = entry.path.stat()
+        except OSError:
+            return False
+        return st.st_mtime_ns == entry.mtime_ns and st.st_size == entry.size
+
+    def _scan(self) -> None:
+        """Percorre la cartella (solo stat) e riparsa i file nuovi o cambiati"""
+        self._last_scan = time.monotonic()
+        self.scan_count += 1
+        root = self._root
+        previous = self._entries
+        seen: Dict[str, _CatalogEntry] = {}
+        if root is not None and root.exists():
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = sorted(d for d in dirnames if d.lower() not in _EXCLUDED_DIRS)
+                for fname in sorted(filenames):
+                    path = Path(dirpath) / fname
+                    entry = self._load(path, previous.get(str(path)))
+                    if entry is not None:
+                        seen[str(path)] = entry
+        self._commit(seen, previous)
+
+    def _refresh_paths(self, paths: Iterable[Path]) -> None:
+        """Aggiorna solo i file indicati; una cartella cambiata richiede la scansione completa"""
+        root = self._root
+        entries = dict(self._entries)
+        for path in paths:
+            path = Path(path)
+            try:
+                parts = path.relative_to(root).parts
+            except ValueError:
+                continue
+            if any(p.lower() in _EXCLUDED_DIRS for p in parts[:-1]):
+                continue
+            key = str(path)
+            if not path.name.lower().endswith((".sql", ".lnk")):
+                prefix = key + os.sep
+                if path.is_dir() or any(k.startswith(prefix) for k in entries):
+                    self._scan()
+                    return
+                continue
+            entry = self._load(path, entries.get(key))
+            if entry is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = entry
+        self._commit(entries, self._entries)
+
+    def _load(self, path: Path, entry: Optional[_CatalogEntry]) -> Optional[_CatalogEntry]:
+        """Voce aggiornata per un percorso: riusa quella esistente se mtime e dimensione non cambiano"""
+        lower = path.name.lower()
+        shortcut = lower.endswith(".lnk")
+        if not shortcut and not lower.endswith(".sql"):
+            return None
+        try:
+            symlink = stat.S_ISLNK(path.lstat().st_mode)
+            st = path.stat()
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+            return entry
+        if shortcut or symlink:
+            entry = _CatalogEntry(path, st.st_mtime_ns, st.st_size, None, shortcut=shortcut, alias=True)
+            self._resolve_alias(entry)
+            return entry
+        return _CatalogEntry(path, st.st_mtime_ns, st.st_size, self._parse(path, self._subdirectory(path)))
+
+    def _resolve_alias(self, entry: _CatalogEntry) -> None:
+        """Risolve la destinazione di un collegamento (una volta, finché il collegamento non cambia)"""
+        path = entry.path
+        if not entry.shortcut:
+            entry.target = Path(os.path.realpath(path))
+            return
+        try:
+            local_path, relative_path = read_shell_link(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"[QUERY_CATALOG] Collegamento non leggibile {path}: {e}")
+            return
+        candidates = []
+        if relative_path:
+            candidates.append(path.parent / relative_path.replace("\\", "/"))
+        if local_path:
+            candidates.append(Path(local_path))
+            # Percorso assoluto di un'altra installazione: riporta la parte dopo la cartella Query sotto la radice
+            parts = PureWindowsPath(local_path).parts
+            lowered = [p.lower() for p in parts]
+            root_name = self._root.name.lower()
+            if root_name in lowered:
+                idx = len(lowered) - 1 - lowered[::-1].index(root_name)
+                candidates.append(self._root.joinpath(*parts[idx + 1:]))
+        for candidate in candidates:
+            if candidate.name.lower().endswith(".sql") and candidate.is_file():
+                entry.target = Path(os.path.normpath(candidate))
+                return
+        # Destinazione spostata: la si cerca per nome file nel catalogo
+        name = PureWindowsPath(local_path or relative_path or "").name
+        if name.lower().endswith(".sql"):
+            entry.target_name = name.lower()
+        else:
+            logger.warning(f"[QUERY_CATALOG] Destinazione del collegamento {path} non trovata")
+
+    def _commit(self, entries: Dict[str, _CatalogEntry], previous: Dict[str, _CatalogEntry]) -> None:
+        """Ricostruisce gli indici, collega gli alias e accoda la variazione per i listener"""
+        before = {k: e.info for k, e in previous.items() if not e.shortcut}
+        keys = sorted(entries, key=lambda k: (len(Path(k).parts), k.lower()))
+        by_name: Dict[str, str] = {}
+        for key in keys:
+            if not entries[key].alias:
+                by_name.setdefault(entries[key].path.name.lower(), key)
+        for key in keys:
+            entry = entries[key]
+            if entry.alias:
+                self._link_alias(entry, entries, by_name)
+                name = entry.path.name[:-4] if entry.shortcut else entry.path.name
+                by_name.setdefault(name.lower(), key)
+
+        upserted = [e.info for k, e in entries.items()
+                    if e.info is not None and not e.shortcut and before.get(k) is not e.info]
+        removed = [info for k, info in before.items()
+                   if info is not None and (k not in entries or entries[k].info is None)]
+        self._entries = entries
+        self._by_name = by_name
+        self._sorted_all = sorted((e.info for e in entries.values() if e.info is not None), key=lambda q: q.filename)
+        self._sorted = sorted((e.info for e in entries.values() if e.info is not None and not e.shortcut),
+                              key=lambda q: q.filename)
+        if upserted or removed:
+            self.version += 1
+            self._pending.append(CatalogChange(self.version, upserted, removed))
+            logger.debug(f"[QUERY_CATALOG] {self._root}: {len(entries)} file, {len(upserted)} aggiornati, "
+                         f"{len(removed)} rimossi (versione {self.version})")
+
+    def _link_alias(self, entry: _CatalogEntry, entries: Dict[str, _CatalogEntry], by_name: Dict[str, str]) -> None:
+        target_key = str(entry.target) if entry.target is not None else by_name.get(entry.target_name or "")
+        target = entries.get(target_key) if target_key else None
+        if target is not None and not target.alias:
+            source = target.info
+        elif entry.target is not None and target is None:
+            # Destinazione fuori dalla cartella Query: parsata direttamente
+            source = entry.source or self._parse(entry.target, None)
+        else:
+            source = None
+        if source is None:
+            entry.info = entry.source = None
+        elif source is not entry.source or entry.info is None:
+            entry.source = source
+            entry.info = source.model_copy(update={"subdirectory": self._subdirectory(entry.path)})
+
+    def _flush(self) -> None:
+        """Notifica ai listener le variazioni accodate (fuori dal lock)"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            listeners = list(self._listeners)
+        for change in pending:
+            for listener in listeners:
+                try:
+                    listener(change)
+                except Exception as e:
+                    logger.error(f"[QUERY_CATALOG] Errore nella notifica della variazione: {e}")
+
+    def _subdirectory(self, path: Path) -> str:
+        parts = path.relative_to(self._root).parts[:-1]
+        return "/".join(parts) if parts else ""
+
+    def _parse(self, path: Path, subdirectory: Optional[str]) -> Optional[QueryInfo]:
+        self.parse_count += 1
+        try:
+            info = self._parser(path)
+        except Exception as e:
+            logger.error(f"Errore nel parsing del file {path}: {e}")
+            return None
+        if info is not None and subdirectory is not None:
+            info.subdirectory = subdirectory
+        return info
@@ -0,0 +1,153 @@
+"""
+Query compilate: struttura di un file query calcolata una sola volta per (file, mtime).
+
+Rimozione delle righe `define`, suddivisione in step (`--$STEP n$ -> ...`) e statement,
+pulizia dei terminatori per Oracle, classificazione SELECT/DML e posizione dei
+segnaposto &PARAM non dipendono dai valori dei parametri: vengono calcolati alla
+prima esecuzione e riusati finché il file non cambia. All'esecuzione resta solo la
+composizione del testo con i valori (bind o sostituzione letterale).
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models.queries import QueryInfo
+from app.services.sql_binding import SqlTemplate, compile_sql_template
+from app.services.sql_lexer import split_statements
+
+
+_DEFINE_PATTERN = re.compile(r'define\s+\w+\s*=.*?(?=\n|$)', re.IGNORECASE | re.MULTILINE)
+_STEP_PATTERN = re.compile(r"--\$STEP\s*(\d+)\$\s*->\s*(.*)")
+
+
+def strip_defines(sql_content: str) -> str:
+    """Rimuove le righe `define NOME='valore'`"""
+    return _DEFINE_PATTERN.sub('', sql_content)
+
+
+def sanitize_sql_for_oracle(sql: str) -> str:
+    """Rimuove caratteri speciali non validi alla fine della query per Oracle."""
+    # Rimuove spazi, tab, newline e altri caratteri non stampabili alla fine
+    # Inoltre rimuove eventuali punti e virgola finali o slash (usati in script SQL*Plus)
+    if not isinstance(sql, str):
+        return sql
+    s = sql.rstrip()
+    # Rimuovi ripetutamente i terminatori espliciti di script (;) o slash (/)
+    while s.endswith(';') or s.endswith('/'):
+        s = s[:-1].rstrip()
+    return s
+
+
+def parse_sql_steps(sql_content: str) -> List[Dict[str, Any]]:
+    """Step dello script (marcatori `--$STEP n$ -> descrizione`); senza marcatori un solo step"""
+    matches = list(_STEP_PATTERN.finditer(sql_content))
+    steps = []
+    for i, match in enumerate(matches):
+        start = match.end()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(sql_content)
+        step_sql = sql_content[start:end].strip()
+        steps.append({
+            "number": int(match.group(1)),
+            "description": match.group(2).strip(),
+            "sql": step_sql
+        })
+    if not steps:
+        return [{"number": 1, "description": "Query unica", "sql": sql_content.strip()}]
+    return steps
+
+
+class CompiledStatement:
+    """Statement eseguibile: testo compilato e classificazione"""
+
+    __slots__ = ("template", "is_select", "step", "multi_step", "step_sql")
+
+    def __init__(self, template: SqlTemplate, is_select: bool, step: int, multi_step: bool,
+                 step_sql: Optional[str] = None):
+        self.template = template
+        self.is_select = is_select
+        self.step = step
+        self.multi_step = multi_step
+        # Solo sull'ultimo statement dello step: testo dello step per la diagnostica finale
+        self.step_sql = step_sql
+
+
+class CompiledQuery:
+    """File query pronto per l'esecuzione: step, statement e segnaposto"""
+
+    __slots__ = ("source", "steps", "statements", "multi_step", "last_select", "placeholders")
+
+    def __init__(self, source: str, steps: List[Dict[str, Any]], statements: List[CompiledStatement], multi_step: bool):
+        self.source = source
+        self.steps = steps
+        self.statements = statements
+        self.multi_step = multi_step
+        select_indexes = [i for i, s in enumerate(statements) if s.is_select]
+        # Indice dell'ultimo SELECT (restituito come risultato); len(statements) se assente
+        self.last_select = select_indexes[-1] if select_indexes else len(statements)
+        self.placeholders = tuple(dict.fromkeys(n for s in statements for n in s.template.placeholders))
+
+
+def compile_query(sql_content: str, oracle: bool = False) -> CompiledQuery:
+    """Compila il contenuto di un file query (parametri ancora come &PARAM)"""
+    steps = parse_sql_steps(strip_defines(sql_content))
+    multi_step = not (len(steps) == 1 and steps[0]["description"] == "Query unica")
+    statements: List[CompiledStatement] = []
+    for step in steps:
+        raw_sql = step["sql"]
+        sql_to_execute = raw_sql
+        if multi_step:
+            # Rimuovi punto e virgola finale
+            sql_to_execute = sql_to_execute.rstrip().rstrip(';')
+        if oracle:
+            sql_to_execute = sanitize_sql_for_oracle(sql_to_execute)
+        step["sql"] = sql_to_execute
+        # I driver (oracledb compreso) non accettano più statement in una stringa:
+        # il lexer separa gli statement rispettando stringhe, commenti e blocchi PL/SQL.
+        step_statements = []
+        for stmt in split_statements(raw_sql):
+            text = stmt.text
+            if oracle and not stmt.plsql:
+                text = sanitize_sql_for_oracle(text)
+            if not text:
+                continue
+            step_statements.append(CompiledStatement(
+                compile_sql_template(text), stmt.is_select, step["number"], multi_step
+            ))
+        if step_statements:
+            step_statements[-1].step_sql = sql_to_execute
+        statements.extend(step_statements)
+    return CompiledQuery(sql_content, steps, statements, multi_step)
+
+
+class QueryCompiler:
+    """Cache delle query compilate per (file, mtime, dimensione, dialetto)"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max(1, int(max_entries))
+        self._cache: "OrderedDict[Tuple, CompiledQuery]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.compile_count = 0
+
+    def get(self, query_info: QueryInfo, db_type: Optional[str] = None) -> CompiledQuery:
+        """Query compilata dalla cache; ricompilata se il file è cambiato"""
+        oracle = db_type == "oracle"
+        key = (query_info.full_path, query_info.modified_at, query_info.size_bytes, oracle)
+        content = query_info.sql_content
+        with self._lock:
+            compiled = self._cache.get(key)
+            if compiled is not None and (compiled.source is content or compiled.source == content):
+                self._cache.move_to_end(key)
+                return compiled
+        compiled = compile_query(content, oracle=oracle)
+        with self._lock:
+            self.compile_count += 1
+            self._cache[key] = compiled
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return compiled
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,182 @@
+"""
+Pool dedicato per l'esecuzione delle query sul database.
+
+Le query (sincrone: SQLAlchemy/oracledb) non girano mai sull'event loop di uvicorn:
+vengono eseguite su un ThreadPoolExecutor a dimensione fissa, con un limite di
+esecuzioni contemporanee per connessione. Le richieste oltre il limite restano in
+una coda per connessione (anch'essa limitata) e vengono avviate appena si libera
+uno slot, così una connessione lenta non occupa tutti i worker del pool.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import get_settings
+
+
+class QueryQueueFullError(RuntimeError):
+    """Coda di esecuzione piena per la connessione richiesta"""
+
+
+class _ConnectionSlots:
+    """Stato di una connessione: slot occupati, coda di attesa e contatori"""
+
+    def __init__(self):
+        self.running = 0
+        self.pending: Deque[Tuple[Future, Callable[..., Any], tuple, float]] = deque()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_queued = 0
+        self.total_wait_ms = 0.0
+
+
+class QueryExecutor:
+    """Esecutore limitato delle query con code per connessione"""
+
+    def __init__(self, max_workers: int = 8, per_connection_limit: int = 2, max_queue_per_connection: int = 20):
+        self.max_workers = max(1, int(max_workers))
+        self.per_connection_limit = max(1, int(per_connection_limit))
+        self.max_queue_per_connection = max(0, int(max_queue_per_connection))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pstt-query")
+        self._lock = threading.Lock()
+        self._connections: Dict[str, _ConnectionSlots] = {}
+        logger.info(
+            f"QueryExecutor inizializzato - worker={self.max_workers} "
+            f"per_connessione={self.per_connection_limit} coda_max={self.max_queue_per_connection}"
+        )
+
+    def submit(self, connection_name: str, fn: Callable[..., Any], *args: Any) -> Future:
+        """Accoda `fn(*args)` sulla connessione indicata.
+
+        Restituisce un concurrent.futures.Future (da attendere con asyncio.wrap_future
+        nel codice async). Solleva QueryQueueFullError se la coda della connessione è piena.
+        """
+        future: Future = Future()
+        with self._lock:
+            slots = self._connections.setdefault(connection_name, _ConnectionSlots())
+            if slots.running < self.per_connection_limit:
+                slots.running += 1
+                self._dispatch(connection_name, future, fn, args, time.monotonic())
+            elif len(slots.pending) < self.max_queue_per_connection:
+                slots.pending.append((future, fn, args, time.monotonic()))
+                slots.max_queued = max(slots.max_queued, len(slots.pending))
+                logger.debug(f"[EXECUTOR] {connection_name}: richiesta in coda (in attesa={len(slots.pending)})")
+            else:
+                slots.rejected += 1
+                raise QueryQueueFullError(
+                    f"Troppe query in attesa sulla connessione {connection_name} "
+                    f"({len(slots.pending)} in coda, {slots.running} in esecuzione)"
+                )
+        return future
+
+    async def run(self, connection_name: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """Variante async di submit: attende il risultato senza bloccare l'event loop"""
+        return await asyncio.wrap_future(self.submit(connection_name, fn, *args))
+
+    def _dispatch(self, connection_name: str, future: Future, fn: Callable[..., Any], args: tuple, queued_at: float) -> None:
+        # Chiamato con self._lock acquisito e slot già riservato
+        slots = self._connections[connection_name]
+        slots.total_wait_ms += (time.monotonic() - queued_at) * 1000
+        task = self._pool.submit(self._run, connection_name, future, fn, args)
+        # Se il pool viene arrestato prima dell'avvio, chi attende riceve la cancellazione
+        task.add_done_callback(lambda t: future.cancel() if t.cancelled() else None)
+
+    def _run(self, connection_name: str, future: Future, fn: Callable[..., Any], args: tuple) -> None:
+        failed = False
+        try:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                failed = True
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        finally:
+            self._release(connection_name, failed)
+
+    def _release(self, connection_name: str, failed: bool) -> None:
+        with self._lock:
+            slots = self._connections[connection_name]
+            slots.running -= 1
+            if failed:
+                slots.failed += 1
+            else:
+                slots.completed += 1
+            while slots.pending:
+                future, fn, args, queued_at = slots.pending.popleft()
+                if future.cancelled():
+                    continue
+                slots.running += 1
+                self._dispatch(connection_name, future, fn, args, queued_at)
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Metriche del pool: worker, code e contatori per connessione"""
+        with self._lock:
+            connections = {}
+            for name, slots in self._connections.items():
+                started = slots.completed + slots.failed + slots.running
+                connections[name] = {
+                    "running": slots.running,
+                    "queued": len(slots.pending),
+                    "max_queued": slots.max_queued,
+                    "completed": slots.completed,
+                    "failed": slots.failed,
+                    "rejected": slots.rejected,
+                    "avg_wait_ms": round(slots.total_wait_ms / started, 2) if started else 0.0,
+                }
+            running = sum(c["running"] for c in connections.values())
+            queued = sum(c["queued"] for c in connections.values())
+        return {
+            "max_workers": self.max_workers,
+            "per_connection_limit": self.per_connection_limit,
+            "max_queue_per_connection": self.max_queue_per_connection,
+            "running": running,
+            "queued": queued,
+            "connections": connections,
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Arresta il pool; le richieste ancora in coda vengono annullate"""
+        with self._lock:
+            for slots in self._connections.values():
+                while slots.pending:
+                    slots.pending.popleft()[0].cancel()
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+# Singleton process-wide
+_query_executor: Optional[QueryExecutor] = None
+_query_executor_lock = threading.Lock()
+
+
+def get_query_executor() -> QueryExecutor:
+    """Ottiene l'esecutore query condiviso (singleton)"""
+    global _query_executor
+    if _query_executor is None:
+        with _query_executor_lock:
+            if _query_executor is None:
+                settings = get_settings()
+                _query_executor = QueryExecutor(
+                    max_workers=getattr(settings, "query_executor_workers", 8),
+                    per_connection_limit=getattr(settings, "query_executor_per_connection", 2),
+                    max_queue_per_connection=getattr(settings, "query_executor_max_queue", 20),
+                )
+    return _query_executor
+
+
+def shutdown_query_executor() -> None:
+    """Arresta l'esecutore condiviso; una successiva get_query_executor ne crea uno nuovo"""
+    global _query_executor
+    with _query_executor_lock:
+        executor, _query_executor = _query_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
@@ -0,0 +1,275 @@
+"""
+Job di esecuzione query asincroni: submit, polling dello stato, paginazione dei
+risultati e annullamento.
+
+Il job gira sul QueryExecutor (stessi limiti per connessione delle query
+sincrone) e legge le righe in streaming da QueryService.stream_query, così lo
+stato riporta le righe lette mentre la query è ancora in corso. I risultati dei
+job terminati vengono conservati per `query_job_ttl_sec` secondi, o fino alla
+lettura dell'ultima pagina; ogni job conserva al massimo `query_job_max_rows`
+righe (oltre, la lettura si ferma con has_more).
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from app.core.config import get_settings
+from app.models.queries import (
+    QueryExecutionRequest,
+    QueryJobPage,
+    QueryJobState,
+    QueryJobStatus,
+    ResultFormat,
+)
+from app.services.query_executor import QueryExecutor, get_query_executor
+from app.services.query_service import QueryExecutionError, QueryService, shape_result_rows
+
+
+_FINAL_STATES = (QueryJobState.COMPLETED, QueryJobState.FAILED, QueryJobState.CANCELLED)
+
+
+class QueryJobCancelled(Exception):
+    """Interruzione della lettura per annullamento richiesto dall'utente"""
+
+
+class QueryJobResultsReleased(Exception):
+    """Risultati già rilasciati dopo la lettura dell'ultima pagina"""
+
+
+class QueryJob:
+    """Stato interno di un job query"""
+
+    def __init__(self, request: QueryExecutionRequest):
+        self.job_id = uuid.uuid4().hex
+        # La traccia dell'esecuzione usa l'id del job
+        if not request.request_id:
+            request.request_id = self.job_id
+        self.request = request
+        self.status = QueryJobState.QUEUED
+        self.column_names: List[str] = []
+        # Righe come liste (nomi colonna una sola volta in column_names)
+        self.data: List[List[Any]] = []
+        self.row_count = 0
+        self.has_more = False
+        self.released = False
+        self.error_message: Optional[str] = None
+        self.submitted_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.cancel_requested = False
+        self.future: Optional[Future] = None
+        self.connection = None
+        self._started_monotonic: Optional[float] = None
+        self._elapsed_ms: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINAL_STATES
+
+    def elapsed_ms(self) -> float:
+        if self._elapsed_ms is not None:
+            return self._elapsed_ms
+        if self._started_monotonic is None:
+            return 0.0
+        return (time.monotonic() - self._started_monotonic) * 1000
+
+    def mark_started(self) -> None:
+        self.status = QueryJobState.RUNNING
+        self.started_at = datetime.now()
+        self._started_monotonic = time.monotonic()
+
+    def mark_finished(self, status: QueryJobState, error_message: Optional[str] = None) -> None:
+        self._elapsed_ms = self.elapsed_ms()
+        self.status = status
+        self.error_message = error_message
+        self.finished_at = datetime.now()
+        self.connection = None
+
+
+class QueryJobService:
+    """Gestione dei job query asincroni"""
+
+    def __init__(self, query_service: Optional[QueryService] = None, executor: Optional[QueryExecutor] = None,
+                 ttl_sec: Optional[int] = None, max_rows: Optional[int] = None):
+        self.query_service = query_service or QueryService()
+        self.executor = executor or get_query_executor()
+        settings = get_settings()
+        self.ttl_sec = int(ttl_sec if ttl_sec is not None else getattr(settings, "query_job_ttl_sec", 1800))
+        # Righe conservate in memoria per job (0 = illimitato)
+        self.max_rows = int(max_rows if max_rows is not None else getattr(settings, "query_job_max_rows", 200000))
+        self._jobs: Dict[str, QueryJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, request: QueryExecutionRequest) -> QueryJobStatus:
+        """Accoda la query e restituisce subito lo stato del job (solleva QueryQueueFullError se la coda è piena)"""
+        self._purge_expired()
+        job = QueryJob(request)
+        job.future = self.executor.submit(request.connection_name, self._run, job)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        logger.info(f"[QUERY_JOB][{job.job_id}] Accodata {request.query_filename} su {request.connection_name}")
+        return self._to_status(job)
+
+    def get_status(self, job_id: str) -> Optional[QueryJobStatus]:
+        self._purge_expired()
+        job = self._jobs.get(job_id)
+        return self._to_status(job) if job else None
+
+    def get_page(self, job_id: str, offset: int = 0, limit: int = 1000,
+                 result_format: ResultFormat = ResultFormat.RECORDS) -> Optional[QueryJobPage]:
+        """Restituisce una pagina dei risultati (anche parziali se il job è in corso) nel formato richiesto.
+        Letta l'ultima pagina di un job terminato le righe vengono rilasciate (QueryJobResultsReleased
+        per le richieste successive)."""
+        self._purge_expired()
+        job = self._jobs.get(job_id)
+        if not job:
+            return None
+        if job.released:
+            raise QueryJobResultsReleased(f"Risultati del job {job_id} già letti e rilasciati")
+        offset = max(0, int(offset))
+        limit = max(1, int(limit))
+        data = job.data
+        page = QueryJobPage(
+            job_id=job.job_id,
+            status=job.status,
+            offset=offset,
+            limit=limit,
+            total_rows=len(data),
+            column_names=job.column_names,
+            **shape_result_rows(job.column_names, data[offset:offset + limit], result_format),
+        )
+        if job.finished and offset + limit >= len(data):
+            job.data = []
+            job.released = True
+            logger.debug(f"[QUERY_JOB][{job.job_id}] Ultima pagina letta: {len(data)} righe rilasciate")
+        return page
+
+    def cancel(self, job_id: str) -> Optional[QueryJobStatus]:
+        """Annulla il job: se in coda non parte, se in esecuzione interrompe la query sul DB"""
+        job = self._jobs.get(job_id)
+        if not job:
+            return None
+        if job.finished:
+            return self._to_status(job)
+        job.cancel_requested = True
+        if job.future is not None and job.future.cancel():
+            job.mark_finished(QueryJobState.CANCELLED, "Annullata dall'utente")
+            logger.info(f"[QUERY_JOB][{job.job_id}] Annullata prima dell'avvio")
+        else:
+            self._interrupt(job)
+        return self._to_status(job)
+
+    def _run(self, job: QueryJob) -> None:
+        if job.cancel_requested:
+            job.mark_finished(QueryJobState.CANCELLED, "Annullata dall'utente")
+            return
+        job.mark_started()
+        logger.info(f"[QUERY_JOB][{job.job_id}] START {job.request.query_filename}")
+
+        def _attach(conn) -> None:
+            # Annullamento arrivato durante l'attesa del lease o la connessione: la query non parte
+            if job.cancel_requested:
+                raise QueryJobCancelled()
+            job.connection = conn
+
+        try:
+            with self.query_service.stream_query(job.request, on_connection=_attach) as stream:
+                job.column_names = stream.column_names
+                width = len(stream.column_names)
+                for batch in stream.iter_batches():
+                    job.data.extend(stream.row_to_list(row, width) for row in batch)
+                    job.row_count = len(job.data)
+                    if job.cancel_requested:
+                        raise QueryJobCancelled()
+                    if self.max_rows and job.row_count > self.max_rows:
+                        # Tetto di memoria per job: il risultato resta parziale (has_more)
+                        del job.data[self.max_rows:]
+                        job.row_count = len(job.data)
+                        job.has_more = True
+                        logger.warning(f"[QUERY_JOB][{job.job_id}] Limite di {self.max_rows} righe raggiunto: risultato troncato")
+                        break
+                else:
+                    job.has_more = stream.has_more
+            job.mark_finished(QueryJobState.COMPLETED)
+            logger.info(f"[QUERY_JOB][{job.job_id}] END righe={job.row_count} durata={job.elapsed_ms():.0f}ms")
+        except QueryJobCancelled:
+            job.mark_finished(QueryJobState.CANCELLED, "Annullata dall'utente")
+            logger.info(f"[QUERY_JOB][{job.job_id}] Annullata dopo {job.row_count} righe")
+        except Exception as e:
+            if job.cancel_requested:
+                # L'errore è la conseguenza dell'interruzione lato DB (es. ORA-01013)
+                job.mark_finished(QueryJobState.CANCELLED, "Annullata dall'utente")
+                logger.info(f"[QUERY_JOB][{job.job_id}] Query interrotta sul database")
+            else:
+                message = str(e) if isinstance(e, QueryExecutionError) else f"Errore generico: {str(e)}"
+                job.mark_finished(QueryJobState.FAILED, message)
+                logger.error(f"[QUERY_JOB][{job.job_id}] FAIL {message}")
+
+    def _interrupt(self, job: QueryJob) -> None:
+        """Interrompe la chiamata in corso sulla connessione del job.
+        Oracle (oracledb) e PostgreSQL (psycopg2, equivalente a pg_cancel_backend) espongono
+        cancel() sulla connessione DBAPI; la connessione torna poi al pool alla chiusura del job.
+        """
+        conn = job.connection
+        if conn is None:
+            return
+        try:
+            driver_connection = conn.connection.driver_connection
+            cancel = getattr(driver_connection, "cancel", None)
+            if callable(cancel):
+                cancel()
+                logger.info(f"[QUERY_JOB][{job.job_id}] Richiesta di annullamento inviata al database")
+            else:
+                logger.warning(f"[QUERY_JOB][{job.job_id}] Driver senza cancel(): interruzione al prossimo blocco di righe")
+        except Exception as e:
+            logger.warning(f"[QUERY_JOB][{job.job_id}] Annullamento lato DB non riuscito: {e}")
+
+    def _purge_expired(self) -> None:
+        """Rimuove i job terminati oltre la TTL"""
+        now = datetime.now()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished and job.finished_at and now - job.finished_at > timedelta(seconds=self.ttl_sec)
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if expired:
+            logger.debug(f"[QUERY_JOB] Rimossi {len(expired)} job scaduti")
+
+    def _to_status(self, job: QueryJob) -> QueryJobStatus:
+        return QueryJobStatus(
+            job_id=job.job_id,
+            query_filename=job.request.query_filename,
+            connection_name=job.request.connection_name,
+            status=job.status,
+            row_count=job.row_count,
+            elapsed_ms=job.elapsed_ms(),
+            column_names=job.column_names,
+            has_more=job.has_more,
+            error_message=job.error_message,
+            submitted_at=job.submitted_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at,
+            expires_at=job.finished_at + timedelta(seconds=self.ttl_sec) if job.finished_at else None,
+        )
+
+
+# Singleton process-wide
+_query_job_service: Optional[QueryJobService] = None
+_query_job_service_lock = threading.Lock()
+
+
+def get_query_job_service() -> QueryJobService:
+    """Ottiene il servizio job query condiviso (singleton)"""
+    global _query_job_service
+    if _query_job_service is None:
+        with _query_job_service_lock:
+            if _query_job_service is None:
+                _query_job_service = QueryJobService()
+    return _query_job_service
@@ -2,78 +2,187 @@
 Servizio per la gestione e l'esecuzione delle query SQL
 """
 import re
-import os
+import threading
 import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 from loguru import logger
 
 from app.core.config import get_settings
+from app.services.connection_governor import ConnectionBudgetTimeout, get_connection_governor
 from app.services.connection_service import ConnectionService
+from app.services.execution_trace import ExecutionTrace, get_execution_traces
+from app.services.query_catalog import QueryCatalog
+from app.services.query_compiler import CompiledQuery, QueryCompiler, sanitize_sql_for_oracle, strip_defines
+from app.services.sql_binding import BIND_DIALECTS, ListBind
 from app.models.queries import (
     QueryInfo, 
     QueryParameter, 
     ParameterType,
     QueryExecutionRequest,
-    QueryExecutionResult
+    QueryExecutionResult,
+    ResultFormat
 )
 
 
+# Errori di sintassi con cui Oracle < 12c rifiuta FETCH FIRST: solo in questi casi si riesegue senza limite
+_FETCH_FIRST_UNSUPPORTED = ("ORA-00933", "ORA-00923", "ORA-02000")
+# Elementi massimi di una collezione SQL Oracle (VARRAY(32767) di SYS.ODCIVARCHAR2LIST)
+ORACLE_COLLECTION_MAX = 32767
+# Coppie (sessione, tipo collezione) tenute in cache
+COLLECTION_TYPE_CACHE_SIZE = 256
+
+
+class QueryExecutionError(Exception):
+    """Errore di esecuzione query; il messaggio viene riportato in QueryExecutionResult.error_message"""
+
+
+def shape_result_rows(column_names: List[str], rows: List[List[Any]], result_format=ResultFormat.RECORDS) -> Dict[str, Any]:
+    """Prepara i campi data/rows/columns del payload a partire da righe come liste.
+
+    Con `records` ogni riga diventa un oggetto (nomi colonna ripetuti per riga);
+    con `rows` e `columns` i nomi colonna compaiono una sola volta, in column_names.
+    """
+    if result_format == ResultFormat.ROWS:
+        return {"data": [], "rows": rows, "columns": None}
+    if result_format == ResultFormat.COLUMNS:
+        columns = {name: [row[i] for row in rows] for i, name in enumerate(column_names)}
+        return {"data": [], "rows": None, "columns": columns}
+    return {"data": [dict(zip(column_names, row)) for row in rows], "rows": None, "columns": None}
+
+
+class QueryStream:
+    """Risultato di una query letto dal cursore a blocchi.
+
+    I nomi colonna sono disponibili subito dopo l'esecuzione; le righe vengono
+    trasferite con fetchmany a blocchi di `batch_size`, senza materializzare
+    l'intero result set. Con `limit` la lettura si ferma dopo `limit` righe e
+    `has_more` indica se il cursore ne conteneva altre. `description` è la
+    cursor.description DB-API (tipi, precisione e scala delle colonne), se disponibile.
+    """
+
+    def __init__(self, result=None, column_names: Optional[List[str]] = None, batch_size: int = 1000, limit: Optional[int] = None,
+                 description: Optional[List[tuple]] = None):
+        self._result = result
+        self.column_names: List[str] = column_names or []
+        self.description = list(description) if description else None
+        self.batch_size = max(1, int(batch_size or 1000))
+        self.limit = limit if limit is not None and limit > 0 else None
+        self.row_count = 0
+        self.has_more = False
+
+    def iter_batches(self) -> Iterator[List[Any]]:
+        """Restituisce blocchi di righe con i valori nativi del driver (Decimal, datetime, ...)"""
+        if self._result is None:
+            return
+        try:
+            while True:
+                size = self.batch_size
+                if self.limit is not None:
+                    # Una riga oltre il limite basta per valorizzare has_more
+                    size = min(size, self.limit + 1 - self.row_count)
+                try:
+                    rows = self._result.fetchmany(size)
+                except Exception as e:
+                    raise QueryExecutionError(f"Statement fetch failed: {str(e)}") from e
+                if not rows:
+                    break
+                if self.limit is not None and self.row_count + len(rows) > self.limit:
+                    rows = rows[:self.limit - self.row_count]
+                    self.has_more = True
+                self.row_count += len(rows)
+                if rows:
+                    yield rows
+                if self.has_more:
+                    break
+        finally:
+            self.close()
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Restituisce le righe come dizionari serializzabili (datetime in formato ISO)"""
+        for batch in self.iter_batches():
+            for row in batch:
+                yield self.row_to_dict(row, self.column_names)
+
+    def iter_rows(self) -> Iterator[List[Any]]:
+        """Restituisce le righe come liste serializzabili, nell'ordine di column_names"""
+        width = len(self.column_names)
+        for batch in self.iter_batches():
+            for row in batch:
+                yield self.row_to_list(row, width)
+
+    @staticmethod
+    def row_to_dict(row, column_names: List[str]) -> Dict[str, Any]:
+        record = {}
+        for i, col_name in enumerate(column_names):
+            value = row[i] if i < len(row) else None
+            record[col_name] = value.isoformat() if isinstance(value, datetime) else value
+        return record
+
+    @staticmethod
+    def row_to_list(row, width: int) -> List[Any]:
+        values = []
+        for i in range(width):
+            value = row[i] if i < len(row) else None
+            values.append(value.isoformat() if isinstance(value, datetime) else value)
+        return values
+
+    def close(self) -> None:
+        """Rilascia il cursore; le righe non lette non vengono trasferite"""
+        if self._result is not None:
+            try:
+                self._result.close()
+            except Exception:
+                pass
+            self._result = None
+
+
 class QueryService:
     """Servizio per la gestione e l'esecuzione delle query SQL"""
     
-    def __init__(self):
+    def __init__(self, connection_service: Optional[ConnectionService] = None):
         self.settings = get_settings()
-        self.connection_service = ConnectionService()
+        # Il ConnectionService (e il relativo registro engine) è condiviso quando iniettato dal lifespan
+        self.connection_service = connection_service or ConnectionService()
         
         # Pattern per identificare parametri nelle query
         self.define_pattern = re.compile(r"define\s+(\w+)\s*=\s*['\"]([^'\"]*)['\"](?:\s*--\s*(.*))?", re.IGNORECASE)
         self.parameter_pattern = re.compile(r"&(\w+)", re.IGNORECASE)
+
+        # Catalogo dei file query parsati (invalidato per mtime/dimensione)
+        try:
+            rescan_sec = float(getattr(self.settings, 'query_catalog_rescan_sec', 5))
+        except (TypeError, ValueError):
+            rescan_sec = 5.0
+        self.catalog = QueryCatalog(self._parse_sql_file, rescan_interval_sec=rescan_sec)
+        # Query compilate (step, statement, segnaposto) per file e mtime
+        self.compiler = QueryCompiler()
+        # Tracce delle esecuzioni recenti (opt-in, in memoria)
+        self.traces = get_execution_traces()
+        # Budget di connessioni del processo condiviso con scheduler ed export
+        self.governor = get_connection_governor()
+        # Tipi collezione Oracle per sessione del pool: gettype è un round trip sul dizionario dati
+        self._collection_types: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._collection_types_lock = threading.Lock()
         
         logger.info(f"QueryService inizializzato - directory query: {self.settings.query_dir}")
     
-    def get_queries(self) -> List[QueryInfo]:
+    def get_queries(self, include_aliases: bool = False) -> List[QueryInfo]:
         """Ottiene la lista di tutte le query disponibili (ricorsiva sulle sottocartelle)."""
         try:
-            queries = []
-            
             if not self.settings.query_dir.exists():
                 logger.warning(f"Directory query non trovata: {self.settings.query_dir}")
-                return queries
-            
-            # Scansiona ricorsivamente tutti i file .sql nelle sottocartelle, includendo radice
-            for sql_file in self.settings.query_dir.rglob("*.sql"):
-                # Escludi cartelle di lavoro temporanee
-                try:
-                    # subdir relativa rispetto alla query_dir
-                    rel = sql_file.relative_to(self.settings.query_dir)
-                    parts = rel.parts[:-1]  # tutte le parti tranne il filename
-                    subdir = os.path.join(*parts) if parts else ""
-                    # normalizza separatore cartelle in formato unix-like per coerenza
-                    subdir = subdir.replace("\\", "/") if subdir else ""
-                    # filtra cartelle da escludere (tmp sempre esclusa; altre esclusioni lato UI)
-                    if any(p.lower() in ["tmp", "_tmp"] for p in parts):
-                        continue
-                except Exception:
-                    subdir = ""
-                try:
-                    query_info = self._parse_sql_file(sql_file)
-                    # aggiungi subdir metadata
-                    if query_info:
-                        query_info.subdirectory = subdir
-                    if query_info:
-                        queries.append(query_info)
-                except Exception as e:
-                    logger.error(f"Errore nel parsing del file {sql_file}: {e}")
-                    continue
-            
-            # Ordina per nome file
-            queries.sort(key=lambda q: q.filename)
-            
-            logger.info(f"Trovate {len(queries)} query SQL")
+                return []
+
+            # Il catalogo riparsa solo i file nuovi o modificati (cartelle tmp escluse)
+            queries = self.catalog.list(self.settings.query_dir, include_aliases=include_aliases)
+            logger.debug(f"Trovate {len(queries)} query SQL")
             return queries
             
         except Exception as e:
@@ -81,23 +190,12 @@ class QueryService:
             return []
     
     def get_query(self, filename: str) -> Optional[QueryInfo]:
-        """Ottiene i dettagli di una query specifica (ricerca ricorsiva per nome file)."""
+        """Ottiene i dettagli di una query specifica (ricerca per nome file nel catalogo)."""
         try:
-            # Cerca ricorsivamente il file per nome nelle sottocartelle
-            for sql_file in self.settings.query_dir.rglob(filename):
-                if sql_file.name.lower() == filename.lower():
-                    info = self._parse_sql_file(sql_file)
-                    if info:
-                        try:
-                            rel = sql_file.relative_to(self.settings.query_dir)
-                            parts = rel.parts[:-1]
-                            subdir = os.path.join(*parts) if parts else ""
-                            info.subdirectory = subdir.replace("\\", "/") if subdir else ""
-                        except Exception:
-                            pass
-                    return info
-            logger.error(f"File query non trovato: {filename}")
-            return None
+            info = self.catalog.get(self.settings.query_dir, filename)
+            if info is None:
+                logger.error(f"File query non trovato: {filename}")
+            return info
             
         except Exception as e:
             logger.error(f"Errore nel recupero della query {filename}: {e}")
@@ -319,39 +417,34 @@ class QueryService:
     
     def _sanitize_sql_for_oracle(self, sql: str) -> str:
         """Rimuove caratteri speciali non validi alla fine della query per Oracle."""
-        # Rimuove spazi, tab, newline e altri caratteri non stampabili alla fine
-        # Inoltre rimuove eventuali punti e virgola finali o slash (usati in script SQL*Plus)
-        if not isinstance(sql, str):
-            return sql
-        s = sql.rstrip()
-        # Rimuovi ripetutamente i terminatori espliciti di script (;) o slash (/)
-        while s.endswith(';') or s.endswith('/'):
-            s = s[:-1].rstrip()
-        return s
+        return sanitize_sql_for_oracle(sql)
 
     def save_query(self, filename: str, new_content: str) -> bool:
         """Salva il contenuto della query nel file corrispondente (ricerca ricorsiva per filename)."""
         try:
-            for sql_file in self.settings.query_dir.rglob(filename):
-                if sql_file.name.lower() == filename.lower():
-                    # Usa UTF-8 e crea backup semplice
+            sql_file = self.catalog.find_path(self.settings.query_dir, filename)
+            if sql_file is not None:
+                # Usa UTF-8 e crea backup semplice
+                try:
+                    backup = sql_file.with_suffix('.bak')
+                    if sql_file.exists():
+                        sql_file.replace(backup)
+                        # ripristina bak originale se write fallisce
+                    with open(sql_file, 'w', encoding='utf-8') as f:
+                        f.write(new_content)
+                    return True
+                except Exception as e:
+                    logger.error(f"Errore salvataggio file {sql_file}: {e}")
+                    # prova a ripristinare backup
                     try:
-                        backup = sql_file.with_suffix('.bak')
-                        if sql_file.exists():
-                            sql_file.replace(backup)
-                            # ripristina bak originale se write fallisce
-                        with open(sql_file, 'w', encoding='utf-8') as f:
-                            f.write(new_content)
-                        return True
-                    except Exception as e:
-                        logger.error(f"Errore salvataggio file {sql_file}: {e}")
-                        # prova a ripristinare backup
-                        try:
-                            if backup.exists():
-                                backup.replace(sql_file)
-                        except Exception:
-                            pass
-                        return False
+                        if backup.exists():
+                            backup.replace(sql_file)
+                    except Exception:
+                        pass
+                    return False
+                finally:
+                    # Il prossimo accesso rilegge il file salvato
+                    self.catalog.invalidate(sql_file)
             logger.error(f"File query non trovato per salvataggio: {filename}")
             return False
         except Exception as e:
@@ -485,379 +578,142 @@ class QueryService:
             issues.append({"type": "error", "message": "Errore interno nel lint"})
         return issues
 
-    def execute_query(self, request: QueryExecutionRequest) -> QueryExecutionResult:
-        start_time = time.time()
+    @contextmanager
+    def stream_query(self, request: QueryExecutionRequest, batch_size: Optional[int] = None,
+                     on_connection: Optional[Callable[[Any], None]] = None) -> Iterator[QueryStream]:
+        """Esegue la query e restituisce un QueryStream posizionato sull'ultimo SELECT.
+
+        Gli statement che precedono l'ultimo SELECT (ALTER SESSION, step di preparazione)
+        vengono eseguiti subito; quelli successivi solo dopo che il chiamante ha consumato
+        lo stream senza errori. La connessione resta impegnata per tutto il blocco with.
+        Gli errori vengono sollevati come QueryExecutionError.
+        `on_connection` riceve la connessione appena aperta (es. per poter annullare la query).
+        Con le tracce attive gli statement eseguiti vengono registrati sotto `request.request_id`.
+        """
+        if not request.request_id:
+            request.request_id = uuid.uuid4().hex
+        trace = self.traces.start(request.request_id, request.query_filename, request.connection_name)
         try:
-            query_info = self.get_query(request.query_filename)
-            if not query_info:
-                return QueryExecutionResult(
-                    query_filename=request.query_filename,
-                    connection_name=request.connection_name,
-                    success=False,
-                    execution_time_ms=0,
-                    row_count=0,
-                    error_message=f"Query non trovata: {request.query_filename}"
-                )
-            missing_params = self._validate_parameters(query_info.parameters, request.parameters)
-            if missing_params:
-                return QueryExecutionResult(
-                    query_filename=request.query_filename,
-                    connection_name=request.connection_name,
-                    success=False,
-                    execution_time_ms=0,
-                    row_count=0,
-                    error_message=f"Parametri obbligatori mancanti: {', '.join(missing_params)}"
+            with self._stream_query(request, batch_size, on_connection, trace) as stream:
+                yield stream
+        except Exception as e:
+            self.traces.finish(trace, str(e))
+            raise
+        self.traces.finish(trace)
+
+    @contextmanager
+    def _stream_query(self, request: QueryExecutionRequest, batch_size: Optional[int],
+                      on_connection: Optional[Callable[[Any], None]],
+                      trace: Optional[ExecutionTrace]) -> Iterator[QueryStream]:
+        """Esecuzione vera e propria di stream_query"""
+        query_info = self.get_query(request.query_filename)
+        if not query_info:
+            raise QueryExecutionError(f"Query non trovata: {request.query_filename}")
+        missing_params = self._validate_parameters(query_info.parameters, request.parameters)
+        if missing_params:
+            raise QueryExecutionError(f"Parametri obbligatori mancanti: {', '.join(missing_params)}")
+        engine = self.connection_service.get_engine(request.connection_name)
+        if not engine:
+            raise QueryExecutionError(f"Impossibile connettersi al database: {request.connection_name}")
+        connection = self.connection_service.get_connection(request.connection_name)
+        db_type = connection.db_type.lower() if connection else None
+        preview_limit = request.limit if request.limit is not None and request.limit > 0 else None
+        batch_size = batch_size or getattr(self.settings, "query_fetch_arraysize", 1000)
+
+        # Struttura del file (step, statement, segnaposto) compilata una volta per (file, mtime)
+        compiled = self.compiler.get(query_info, db_type)
+        statements = self._prepare_statements(compiled, request, query_info.parameters, db_type)
+        last_select = compiled.last_select
+
+        environment = getattr(connection, "environment", None) if connection else None
+        with self._connection_lease(request.connection_name, environment), engine.connect() as conn:
+            if on_connection is not None:
+                on_connection(conn)
+            for entry in statements[:last_select]:
+                result = self._execute_statement(conn, entry, request.connection_name, db_type, preview_limit, trace=trace)
+                # Il risultato dei SELECT intermedi non viene restituito: libera subito il cursore
+                if entry["is_select"]:
+                    result.close()
+                self._after_statement(conn, entry, trace)
+            if last_select < len(statements):
+                final = statements[last_select]
+                result = self._execute_statement(
+                    conn, final, request.connection_name, db_type, preview_limit, trace=trace,
+                    execution_options={
+                        "stream_results": True,
+                        "max_row_buffer": batch_size,
+                        "fetch_arraysize": batch_size,
+                    },
                 )
-            processed_sql = self._substitute_parameters(query_info.sql_content, request.parameters, query_info.parameters)
-            engine = self.connection_service.get_engine(request.connection_name)
-            if not engine:
-                return QueryExecutionResult(
-                    query_filename=request.query_filename,
-                    connection_name=request.connection_name,
-                    success=False,
-                    execution_time_ms=0,
-                    row_count=0,
-                    error_message=f"Impossibile connettersi al database: {request.connection_name}"
+                stream = QueryStream(
+                    result, list(result.keys()), batch_size=batch_size, limit=preview_limit,
+                    description=getattr(getattr(result, 'cursor', None), 'description', None),
                 )
-            # STEP LOGIC
-            steps = self._parse_sql_steps(processed_sql)
-            # Log parsed steps for diagnostics (first 200 chars each)
-            try:
-                for s in steps:
-                    preview = s["sql"][:200].replace('\n', ' ')
-                    logger.debug(f"[Diag] Step {s['number']} desc='{s['description']}' preview='{preview}'")
-            except Exception:
-                pass
-            if len(steps) == 1 and steps[0]["description"] == "Query unica":
-                # Query semplice, ma gestisci comunque multi-statement (ALTER SESSION; WITH/SELECT; ecc.)
-                with engine.connect() as conn:
-                    # Applica LIMIT solo se è stato esplicitamente fornito un valore numerico
-                    if request.limit is not None and request.limit > 0:
-                        processed_sql = self._add_limit_clause(processed_sql, request.limit, request.connection_name)
-                    connection = self.connection_service.get_connection(request.connection_name)
-                    db_type = connection.db_type.lower() if connection else None
-                    sql_to_execute = processed_sql
-                    if db_type == "oracle":
-                        sql_to_execute = self._sanitize_sql_for_oracle(sql_to_execute)
-                    tmp_dir = Path(self.settings.query_dir) / "tmp"
-                    tmp_dir.mkdir(parents=True, exist_ok=True)
-                    tmp_file = tmp_dir / "tmp.txt"
-                    try:
-                        with open(tmp_file, "w", encoding="utf-8") as f:
-                            f.write(sql_to_execute)
-                    except Exception as e:
-                        logger.error(f"Impossibile salvare la query in tmp.txt: {e}")
-
-                    # Suddividi per ';' ed esegui ogni statement separatamente, restituendo l'ultimo SELECT
-                    last_select_result: Optional[QueryExecutionResult] = None
-                    step_sql_normalized = sql_to_execute.strip()
-                    statements = [s.strip() for s in re.split(r";\s*(?=\n|$)|;", step_sql_normalized) if s.strip()]
-                    for stmt in statements:
-                        stmt = stmt.rstrip().rstrip(';').strip()
-                        if not stmt:
-                            continue
-                        # Rimuovi commenti prima del check SELECT
-                        stmt_no_comments = re.sub(r'--[^\n]*', '', stmt)
-                        stmt_no_comments = re.sub(r'/\*.*?\*/', '', stmt_no_comments, flags=re.DOTALL)
-                        stmt_no_comments = stmt_no_comments.strip()
-                        is_select = stmt_no_comments.lower().startswith("select") or stmt_no_comments.lower().startswith("with")
-                        try:
-                            result = conn.execute(text(stmt))
-                            # Per Oracle, commit dopo DML/DDL
-                            if db_type == "oracle" and not is_select:
-                                try:
-                                    conn.commit()
-                                except Exception:
-                                    pass
-                        except Exception as e:
-                            execution_time = (time.time() - start_time) * 1000
-                            err_msg = f"Statement execute failed: {stmt} - Error: {str(e)}"
-                            logger.error(err_msg)
-                            # Diagnostica
-                            try:
-                                stmt_preview = stmt[:100].replace('\n', ' ')
-                                diag_file = tmp_dir / "tmp_diagnostics.txt"
-                                with open(diag_file, 'a', encoding='utf-8') as df:
-                                    df.write(f"STATEMENT_EXECUTE_FAILED | {stmt_preview} | {str(e)}\n")
-                            except Exception:
-                                pass
-                            return QueryExecutionResult(
-                                query_filename=request.query_filename,
-                                connection_name=request.connection_name,
-                                success=False,
-                                execution_time_ms=execution_time,
-                                row_count=0,
-                                error_message=err_msg,
-                                parameters_used=request.parameters
-                            )
-                        if is_select:
-                            try:
-                                rows = result.fetchall()
-                                column_names = list(result.keys()) if result.keys() else []
-                                data = []
-                                for row in rows:
-                                    row_dict = {}
-                                    for i, col_name in enumerate(column_names):
-                                        value = row[i] if i < len(row) else None
-                                        if isinstance(value, datetime):
-                                            row_dict[col_name] = value.isoformat()
-                                        else:
-                                            row_dict[col_name] = value
-                                    data.append(row_dict)
-                                execution_time = (time.time() - start_time) * 1000
-                                last_select_result = QueryExecutionResult(
-                                    query_filename=request.query_filename,
-                                    connection_name=request.connection_name,
-                                    success=True,
-                                    execution_time_ms=execution_time,
-                                    row_count=len(data),
-                                    column_names=column_names,
-                                    data=data,
-                                    parameters_used=request.parameters
-                                )
-                            except Exception as e:
-                                execution_time = (time.time() - start_time) * 1000
-                                stmt_preview = stmt[:100].replace('\n', ' ')
-                                logger.error(f"Statement fetch failed: {stmt_preview} - Error: {str(e)}")
-                                try:
-                                    diag_file = tmp_dir / "tmp_diagnostics.txt"
-                                    with open(diag_file, 'a', encoding='utf-8') as df:
-                                        df.write(f"STATEMENT_FETCH_FAILED | {stmt_preview} | {str(e)}\n")
-                                except Exception:
-                                    pass
-                                return QueryExecutionResult(
-                                    query_filename=request.query_filename,
-                                    connection_name=request.connection_name,
-                                    success=False,
-                                    execution_time_ms=execution_time,
-                                    row_count=0,
-                                    error_message=f"Statement fetch failed: {str(e)}",
-                                    parameters_used=request.parameters
-                                )
-
-                    # Se esiste un risultato SELECT, restituiscilo; altrimenti OK senza righe
-                    if last_select_result:
-                        logger.info(f"Query {request.query_filename} eseguita con successo: {last_select_result.row_count} righe")
-                        return last_select_result
-                    else:
-                        execution_time = (time.time() - start_time) * 1000
-                        return QueryExecutionResult(
-                            query_filename=request.query_filename,
-                            connection_name=request.connection_name,
-                            success=True,
-                            execution_time_ms=execution_time,
-                            row_count=0,
-                            column_names=[],
-                            data=[],
-                            parameters_used=request.parameters
-                        )
             else:
-                # Multi-step
-                last_result = None
-                with engine.connect() as conn:
-                    for step in steps:
-                        original_step_sql = step["sql"]
-                        sql_to_execute = original_step_sql
-                        # Salva versione raw prima di qualsiasi sostituzione per diagnosi
-                        try:
-                            tmp_dir = Path(self.settings.query_dir) / "tmp"
-                            tmp_dir.mkdir(parents=True, exist_ok=True)
-                            raw_file = tmp_dir / f"tmp_step{step['number']}_raw.txt"
-                            with open(raw_file, "w", encoding="utf-8") as f_raw:
-                                f_raw.write(original_step_sql)
-                        except Exception as e:
-                            logger.error(f"Impossibile salvare raw step {step['number']}: {e}")
-                        # Sostituisci parametri per ogni step
-                        # Prima, crea una copia dei parametri e aggiungi quelli opzionali mancanti come stringa vuota
-                        param_values = dict(request.parameters)
-                        for param in query_info.parameters:
-                            if param.name not in param_values:
-                                param_values[param.name] = ""
-                        sql_to_execute = self._substitute_parameters(sql_to_execute, param_values, query_info.parameters)
-                        # Rimuovi punto e virgola finale
-                        sql_to_execute = sql_to_execute.rstrip().rstrip(';')
-                        connection = self.connection_service.get_connection(request.connection_name)
-                        db_type = connection.db_type.lower() if connection else None
-                        if db_type == "oracle":
-                            sql_to_execute = self._sanitize_sql_for_oracle(sql_to_execute)
-                        tmp_dir = Path(self.settings.query_dir) / "tmp"
-                        tmp_dir.mkdir(parents=True, exist_ok=True)
-                        tmp_file = tmp_dir / f"tmp_step{step['number']}.txt"
-                        try:
-                            with open(tmp_file, "w", encoding="utf-8") as f:
-                                f.write(sql_to_execute)
-                            # Log transformation diff if changed
-                            if original_step_sql != sql_to_execute:
-                                try:
-                                    raw_preview = original_step_sql[:60].replace('\n', ' ')
-                                    final_preview = sql_to_execute[:60].replace('\n', ' ')
-                                    logger.debug(f"[Diag] Step {step['number']} transformed. Raw starts with: '{raw_preview}' Final starts with: '{final_preview}'")
-                                except Exception as log_e:
-                                    logger.debug(f"[Diag] Step {step['number']} transformed (preview unavail): {log_e}")
-                        except Exception as e:
-                            logger.error(f"Impossibile salvare la query in tmp_step{step['number']}.txt: {e}")
-                        # Execute each statement inside the step separately.
-                        # Some DB drivers (and cx_Oracle) don't accept multi-statement strings,
-                        # so split on semicolons and run statements one by one.
-                        step_sql_normalized = sql_to_execute.strip()
-                        # Split statements by semicolon. Keep simple split — we'll strip empty pieces.
-                        statements = [s.strip() for s in re.split(r";\s*(?=\n|$)|;", step_sql_normalized) if s.strip()]
-                        for stmt in statements:
-                            # remove any trailing semicolon leftovers
-                            stmt = stmt.rstrip().rstrip(';').strip()
-                            if not stmt:
-                                continue
-                            # Rimuovi commenti prima del check SELECT
-                            stmt_no_comments = re.sub(r'--[^\n]*', '', stmt)
-                            stmt_no_comments = re.sub(r'/\*.*?\*/', '', stmt_no_comments, flags=re.DOTALL)
-                            stmt_no_comments = stmt_no_comments.strip()
-                            is_select = stmt_no_comments.lower().startswith("select") or stmt_no_comments.lower().startswith("with")
-                            # Advanced diagnostics: measure execute and fetch times separately
-                            exec_time_ms = None
-                            fetch_time_ms = None
-                            fetch_error = None
-                            try:
-                                # Execute the statement as-is (no runtime hint stripping)
-                                stmt_to_execute = stmt
-                                t_exec_start = time.time()
-                                result = conn.execute(text(stmt_to_execute))
-                                exec_time_ms = (time.time() - t_exec_start) * 1000
-                                # For Oracle, commit after DML/DDL statements
-                                if db_type == "oracle" and not is_select:
-                                    try:
-                                        conn.commit()
-                                    except Exception:
-                                        pass
-                            except Exception as e:
-                                execution_time = (time.time() - start_time) * 1000
-                                err_msg = f"Statement execute failed: {stmt} - Error: {str(e)}"
-                                logger.error(err_msg)
-                                # Save per-step diagnostics file with statement-level failure
-                                try:
-                                    stmt_preview = stmt[:100].replace('\n', ' ')
-                                    diag_file = tmp_dir / f"tmp_step{step['number']}_diagnostics.txt"
-                                    with open(diag_file, 'a', encoding='utf-8') as df:
-                                        df.write(f"STATEMENT_EXECUTE_FAILED | {stmt_preview} | {str(e)}\n")
-                                except Exception:
-                                    pass
-                                return QueryExecutionResult(
-                                    query_filename=request.query_filename,
-                                    connection_name=request.connection_name,
-                                    success=False,
-                                    execution_time_ms=execution_time,
-                                    row_count=0,
-                                    error_message=err_msg,
-                                    parameters_used=request.parameters
-                                )
-                            if is_select:
-                                try:
-                                    t_fetch_start = time.time()
-                                    rows = result.fetchall()
-                                    fetch_time_ms = (time.time() - t_fetch_start) * 1000
-                                    column_names = list(result.keys()) if result.keys() else []
-                                    data = []
-                                    for row in rows:
-                                        row_dict = {}
-                                        for i, col_name in enumerate(column_names):
-                                            value = row[i] if i < len(row) else None
-                                            if isinstance(value, datetime):
-                                                row_dict[col_name] = value.isoformat()
-                                            else:
-                                                row_dict[col_name] = value
-                                        data.append(row_dict)
-                                    execution_time = (time.time() - start_time) * 1000
-                                    last_result = QueryExecutionResult(
-                                        query_filename=request.query_filename,
-                                        connection_name=request.connection_name,
-                                        success=True,
-                                        execution_time_ms=execution_time,
-                                        row_count=len(data),
-                                        column_names=column_names,
-                                        data=data,
-                                        parameters_used=request.parameters
-                                    )
-                                except Exception as e:
-                                    fetch_error = str(e)
-                                    execution_time = (time.time() - start_time) * 1000
-                                    stmt_preview = stmt[:100].replace('\n', ' ')
-                                    logger.error(f"Statement fetch failed: {stmt_preview} - Error: {fetch_error}")
-                                    # Append diagnostic info
-                                    try:
-                                        diag_file = tmp_dir / f"tmp_step{step['number']}_diagnostics.txt"
-                                        with open(diag_file, 'a', encoding='utf-8') as df:
-                                            df.write(f"STATEMENT_FETCH_FAILED | {stmt_preview} | {fetch_error}\n")
-                                    except Exception:
-                                        pass
-                                    return QueryExecutionResult(
-                                        query_filename=request.query_filename,
-                                        connection_name=request.connection_name,
-                                        success=False,
-                                        execution_time_ms=execution_time,
-                                        row_count=0,
-                                        error_message=f"Statement fetch failed: {fetch_error}",
-                                        parameters_used=request.parameters
-                                    )
-                            else:
-                                # Non-select statements: log exec time in diagnostics file
-                                try:
-                                    stmt_preview = stmt[:100].replace('\n', ' ')
-                                    diag_file = tmp_dir / f"tmp_step{step['number']}_diagnostics.txt"
-                                    with open(diag_file, 'a', encoding='utf-8') as df:
-                                        df.write(f"STATEMENT_EXECUTED | {stmt_preview} | exec_ms={exec_time_ms}\n")
-                                except Exception:
-                                    pass
-                        # --- Diagnostic checks after executing all statements in the step ---
-                        try:
-                            # If this step references the temporary table, collect diagnostics
-                            step_upper = sql_to_execute.upper() if isinstance(sql_to_execute, str) else ''
-                            if 'APPO_BARCODE_NO_EMF' in step_upper:
-                                diagnostics = []
-                                try:
-                                    res_user = conn.execute(text("SELECT USER FROM DUAL"))
-                                    user = res_user.fetchone()[0] if res_user is not None else None
-                                    diagnostics.append(f"SESSION_USER={user}")
-                                except Exception as e:
-                                    diagnostics.append(f"SESSION_USER_ERROR={str(e)}")
-                                try:
-                                    res_schema = conn.execute(text("SELECT SYS_CONTEXT('USERENV','CURRENT_SCHEMA') FROM DUAL"))
-                                    current_schema = res_schema.fetchone()[0] if res_schema is not None else None
-                                    diagnostics.append(f"CURRENT_SCHEMA={current_schema}")
-                                except Exception:
-                                    diagnostics.append("CURRENT_SCHEMA=UNAVAILABLE")
-                                # Try a COUNT on the target table to check persistence
-                                try:
-                                    cnt_res = conn.execute(text("SELECT COUNT(*) FROM starown.APPO_BARCODE_NO_EMF"))
-                                    cnt = cnt_res.fetchone()[0]
-                                    diagnostics.append(f"COUNT_starown.APPO_BARCODE_NO_EMF={cnt}")
-                                except Exception as e:
-                                    diagnostics.append(f"COUNT_ERROR={str(e)}")
-
-                                # Save diagnostics to tmp file
-                                try:
-                                    diag_file = tmp_dir / f"tmp_step{step['number']}_diagnostics.txt"
-                                    with open(diag_file, 'w', encoding='utf-8') as df:
-                                        for line in diagnostics:
-                                            df.write(line + '\n')
-                                    logger.debug(f"[Diag] Wrote diagnostics for step {step['number']}: {'; '.join(diagnostics)}")
-                                except Exception as e:
-                                    logger.error(f"Impossibile salvare diagnostica per step {step['number']}: {e}")
-                        except Exception as e:
-                            logger.error(f"Errore durante diagnostica step {step['number']}: {e}")
-                if last_result:
-                    return last_result
+                final = None
+                stream = QueryStream(batch_size=batch_size, limit=preview_limit)
+            try:
+                yield stream
+            finally:
+                stream.close()
+            if final is not None:
+                self._after_statement(conn, final, trace)
+            for entry in statements[last_select + 1:]:
+                result = self._execute_statement(conn, entry, request.connection_name, db_type, preview_limit, trace=trace)
+                if entry["is_select"]:
+                    result.close()
+                self._after_statement(conn, entry, trace)
+
+    @contextmanager
+    def _connection_lease(self, connection_name: str, environment: Optional[str]) -> Iterator[None]:
+        """Posto nel budget del governatore per la durata dell'esecuzione"""
+        environment = environment if isinstance(environment, str) else ""
+        try:
+            self.governor.acquire(connection_name, environment)
+        except ConnectionBudgetTimeout as e:
+            raise QueryExecutionError(str(e)) from e
+        try:
+            yield
+        finally:
+            self.governor.release(connection_name, environment)
+
+    def execute_query(self, request: QueryExecutionRequest) -> QueryExecutionResult:
+        start_time = time.time()
+        try:
+            result_format = getattr(request, 'result_format', ResultFormat.RECORDS)
+            with self.stream_query(request) as stream:
+                # Le righe vengono convertite blocco per blocco: nessuna copia intermedia del result set
+                if result_format == ResultFormat.RECORDS:
+                    payload = {"data": list(stream.iter_records())}
                 else:
-                    execution_time = (time.time() - start_time) * 1000
-                    return QueryExecutionResult(
-                        query_filename=request.query_filename,
-                        connection_name=request.connection_name,
-                        success=True,
-                        execution_time_ms=execution_time,
-                        row_count=0,
-                        column_names=[],
-                        data=[],
-                        parameters_used=request.parameters
-                    )
-    
+                    payload = shape_result_rows(stream.column_names, list(stream.iter_rows()), result_format)
+            execution_time = (time.time() - start_time) * 1000
+            if stream.column_names:
+                logger.info(f"Query {request.query_filename} eseguita con successo: {stream.row_count} righe")
+            return QueryExecutionResult(
+                query_filename=request.query_filename,
+                connection_name=request.connection_name,
+                success=True,
+                execution_time_ms=execution_time,
+                row_count=stream.row_count,
+                column_names=stream.column_names,
+                has_more=stream.has_more,
+                parameters_used=request.parameters,
+                request_id=request.request_id,
+                **payload
+            )
+        except QueryExecutionError as e:
+            execution_time = (time.time() - start_time) * 1000
+            return QueryExecutionResult(
+                query_filename=request.query_filename,
+                connection_name=request.connection_name,
+                success=False,
+                execution_time_ms=execution_time,
+                row_count=0,
+                error_message=str(e),
+                parameters_used=request.parameters,
+                request_id=request.request_id
+            )
         except Exception as e:
             logger.error(f"Errore generico in execute_query: {e}")
             execution_time = (time.time() - start_time) * 1000
@@ -868,9 +724,108 @@ class QueryService:
                 execution_time_ms=execution_time,
                 row_count=0,
                 error_message=f"Errore generico: {str(e)}",
-                parameters_used=request.parameters
+                parameters_used=request.parameters,
+                request_id=request.request_id
             )
-    
+
+    def _prepare_statements(self, compiled: CompiledQuery, request: QueryExecutionRequest,
+                            query_params: List[QueryParameter], db_type: Optional[str]) -> List[Dict[str, Any]]:
+        """Compone gli statement della query compilata con i valori dei parametri (bind o testo)"""
+        if self._use_bind_variables(request, db_type):
+            values, types, literal_names, lists = self._binding_inputs(request.parameters, query_params, db_type)
+            chunk = self._list_collection_max()
+            render = lambda t: t.render(values, types, literal_names, lists, db_type, chunk)
+        else:
+            values = self._parameter_values(request.parameters, query_params)
+            render = lambda t: (t.render_literal(values), {})
+        multi_step = compiled.multi_step
+        statements: List[Dict[str, Any]] = []
+        for compiled_stmt in compiled.statements:
+            sql, params = render(compiled_stmt.template)
+            statements.append({
+                "sql": sql,
+                "params": params,
+                "is_select": compiled_stmt.is_select,
+                "step": compiled_stmt.step,
+                "multi_step": multi_step,
+                "step_sql": compiled_stmt.step_sql,
+            })
+        return statements
+
+    def _execute_statement(self, conn, entry: Dict[str, Any], connection_name: str, db_type: Optional[str],
+                           preview_limit: Optional[int], execution_options: Optional[Dict[str, Any]] = None,
+                           trace: Optional[ExecutionTrace] = None):
+        """Esegue un singolo statement applicando l'eventuale limite di preview ai SELECT"""
+        stmt = entry["sql"]
+        options = execution_options or {}
+        started = time.monotonic()
+        try:
+            params = self._resolve_list_binds(conn, entry.get("params") or {})
+            stmt_to_execute = stmt
+            if entry["is_select"] and preview_limit:
+                # Una riga in più del limite per sapere se il risultato prosegue (has_more)
+                stmt_to_execute = self._add_limit_clause(stmt, preview_limit + 1, connection_name)
+            try:
+                result = conn.execute(text(stmt_to_execute), params, execution_options=options)
+            except Exception as limit_err:
+                # Su Oracle < 12c FETCH FIRST non è supportato: riesegui la query originale,
+                # il limite viene comunque garantito lato cursore da QueryStream.
+                # Gli altri errori (tabella inesistente, timeout, annullamento) non vanno ripetuti.
+                if (db_type != "oracle" or stmt_to_execute == stmt
+                        or not any(code in str(limit_err) for code in _FETCH_FIRST_UNSUPPORTED)):
+                    raise
+                logger.warning(f"Limite server-side non applicabile, uso limite lato cursore: {limit_err}")
+                result = conn.execute(text(stmt), params, execution_options=options)
+            # Per Oracle, commit dopo DML/DDL
+            if db_type == "oracle" and not entry["is_select"]:
+                try:
+                    conn.commit()
+                except Exception:
+                    pass
+            if trace is not None:
+                trace.statement(entry, "executed", (time.monotonic() - started) * 1000)
+            return result
+        except Exception as e:
+            err_msg = f"Statement execute failed: {stmt} - Error: {str(e)}"
+            logger.error(err_msg)
+            if trace is not None:
+                trace.statement(entry, "failed", (time.monotonic() - started) * 1000, str(e))
+            raise QueryExecutionError(err_msg) from e
+
+    def _after_statement(self, conn, entry: Dict[str, Any], trace: Optional[ExecutionTrace] = None) -> None:
+        """Diagnostica post-esecuzione degli step di script multi-step (solo con tracce attive)"""
+        if trace is None or not entry["multi_step"] or entry["step_sql"] is None:
+            return
+        # --- Diagnostic checks after executing all statements in the step ---
+        try:
+            # If this step references the temporary table, collect diagnostics
+            if 'APPO_BARCODE_NO_EMF' in entry["step_sql"].upper():
+                diagnostics = []
+                try:
+                    res_user = conn.execute(text("SELECT USER FROM DUAL"))
+                    user = res_user.fetchone()[0] if res_user is not None else None
+                    diagnostics.append(f"SESSION_USER={user}")
+                except Exception as e:
+                    diagnostics.append(f"SESSION_USER_ERROR={str(e)}")
+                try:
+                    res_schema = conn.execute(text("SELECT SYS_CONTEXT('USERENV','CURRENT_SCHEMA') FROM DUAL"))
+                    current_schema = res_schema.fetchone()[0] if res_schema is not None else None
+                    diagnostics.append(f"CURRENT_SCHEMA={current_schema}")
+                except Exception:
+                    diagnostics.append("CURRENT_SCHEMA=UNAVAILABLE")
+                # Try a COUNT on the target table to check persistence
+                try:
+                    cnt_res = conn.execute(text("SELECT COUNT(*) FROM starown.APPO_BARCODE_NO_EMF"))
+                    cnt = cnt_res.fetchone()[0]
+                    diagnostics.append(f"COUNT_starown.APPO_BARCODE_NO_EMF={cnt}")
+                except Exception as e:
+                    diagnostics.append(f"COUNT_ERROR={str(e)}")
+                for line in diagnostics:
+                    trace.note(f"STEP {entry['step']} | {line}")
+                logger.debug(f"[Diag] Diagnostica step {entry['step']}: {'; '.join(diagnostics)}")
+        except Exception as e:
+            logger.error(f"Errore durante diagnostica step {entry['step']}: {e}")
+
     def _validate_parameters(self, query_params: List[QueryParameter], provided_params: Dict[str, Any]) -> List[str]:
         """Valida che tutti i parametri obbligatori siano forniti"""
         missing = []
@@ -886,21 +841,9 @@ class QueryService:
     def _substitute_parameters(self, sql_content: str, params: dict, query_params: list) -> str:
         """Sostituisce i parametri nella query SQL"""
         try:
-            processed_sql = sql_content
-            param_values = {}
-            # Prima aggiungi i valori di default
-            for param in query_params:
-                if param.default_value is not None:
-                    param_values[param.name] = param.default_value
-            # Poi sovrascrivi con i valori forniti
-            for param_name, param_value in params.items():
-                # Controlla se è un parametro lista (nome contiene LIST o BARCODES)
-                if param_name and any(kw in param_name.upper() for kw in ['LIST', 'BARCODES', 'CODES', 'IDS']):
-                    param_values[param_name] = self._format_list_parameter(str(param_value) if param_value is not None else "")
-                else:
-                    param_values[param_name] = str(param_value) if param_value is not None else ""
+            param_values = self._parameter_values(params, query_params)
             # Rimuovi le righe 'define'
-            processed_sql = re.sub(r'define\s+\w+\s*=.*?(?=\n|$)', '', processed_sql, flags=re.IGNORECASE | re.MULTILINE)
+            processed_sql = self._strip_defines(sql_content)
             # Sostituisci TUTTI i parametri &PARAM con il valore o stringa vuota
             def replace_param(match):
                 name = match.group(1)
@@ -910,8 +853,91 @@ class QueryService:
         except Exception as e:
             logger.error(f"Errore nella sostituzione dei parametri: {e}")
             return sql_content
+
+    def _binding_inputs(self, params: dict, query_params: list, db_type: Optional[str]):
+        """Valori, tipi, parametri da lasciare nel testo ed elementi delle liste per le bind"""
+        # Con le bind array le liste in IN non passano dal testo: nessun troncamento a 1000 elementi
+        array_lists = db_type in ("oracle", "postgresql")
+        values = self._parameter_values(params, query_params, list_limit=None if array_lists else 1000)
+        types = {p.name: p.parameter_type for p in query_params}
+        literal_names = [name for name in values if self._is_list_parameter(name)]
+        lists = {
+            name: self._split_list_parameter(str(value) if value is not None else "")
+            for name, value in params.items() if self._is_list_parameter(name)
+        }
+        return values, types, literal_names, lists
+
+    def _list_collection_max(self) -> int:
+        """Elementi per collezione Oracle, mai oltre il limite di SYS.ODCIVARCHAR2LIST (32767)"""
+        value = getattr(self.settings, 'query_list_collection_max', ORACLE_COLLECTION_MAX)
+        return min(value, ORACLE_COLLECTION_MAX) if isinstance(value, int) and value > 0 else ORACLE_COLLECTION_MAX
+
+    def _resolve_list_binds(self, conn, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Crea le collezioni Oracle per i parametri lista (tipo SQL da QUERY_LIST_COLLECTION_TYPE)"""
+        if not any(isinstance(v, ListBind) for v in params.values()):
+            return params
+        type_name = getattr(self.settings, 'query_list_collection_type', None)
+        if not isinstance(type_name, str) or not type_name:
+            type_name = "SYS.ODCIVARCHAR2LIST"
+        collection_type = self._collection_type(conn.connection.driver_connection, type_name)
+        return {
+            k: collection_type.newobject(v.values) if isinstance(v, ListBind) else v
+            for k, v in params.items()
+        }
+
+    def _collection_type(self, driver_connection, type_name: str):
+        """Tipo collezione della sessione, letto dal database una sola volta per sessione e nome"""
+        # Con il pool nativo ogni acquire restituisce un nuovo oggetto Connection sulla stessa
+        # sessione (_impl): la chiave è la sessione, tenuta in cache perché il suo id resti univoco
+        session = getattr(driver_connection, "_impl", None) or driver_connection
+        key = (id(session), type_name)
+        with self._collection_types_lock:
+            cached = self._collection_types.get(key)
+            if cached is not None and cached[0] is session:
+                self._collection_types.move_to_end(key)
+                return cached[1]
+        collection_type = driver_connection.gettype(type_name)
+        with self._collection_types_lock:
+            self._collection_types[key] = (session, collection_type)
+            self._collection_types.move_to_end(key)
+            while len(self._collection_types) > COLLECTION_TYPE_CACHE_SIZE:
+                self._collection_types.popitem(last=False)
+        return collection_type
+
+    def _use_bind_variables(self, request: QueryExecutionRequest, db_type: Optional[str]) -> bool:
+        """Bind variable se richieste (o abilitate da configurazione) e supportate dal database"""
+        enabled = getattr(request, 'bind_variables', None)
+        if enabled is None:
+            enabled = getattr(self.settings, 'query_bind_variables', True) is not False
+        return bool(enabled) and db_type in BIND_DIALECTS
+
+    def _parameter_values(self, params: dict, query_params: list, list_limit: Optional[int] = 1000) -> Dict[str, str]:
+        """Valori stringa dei parametri: default del file sovrascritti da quelli forniti, liste formattate"""
+        param_values = {}
+        # Prima aggiungi i valori di default
+        for param in query_params:
+            if param.default_value is not None:
+                param_values[param.name] = param.default_value
+        # Poi sovrascrivi con i valori forniti
+        for param_name, param_value in params.items():
+            # Controlla se è un parametro lista (nome contiene LIST o BARCODES)
+            if self._is_list_parameter(param_name):
+                param_values[param_name] = self._format_list_parameter(
+                    str(param_value) if param_value is not None else "", max_items=list_limit
+                )
+            else:
+                param_values[param_name] = str(param_value) if param_value is not None else ""
+        return param_values
+
+    @staticmethod
+    def _is_list_parameter(param_name: str) -> bool:
+        return bool(param_name) and any(kw in param_name.upper() for kw in ['LIST', 'BARCODES', 'CODES', 'IDS'])
+
+    @staticmethod
+    def _strip_defines(sql_content: str) -> str:
+        return strip_defines(sql_content)
     
-    def _format_list_parameter(self, value: str) -> str:
+    def _format_list_parameter(self, value: str, max_items: Optional[int] = 1000) -> str:
         """Formatta un parametro lista per SQL IN clause.
         Supporta input nei formati: 
         - 123,456,789 
@@ -920,29 +946,16 @@ class QueryService:
         Restituisce: '123','456','789'
         """
         try:
-            if not value or not value.strip():
+            items = self._split_list_parameter(value)
+            if not items:
                 return "''"
             
-            # Rimuovi spazi bianchi iniziali/finali
-            value = value.strip()
-            
-            # Step 1: Se già formattato con apici, rimuovili per normalizzare
-            # Pattern: rimuove apici singoli e doppi
-            value = re.sub(r"['\"]", '', value)
-            
-            # Step 2: Split per vari separatori (virgola, newline, spazi multipli)
-            # Supporta CR+LF, LF, virgola, spazi
-            items = re.split(r'[,\n\r\s]+', value)
+            # Valida lunghezza massima (IN letterale; senza limite con le bind array)
+            if max_items is not None and len(items) > max_items:
+                logger.warning(f"Lista parametri troppo lunga: {len(items)} elementi (max {max_items})")
+                items = items[:max_items]
             
-            # Step 3: Filtra elementi vuoti e rimuovi spazi
-            items = [item.strip() for item in items if item.strip()]
-            
-            # Step 4: Valida lunghezza massima
-            if len(items) > 1000:
-                logger.warning(f"Lista parametri troppo lunga: {len(items)} elementi (max 1000)")
-                items = items[:1000]
-            
-            # Step 5: Formatta come 'val1','val2','val3'
+            # Formatta come 'val1','val2','val3'
             # Escape apici interni raddoppiandoli (SQL standard)
             formatted_items = [f"'{item.replace(chr(39), chr(39)+chr(39))}'" for item in items]
             
@@ -955,10 +968,23 @@ class QueryService:
             # Fallback sicuro
             return "''"
     
+    @staticmethod
+    def _split_list_parameter(value: str) -> List[str]:
+        """Elementi di un parametro lista (separati da virgola, spazi o a capo, apici ignorati)"""
+        if not value or not value.strip():
+            return []
+        # Step 1: Se già formattato con apici, rimuovili per normalizzare
+        value = re.sub(r"['\"]", '', value.strip())
+        # Step 2: Split per vari separatori (virgola, newline, spazi multipli)
+        items = re.split(r'[,\n\r\s]+', value)
+        # Step 3: Filtra elementi vuoti e rimuovi spazi
+        return [item.strip() for item in items if item.strip()]
+
     def _add_limit_clause(self, sql: str, limit: int, connection_name: str) -> str:
-        """Aggiunge una clausola LIMIT/TOP ai DB che la supportano.
+        """Aggiunge una clausola LIMIT/TOP/FETCH FIRST ai DB che la supportano.
         Se `limit` è None o <= 0 la query non viene modificata.
-        Per Oracle non viene aggiunta alcuna clausola.
+        Per Oracle la clausola FETCH FIRST viene accodata alla query (senza subselect,
+        per non generare ORA-00918 su colonne omonime).
         """
         try:
             connection = self.connection_service.get_connection(connection_name)
@@ -974,18 +1000,21 @@ class QueryService:
                     s = s[:-1].rstrip()
                 sql = s
             sql_upper = sql.upper()
-            # Se il db è Oracle, NON aggiungere nulla
-            if db_type == "oracle":
-                return sql
-            # Per gli altri db mantieni la logica precedente
-            if any(keyword in sql_upper for keyword in ['LIMIT', 'ROWNUM', 'TOP', 'FETCH']):
-                return sql  # Query ha già limitazioni
             # Se per qualche motivo limit non è un numero positivo, non modificare la query
             try:
                 if limit is None or int(limit) <= 0:
                     return sql
             except Exception:
                 return sql
+            if db_type == "oracle":
+                # Query già limitate o non limitabili restano invariate
+                if re.search(r'\bROWNUM\b|\bFETCH\b|\bFOR\s+UPDATE\b', sql_upper):
+                    return sql
+                # A capo prima della clausola: la query può terminare con un commento --
+                return f"{sql}\nFETCH FIRST {int(limit)} ROWS ONLY"
+            # Per gli altri db mantieni la logica precedente
+            if any(keyword in sql_upper for keyword in ['LIMIT', 'ROWNUM', 'TOP', 'FETCH']):
+                return sql  # Query ha già limitazioni
 
             if db_type in ["postgresql", "mysql"]:
                 # Applica il limite in modo sicuro incapsulando la query in una subselect
@@ -998,23 +1027,6 @@ class QueryService:
         except Exception:
             return sql
     
-    def _parse_sql_steps(self, sql_content: str):
-        pattern = r"--\$STEP\s*(\d+)\$\s*->\s*(.*)"
-        matches = list(re.finditer(pattern, sql_content))
-        steps = []
-        for i, match in enumerate(matches):
-            start = match.end()
-            end = matches[i+1].start() if i+1 < len(matches) else len(sql_content)
-            step_sql = sql_content[start:end].strip()
-            steps.append({
-                "number": int(match.group(1)),
-                "description": match.group(2).strip(),
-                "sql": step_sql
-            })
-        if not steps:
-            return [{"number": 1, "description": "Query unica", "sql": sql_content.strip()}]
-        return steps
-
     def get_active_jobs_count(self) -> int:
         """Restituisce il numero di job attivi nel scheduler, esclusi quelli di pulizia."""
         return len([job for job in self.scheduler.get_jobs() if not job.name.lower().startswith("cleanup")]) if self.scheduler else 0
@@ -0,0 +1,127 @@
+"""
+Sorveglianza della cartella Query e notifica delle variazioni del catalogo ai client.
+
+Il watcher usa le notifiche del file system (inotify / ReadDirectoryChangesW tramite
+`watchfiles`) e passa al polling periodico se la libreria non è disponibile o se le
+notifiche non funzionano (es. cartelle di rete). Ogni variazione aggiorna solo i
+percorsi coinvolti nel catalogo; il broker inoltra le variazioni ai client UI
+iscritti al canale Server-Sent Events.
+"""
+import asyncio
+import json
+import threading
+from pathlib import Path
+from typing import Optional, Set
+
+from loguru import logger
+
+from app.services.query_catalog import CatalogChange, QueryCatalog
+
+
+class QueryCatalogWatcher:
+    """Thread che mantiene allineato il catalogo alle modifiche della cartella Query"""
+
+    def __init__(self, catalog: QueryCatalog, root: Path, poll_interval_sec: float = 2.0, force_polling: bool = False):
+        self.catalog = catalog
+        self.root = Path(root)
+        self.poll_interval_sec = max(0.1, float(poll_interval_sec))
+        self.force_polling = force_polling
+        self.mode: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Indicizza la cartella e avvia la sorveglianza in background"""
+        if self._thread is not None:
+            return
+        self.catalog.refresh(self.root)
+        self.catalog.watched = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="query-catalog-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Ferma il watcher; il catalogo torna alle scansioni periodiche"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.catalog.watched = False
+
+    def _run(self) -> None:
+        if not self.force_polling and self._watch_native():
+            return
+        self._poll()
+
+    def _watch_native(self) -> bool:
+        """Notifiche del file system; False se non disponibili e serve il polling"""
+        try:
+            from watchfiles import watch
+        except ImportError:
+            logger.info("[QUERY_WATCHER] watchfiles non disponibile: uso il polling")
+            return False
+        self.mode = "native"
+        logger.info(f"[QUERY_WATCHER] Sorveglianza di {self.root} tramite notifiche del file system")
+        try:
+            for changes in watch(self.root, stop_event=self._stop, debounce=200, raise_interrupt=False):
+                self._apply([Path(p) for _, p in changes])
+            return True
+        except Exception as e:
+            if self._stop.is_set():
+                return True
+            logger.warning(f"[QUERY_WATCHER] Notifiche del file system non disponibili ({e}): uso il polling")
+            # Eventi persi durante il cambio di modalità: riallineamento completo
+            self._apply(None)
+            return False
+
+    def _poll(self) -> None:
+        self.mode = "polling"
+        logger.info(f"[QUERY_WATCHER] Sorveglianza di {self.root} in polling ogni {self.poll_interval_sec}s")
+        while not self._stop.wait(self.poll_interval_sec):
+            self._apply(None)
+
+    def _apply(self, paths) -> None:
+        try:
+            self.catalog.refresh(self.root, paths)
+        except Exception as e:
+            logger.error(f"[QUERY_WATCHER] Errore nell'aggiornamento del catalogo: {e}")
+
+
+class QueryCatalogEvents:
+    """Inoltra le variazioni del catalogo ai client iscritti (code asyncio sull'event loop)"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_queue: int = 50):
+        self._loop = loop
+        self._max_queue = max_queue
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._max_queue)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def publish(self, change: CatalogChange) -> None:
+        """Chiamabile da qualsiasi thread: serializza una sola volta e consegna sull'event loop"""
+        message = ("catalog", json.dumps(change.to_dict()))
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, message)
+        except RuntimeError:
+            # Event loop già chiuso (arresto applicazione)
+            pass
+
+    def _dispatch(self, message) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Client troppo lento: scarta le variazioni accodate e chiede di ricaricare la lista
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("resync", "{}"))
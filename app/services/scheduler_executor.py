@@ -0,0 +1,168 @@
+"""
+Esecutore dei job schedulati con slot per connessione e classi di priorità.
+
+I job dello scheduler non usano più il pool di default dell'event loop: il
+lavoro sul database gira su un ThreadPoolExecutor dedicato con un numero di
+worker configurabile (SCHEDULER_MAX_WORKERS) e al massimo
+SCHEDULER_CONNECTION_SLOTS esecuzioni contemporanee per connessione. I job che
+non trovano posto restano in coda; quando si libera un worker parte il job in
+attesa con priorità più alta (high, normal, low) e, a parità, il primo arrivato
+tra quelli la cui connessione ha uno slot libero. Coda ed esecuzioni in corso
+sono visibili nello stato dello scheduler (dashboard).
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class SchedulerTask:
+    """Job accodato: `started` si completa all'avvio, `future` con il risultato"""
+
+    __slots__ = ("label", "connection", "priority", "fn", "args", "seq", "queued_at", "started_at",
+                 "started", "future")
+
+    def __init__(self, label: str, connection: str, priority: str, fn: Callable[..., Any], args: tuple, seq: int):
+        self.label = label
+        self.connection = connection
+        self.priority = priority if priority in PRIORITIES else "normal"
+        self.fn = fn
+        self.args = args
+        self.seq = seq
+        self.queued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.started: Future = Future()
+        self.future: Future = Future()
+
+    def sort_key(self):
+        return PRIORITIES[self.priority], self.seq
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        data = {"label": self.label, "connection": self.connection, "priority": self.priority}
+        if self.started_at is None:
+            data["waiting_sec"] = round(now - self.queued_at, 1)
+        else:
+            data["running_sec"] = round(now - self.started_at, 1)
+        return data
+
+
+class SchedulerExecutor:
+    """Worker globali, slot per connessione e code a priorità per i job schedulati"""
+
+    def __init__(self, max_workers: int = 4, connection_slots: int = 2):
+        self.max_workers = max(1, int(max_workers))
+        self.connection_slots = max(1, int(connection_slots))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pstt-scheduler")
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._queue: List[tuple] = []
+        self._running: Dict[int, SchedulerTask] = {}
+        self._running_by_connection: Dict[str, int] = {}
+        self._completed = 0
+        self._failed = 0
+        self._max_queued = 0
+        self._total_wait_sec = 0.0
+
+    def submit(self, connection_name: str, fn: Callable[..., Any], *args: Any, priority: str = "normal",
+               label: Optional[str] = None) -> SchedulerTask:
+        """Accoda `fn(*args)`; il task parte appena c'è un worker e uno slot sulla connessione"""
+        with self._lock:
+            task = SchedulerTask(label or getattr(fn, "__name__", "job"), connection_name, priority, fn, args,
+                                 next(self._seq))
+            heapq.heappush(self._queue, (task.sort_key(), task))
+            self._max_queued = max(self._max_queued, len(self._queue))
+            self._dispatch()
+            if task.started_at is None:
+                logger.info(
+                    f"[SCHEDULER] {task.label} in coda su {connection_name} "
+                    f"(priorità {task.priority}, in attesa {len(self._queue)})"
+                )
+        return task
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Job in esecuzione e in coda, slot occupati per connessione"""
+        now = time.monotonic()
+        with self._lock:
+            queued = [task for _, task in sorted(self._queue)]
+            running = list(self._running.values())
+            started = self._completed + self._failed + len(running)
+            return {
+                "max_workers": self.max_workers,
+                "connection_slots": self.connection_slots,
+                "running_count": len(running),
+                "queued_count": len(queued),
+                "max_queued": self._max_queued,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_wait_sec": round(self._total_wait_sec / started, 2) if started else 0.0,
+                "running": [t.to_dict(now) for t in running],
+                "queued": [t.to_dict(now) for t in queued],
+                "connections": dict(self._running_by_connection),
+                "updated_at": datetime.now().isoformat(),
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Arresta il pool; i job ancora in coda vengono annullati"""
+        with self._lock:
+            while self._queue:
+                task = heapq.heappop(self._queue)[1]
+                task.started.cancel()
+                task.future.cancel()
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _dispatch(self) -> None:
+        # Chiamato con self._lock acquisito: avvia i job in ordine di priorità finché ci sono worker liberi
+        deferred = []
+        while self._queue and len(self._running) < self.max_workers:
+            entry = heapq.heappop(self._queue)
+            task = entry[1]
+            if task.future.cancelled():
+                continue
+            if self._running_by_connection.get(task.connection, 0) >= self.connection_slots:
+                deferred.append(entry)
+                continue
+            self._start(task)
+        for entry in deferred:
+            heapq.heappush(self._queue, entry)
+
+    def _start(self, task: SchedulerTask) -> None:
+        task.started_at = time.monotonic()
+        self._total_wait_sec += task.started_at - task.queued_at
+        self._running[task.seq] = task
+        self._running_by_connection[task.connection] = self._running_by_connection.get(task.connection, 0) + 1
+        task.started.set_result(task.started_at - task.queued_at)
+        self._pool.submit(self._run, task)
+
+    def _run(self, task: SchedulerTask) -> None:
+        failed = False
+        try:
+            if not task.future.set_running_or_notify_cancel():
+                return
+            try:
+                result = task.fn(*task.args)
+            except BaseException as e:
+                failed = True
+                task.future.set_exception(e)
+            else:
+                task.future.set_result(result)
+        finally:
+            with self._lock:
+                self._running.pop(task.seq, None)
+                remaining = self._running_by_connection.get(task.connection, 1) - 1
+                if remaining > 0:
+                    self._running_by_connection[task.connection] = remaining
+                else:
+                    self._running_by_connection.pop(task.connection, None)
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                self._dispatch()
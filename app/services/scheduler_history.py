@@ -0,0 +1,258 @@
+"""
+Storico esecuzioni dello scheduler su SQLite (export_dir/scheduler_history.db).
+
+Ogni esecuzione è una riga: aggiungere o aggiornare un evento costa una sola
+INSERT/UPDATE indipendentemente dalla dimensione dello storico, e le letture
+(API /history, stato scheduler, report giornaliero) usano gli indici su
+timestamp, query e stato invece di rileggere e filtrare l'intero file.
+
+L'evento completo è salvato come JSON nella colonna `data` (stessi campi di
+SchedulingHistoryItem); timestamp, query, connessione e stato sono duplicati
+in colonne indicizzate. Gli eventi più vecchi di `retention_days` vengono
+eliminati da compact() e lo spazio liberato restituito al file system.
+
+Al primo avvio lo storico legacy scheduler_history.json viene importato e
+rinominato in scheduler_history.json.migrated.
+"""
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional
+
+from loguru import logger
+
+from app.core.config import get_settings
+
+
+HISTORY_DB = "scheduler_history.db"
+LEGACY_HISTORY_FILE = "scheduler_history.json"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS history ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " timestamp TEXT NOT NULL DEFAULT '',"
+    " query TEXT NOT NULL DEFAULT '',"
+    " connection TEXT NOT NULL DEFAULT '',"
+    " status TEXT NOT NULL DEFAULT '',"
+    " duration_sec REAL,"
+    " data TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_history_timestamp ON history (timestamp)",
+    "CREATE INDEX IF NOT EXISTS ix_history_query ON history (query, timestamp)",
+    "CREATE INDEX IF NOT EXISTS ix_history_status ON history (status, timestamp)",
+)
+
+
+class SchedulerHistoryStore:
+    """Storico append-only delle esecuzioni schedulate con retention"""
+
+    def __init__(self, path: Path, retention_days: int = 90):
+        self.path = Path(path)
+        self.retention_days = max(0, int(retention_days))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def append(self, entry: Mapping[str, Any]) -> Optional[int]:
+        """Aggiunge un evento; restituisce l'id della riga (None se non salvato)"""
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    cursor = conn.execute(
+                        "INSERT INTO history (timestamp, query, connection, status, duration_sec, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        _columns(entry) + (_dumps(entry),),
+                    )
+                return cursor.lastrowid
+        except Exception as e:
+            logger.warning(f"[SCHEDULER] Impossibile salvare evento history: {e}")
+            return None
+
+    def update(self, entry_id: int, entry: Mapping[str, Any]) -> bool:
+        """Sostituisce l'evento `entry_id` (es. esito Kafka o timeout di scrittura)"""
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    cursor = conn.execute(
+                        "UPDATE history SET timestamp = ?, query = ?, connection = ?, status = ?, "
+                        "duration_sec = ?, data = ? WHERE id = ?",
+                        _columns(entry) + (_dumps(entry), entry_id),
+                    )
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.warning(f"[SCHEDULER] Impossibile aggiornare evento history {entry_id}: {e}")
+            return False
+
+    def query(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+              query: Optional[str] = None, status: Optional[str] = None, limit: Optional[int] = None,
+              include_undated: bool = False) -> List[Dict[str, Any]]:
+        """Eventi in ordine cronologico; con `limit` i più recenti.
+
+        `include_undated` include anche gli eventi senza timestamp (storico legacy).
+        """
+        clauses: List[str] = []
+        params: List[Any] = []
+        if since is not None or until is not None:
+            window = []
+            if since is not None:
+                window.append("timestamp >= ?")
+                params.append(since.isoformat())
+            if until is not None:
+                window.append("timestamp < ?")
+                params.append(until.isoformat())
+            clauses.append("(" + " AND ".join(window) + (" OR timestamp = '')" if include_undated else ")"))
+        if query is not None:
+            clauses.append("query = ?")
+            params.append(query)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        sql = "SELECT id, data FROM history"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(max(0, int(limit)))
+        try:
+            with self._lock:
+                rows = self._connection().execute(sql, params).fetchall()
+        except Exception as e:
+            logger.error(f"[SCHEDULER] Errore lettura history: {e}")
+            return []
+        return [_loads(entry_id, data) for entry_id, data in reversed(rows)]
+
+    def totals(self) -> Dict[str, Dict[str, Any]]:
+        """Numero di eventi e durata complessiva per stato su tutto lo storico (indice su status)"""
+        try:
+            with self._lock:
+                rows = self._connection().execute(
+                    "SELECT status, COUNT(*), COALESCE(SUM(duration_sec), 0) FROM history GROUP BY status"
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"[SCHEDULER] Errore lettura totali history: {e}")
+            return {}
+        return {status: {"count": count, "duration_sec": duration} for status, count, duration in rows}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def delete_matching(self, pattern: str) -> int:
+        """Elimina gli eventi delle query che corrispondono alla regex (case insensitive)"""
+        regex = re.compile(pattern, flags=re.IGNORECASE)
+        with self._lock:
+            conn = self._connection()
+            names = [q for (q,) in conn.execute("SELECT DISTINCT query FROM history") if regex.match(q or "")]
+            if not names:
+                return 0
+            with conn:
+                cursor = conn.execute(
+                    f"DELETE FROM history WHERE query IN ({','.join('?' * len(names))})", names
+                )
+            return cursor.rowcount
+
+    def compact(self, now: Optional[datetime] = None) -> int:
+        """Elimina gli eventi oltre la retention e recupera lo spazio del file"""
+        if not self.retention_days:
+            return 0
+        cutoff = (now or datetime.now()) - timedelta(days=self.retention_days)
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    cursor = conn.execute(
+                        "DELETE FROM history WHERE timestamp < ? AND timestamp != ''", (cutoff.isoformat(),)
+                    )
+                conn.execute("PRAGMA incremental_vacuum")
+            if cursor.rowcount:
+                logger.info(f"[SCHEDULER] History: eliminati {cursor.rowcount} eventi oltre {self.retention_days} giorni")
+            return cursor.rowcount
+        except Exception as e:
+            logger.warning(f"[SCHEDULER] Compattazione history fallita: {e}")
+            return 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Chiamato con self._lock acquisito
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            # auto_vacuum va impostato prima della creazione delle tabelle
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            with conn:
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+            self._conn = conn
+            self._import_legacy(conn)
+        return self._conn
+
+    def _import_legacy(self, conn: sqlite3.Connection) -> None:
+        """Importa scheduler_history.json (una sola volta, in un'unica transazione)"""
+        legacy = self.path.parent / LEGACY_HISTORY_FILE
+        if not legacy.exists():
+            return
+        try:
+            text = legacy.read_text(encoding="utf-8")
+            entries = json.loads(text) if text.strip() else []
+            entries = [e for e in entries if isinstance(e, dict)]
+            with conn:
+                conn.executemany(
+                    "INSERT INTO history (timestamp, query, connection, status, duration_sec, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [_columns(e) + (_dumps(e),) for e in entries],
+                )
+            legacy.replace(legacy.with_name(LEGACY_HISTORY_FILE + ".migrated"))
+            logger.info(f"[SCHEDULER] Importati {len(entries)} eventi da {legacy} in {self.path.name}")
+        except Exception as e:
+            # Il file resta al suo posto: l'import verrà ritentato al prossimo avvio
+            logger.warning(f"[SCHEDULER] Import history legacy non riuscito ({legacy}): {e}")
+
+
+def _columns(entry: Mapping[str, Any]) -> tuple:
+    duration = entry.get("duration_sec")
+    return (
+        str(entry.get("timestamp") or ""),
+        str(entry.get("query") or ""),
+        str(entry.get("connection") or ""),
+        str(entry.get("status") or ""),
+        duration if isinstance(duration, (int, float)) else None,
+    )
+
+
+def _dumps(entry: Mapping[str, Any]) -> str:
+    return json.dumps({k: v for k, v in entry.items() if k != "id"}, default=str)
+
+
+def _loads(entry_id: int, data: str) -> Dict[str, Any]:
+    entry = json.loads(data)
+    entry["id"] = entry_id
+    return entry
+
+
+_history_stores: Dict[Path, SchedulerHistoryStore] = {}
+_history_stores_lock = threading.Lock()
+
+
+def get_scheduler_history_store(export_dir: Optional[Path] = None) -> SchedulerHistoryStore:
+    """Store condiviso per la cartella export (di default quella dei settings)"""
+    settings = get_settings()
+    path = (Path(export_dir or settings.export_dir) / HISTORY_DB).resolve()
+    store = _history_stores.get(path)
+    if store is None:
+        with _history_stores_lock:
+            store = _history_stores.get(path)
+            if store is None:
+                store = SchedulerHistoryStore(path, getattr(settings, "scheduler_history_retention_days", 90))
+                _history_stores[path] = store
+    return store
@@ -2,6 +2,9 @@
 Servizio per il sistema di scheduling (stub per ora)
 """
 import asyncio
+import hashlib
+import shutil
+import time
 from datetime import datetime
 from typing import Optional, List, Tuple
 from loguru import logger
@@ -9,7 +12,12 @@ import os
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
+from apscheduler.util import localize
 from app.services.query_service import QueryService
+from app.services.connection_governor import run_as_workload
+from app.services.export_service import EXPORT_FILE_FORMATS, export_query_to_file, write_records
+from app.services.scheduler_history import SchedulerHistoryStore, get_scheduler_history_store
+from app.services.scheduler_executor import SchedulerExecutor
 from app.core.config import get_settings
 from pathlib import Path
 from app.models.queries import QueryExecutionRequest
@@ -39,6 +47,110 @@ def _to_int(val, default: int) -> int:
             return default
 
 
+# Eventi recenti tenuti in memoria per stato e dashboard; lo storico completo è nello store
+HISTORY_WINDOW = 200
+# Chiave dell'esecutore per le scritture su file (copie e risultati in memoria): non occupa slot di connessione
+IO_SLOT = "io"
+
+
+def _parse_end_date(ed):
+    """Data di fine schedulazione: accetta stringhe ISO (YYYY-MM-DD), DD/MM/YYYY, oggetti datetime/date.
+    Restituisce None se non è possibile interpretarla."""
+    if ed is None:
+        return None
+    # controlla datetime prima di date perché datetime è sottoclasse di date
+    if isinstance(ed, datetime):
+        return ed.date()
+    if isinstance(ed, date):
+        return ed
+    if isinstance(ed, str):
+        s = ed.strip()
+        # prova ISO YYYY-MM-DD
+        try:
+            return date.fromisoformat(s)
+        except Exception:
+            pass
+        # prova DD/MM/YYYY
+        for fmt in ("%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d"):
+            try:
+                return datetime.strptime(s, fmt).date()
+            except Exception:
+                continue
+    return None
+
+
+def build_trigger(sched: dict) -> Optional[CronTrigger]:
+    """Trigger della schedulazione: cron_expression in modalità 'cron', altrimenti giorni/ora/minuto.
+    None se la schedulazione non ha un orario valido."""
+    if sched.get('scheduling_mode', 'classic') == 'cron':
+        if not sched.get('cron_expression'):
+            return None
+        try:
+            return CronTrigger.from_crontab(sched['cron_expression'])
+        except Exception:
+            logger.warning(f"Impossibile parse cron_expression: {sched.get('cron_expression')}")
+            return None
+    trigger_args = {}
+    if sched.get('hour') is not None:
+        trigger_args['hour'] = sched.get('hour')
+    if sched.get('minute') is not None:
+        trigger_args['minute'] = sched.get('minute')
+    # non supportare i secondi dalla configurazione dashboard; ignora eventuali valori
+    days = sched.get('days_of_week')
+    if days:
+        trigger_args['day_of_week'] = ','.join(str(d) for d in days)
+    return CronTrigger(**trigger_args) if trigger_args else None
+
+
+def _dependency_refs(sched: dict) -> set:
+    """Riferimenti (nome schedulazione o file query) da cui dipende la schedulazione"""
+    refs = sched.get('depends_on') or []
+    if isinstance(refs, str):
+        refs = refs.split('|')
+    return {str(r).strip() for r in refs if str(r).strip()}
+
+
+def _schedule_ref(sched: dict) -> str:
+    return sched.get('name') or f"{sched.get('query')}@{sched.get('connection')}#{sched.get('sharing_mode', 'filesystem')}"
+
+
+# Job APScheduler delle schedulazioni: id stabili derivati dall'identità della schedulazione
+JOB_ID_PREFIX = "export:"
+CLEANUP_JOB_ID = "cleanup_old_exports"
+DAILY_REPORT_JOB_ID = "daily_report"
+_IDENTITY_FIELDS = ('query', 'connection', 'sharing_mode', 'output_dir', 'output_filename_template', 'kafka_topic', 'email_to')
+
+
+def schedule_job_id(sched: dict) -> str:
+    """Id del job: il nome della schedulazione se presente, altrimenti un hash di query, connessione e destinazione.
+    Orario, priorità e opzioni di export non fanno parte dell'identità: modificarli non cambia l'id."""
+    if sched.get('name'):
+        return f"{JOB_ID_PREFIX}{sched['name']}"
+    identity = [str(getattr(sched.get(f), 'value', sched.get(f)) or '') for f in _IDENTITY_FIELDS]
+    return f"{JOB_ID_PREFIX}{hashlib.sha1('|'.join(identity).encode('utf-8')).hexdigest()[:12]}"
+
+
+def _fires_at(sched: dict, minute: datetime) -> bool:
+    """True se la schedulazione scatta nel minuto indicato (ora locale)"""
+    trigger = build_trigger(sched)
+    if trigger is None:
+        return False
+    fire_time = localize(minute, trigger.timezone)
+    return trigger.get_next_fire_time(None, fire_time) == fire_time
+
+
+class _SharedRun:
+    """Esecuzione condivisa da più schedulazioni identiche: una query, un risultato per tutti i sink"""
+
+    __slots__ = ("future", "remaining", "file", "created")
+
+    def __init__(self, participants: int, shared_file: Optional[Path]):
+        self.future = asyncio.get_running_loop().create_future()
+        self.remaining = participants
+        self.file = shared_file
+        self.created = time.monotonic()
+
+
 def _daily_report_job():
     """Funzione modulare sicura per il reloader: genera e invia il report giornaliero."""
     try:
@@ -53,60 +165,54 @@ def _daily_report_job():
 class SchedulerService:
     """Servizio per la gestione dello scheduling"""
     
-    def __init__(self):
+    def __init__(self, query_service: Optional[QueryService] = None):
         self.is_running = False
         self.scheduler = None
         self.jobs = []
-        self.query_service = QueryService()
+        self.query_service = query_service or QueryService()
         self.settings = get_settings()
         self.export_dir = Path(self.settings.export_dir)
         self.queries_to_schedule = [sched["query"] for sched in getattr(self.settings, 'scheduling', [])]
         self.execution_history = []  # Tracciamento esecuzioni
+        self._shared_runs = {}  # Esecuzioni condivise in corso per (query, connessione, parametri, minuto)
+        # DAG depends_on: job a monte riusciti (con istante) per ogni job a valle in attesa, task a valle in esecuzione
+        self._dependency_progress = {}
+        self._dependent_tasks = set()
+        # Worker dedicati ai job: slot per connessione e priorità invece del pool di default del loop
+        self.executor = SchedulerExecutor(
+            max_workers=_to_int(getattr(self.settings, 'scheduler_max_workers', 4), 4),
+            connection_slots=_to_int(getattr(self.settings, 'scheduler_connection_slots', 2), 2)
+        )
         logger.info("SchedulerService inizializzato")
     
+    @property
+    def history_store(self) -> SchedulerHistoryStore:
+        """Storico persistente nella cartella export corrente"""
+        return get_scheduler_history_store(self.export_dir)
+
     def load_history(self):
-        history_path = self.export_dir / "scheduler_history.json"
-        if history_path.exists():
-            try:
-                # Gestisci file vuoto o corrotto con backup automatico
-                text = history_path.read_text(encoding="utf-8")
-                if not text.strip():
-                    self.execution_history = []
-                    return
-                all_history = json.loads(text)
-                # Mantieni tutto lo storico in memoria; il filtro dei 30 giorni verrà applicato in API/UI
-                # per evitare perdite di eventi al riavvio.
-                try:
-                    self.execution_history = list(all_history)
-                except Exception:
-                    self.execution_history = []
-            except Exception as e:
-                # Backup del file corrotto e riparti da history vuota
-                try:
-                    import shutil
-                    ts = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-                    backup = self.export_dir / f"scheduler_history_corrupt_{ts}.json"
-                    shutil.copy(str(history_path), str(backup))
-                    logger.warning(f"[SCHEDULER] scheduler_history.json corrotto: backup in {backup} ({e})")
-                except Exception:
-                    logger.warning(f"[SCHEDULER] scheduler_history.json corrotto e non backupabile: {e}")
-                self.execution_history = []
-        else:
-            self.execution_history = []
+        """Applica la retention e carica in memoria solo gli eventi più recenti"""
+        store = self.history_store
+        store.compact()
+        self.execution_history = store.query(limit=HISTORY_WINDOW)
 
-    def save_history(self):
-        history_path = self.export_dir / "scheduler_history.json"
-        try:
-            tmp_dir = self.export_dir / "_tmp"
-            tmp_dir.mkdir(parents=True, exist_ok=True)
-            tmp_file = tmp_dir / "scheduler_history.json.tmp"
-            with open(tmp_file, "w", encoding="utf-8") as f:
-                json.dump(self.execution_history, f, indent=2)
-            # Move atomico
-            import shutil
-            shutil.move(str(tmp_file), str(history_path))
-        except Exception as e:
-            logger.warning(f"[SCHEDULER] Impossibile salvare history: {e}")
+    def _record_history(self, entry: dict) -> None:
+        """Aggiunge un evento (una INSERT, nessuna riscrittura dello storico)"""
+        entry_id = self.history_store.append(entry)
+        if entry_id is not None:
+            entry["id"] = entry_id
+        self.execution_history.append(entry)
+        if len(self.execution_history) > HISTORY_WINDOW:
+            del self.execution_history[:-HISTORY_WINDOW]
+
+    def _update_history(self, entry: dict) -> None:
+        """Persiste le modifiche a un evento già registrato"""
+        if entry.get("id") is not None:
+            self.history_store.update(entry["id"], entry)
+        else:
+            entry_id = self.history_store.append(entry)
+            if entry_id is not None:
+                entry["id"] = entry_id
 
     async def start(self):
         """Avvia il servizio scheduler"""
@@ -119,83 +225,10 @@ class SchedulerService:
             }
             self.scheduler = AsyncIOScheduler(executors=executors)
             self.scheduler.start()
-            # Schedulazione dinamica da config
-            scheduling = getattr(self.settings, 'scheduling', [])
-            for sched in scheduling:
-                try:
-                    mode = sched.get('scheduling_mode', 'classic')
-                    end_date = sched.get('end_date')
-                    if mode == 'cron' and sched.get('cron_expression'):
-                        try:
-                            trigger = CronTrigger.from_crontab(sched['cron_expression'])
-                        except Exception:
-                            # fallback: try to parse as CronTrigger kwargs
-                            logger.warning(f"Impossibile parse cron_expression: {sched.get('cron_expression')}, skipping job")
-                            continue
-                    else:
-                        trigger_args = {}
-                        if sched.get('hour') is not None:
-                            trigger_args['hour'] = sched.get('hour')
-                        if sched.get('minute') is not None:
-                            trigger_args['minute'] = sched.get('minute')
-                        # non supportare i secondi dalla configurazione dashboard; ignora eventuali valori
-                        days = sched.get('days_of_week')
-                        if days:
-                            trigger_args['day_of_week'] = ','.join(str(d) for d in days)
-                        if not trigger_args:
-                            logger.warning(f"Schedulazione priva di orario per job {sched.get('query')}, skipping")
-                            continue
-                        trigger = CronTrigger(**trigger_args)
-
-                    # Passa l'intera dict di schedulazione al job per avere accesso ai nuovi campi
-                    self.scheduler.add_job(
-                        self.run_scheduled_query,
-                        trigger,
-                        args=[sched],
-                        name=f"Export {sched.get('query')} on {sched.get('connection')}",
-                        misfire_grace_time=600,  # 10 minuti di tolleranza
-                        coalesce=True
-                    )
-                except Exception as e:
-                    logger.error(f"Errore nella creazione job per sched {sched}: {e}")
-            # Cleanup job (direct coroutine, avoids create_task outside loop)
-            def _to_int(x, d):
-                try:
-                    return int(str(x))
-                except Exception:
-                    return d
-            misfire = _to_int(getattr(self.settings, 'scheduler_misfire_grace_time_sec', 900), 900)
-            coalesce_enabled = str(getattr(self.settings, 'scheduler_coalesce_enabled', 'true')).lower() == 'true'
-            self.scheduler.add_job(
-                self.cleanup_old_exports,
-                CronTrigger(hour=7, minute=0),
-                name="Cleanup old exports",
-                misfire_grace_time=misfire,
-                coalesce=coalesce_enabled,
-            )
-            # Daily report job (configurabile via env)
-            try:
-                if getattr(self.settings, 'daily_report_enabled', False):
-                    cron = getattr(self.settings, 'daily_report_cron', None)
-                    if cron:
-                        try:
-                            dr_trigger = CronTrigger.from_crontab(cron)
-                        except Exception:
-                            logger.warning(f"[DAILY_REPORT] Cron non valido '{cron}', fallback su daily_reports_hour")
-                            dr_trigger = CronTrigger(hour=getattr(self.settings, 'daily_reports_hour', 6), minute=0)
-                    else:
-                        dr_trigger = CronTrigger(hour=getattr(self.settings, 'daily_reports_hour', 6), minute=0)
-
-                    self.scheduler.add_job(
-                        _daily_report_job,
-                        dr_trigger,
-                        name="Daily report schedulazioni",
-                        misfire_grace_time=misfire,
-                        coalesce=coalesce_enabled
-                    )
-                    logger.info("[DAILY_REPORT] Job giornaliero configurato")
-            except Exception:
-                logger.exception("[DAILY_REPORT] Errore configurazione job giornaliero")
+            # Schedulazione dinamica da config (job con id stabili, vedi sync_jobs)
+            self.sync_jobs()
+            for cycle in self.dependency_cycles():
+                logger.error(f"[SCHEDULER] Dipendenza circolare, job mai avviati: {' -> '.join(cycle)}")
             logger.info("✅ SchedulerService avviato con job da configurazione")
         except Exception as e:
             logger.error(f"Errore nell'avvio del scheduler: {e}")
@@ -211,15 +244,103 @@ class SchedulerService:
             self.is_running = False
             if self.scheduler:
                 self.scheduler.shutdown()
+            self.executor.shutdown(wait=False)
             logger.info("🛑 SchedulerService fermato")
         except Exception as e:
             logger.error(f"Errore nell'arresto del scheduler: {e}")
+
+    def sync_jobs(self) -> dict:
+        """Allinea i job dello scheduler a settings.scheduling confrontando per id.
+        Aggiunge i nuovi, rimuove quelli non più configurati e tocca gli esistenti solo se cambiati:
+        un trigger diverso viene ripianificato, altri campi aggiornano solo gli argomenti del job.
+        I job invariati conservano prossima esecuzione e stato di misfire."""
+        counts = {"added": 0, "rescheduled": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        if not self.scheduler:
+            return counts
+        misfire = _to_int(getattr(self.settings, 'scheduler_misfire_grace_time_sec', 900), 900)
+        coalesce_enabled = str(getattr(self.settings, 'scheduler_coalesce_enabled', 'true')).lower() == 'true'
+
+        desired = {}
+        for sched in getattr(self.settings, 'scheduling', []) or []:
+            try:
+                if sched.get('depends_on'):
+                    # Avviato al termine delle schedulazioni da cui dipende, non da un orario
+                    continue
+                trigger = build_trigger(sched)
+                if trigger is None:
+                    logger.warning(f"Schedulazione priva di trigger valido per job {sched.get('query')}, skipping")
+                    continue
+                job_id = schedule_job_id(sched)
+                if job_id in desired:
+                    # Schedulazioni duplicate: id distinti e stabili in ordine di configurazione
+                    n = 2
+                    while f"{job_id}~{n}" in desired:
+                        n += 1
+                    job_id = f"{job_id}~{n}"
+                desired[job_id] = (self.run_scheduled_query, trigger, [sched],
+                                   f"Export {sched.get('query')} on {sched.get('connection')}")
+            except Exception as e:
+                logger.error(f"Errore nella creazione job per sched {sched}: {e}")
+
+        desired[CLEANUP_JOB_ID] = (self.cleanup_old_exports, CronTrigger(hour=7, minute=0), [], "Cleanup old exports")
+        try:
+            if getattr(self.settings, 'daily_report_enabled', False):
+                cron = getattr(self.settings, 'daily_report_cron', None)
+                dr_trigger = None
+                if cron:
+                    try:
+                        dr_trigger = CronTrigger.from_crontab(cron)
+                    except Exception:
+                        logger.warning(f"[DAILY_REPORT] Cron non valido '{cron}', fallback su daily_reports_hour")
+                if dr_trigger is None:
+                    dr_trigger = CronTrigger(hour=getattr(self.settings, 'daily_reports_hour', 6), minute=0)
+                desired[DAILY_REPORT_JOB_ID] = (_daily_report_job, dr_trigger, [], "Daily report schedulazioni")
+        except Exception:
+            logger.exception("[DAILY_REPORT] Errore configurazione job giornaliero")
+
+        managed = (CLEANUP_JOB_ID, DAILY_REPORT_JOB_ID)
+        for job in self.scheduler.get_jobs():
+            # I retry one-off hanno id casuali e restano invariati
+            if (job.id.startswith(JOB_ID_PREFIX) or job.id in managed) and job.id not in desired:
+                self.scheduler.remove_job(job.id)
+                counts["removed"] += 1
+
+        for job_id, (func, trigger, args, name) in desired.items():
+            try:
+                job = self.scheduler.get_job(job_id)
+                if job is None:
+                    self.scheduler.add_job(func, trigger, args=args, id=job_id, name=name,
+                                           misfire_grace_time=misfire, coalesce=coalesce_enabled)
+                    counts["added"] += 1
+                    continue
+                changes = {}
+                if list(job.args) != args or job.name != name:
+                    changes.update(args=args, name=name)
+                if job.misfire_grace_time != misfire or job.coalesce != coalesce_enabled:
+                    changes.update(misfire_grace_time=misfire, coalesce=coalesce_enabled)
+                if changes:
+                    job.modify(**changes)
+                if repr(job.trigger) != repr(trigger):
+                    job.reschedule(trigger)
+                    counts["rescheduled"] += 1
+                elif changes:
+                    counts["updated"] += 1
+                else:
+                    counts["unchanged"] += 1
+            except Exception as e:
+                logger.error(f"Errore nell'allineamento job {job_id}: {e}")
+        logger.info(
+            f"[SCHEDULER] Job allineati: {counts['added']} aggiunti, {counts['rescheduled']} ripianificati, "
+            f"{counts['updated']} aggiornati, {counts['removed']} rimossi, {counts['unchanged']} invariati"
+        )
+        return counts
     
     async def run_scheduled_query(self, *args):
         """Esegue la query schedulata. Accetta due forme di chiamata:
         - run_scheduled_query(sched_dict)
         - run_scheduled_query(query_filename, connection_name, end_date)
         """
+        succeeded = False
         try:
             # Normalizza input
             if len(args) == 1 and isinstance(args[0], dict):
@@ -245,32 +366,6 @@ class SchedulerService:
 
             export_id = f"{query_filename}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
             logger.info(f"[SCHEDULER][{export_id}] START export per {query_filename} su {connection_name}")
-            # Controllo data di fine: accetta stringhe ISO (YYYY-MM-DD), stringhe DD/MM/YYYY,
-            # oggetti datetime/date. Se non è possibile parsare, logga il warning ma non blocca l'esecuzione.
-            def _parse_end_date(ed):
-                if ed is None:
-                    return None
-                # se è già un datetime o date
-                # controlla datetime prima di date perché datetime è sottoclasse di date
-                if isinstance(ed, datetime):
-                    return ed.date()
-                if isinstance(ed, date):
-                    return ed
-                if isinstance(ed, str):
-                    s = ed.strip()
-                    # prova ISO YYYY-MM-DD
-                    try:
-                        return date.fromisoformat(s)
-                    except Exception:
-                        pass
-                    # prova DD/MM/YYYY
-                    for fmt in ("%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d"):
-                        try:
-                            return datetime.strptime(s, fmt).date()
-                        except Exception:
-                            continue
-                return None
-
             if end_date:
                 parsed_end = _parse_end_date(end_date)
                 if parsed_end is None:
@@ -298,21 +393,65 @@ class SchedulerService:
                 query_timeout = 300.0
             if query_timeout <= 0:
                 query_timeout = 300.0
-            logger.info(f"[SCHEDULER][{export_id}] START_QUERY timeout={query_timeout}s")
-            loop = asyncio.get_event_loop()
-            error_message = None
+            write_timeout = _to_int(getattr(self.settings, 'scheduler_write_timeout_sec', 120), 120)
             try:
-                result = await asyncio.wait_for(loop.run_in_executor(None, self.query_service.execute_query, req_obj), timeout=query_timeout)
-            except asyncio.TimeoutError:
-                logger.error(f"[SCHEDULER][{export_id}] TIMEOUT_QUERY superati {query_timeout}s")
-                result = None
-                error_message = f"Timeout query ({int(query_timeout)}s)"
-                # CRITICO: chiudi connessioni stale dopo timeout
+                write_timeout = float(write_timeout)
+            except Exception:
+                write_timeout = 120.0
+            if write_timeout <= 0:
+                write_timeout = 120.0
+
+            # Costruisci filename dal template usando SchedulingItem
+            compress_gz = sched.get('output_compress_gz', False)
+            output_format = sched.get('output_format') or 'xlsx'
+            if output_format not in EXPORT_FILE_FORMATS:
+                output_format = 'xlsx'
+            try:
+                sched_item = SchedulingItem(**sched)
+                output_format = sched_item.output_format
+                # Estensione coerente con il formato (.xlsx, .parquet, .arrow)
+                filename = sched_item.render_output_filename(start_time)
+            except Exception:
+                logger.exception("Impossibile creare SchedulingItem o generare filename, uso fallback")
+                filename = f"{query_filename.replace('.sql','')}_{datetime.now().strftime('%Y-%m-%d')}.{output_format}"
+
+            # Gestione condivisione
+            sharing = sched.get('sharing_mode', 'filesystem')
+            output_dir = sched.get('output_dir') or str(self.export_dir)
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+            filepath = Path(output_dir) / filename
+            # Strategia temp locale: crea file temporaneo e poi move atomico
+            tmp_dir = Path(output_dir) / "_tmp"
+            tmp_dir.mkdir(parents=True, exist_ok=True)
+            tmp_file = tmp_dir / f"{filename}.tmp"
+
+            priority = sched.get('priority') or 'normal'
+            shared = self._shared_execution(sched, req_obj, start_time)
+            if shared is not None:
+                # Stessa query, connessione, parametri e minuto di altre schedulazioni: una sola esecuzione
+                share_key, participants, shared_format = shared
+                shared_run, owner = self._join_shared_run(share_key, participants, shared_format, export_id)
+                stream_to_file = shared_run.file is not None
                 try:
-                    self.query_service.connection_service.close_connection(connection_name)
-                    logger.info(f"[SCHEDULER][{export_id}] Connessione chiusa dopo timeout")
-                except Exception as e:
-                    logger.warning(f"[SCHEDULER][{export_id}] Errore chiusura connessione: {e}")
+                    # Ogni partecipante rilascia l'esecuzione condivisa, anche se la query fallisce
+                    if owner:
+                        await self._run_shared_query(
+                            shared_run, connection_name, req_obj, shared_format, query_timeout, write_timeout, priority, export_id
+                        )
+                    result, write_duration, error_message = await asyncio.shield(shared_run.future)
+                    if stream_to_file and result and getattr(result, 'success', True):
+                        await self._run_io(shutil.copyfile, shared_run.file, tmp_file, priority=priority,
+                                           label=f"{export_id} copia")
+                finally:
+                    self._release_shared_run(share_key, shared_run)
+            else:
+                # Filesystem/email: le righe vanno dal cursore al file senza materializzare il risultato.
+                # Kafka ha bisogno dei record in memoria, così come i QueryService senza stream_query.
+                stream_to_file = sharing != 'kafka' and self._can_stream()
+                result, write_duration, error_message = await self._run_query(
+                    connection_name, req_obj, tmp_file if stream_to_file else None, output_format,
+                    query_timeout, write_timeout, priority, export_id
+                )
             duration_query = (datetime.now() - start_time).total_seconds()
             logger.info(f"[SCHEDULER][{export_id}] END_QUERY duration={duration_query:.2f}s rows={getattr(result,'row_count',0)}")
             duration = (datetime.now() - start_time).total_seconds()
@@ -328,7 +467,7 @@ class SchedulerService:
             sharing = sched.get('sharing_mode', 'filesystem')
             export_mode = 'kafka' if sharing == 'kafka' else ('email' if sharing == 'email' else 'filesystem')
             
-            self.execution_history.append({
+            self._record_history({
                 "query": query_filename,
                 "connection": connection_name,
                 "timestamp": start_time.isoformat(),
@@ -339,7 +478,6 @@ class SchedulerService:
                 "start_date": start_date_token,
                 "export_mode": export_mode
             })
-            self.save_history()
 
             if not result or not getattr(result, 'success', True):
                 err_msg = getattr(result, 'error_message', 'unknown') if result else (error_message or 'unknown')
@@ -351,27 +489,6 @@ class SchedulerService:
                     logger.exception("[SCHEDULER] Retry scheduling errore")
                 return
 
-            # Costruisci filename dal template usando SchedulingItem
-            compress_gz = sched.get('output_compress_gz', False)
-            try:
-                sched_item = SchedulingItem(**sched)
-                filename = sched_item.render_filename(start_time)
-                # Assicura estensione .xlsx
-                if not filename.endswith('.xlsx'):
-                    if filename.endswith('.xls'):
-                        filename = filename[:-4] + '.xlsx'
-                    elif not '.' in filename.split('/')[-1]:
-                        filename += '.xlsx'
-            except Exception:
-                logger.exception("Impossibile creare SchedulingItem o generare filename, uso fallback")
-                filename = f"{query_filename.replace('.sql','')}_{datetime.now().strftime('%Y-%m-%d')}.xlsx"
-
-            # Gestione condivisione
-            sharing = sched.get('sharing_mode', 'filesystem')
-            output_dir = sched.get('output_dir') or str(self.export_dir)
-            Path(output_dir).mkdir(parents=True, exist_ok=True)
-            filepath = Path(output_dir) / filename
-
             # Rimuovi file esistente
             if filepath.exists():
                 try:
@@ -381,49 +498,40 @@ class SchedulerService:
                     logger.error(f"[SCHEDULER] Impossibile eliminare file esistente: {filepath} - {e}")
                     return
 
-            import pandas as pd
-            df = pd.DataFrame(result.data)
-            # Strategia temp locale: crea file temporaneo e poi move atomico
-            tmp_dir = Path(output_dir) / "_tmp"
-            tmp_dir.mkdir(parents=True, exist_ok=True)
-            tmp_file = tmp_dir / f"{filename}.tmp"
-            write_start = datetime.now()
-            logger.info(f"[SCHEDULER][{export_id}] START_WRITE temp={tmp_file}")
-            write_timeout = _to_int(getattr(self.settings, 'scheduler_write_timeout_sec', 120), 120)
-            try:
-                write_timeout = float(write_timeout)
-            except Exception:
-                write_timeout = 120.0
-            if write_timeout <= 0:
-                write_timeout = 120.0
-            try:
-                # Usa keyword index=False per chiarezza
-                await asyncio.wait_for(loop.run_in_executor(None, lambda: df.to_excel(tmp_file, index=False)), timeout=write_timeout)
-            except asyncio.TimeoutError:
-                logger.error(f"[SCHEDULER][{export_id}] TIMEOUT_WRITE superati {write_timeout}s")
-                # Aggiorna history: contrassegna come fallita per timeout scrittura
-                try:
-                    if self.execution_history and self.execution_history[-1].get('query') == query_filename:
-                        self.execution_history[-1]['status'] = 'fail'
-                        self.execution_history[-1]['error'] = f"Timeout scrittura ({int(write_timeout)}s)"
-                        self.execution_history[-1]['duration_sec'] = None
-                        self.save_history()
-                except Exception:
-                    pass
-                # Schedule retry
+            if stream_to_file:
+                logger.info(f"[SCHEDULER][{export_id}] END_WRITE duration={write_duration:.2f}s size={tmp_file.stat().st_size}B")
+            else:
+                write_start = datetime.now()
+                logger.info(f"[SCHEDULER][{export_id}] START_WRITE temp={tmp_file}")
                 try:
-                    await self._schedule_retry(sched, start_time, f"Timeout scrittura ({int(write_timeout)}s)")
-                except Exception:
-                    logger.exception("[SCHEDULER] Retry scheduling errore")
-                return
-            write_duration = (datetime.now() - write_start).total_seconds()
-            logger.info(f"[SCHEDULER][{export_id}] END_WRITE duration={write_duration:.2f}s size={tmp_file.stat().st_size}B")
+                    await self._run_io(
+                        write_records, tmp_file, getattr(result, 'column_names', None), result.data, output_format,
+                        priority=priority, label=f"{export_id} scrittura", timeout=write_timeout
+                    )
+                except asyncio.TimeoutError:
+                    logger.error(f"[SCHEDULER][{export_id}] TIMEOUT_WRITE superati {write_timeout}s")
+                    # Aggiorna history: contrassegna come fallita per timeout scrittura
+                    try:
+                        if self.execution_history and self.execution_history[-1].get('query') == query_filename:
+                            self.execution_history[-1]['status'] = 'fail'
+                            self.execution_history[-1]['error'] = f"Timeout scrittura ({int(write_timeout)}s)"
+                            self.execution_history[-1]['duration_sec'] = None
+                            self._update_history(self.execution_history[-1])
+                    except Exception:
+                        pass
+                    # Schedule retry
+                    try:
+                        await self._schedule_retry(sched, start_time, f"Timeout scrittura ({int(write_timeout)}s)")
+                    except Exception:
+                        logger.exception("[SCHEDULER] Retry scheduling errore")
+                    return
+                write_duration = (datetime.now() - write_start).total_seconds()
+                logger.info(f"[SCHEDULER][{export_id}] END_WRITE duration={write_duration:.2f}s size={tmp_file.stat().st_size}B")
 
             # Move con retry
             move_attempts = 3
             for attempt in range(1, move_attempts + 1):
                 try:
-                    import shutil
                     shutil.move(str(tmp_file), str(filepath))
                     logger.info(f"[SCHEDULER][{export_id}] MOVE_OK {tmp_file} -> {filepath} attempt={attempt}")
                     break
@@ -441,7 +549,10 @@ class SchedulerService:
                     # Crea nome file .xls.gz (quando Windows apre il .gz, mostrerà nome senza .gz)
                     # Il file interno rimane .xlsx ma il .gz avrà estensione .xls.gz
                     base_name = filepath.stem  # nome senza estensione
-                    gz_path = filepath.parent / f"{base_name}.xls.gz"
+                    if output_format == 'xlsx':
+                        gz_path = filepath.parent / f"{base_name}.xls.gz"
+                    else:
+                        gz_path = filepath.parent / f"{filepath.name}.gz"
                     
                     logger.info(f"[SCHEDULER][{export_id}] COMPRESS_START {filepath} -> {gz_path}")
                     with open(filepath, 'rb') as f_in:
@@ -500,19 +611,24 @@ class SchedulerService:
                     if self.execution_history and self.execution_history[-1].get('query') == query_filename:
                         self.execution_history[-1]['error'] = f"Kafka export failed: {str(kafka_err)}"
                         self.execution_history[-1]['status'] = 'fail'
-                        self.save_history()
+                        self._update_history(self.execution_history[-1])
                     # Schedule retry
                     try:
                         await self._schedule_retry(sched, start_time, f"Kafka export failed: {str(kafka_err)}")
                     except Exception:
                         logger.exception("[SCHEDULER] Retry scheduling errore")
+                    return
+
+            # Export riuscito: avvia i job che dipendono da questa schedulazione
+            succeeded = True
+            self._trigger_dependents(sched)
 
         except Exception as e:
             logger.error(f"[SCHEDULER] Errore durante export {args}: {e}\n{traceback.format_exc()}")
             # Usa i nomi già risolti se disponibili
             qn = locals().get('query_filename', 'unknown')
             cn = locals().get('connection_name', 'unknown')
-            self.execution_history.append({
+            self._record_history({
                 "query": qn,
                 "connection": cn,
                 "timestamp": datetime.now().isoformat(),
@@ -523,13 +639,14 @@ class SchedulerService:
                 "start_date": None,
                 "export_mode": "unknown"
             })
-            self.save_history()
             # Schedule retry on generic failure
             try:
                 await self._schedule_retry(locals().get('sched', {}), datetime.now(), str(e))
             except Exception:
                 logger.exception("[SCHEDULER] Retry scheduling errore")
         finally:
+            if not succeeded and isinstance(locals().get('sched'), dict):
+                self._dependency_failed(sched)
             # CLEANUP: Rilascia risorse dopo ogni esecuzione schedulata
             try:
                 cn = locals().get('connection_name')
@@ -540,6 +657,208 @@ class SchedulerService:
             except Exception as cleanup_err:
                 logger.warning(f"[SCHEDULER] Errore cleanup: {cleanup_err}")
 
+    def _trigger_dependents(self, sched: dict) -> None:
+        """Avvia (in parallelo) i job a valle i cui job a monte sono tutti riusciti nello stesso ciclo"""
+        refs = {r for r in (sched.get('name'), sched.get('query')) if r}
+        now = datetime.now()
+        window = timedelta(hours=max(1, _to_int(getattr(self.settings, 'scheduler_dependency_window_hours', 12), 12)))
+        for downstream in getattr(self.settings, 'scheduling', []) or []:
+            upstream_refs = _dependency_refs(downstream)
+            satisfied = refs & upstream_refs
+            if not satisfied:
+                continue
+            key = _schedule_ref(downstream)
+            done = self._dependency_progress.setdefault(key, {})
+            # Esiti più vecchi della finestra appartengono a un ciclo precedente: non valgono per il join
+            for ref in [r for r, at in done.items() if now - at > window]:
+                del done[ref]
+            done.update(dict.fromkeys(satisfied, now))
+            if not upstream_refs <= done.keys():
+                logger.info(f"[SCHEDULER] {key}: attesa di {', '.join(sorted(upstream_refs - done))}")
+                continue
+            # Join completato: il prossimo ciclo riparte da zero
+            del self._dependency_progress[key]
+            logger.info(f"[SCHEDULER] Avvio job dipendente {key} dopo {', '.join(sorted(upstream_refs))}")
+            task = asyncio.get_running_loop().create_task(self.run_scheduled_query(dict(downstream)))
+            self._dependent_tasks.add(task)
+            task.add_done_callback(self._dependent_tasks.discard)
+
+    def _dependency_failed(self, sched: dict) -> None:
+        """Job a monte fallito senza altri tentativi: i join parziali che lo attendono ripartono da zero,
+        così i job a valle non usano gli output dei job a monte riusciti in questo ciclo insieme a
+        quelli di un ciclo successivo"""
+        if self._retry_pending(sched):
+            return
+        refs = {r for r in (sched.get('name'), sched.get('query')) if r}
+        for downstream in getattr(self.settings, 'scheduling', []) or []:
+            key = _schedule_ref(downstream)
+            if refs & _dependency_refs(downstream) and self._dependency_progress.pop(key, None):
+                logger.info(f"[SCHEDULER] {key}: join annullato, {', '.join(sorted(refs))} non riuscito")
+
+    def dependency_cycles(self) -> List[List[str]]:
+        """Cicli in depends_on: i job coinvolti non verrebbero mai avviati"""
+        scheduling = getattr(self.settings, 'scheduling', []) or []
+        graph = {}
+        for s in scheduling:
+            for ref in _dependency_refs(s):
+                for upstream in scheduling:
+                    if ref in (upstream.get('name'), upstream.get('query')):
+                        graph.setdefault(_schedule_ref(upstream), set()).add(_schedule_ref(s))
+        cycles, state = [], {}
+
+        def _visit(node, path):
+            state[node] = 'visiting'
+            for nxt in sorted(graph.get(node, ())):
+                if state.get(nxt) == 'visiting':
+                    cycles.append(path[path.index(nxt):] + [nxt])
+                elif nxt not in state:
+                    _visit(nxt, path + [nxt])
+            state[node] = 'done'
+
+        for node in sorted(graph):
+            if node not in state:
+                _visit(node, [node])
+        return cycles
+
+    async def _run_io(self, fn, *args, priority: str = "normal", label: Optional[str] = None,
+                      timeout: Optional[float] = None):
+        """Scrittura file sull'esecutore dello scheduler (slot "io", nessuna connessione database).
+        Il timeout decorre dall'avvio, non dall'attesa in coda."""
+        task = self.executor.submit(IO_SLOT, fn, *args, priority=priority, label=label)
+        await asyncio.wrap_future(task.started)
+        return await asyncio.wait_for(asyncio.wrap_future(task.future), timeout=timeout)
+
+    def _can_stream(self) -> bool:
+        return callable(getattr(self.query_service, 'stream_query', None))
+
+    async def _run_query(self, connection_name: str, req_obj: QueryExecutionRequest, stream_target: Optional[Path],
+                         output_format: str, query_timeout: float, write_timeout: float, priority: str, export_id: str):
+        """Fase query sull'esecutore dello scheduler: (risultato, durata scrittura, errore).
+        Con `stream_target` le righe vanno direttamente nel file, altrimenti il risultato resta in memoria."""
+        write_duration = 0.0
+        error_message = None
+        try:
+            if stream_target is not None:
+                # Query e scrittura sono contestuali: il timeout copre entrambe le fasi
+                query_timeout += write_timeout
+                task = self.executor.submit(
+                    connection_name, run_as_workload, "scheduled", export_query_to_file, self.query_service, req_obj, stream_target, output_format,
+                    priority=priority, label=export_id
+                )
+            else:
+                task = self.executor.submit(
+                    connection_name, run_as_workload, "scheduled", self.query_service.execute_query, req_obj,
+                    priority=priority, label=export_id
+                )
+            # L'attesa di uno slot libero non consuma il timeout della query
+            queue_wait = await asyncio.wrap_future(task.started)
+            if queue_wait >= 1:
+                logger.info(f"[SCHEDULER][{export_id}] Slot ottenuto dopo {queue_wait:.1f}s in coda")
+            logger.info(f"[SCHEDULER][{export_id}] START_QUERY{' streaming format=' + output_format + ' temp=' + str(stream_target) if stream_target else ''} timeout={query_timeout}s")
+            if stream_target is not None:
+                result, write_duration = await asyncio.wait_for(asyncio.wrap_future(task.future), timeout=query_timeout)
+            else:
+                result = await asyncio.wait_for(asyncio.wrap_future(task.future), timeout=query_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"[SCHEDULER][{export_id}] TIMEOUT_QUERY superati {query_timeout}s")
+            result = None
+            error_message = f"Timeout query ({int(query_timeout)}s)"
+            # CRITICO: chiudi connessioni stale dopo timeout
+            try:
+                self.query_service.connection_service.close_connection(connection_name)
+                logger.info(f"[SCHEDULER][{export_id}] Connessione chiusa dopo timeout")
+            except Exception as e:
+                logger.warning(f"[SCHEDULER][{export_id}] Errore chiusura connessione: {e}")
+        return result, write_duration, error_message
+
+    def _shared_execution(self, sched: dict, req_obj: QueryExecutionRequest, start_time: datetime):
+        """(chiave, partecipanti, formato streaming) se altre schedulazioni eseguono la stessa query
+        sulla stessa connessione nello stesso minuto; None altrimenti.
+        Il formato è None quando il risultato deve restare in memoria (Kafka o formati diversi)."""
+        if sched.get('retry_attempt') or sched.get('depends_on'):
+            return None
+        minute = start_time.replace(second=0, microsecond=0)
+        siblings = []
+        for s in getattr(self.settings, 'scheduling', []) or []:
+            if s.get('query') != sched.get('query') or s.get('connection') != sched.get('connection') or s.get('depends_on'):
+                continue
+            parsed_end = _parse_end_date(s.get('end_date'))
+            if parsed_end is not None and _today() > parsed_end:
+                continue
+            try:
+                if _fires_at(s, minute):
+                    siblings.append(s)
+            except Exception:
+                continue
+        if len(siblings) < 2:
+            return None
+        formats = {s.get('output_format') or 'xlsx' for s in siblings}
+        streamable = (
+            self._can_stream() and len(formats) == 1
+            and all(s.get('sharing_mode', 'filesystem') != 'kafka' for s in siblings)
+        )
+        key = (
+            sched.get('query'), sched.get('connection'),
+            json.dumps(req_obj.parameters or {}, sort_keys=True, default=str), minute.isoformat()
+        )
+        return key, len(siblings), (formats.pop() if streamable else None)
+
+    def _join_shared_run(self, key: tuple, participants: int, shared_format: Optional[str],
+                         export_id: str) -> Tuple[_SharedRun, bool]:
+        """Esecuzione condivisa del gruppo: (esecuzione, True se questo partecipante deve eseguire la query)"""
+        self._purge_shared_runs()
+        shared_run = self._shared_runs.get(key)
+        if shared_run is not None:
+            logger.info(f"[SCHEDULER][{export_id}] Riuso dell'esecuzione condivisa in corso")
+            return shared_run, False
+        shared_file = None
+        if shared_format:
+            digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:12]
+            shared_file = self.export_dir / "_tmp" / f"shared_{digest}.{shared_format}.tmp"
+            shared_file.parent.mkdir(parents=True, exist_ok=True)
+        shared_run = _SharedRun(participants, shared_file)
+        self._shared_runs[key] = shared_run
+        logger.info(
+            f"[SCHEDULER][{export_id}] Esecuzione condivisa da {participants} schedulazioni "
+            f"({'streaming ' + shared_format if shared_format else 'risultato in memoria'})"
+        )
+        return shared_run, True
+
+    async def _run_shared_query(self, shared_run: _SharedRun, connection_name: str, req_obj: QueryExecutionRequest,
+                                shared_format: Optional[str], query_timeout: float, write_timeout: float,
+                                priority: str, export_id: str) -> None:
+        """Il primo partecipante esegue la query; l'esito (o l'errore) va a tutti tramite shared_run.future"""
+        try:
+            outcome = await self._run_query(
+                connection_name, req_obj, shared_run.file, shared_format or 'xlsx', query_timeout, write_timeout, priority, export_id
+            )
+        except BaseException as e:
+            shared_run.future.set_exception(e)
+        else:
+            shared_run.future.set_result(outcome)
+
+    def _release_shared_run(self, key: tuple, shared_run: _SharedRun) -> None:
+        """Ultimo partecipante: rimuove l'esecuzione condivisa e il file temporaneo"""
+        shared_run.remaining -= 1
+        if shared_run.remaining <= 0:
+            self._drop_shared_run(key, shared_run)
+
+    def _purge_shared_runs(self, max_age_sec: float = 3600) -> None:
+        # Partecipanti mai arrivati (job rimossi, misfire): le esecuzioni concluse e vecchie vengono scartate
+        now = time.monotonic()
+        for key, shared_run in list(self._shared_runs.items()):
+            if shared_run.future.done() and now - shared_run.created > max_age_sec:
+                self._drop_shared_run(key, shared_run)
+
+    def _drop_shared_run(self, key: tuple, shared_run: _SharedRun) -> None:
+        if self._shared_runs.get(key) is shared_run:
+            del self._shared_runs[key]
+        if shared_run.file is not None:
+            try:
+                shared_run.file.unlink(missing_ok=True)
+            except Exception as e:
+                logger.warning(f"[SCHEDULER] Impossibile eliminare file condiviso {shared_run.file}: {e}")
+
     async def _execute_kafka_export(
         self,
         export_id: str,
@@ -686,7 +1005,7 @@ class SchedulerService:
                     f"Kafka partial failure: {result.failed}/{result.total} messaggi falliti. "
                     f"Errori: {', '.join(result.errors[:3])}"
                 )
-            self.save_history()
+            self._update_history(self.execution_history[-1])
         
         # Se troppi fallimenti, solleva eccezione
         if success_rate < 95.0:
@@ -787,16 +1106,19 @@ class SchedulerService:
                 if (now - mtime).days > 30:
                     file.unlink()
                     logger.info(f"[SCHEDULER] File eliminato: {file}")
+            await asyncio.to_thread(self.history_store.compact)
             logger.info("[SCHEDULER] Pulizia completata")
         except Exception as e:
             logger.error(f"[SCHEDULER] Errore pulizia file: {e}")
     
     def get_status(self) -> dict:
-        """Ottiene lo stato del scheduler"""
+        """Ottiene lo stato del scheduler (contatori su tutto lo storico, ultime esecuzioni dalla memoria)"""
         history = self.execution_history[-20:]  # Ultime 20 esecuzioni
-        success_count = sum(1 for h in self.execution_history if h["status"] == "success")
-        fail_count = sum(1 for h in self.execution_history if h["status"] == "fail")
-        avg_time = (sum(h["duration_sec"] for h in self.execution_history if h["duration_sec"] is not None) / max(1, len(self.execution_history)))
+        totals = self.history_store.totals()
+        success_count = totals.get("success", {}).get("count", 0)
+        fail_count = totals.get("fail", {}).get("count", 0)
+        total_count = sum(t["count"] for t in totals.values())
+        avg_time = sum(t["duration_sec"] for t in totals.values()) / max(1, total_count)
         # Filtra solo i job utente (escludi job tecnici come la pulizia)
         if self.scheduler:
             try:
@@ -815,30 +1137,38 @@ class SchedulerService:
             "history": history,
             "success_count": success_count,
             "fail_count": fail_count,
-            "avg_duration_sec": avg_time
+            "avg_duration_sec": avg_time,
+            "executor": self.executor.get_stats()
         }
 
+    @staticmethod
+    def _retry_pending(sched: dict) -> bool:
+        """True se un export fallito di questa schedulazione verrà ritentato (retry abilitati e tentativi residui)"""
+        settings = get_settings()
+        if str(getattr(settings, 'scheduler_retry_enabled', True)).lower() == 'false':
+            return False
+        max_attempts = _to_int(getattr(settings, 'scheduler_retry_max_attempts', 3), 3)
+        return int(sched.get('retry_attempt', 0) or 0) < max_attempts
+
     async def _schedule_retry(self, sched: dict, start_time: datetime, error_msg: str):
         """Schedule a retry for a failed scheduled export based on Settings.
         Adds a one-off job using DateTrigger after the configured delay.
         """
         try:
             settings = get_settings()
-            enabled = str(getattr(settings, 'scheduler_retry_enabled', True)).lower() != 'false'
-            if not enabled:
+            if not self._retry_pending(sched):
+                if str(getattr(settings, 'scheduler_retry_enabled', True)).lower() != 'false':
+                    logger.info("[SCHEDULER] Retry max attempts raggiunti, nessun nuovo tentativo")
                 return
             delay_min = _to_int(getattr(settings, 'scheduler_retry_delay_minutes', 30), 30)
             max_attempts = _to_int(getattr(settings, 'scheduler_retry_max_attempts', 3), 3)
             attempt = int(sched.get('retry_attempt', 0) or 0)
-            if attempt >= max_attempts:
-                logger.info("[SCHEDULER] Retry max attempts raggiunti, nessun nuovo tentativo")
-                return
             run_date = datetime.now() + timedelta(minutes=delay_min)
             new_sched = dict(sched)
             new_sched['retry_attempt'] = attempt + 1
             # Log in history that a retry is scheduled
             try:
-                self.execution_history.append({
+                self._record_history({
                     "query": new_sched.get('query'),
                     "connection": new_sched.get('connection'),
                     "timestamp": datetime.now().isoformat(),
@@ -849,7 +1179,6 @@ class SchedulerService:
                     "start_date": None,
                     "export_mode": new_sched.get('sharing_mode', 'filesystem')
                 })
-                self.save_history()
             except Exception:
                 pass
             # Add one-off job
@@ -869,14 +1198,17 @@ class SchedulerService:
     
     def remove_scheduling(self, query_filename, connection_name):
         """Rimuove una schedulazione attiva e il relativo job dal scheduler."""
-        # Trova il job corrispondente
-        job_id = f"Export {query_filename} on {connection_name}"
+        # Trova i job corrispondenti tra quelli delle schedulazioni (id stabili, vedi schedule_job_id)
         if self.scheduler:
-            try:
-                self.scheduler.remove_job(job_id)
-                logger.info(f"Job rimosso: {job_id}")
-            except Exception as e:
-                logger.error(f"Impossibile rimuovere job {job_id}: {e}")
+            for job in self.scheduler.get_jobs():
+                sched = job.args[0] if job.args and isinstance(job.args[0], dict) else {}
+                if not job.id.startswith(JOB_ID_PREFIX) or (sched.get('query'), sched.get('connection')) != (query_filename, connection_name):
+                    continue
+                try:
+                    self.scheduler.remove_job(job.id)
+                    logger.info(f"Job rimosso: {job.id}")
+                except Exception as e:
+                    logger.error(f"Impossibile rimuovere job {job.id}: {e}")
         # Rimuovi la schedulazione dalla fonte dati (es. file, config, db)
         # Esempio: se usi una lista in memoria
         self.queries_to_schedule = [q for q in self.queries_to_schedule if q != query_filename]
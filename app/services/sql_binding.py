@@ -0,0 +1,361 @@
+"""
+Conversione dei parametri &PARAM in bind variable (:p_param).
+
+Con i valori incollati nel testo ogni esecuzione con date o barcode diversi è uno
+statement nuovo per il database (hard parse su Oracle). Qui il testo SQL dipende
+solo dal file query: i valori viaggiano come bind, tipizzati secondo
+`QueryParameter.parameter_type`, e il driver riusa lo stesso cursore.
+
+Regole di conversione:
+- `'&X'` (letterale composto dal solo parametro) diventa `:p_x` con valore stringa;
+- `'%&A%&B%'` diventa `('%' || :p_a || '%' || :p_b || '%')`;
+- i letterali tipizzati (`DATE '&D'`, `TIMESTAMP '&D 00:00:00'`, `INTERVAL '&N' DAY`)
+  richiedono una costante stringa: il valore resta incollato nel testo;
+- `&X` fuori dagli apici diventa `:p_x_v` solo per i tipi numerici, data e booleano
+  con valore convertibile; negli altri casi (testo SQL, posizioni di identificatore
+  come `FROM &TABELLA` o `&SCHEMA.tabella`, parametri lista) resta la sostituzione
+  letterale;
+- nei commenti e negli identificatori tra doppi apici il valore viene incollato.
+
+I parametri lista usati come `IN (&LISTA)` diventano un'unica bind di tipo array,
+senza limite di elementi né testo SQL proporzionale alla lista:
+`IN (SELECT column_value FROM TABLE(:p_lista))` su Oracle (collezione SQL, vedi
+`ListBind`) e `= ANY(:p_lista)` su PostgreSQL, con gli elementi convertiti nel tipo
+del parametro (int/Decimal per i numerici, la lista resta letterale se un elemento
+non è convertibile). Altrove la lista resta letterale.
+
+La scansione del testo (stringhe, commenti, posizione dei segnaposto) avviene una
+sola volta in `compile_sql_template`; `SqlTemplate.render` a ogni esecuzione
+compone solo il testo e le bind a partire dai valori.
+"""
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.models.queries import ParameterType
+from app.services.sql_lexer import q_quote_end, quoted_end
+
+
+# Dialetti con concatenazione `||` e bind per nome
+BIND_DIALECTS = ("oracle", "postgresql", "sqlite")
+
+BIND_PREFIX = "p_"
+
+_PLACEHOLDER = re.compile(r"&([A-Za-z0-9_]+)")
+_IN_LIST_BEFORE = re.compile(r"(\bNOT\s+)?\bIN\s*\(\s*$", re.IGNORECASE)
+_IN_LIST_AFTER = re.compile(r"\s*\)")
+_TYPED_LITERAL_BEFORE = re.compile(r"\b(DATE|TIMESTAMP|INTERVAL)\s*$", re.IGNORECASE)
+_IDENTIFIER_KEYWORDS = ("FROM", "JOIN", "INTO", "UPDATE", "TABLE", "ON COMMIT")
+_DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y")
+_DATETIME_FORMATS = (
+    "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M",
+)
+_TRUE_VALUES = ("1", "true", "yes", "si", "s", "y")
+_FALSE_VALUES = ("0", "false", "no", "n")
+
+
+class ListBind:
+    """Valori di un parametro lista da legare come collezione Oracle.
+
+    L'oggetto collezione richiede la connessione del driver: viene creato dal
+    QueryService subito prima dell'esecuzione.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: List[str]):
+        self.values = values
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ListBind) and other.values == self.values
+
+    def __repr__(self) -> str:
+        return f"ListBind({len(self.values)} valori)"
+
+
+def bind_name(param_name: str, typed: bool = False) -> str:
+    """Nome della bind variable (prefisso per evitare parole riservate come :date)"""
+    return f"{BIND_PREFIX}{param_name.lower()}{'_v' if typed else ''}"
+
+
+def convert_value(value: str, parameter_type: Any) -> Optional[Any]:
+    """Valore tipizzato per un parametro fuori dagli apici; None se non convertibile"""
+    text = (value or "").strip()
+    if not text:
+        return None
+    try:
+        if parameter_type == ParameterType.INTEGER:
+            return int(text)
+        if parameter_type == ParameterType.FLOAT:
+            # Accetta anche la virgola decimale (12,5)
+            if text.count(",") == 1 and "." not in text:
+                text = text.replace(",", ".")
+            return Decimal(text)
+        if parameter_type == ParameterType.BOOLEAN:
+            lowered = text.lower()
+            if lowered in _TRUE_VALUES:
+                return 1
+            if lowered in _FALSE_VALUES:
+                return 0
+            return None
+        if parameter_type == ParameterType.DATE:
+            return _parse_datetime(text, _DATE_FORMATS, as_date=True)
+        if parameter_type == ParameterType.DATETIME:
+            return _parse_datetime(text, _DATETIME_FORMATS + _DATE_FORMATS)
+    except (ValueError, InvalidOperation):
+        return None
+    return None
+
+
+def _parse_datetime(text: str, formats: Iterable[str], as_date: bool = False):
+    for fmt in formats:
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return parsed.date() if as_date else parsed
+    return None
+
+
+def compile_sql_template(sql: str) -> "SqlTemplate":
+    """Scandisce il testo una volta e registra la posizione e il contesto di ogni segnaposto"""
+    nodes: List[tuple] = []
+    pending: List[str] = []
+    pos = 0
+    length = len(sql)
+
+    def flush() -> None:
+        if pending:
+            nodes.append(("sql", "".join(pending)))
+            pending.clear()
+
+    while pos < length:
+        ch = sql[pos]
+        nxt = sql[pos + 1] if pos + 1 < length else ""
+        if ch == "-" and nxt == "-":
+            end = sql.find("\n", pos)
+            end = length if end < 0 else end
+            _text_node(nodes, pending, flush, sql[pos:end])
+            pos = end
+        elif ch == "/" and nxt == "*":
+            end = sql.find("*/", pos + 2)
+            end = length if end < 0 else end + 2
+            _text_node(nodes, pending, flush, sql[pos:end])
+            pos = end
+        elif ch in "qQnN" and q_quote_end(sql, pos) is not None:
+            # q-quote Oracle: testo letterale, i segnaposto all'interno restano sostituzioni testuali
+            end = q_quote_end(sql, pos)
+            _text_node(nodes, pending, flush, sql[pos:end])
+            pos = end
+        elif ch == "'":
+            end = quoted_end(sql, pos)
+            token = sql[pos:end]
+            closed = len(token) > 1 and token.endswith("'")
+            body = token[1:-1] if closed else token[1:]
+            if _PLACEHOLDER.search(body):
+                typed_literal = _TYPED_LITERAL_BEFORE.search("".join(pending)[-20:]) is not None
+                flush()
+                nodes.append(("string", _split_parts(body), closed, typed_literal))
+            else:
+                pending.append(token)
+            pos = end
+        elif ch == '"':
+            end = quoted_end(sql, pos)
+            _text_node(nodes, pending, flush, sql[pos:end])
+            pos = end
+        elif ch == "&" and _PLACEHOLDER.match(sql, pos):
+            match = _PLACEHOLDER.match(sql, pos)
+            text_before = "".join(pending)
+            identifier = _identifier_position(text_before, sql, match.end())
+            in_before = _IN_LIST_BEFORE.search(text_before[-40:])
+            in_after = _IN_LIST_AFTER.match(sql, match.end())
+            if in_before is not None and in_after is not None:
+                prefix = in_before.group(0)
+                pending[:] = [text_before[:len(text_before) - len(prefix)]]
+                flush()
+                nodes.append(("param", match.group(1), identifier, prefix, in_after.group(0), in_before.group(1) is not None))
+                pos = in_after.end()
+            else:
+                flush()
+                nodes.append(("param", match.group(1), identifier, None, None, False))
+                pos = match.end()
+        else:
+            pending.append(ch)
+            pos += 1
+    flush()
+    return SqlTemplate(sql, nodes)
+
+
+def _text_node(nodes, pending, flush, token) -> None:
+    """Commento o identificatore tra doppi apici: segnaposto sempre sostituiti nel testo"""
+    if _PLACEHOLDER.search(token):
+        flush()
+        nodes.append(("text", _split_parts(token)))
+    else:
+        pending.append(token)
+
+
+def _split_parts(text: str) -> List[Tuple[bool, str]]:
+    """Testo -> sequenza di (è_parametro, testo o nome parametro)"""
+    parts: List[Tuple[bool, str]] = []
+    last = 0
+    for m in _PLACEHOLDER.finditer(text):
+        if m.start() > last:
+            parts.append((False, text[last:m.start()]))
+        parts.append((True, m.group(1)))
+        last = m.end()
+    if last < len(text):
+        parts.append((False, text[last:]))
+    return parts
+
+
+class SqlTemplate:
+    """Testo SQL compilato: parti fisse e segnaposto con il loro contesto"""
+
+    __slots__ = ("text", "nodes", "placeholders")
+
+    def __init__(self, text: str, nodes: List[tuple]):
+        self.text = text
+        self.nodes = nodes
+        names = []
+        for node in nodes:
+            if node[0] == "param":
+                names.append(node[1])
+            elif node[0] in ("string", "text"):
+                names.extend(value for is_name, value in node[1] if is_name)
+        self.placeholders = tuple(dict.fromkeys(names))
+
+    def render_literal(self, values: Dict[str, str]) -> str:
+        """Valori incollati nel testo (sostituzione classica)"""
+        out = []
+        for node in self.nodes:
+            kind = node[0]
+            if kind == "sql":
+                out.append(node[1])
+            elif kind == "text":
+                out.append(_join_literal(node[1], values))
+            elif kind == "string":
+                out.append("'" + _join_literal(node[1], values) + ("'" if node[2] else ""))
+            else:
+                _, name, _, prefix, suffix, _ = node
+                out.append(f"{prefix or ''}{values.get(name, '')}{suffix or ''}")
+        return "".join(out)
+
+    def render(self, values: Dict[str, str], types: Dict[str, Any], literal_names: Iterable[str] = (),
+               lists: Optional[Dict[str, List[str]]] = None, list_dialect: Optional[str] = None,
+               list_chunk: int = 32767) -> Tuple[str, Dict[str, Any]]:
+        """Testo con bind variable e relativi valori (vedi `bind_parameters`)"""
+        literal_names = set(literal_names)
+        lists = lists or {}
+        binds: Dict[str, Any] = {}
+        out = []
+        for node in self.nodes:
+            kind = node[0]
+            if kind == "sql":
+                out.append(node[1])
+            elif kind == "text":
+                out.append(_join_literal(node[1], values))
+            elif kind == "string":
+                _, parts, closed, typed_literal = node
+                if typed_literal:
+                    # DATE/TIMESTAMP/INTERVAL '...': il database accetta solo una costante
+                    out.append("'" + _join_literal(parts, values) + ("'" if closed else ""))
+                else:
+                    out.append(_bind_string(parts, closed, values, literal_names, binds))
+            else:
+                _, name, identifier, prefix, suffix, negated = node
+                if prefix is not None and name in lists and list_dialect in ("oracle", "postgresql"):
+                    bound = _bind_list(name, lists[name], types.get(name), negated, list_dialect, list_chunk, binds)
+                    if bound is not None:
+                        out.append(bound)
+                        continue
+                value = values.get(name, "")
+                typed = None
+                if name not in literal_names and not identifier:
+                    typed = convert_value(value, types.get(name))
+                if typed is None:
+                    out.append(f"{prefix or ''}{value}{suffix or ''}")
+                else:
+                    key = bind_name(name, typed=True)
+                    binds[key] = typed
+                    out.append(f"{prefix or ''}:{key}{suffix or ''}")
+        return "".join(out), binds
+
+
+def bind_parameters(sql: str, values: Dict[str, str], types: Dict[str, Any],
+                    literal_names: Iterable[str] = (), lists: Optional[Dict[str, List[str]]] = None,
+                    list_dialect: Optional[str] = None, list_chunk: int = 32767) -> Tuple[str, Dict[str, Any]]:
+    """Sostituisce i segnaposto &PARAM con bind variable.
+
+    `values` contiene i valori stringa (default già applicati), `types` il tipo di ogni
+    parametro, `literal_names` i parametri da incollare nel testo (es. liste fuori da IN).
+    `lists` contiene gli elementi dei parametri lista da legare come array in `IN (&X)`
+    per `list_dialect` ('oracle' o 'postgresql'); su Oracle collezioni oltre `list_chunk`
+    elementi vengono suddivise in più bind.
+    Restituisce (sql, binds); i parametri non forniti valgono stringa vuota come nella
+    sostituzione letterale.
+    """
+    return compile_sql_template(sql).render(values, types, literal_names, lists, list_dialect, list_chunk)
+
+
+def _join_literal(parts: List[Tuple[bool, str]], values: Dict[str, str]) -> str:
+    return "".join(values.get(value, "") if is_name else value for is_name, value in parts)
+
+
+def _bind_list(name: str, items: List[str], parameter_type: Any, negated: bool, dialect: str, chunk: int,
+               binds: Dict[str, Any]) -> Optional[str]:
+    """`[NOT] IN (&X)` come confronto con un array; None se la lista deve restare letterale"""
+    key = bind_name(name)
+    if dialect == "postgresql":
+        # L'array ha il tipo degli elementi (text[] per le stringhe): `colonna_numerica = ANY(text[])`
+        # non esiste, quindi gli elementi seguono il tipo del parametro
+        typed = _typed_list_items(items, parameter_type)
+        if typed is None:
+            return None
+        binds[key] = typed
+        return f"<> ALL(:{key})" if negated else f"= ANY(:{key})"
+    chunk = max(1, int(chunk))
+    parts = [items[i:i + chunk] for i in range(0, len(items), chunk)] or [[]]
+    selects = []
+    for idx, part in enumerate(parts):
+        part_key = key if idx == 0 else f"{key}_{idx + 1}"
+        binds[part_key] = ListBind(part)
+        selects.append(f"SELECT column_value FROM TABLE(:{part_key})")
+    return f"{'NOT IN' if negated else 'IN'} ({' UNION ALL '.join(selects)})"
+
+
+def _typed_list_items(items: List[str], parameter_type: Any) -> Optional[List[Any]]:
+    """Elementi convertiti nel tipo del parametro; None se anche uno solo non è convertibile"""
+    if parameter_type in (None, ParameterType.STRING):
+        return list(items)
+    typed = [convert_value(item, parameter_type) for item in items]
+    return None if any(value is None for value in typed) else typed
+
+
+def _bind_string(parts: List[Tuple[bool, str]], closed: bool, values: Dict[str, str], literal_names,
+                 binds: Dict[str, Any]) -> str:
+    """Letterale con segnaposto -> bind singola o concatenazione di parti fisse e bind"""
+    if any(is_name and value in literal_names for is_name, value in parts) or not closed:
+        return "'" + _join_literal(parts, values) + ("'" if closed else "")
+    out = []
+    for is_name, value in parts:
+        if is_name:
+            key = bind_name(value)
+            binds[key] = values.get(value, "")
+            out.append(f":{key}")
+        else:
+            out.append(f"'{value}'")
+    return out[0] if len(out) == 1 else "(" + " || ".join(out) + ")"
+
+
+def _identifier_position(text_before: str, sql: str, end: int) -> bool:
+    """Vero se il segnaposto compone un nome (schema.&TAB, &SCHEMA.tab, FROM &TAB)"""
+    if end < len(sql) and sql[end] == ".":
+        return True
+    before = text_before[-40:].rstrip()
+    if before.endswith("."):
+        return True
+    upper = before[-12:].upper()
+    return any(re.search(rf"\b{kw}$", upper) for kw in _IDENTIFIER_KEYWORDS)
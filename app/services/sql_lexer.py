@@ -0,0 +1,218 @@
+"""
+Suddivisione di uno script SQL in statement con una sola passata sul testo.
+
+Riconosce letterali stringa ('' come apice escapato), q-quote Oracle (q'[...]',
+nq'{...}'), identificatori tra doppi apici, commenti `--` e `/* */`, blocchi
+PL/SQL (BEGIN/DECLARE ... END; e CREATE PROCEDURE/FUNCTION/PACKAGE/TRIGGER/TYPE)
+e la riga `/` di SQL*Plus come terminatore. I `;` dentro stringhe, commenti e
+blocchi non spezzano lo statement. Stringhe e commenti vengono saltati con
+`str.find`: il costo resta lineare anche con liste letterali molto lunghe.
+"""
+import re
+from typing import List, Optional
+
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_$#]*")
+_Q_CLOSERS = {"[": "]", "{": "}", "(": ")", "<": ">"}
+# Unità PL/SQL dopo CREATE [OR REPLACE] [EDITIONABLE|NONEDITIONABLE]: terminano solo con `/` o fine testo
+_PLSQL_UNITS = ("PROCEDURE", "FUNCTION", "PACKAGE", "TRIGGER", "TYPE", "LIBRARY")
+_CREATE_MODIFIERS = ("OR", "REPLACE", "EDITIONABLE", "NONEDITIONABLE")
+_SELECT_KEYWORDS = ("SELECT", "WITH")
+
+
+class SqlStatement:
+    """Statement dello script: testo (senza `;` finale se SQL) e prima parola chiave"""
+
+    __slots__ = ("text", "keyword", "plsql")
+
+    def __init__(self, text: str, keyword: Optional[str], plsql: bool):
+        self.text = text
+        self.keyword = keyword
+        self.plsql = plsql
+
+    @property
+    def is_select(self) -> bool:
+        return self.keyword in _SELECT_KEYWORDS
+
+    def __repr__(self) -> str:
+        return f"SqlStatement({self.keyword}, plsql={self.plsql}, {self.text[:40]!r})"
+
+
+def q_quote_end(sql: str, pos: int) -> Optional[int]:
+    """Fine (esclusa) del q-quote che inizia in `pos` (q'X...X' o nq'X...X'), None se non è un q-quote"""
+    start = pos
+    if sql[pos] in "nN":
+        pos += 1
+    if pos + 2 >= len(sql) or sql[pos] not in "qQ" or sql[pos + 1] != "'":
+        return None
+    if start > 0 and (sql[start - 1].isalnum() or sql[start - 1] in "_$#"):
+        return None
+    delimiter = sql[pos + 2]
+    if delimiter.isspace():
+        return None
+    closing = _Q_CLOSERS.get(delimiter, delimiter) + "'"
+    end = sql.find(closing, pos + 3)
+    return len(sql) if end < 0 else end + 2
+
+
+def quoted_end(sql: str, pos: int) -> int:
+    """Fine (esclusa) della stringa '...' o dell'identificatore "..." che inizia in `pos`"""
+    quote = sql[pos]
+    length = len(sql)
+    pos += 1
+    while True:
+        end = sql.find(quote, pos)
+        if end < 0:
+            return length
+        if quote == "'" and end + 1 < length and sql[end + 1] == "'":
+            pos = end + 2
+            continue
+        return end + 1
+
+
+def split_statements(sql: str) -> List[SqlStatement]:
+    """Statement dello script nell'ordine; quelli composti solo da commenti vengono scartati"""
+    statements: List[SqlStatement] = []
+    length = len(sql)
+    pos = 0
+    start = 0
+    state = _StatementState()
+    line_blank = True
+
+    def emit(end: int) -> None:
+        text = sql[start:end].strip()
+        if state.significant and text:
+            statements.append(SqlStatement(text, state.keyword, state.mode is not None))
+
+    while pos < length:
+        ch = sql[pos]
+        if ch == "\n":
+            line_blank = True
+            pos += 1
+        elif ch in " \t\r\f\v":
+            pos += 1
+        elif ch == "-" and sql.startswith("--", pos):
+            end = sql.find("\n", pos)
+            pos = length if end < 0 else end
+        elif ch == "/" and sql.startswith("/*", pos):
+            end = sql.find("*/", pos + 2)
+            pos = length if end < 0 else end + 2
+            line_blank = False
+        elif ch == "/" and line_blank and _rest_of_line_blank(sql, pos + 1):
+            # Riga con la sola `/`: termina lo statement o il blocco PL/SQL corrente
+            emit(pos)
+            end = sql.find("\n", pos)
+            pos = length if end < 0 else end
+            start = pos
+            state = _StatementState()
+        elif ch == "'" or ch == '"':
+            pos = quoted_end(sql, pos)
+            state.token()
+            line_blank = False
+        elif ch in "qQnN" and q_quote_end(sql, pos) is not None:
+            pos = q_quote_end(sql, pos)
+            state.token()
+            line_blank = False
+        elif ch.isalpha() or ch == "_":
+            match = _WORD.match(sql, pos)
+            state.word(match.group(0).upper())
+            pos = match.end()
+            line_blank = False
+        elif ch == ";":
+            line_blank = False
+            if state.mode == "unit" or (state.mode == "block" and not state.block_closed()):
+                pos += 1
+                state.token()
+                continue
+            # Il blocco anonimo conserva il proprio `END;`
+            emit(pos + 1 if state.mode == "block" else pos)
+            pos += 1
+            start = pos
+            state = _StatementState()
+        else:
+            state.token()
+            line_blank = False
+            pos += 1
+    emit(length)
+    return statements
+
+
+def _rest_of_line_blank(sql: str, pos: int) -> bool:
+    end = sql.find("\n", pos)
+    return not sql[pos:end if end >= 0 else len(sql)].strip()
+
+
+class _StatementState:
+    """Stato dello statement in lettura: prima parola, tipo (SQL/blocco/unità) e annidamento BEGIN/CASE.
+    I sottoprogrammi dichiarati nel blocco (PROCEDURE/FUNCTION ... IS ... BEGIN ... END nome;)
+    chiudono il proprio BEGIN senza chiudere il blocco che li contiene.
+    """
+
+    __slots__ = ("significant", "keyword", "mode", "create", "depth", "opened", "after_end",
+                 "header", "subprograms", "ended_at")
+
+    def __init__(self):
+        self.significant = False
+        self.keyword: Optional[str] = None
+        self.mode: Optional[str] = None   # None = SQL, "block" = blocco anonimo, "unit" = CREATE PL/SQL
+        self.create = False
+        self.depth = 0
+        self.opened = False
+        self.after_end = False
+        self.header = False             # dopo PROCEDURE/FUNCTION, in attesa di IS/AS (o `;` se dichiarazione)
+        self.subprograms: List[int] = []  # profondità di apertura dei sottoprogrammi con corpo
+        self.ended_at: Optional[int] = None
+
+    def token(self) -> None:
+        self.significant = True
+        self.after_end = False
+
+    def word(self, word: str) -> None:
+        if not self.significant:
+            self.significant = True
+            self.keyword = word
+            if word in ("BEGIN", "DECLARE"):
+                self.mode = "block"
+            self.create = word == "CREATE"
+        elif self.create:
+            if word in _PLSQL_UNITS:
+                self.mode = "unit"
+            if word not in _CREATE_MODIFIERS:
+                self.create = False
+        if self.mode != "block":
+            return
+        if self.after_end:
+            self.after_end = False
+            if word in ("IF", "LOOP"):
+                # END IF / END LOOP non chiudono un BEGIN
+                self.depth += 1
+                self.ended_at = None
+                return
+            if word == "CASE":
+                # END CASE chiude il CASE già conteggiato
+                return
+        if word in ("PROCEDURE", "FUNCTION"):
+            self.header = True
+        elif self.header and word in ("IS", "AS"):
+            self.header = False
+            self.subprograms.append(self.depth)
+        elif word in ("BEGIN", "CASE"):
+            self.depth += 1
+            self.opened = True
+        elif word == "END":
+            self.depth -= 1
+            self.after_end = True
+            self.ended_at = self.depth
+
+    def block_closed(self) -> bool:
+        """Chiamata su `;` nel blocco: True se il `;` chiude il blocco intero"""
+        ended_at, self.ended_at = self.ended_at, None
+        if self.header:
+            # Dichiarazione anticipata (PROCEDURE p;): nessun corpo da attendere
+            self.header = False
+            return False
+        if ended_at is not None and self.subprograms and ended_at == self.subprograms[-1]:
+            # END nome; del sottoprogramma: il blocco esterno resta aperto
+            self.subprograms.pop()
+            return False
+        return self.opened and self.depth <= 0
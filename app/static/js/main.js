@@ -13,9 +13,12 @@ class PSITTool {
         this.selectedSubdir = 'ALL';
         this.editorFilename = null;
         this.editorMode = 'view'; // 'view' | 'edit'
+        this.activeJobId = null;
+        this.catalogVersion = null;
         
         this.initializeEventListeners();
         this.loadQueries();
+        this.subscribeCatalogEvents();
         this.loadConnectionStatus();
     }
 
@@ -35,6 +38,14 @@ class PSITTool {
             this.executeQuery();
         });
         
+        // Cancel running query job (loading overlay)
+        const cancelJobBtn = document.getElementById('loadingCancelBtn');
+        if (cancelJobBtn) {
+            cancelJobBtn.addEventListener('click', () => {
+                this.cancelActiveJob();
+            });
+        }
+        
         // Export buttons
         document.getElementById('exportExcelBtn').addEventListener('click', () => {
             this.exportResults('excel');
@@ -90,6 +101,7 @@ class PSITTool {
             }
             
             this.queries = data.queries;
+            this.catalogVersion = data.version ?? null;
             this.populateSubdirSelector();
             this.renderQueryList();
             
@@ -101,6 +113,35 @@ class PSITTool {
         }
     }
 
+    subscribeCatalogEvents() {
+        // Variazioni del catalogo inviate dal server: la lista viene ricaricata solo se si perde un evento
+        if (!window.EventSource) return;
+        const source = new EventSource('/api/queries/events');
+        source.addEventListener('hello', (e) => {
+            const data = JSON.parse(e.data);
+            if (this.catalogVersion !== null && data.version !== this.catalogVersion) {
+                this.loadQueries();
+            }
+        });
+        source.addEventListener('catalog', (e) => this.applyCatalogChange(JSON.parse(e.data)));
+        source.addEventListener('resync', () => this.loadQueries());
+    }
+
+    applyCatalogChange(change) {
+        if (this.catalogVersion === null || change.version <= this.catalogVersion) return;
+        if (change.version !== this.catalogVersion + 1) {
+            this.loadQueries();
+            return;
+        }
+        const key = (q) => `${q.subdirectory || ''}|${q.filename}`;
+        const changed = new Set([...change.removed, ...change.upserted].map(key));
+        this.queries = this.queries.filter(q => !changed.has(key(q))).concat(change.upserted);
+        this.queries.sort((a, b) => a.filename.localeCompare(b.filename));
+        this.catalogVersion = change.version;
+        this.populateSubdirSelector();
+        this.renderQueryList();
+    }
+
     returnToSelection() {
         // Hide results and reset grid, filters and counters
         try {
@@ -797,31 +838,16 @@ class PSITTool {
                 });
             } catch (e) { /* ignore */ }
             
-            // Esegue la query
-            const response = await fetch('/api/queries/execute', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    query_filename: this.currentQuery.filename,
-                    connection_name: this.currentConnection,
-                    parameters: parameters,
-                    // UI preview should be limited to 1000 rows to keep responsiveness
-                    limit: 1000
-                })
+            // Esegue la query come job asincrono (niente timeout su estrazioni lunghe)
+            const result = await this.runQueryJob({
+                query_filename: this.currentQuery.filename,
+                connection_name: this.currentConnection,
+                parameters: parameters,
+                // UI preview should be limited to 1000 rows to keep responsiveness
+                limit: 1000
             });
-            let result;
-            try {
-                result = await response.json();
-            } catch (parseErr) {
-                // Fallback: show status code/text for non-JSON responses
-                const msg = `HTTP ${response.status} - risposta non valida`;
-                throw new Error(msg);
-            }
-            if (!response.ok || !result.success) {
-                const detailMsg = result && (result.error_message || result.detail);
-                throw new Error(detailMsg || 'Errore nell\'esecuzione della query');
+            if (!result.success) {
+                throw new Error(result.error_message || 'Errore nell\'esecuzione della query');
             }
             
             // Success: ensure required inputs are not shown as invalid anymore
@@ -831,13 +857,11 @@ class PSITTool {
             } catch (e) { /* ignore */ }
 
             this.lastResults = result;
-            // mark as preview only if the returned row_count equals the preview limit
-            const previewLimit = 1000;
-            this.lastResultsIsPreview = (result.row_count === previewLimit);
-            // If the result contains less than the preview limit, treat it as full dataset and cache it
-            if (result.row_count < previewLimit) {
+            // the server reports whether rows were left behind the preview limit
+            this.lastResultsIsPreview = !!result.has_more;
+            // If the result is not truncated, treat it as full dataset and cache it
+            if (!this.lastResultsIsPreview) {
                 this.fullResults = result;
-                this.lastResultsIsPreview = false;
             } else {
                 // clear any cached fullResults for previous queries
                 this.fullResults = null;
@@ -859,7 +883,8 @@ class PSITTool {
         const errorSection = document.getElementById('errorSection');
         // Nascondi errori precedenti
         errorSection.classList.add('hidden');
-        if (result.data.length === 0) {
+        const rows = this.resultRows(result);
+        if (rows.length === 0) {
             resultsTable.innerHTML = `
                 <thead></thead>
                 <tbody>
@@ -882,7 +907,7 @@ class PSITTool {
             // Genera filtri
             this.renderFilters(result.column_names);
             // Genera righe
-            this.renderTableRows(result.data);
+            this.renderTableRows(rows);
         }
         resultsSection.classList.remove('hidden');
 
@@ -902,6 +927,21 @@ class PSITTool {
         } catch (e) { /* ignore */ }
     }
     
+    resultRows(result) {
+        // Righe come array nell'ordine di column_names, qualunque sia il formato del payload
+        // (rows: array per riga, columns: array per colonna, data: oggetti per riga)
+        const columnNames = result.column_names || [];
+        if (Array.isArray(result.rows)) return result.rows;
+        if (result.columns) {
+            const columns = columnNames.map(col => result.columns[col] || []);
+            const count = columns.length ? columns[0].length : 0;
+            const rows = new Array(count);
+            for (let i = 0; i < count; i++) rows[i] = columns.map(values => values[i]);
+            return rows;
+        }
+        return (result.data || []).map(record => columnNames.map(col => record[col]));
+    }
+
     renderFilters(columnNames) {
         const filtersRow = document.getElementById('filtersRow');
         const gridContainer = filtersRow ? filtersRow.querySelector('.grid') : null;
@@ -935,10 +975,10 @@ class PSITTool {
             const tr = document.createElement('tr');
             // Colori alterni con maggiore contrasto
             tr.className = idx % 2 === 0 ? 'bg-white hover:bg-blue-100' : 'bg-blue-50 hover:bg-blue-200';
-            Object.values(row).forEach(value => {
+            row.forEach(value => {
                 const td = document.createElement('td');
                 td.className = 'px-6 py-4 text-sm text-gray-900';
-                td.textContent = value !== null ? value : '';
+                td.textContent = value !== null && value !== undefined ? value : '';
                 tr.appendChild(td);
             });
             tbody.appendChild(tr);
@@ -973,24 +1013,27 @@ class PSITTool {
 
         // Usa il dataset completo se disponibile, altrimenti la preview
         const source = this.fullResults ? this.fullResults : this.lastResults;
-        let filteredData = Array.isArray(source.data) ? [...source.data] : [];
+        let filteredData = [...this.resultRows(source)];
+        const columnIndex = column => (source.column_names || []).indexOf(column);
         
         // Applica filtri
         Object.keys(this.filters).forEach(column => {
             const filterValue = this.filters[column];
-            if (filterValue) {
+            const idx = columnIndex(column);
+            if (filterValue && idx >= 0) {
                 filteredData = filteredData.filter(row => {
-                    const cellValue = row[column];
+                    const cellValue = row[idx];
                     return cellValue && cellValue.toString().toLowerCase().includes(filterValue);
                 });
             }
         });
         
         // Applica ordinamento
-        if (this.sorting.column) {
+        const sortIdx = this.sorting.column ? columnIndex(this.sorting.column) : -1;
+        if (sortIdx >= 0) {
             filteredData.sort((a, b) => {
-                const aValue = a[this.sorting.column];
-                const bValue = b[this.sorting.column];
+                const aValue = a[sortIdx];
+                const bValue = b[sortIdx];
                 
                 if (aValue < bValue) return this.sorting.direction === 'asc' ? -1 : 1;
                 if (aValue > bValue) return this.sorting.direction === 'asc' ? 1 : -1;
@@ -1267,6 +1310,82 @@ class PSITTool {
         }
     }
 
+    setLoadingProgress(job) {
+        // Avanzamento del job query nell'overlay di caricamento (null = messaggio standard)
+        const message = document.getElementById('loadingMessage');
+        const cancelBtn = document.getElementById('loadingCancelBtn');
+        if (message) {
+            message.textContent = job
+                ? `Esecuzione in corso... ${job.row_count} righe lette (${Math.round((job.elapsed_ms || 0) / 1000)}s)`
+                : 'Caricamento in corso...';
+        }
+        if (cancelBtn) cancelBtn.classList.toggle('hidden', !job);
+    }
+
+    async runQueryJob(payload) {
+        // Avvia la query come job, ne segue lo stato e scarica i risultati a pagine
+        const submitResponse = await fetch('/api/queries/jobs', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(payload)
+        });
+        let job = await submitResponse.json();
+        if (!submitResponse.ok) {
+            throw new Error(job.detail || 'Errore nell\'avvio della query');
+        }
+        this.activeJobId = job.job_id;
+        this.setLoadingProgress(job);
+        try {
+            while (job.status === 'queued' || job.status === 'running') {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const statusResponse = await fetch(`/api/queries/jobs/${job.job_id}`);
+                job = await statusResponse.json();
+                if (!statusResponse.ok) {
+                    throw new Error(job.detail || 'Errore nel recupero dello stato della query');
+                }
+                this.setLoadingProgress(job);
+            }
+        } finally {
+            this.activeJobId = null;
+            this.setLoadingProgress(null);
+        }
+        if (job.status !== 'completed') {
+            return { success: false, error_message: job.error_message || 'Query annullata' };
+        }
+        // Formato a righe: i nomi colonna arrivano una volta sola (column_names)
+        const rows = [];
+        const pageSize = 10000;
+        while (rows.length < job.row_count) {
+            const pageResponse = await fetch(`/api/queries/jobs/${job.job_id}/results?offset=${rows.length}&limit=${pageSize}&format=rows`);
+            const page = await pageResponse.json();
+            if (!pageResponse.ok) {
+                throw new Error(page.detail || 'Errore nel recupero dei risultati');
+            }
+            if (!page.rows || !page.rows.length) break;
+            for (const row of page.rows) rows.push(row);
+        }
+        return {
+            query_filename: payload.query_filename,
+            connection_name: payload.connection_name,
+            success: true,
+            execution_time_ms: job.elapsed_ms,
+            row_count: rows.length,
+            column_names: job.column_names,
+            rows: rows,
+            has_more: job.has_more,
+            parameters_used: payload.parameters || {}
+        };
+    }
+
+    async cancelActiveJob() {
+        if (!this.activeJobId) return;
+        try {
+            await fetch(`/api/queries/jobs/${this.activeJobId}`, { method: 'DELETE' });
+        } catch (e) {
+            console.error('Errore nell\'annullamento della query:', e);
+        }
+    }
+
     async ensureFullDataset() {
         // If we already cached full results, return them
         if (this.fullResults) return this.fullResults;
@@ -1275,22 +1394,20 @@ class PSITTool {
         this.showLoading(true);
         try {
             const paramsForExport = (this.lastResults && this.lastResults.parameters_used) ? this.lastResults.parameters_used : {};
-            const execResponse = await fetch('/api/queries/execute', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    query_filename: this.currentQuery.filename,
-                    connection_name: this.currentConnection,
-                    parameters: paramsForExport
-                })
+            const execResult = await this.runQueryJob({
+                query_filename: this.currentQuery.filename,
+                connection_name: this.currentConnection,
+                parameters: paramsForExport
             });
-            const execResult = await execResponse.json();
-            if (!execResponse.ok || !execResult.success) {
-                throw new Error(execResult.error_message || execResult.detail || 'Errore recupero dataset completo');
+            if (!execResult.success) {
+                throw new Error(execResult.error_message || 'Errore recupero dataset completo');
             }
             this.fullResults = execResult;
-            // once we have full results, clear preview flag
-            this.lastResultsIsPreview = false;
+            // once we have full results, clear preview flag (the server may still cap very large results)
+            this.lastResultsIsPreview = !!execResult.has_more;
+            if (execResult.has_more) {
+                console.warn(`Risultato limitato a ${execResult.row_count} righe dal server`);
+            }
             // re-render UI counts
             this.updateStatusBar();
             return execResult;
@@ -1348,7 +1465,8 @@ class PSITTool {
                     body: JSON.stringify({
                         query_filename: this.currentQuery.filename,
                         connection_name: this.currentConnection,
-                        parameters: paramsForExport
+                        parameters: paramsForExport,
+                        result_format: 'rows'
                     })
                 });
                 execResult = await execResponse.json();
@@ -1367,7 +1485,8 @@ class PSITTool {
                     query_filename: this.currentQuery.filename,
                     connection_name: this.currentConnection,
                     parameters: (this.lastResults && this.lastResults.parameters_used) ? this.lastResults.parameters_used : {},
-                    export_format: format
+                    export_format: format,
+                    compress: false
                 };
 
                 const resp = await fetch('/api/queries/export', {
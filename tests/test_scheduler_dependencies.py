@@ -0,0 +1,130 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.scheduler_service import SchedulerService
+
+
+class DummyResult:
+    def __init__(self, success=True):
+        self.success = success
+        self.row_count = 1
+        self.column_names = ["id"]
+        self.data = [{"id": 1}]
+        self.error_message = None if success else "ORA-00942"
+
+
+def _service(monkeypatch, tmp_path, scheduling, execute_query):
+    svc = SchedulerService()
+    monkeypatch.setattr(svc, 'export_dir', tmp_path)
+    monkeypatch.setattr(svc, 'query_service', type('QS', (), {'execute_query': staticmethod(execute_query)})())
+    monkeypatch.setattr(svc.settings, 'scheduling', scheduling)
+    monkeypatch.setattr(svc.settings, 'scheduler_retry_enabled', False)
+    return svc
+
+
+async def _drain(svc):
+    while svc._dependent_tasks:
+        await asyncio.gather(*list(svc._dependent_tasks))
+
+
+def _sched(tmp_path, query, **extra):
+    return {'query': query, 'connection': 'DAG', 'hour': 5, 'minute': 30, 'output_dir': str(tmp_path), **extra}
+
+
+@pytest.mark.asyncio
+async def test_pipeline_runs_branches_in_parallel_then_join(monkeypatch, tmp_path):
+    """staging -> (A, B in parallelo) -> report quando entrambi sono riusciti"""
+    order = []
+    branches = threading.Barrier(2, timeout=5)
+
+    def execute_query(request):
+        if request.query_filename in ('A.sql', 'B.sql'):
+            # Entrambi i rami devono essere in esecuzione contemporaneamente
+            branches.wait()
+        order.append(request.query_filename)
+        return DummyResult()
+
+    scheduling = [
+        _sched(tmp_path, 'STAGING.sql', name='staging'),
+        _sched(tmp_path, 'A.sql', depends_on=['staging']),
+        _sched(tmp_path, 'B.sql', depends_on='staging'),
+        _sched(tmp_path, 'REPORT.sql', depends_on=['A.sql', 'B.sql']),
+    ]
+    svc = _service(monkeypatch, tmp_path, scheduling, execute_query)
+    await svc.run_scheduled_query(scheduling[0])
+    await _drain(svc)
+
+    assert order[0] == 'STAGING.sql'
+    assert sorted(order[1:3]) == ['A.sql', 'B.sql']
+    assert order[3:] == ['REPORT.sql']
+    assert svc._dependency_progress == {}
+    assert svc.dependency_cycles() == []
+    svc.executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_failed_upstream_blocks_downstream_and_cycles_detected(monkeypatch, tmp_path):
+    executed = []
+
+    def execute_query(request):
+        executed.append(request.query_filename)
+        return DummyResult(success=request.query_filename != 'STAGING.sql')
+
+    scheduling = [
+        _sched(tmp_path, 'STAGING.sql'),
+        _sched(tmp_path, 'REPORT.sql', depends_on=['STAGING.sql']),
+        _sched(tmp_path, 'X.sql', name='x', depends_on=['y']),
+        _sched(tmp_path, 'Y.sql', name='y', depends_on=['x']),
+    ]
+    svc = _service(monkeypatch, tmp_path, scheduling, execute_query)
+    await svc.run_scheduled_query(scheduling[0])
+    await _drain(svc)
+
+    assert executed == ['STAGING.sql']
+    assert svc.dependency_cycles() == [['x', 'y', 'x']]
+    svc.executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_join_is_scoped_to_one_cycle(monkeypatch, tmp_path):
+    """A riesce e B fallisce: al ciclo successivo REPORT attende di nuovo sia A sia B"""
+    from datetime import datetime, timedelta
+    executed = []
+    failing = {'B.sql'}
+
+    def execute_query(request):
+        executed.append(request.query_filename)
+        return DummyResult(success=request.query_filename not in failing)
+
+    scheduling = [
+        _sched(tmp_path, 'A.sql', name='a'),
+        _sched(tmp_path, 'B.sql', name='b'),
+        _sched(tmp_path, 'REPORT.sql', depends_on=['a', 'b']),
+    ]
+    svc = _service(monkeypatch, tmp_path, scheduling, execute_query)
+
+    # Ciclo 1: B fallisce senza altri tentativi, il join parziale con A viene annullato
+    await svc.run_scheduled_query(scheduling[0])
+    await svc.run_scheduled_query(scheduling[1])
+    assert svc._dependency_progress == {}
+
+    # Ciclo 2: B riesce prima di A, REPORT parte solo dopo il nuovo A
+    failing.clear()
+    await svc.run_scheduled_query(scheduling[1])
+    await _drain(svc)
+    assert 'REPORT.sql' not in executed
+    await svc.run_scheduled_query(scheduling[0])
+    await _drain(svc)
+    assert executed[-1] == 'REPORT.sql'
+
+    # Esito a monte più vecchio della finestra: non vale per il join
+    await svc.run_scheduled_query(scheduling[0])
+    [progress] = svc._dependency_progress.values()
+    progress['a'] -= timedelta(hours=13)
+    await svc.run_scheduled_query(scheduling[1])
+    await _drain(svc)
+    assert executed.count('REPORT.sql') == 1
+    assert set(progress) == {'b'} and datetime.now() - progress['b'] < timedelta(minutes=1)
+    svc.executor.shutdown()
@@ -1,15 +1,20 @@
 import pytest
+
+import app.services.scheduler_service as scheduler_module
 from app.services.scheduler_service import SchedulerService
 
-def test_scheduler_metrics():
+def test_scheduler_metrics(monkeypatch, tmp_path):
     scheduler = SchedulerService()
+    monkeypatch.setattr(scheduler, 'export_dir', tmp_path)
+    # Finestra in memoria più piccola dello storico: i contatori restano sull'intero storico
+    monkeypatch.setattr(scheduler_module, 'HISTORY_WINDOW', 2)
     # Simula alcune esecuzioni
-    scheduler.execution_history = [
-        {"status": "success", "duration_sec": 2.0},
-        {"status": "fail", "duration_sec": 1.0},
-        {"status": "success", "duration_sec": 3.0},
-    ]
+    for status, duration in (("success", 2.0), ("fail", 1.0), ("success", 3.0)):
+        scheduler._record_history({"status": status, "duration_sec": duration})
     status = scheduler.get_status()
+    assert len(scheduler.execution_history) == 2
     assert status["success_count"] == 2
     assert status["fail_count"] == 1
     assert abs(status["avg_duration_sec"] - 2.0) < 0.01
+    assert status["last_execution"]["duration_sec"] == 3.0
+    scheduler.executor.shutdown()
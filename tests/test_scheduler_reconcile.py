@@ -0,0 +1,67 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from app.api.scheduler import _save_scheduling
+from app.services.scheduler_service import CLEANUP_JOB_ID, SchedulerService, schedule_job_id
+
+
+def _sched(query, **extra):
+    return {'query': query, 'connection': 'RECONCILE', 'hour': 5, 'minute': 30, **extra}
+
+
+@pytest.mark.asyncio
+async def test_sync_jobs_touches_only_changed_schedules(monkeypatch):
+    """Id stabili: la modifica di una schedulazione non ripianifica le altre"""
+    scheduling = [_sched('A.sql'), _sched('B.sql'), _sched('C.sql', output_dir='/exports/c')]
+    svc = SchedulerService()
+    monkeypatch.setattr(svc.settings, 'scheduling', scheduling)
+    monkeypatch.setattr(svc.settings, 'daily_report_enabled', False)
+    svc.scheduler = AsyncIOScheduler()
+    svc.scheduler.start(paused=True)
+    try:
+        counts = svc.sync_jobs()
+        assert counts['added'] == 4  # tre export + cleanup
+        ids = {schedule_job_id(s) for s in scheduling}
+        assert len(ids) == 3
+        assert {j.id for j in svc.scheduler.get_jobs()} == ids | {CLEANUP_JOB_ID}
+        untouched = svc.scheduler.get_job(schedule_job_id(scheduling[1]))
+        next_run = untouched.next_run_time
+
+        # Orario di A cambiato, priorità di C cambiata: stesso id, nessun altro job toccato
+        new_scheduling = [_sched('A.sql', hour=6), _sched('B.sql'), _sched('C.sql', output_dir='/exports/c', priority='high')]
+        monkeypatch.setattr(svc.settings, 'scheduling', new_scheduling)
+        counts = svc.sync_jobs()
+        assert counts == {'added': 0, 'rescheduled': 1, 'updated': 1, 'removed': 0, 'unchanged': 2}
+        assert svc.scheduler.get_job(schedule_job_id(new_scheduling[0])).next_run_time.hour == 6
+        assert svc.scheduler.get_job(schedule_job_id(new_scheduling[2])).args[0]['priority'] == 'high'
+        assert svc.scheduler.get_job(untouched.id).next_run_time == next_run
+
+        # Schedulazione a valle (depends_on) e schedulazione rimossa
+        monkeypatch.setattr(svc.settings, 'scheduling', new_scheduling[:2] + [_sched('D.sql', depends_on=['B.sql'])])
+        counts = svc.sync_jobs()
+        assert counts['removed'] == 1 and counts['added'] == 0
+        svc.remove_scheduling('A.sql', 'RECONCILE')
+        assert {j.id for j in svc.scheduler.get_jobs()} == {schedule_job_id(new_scheduling[1]), CLEANUP_JOB_ID}
+    finally:
+        svc.scheduler.shutdown(wait=False)
+        svc.executor.shutdown()
+
+
+def test_save_scheduling_rewrites_file_only_on_change(tmp_path):
+    cf = tmp_path / 'connections.json'
+    cf.write_text(json.dumps({'connections': [{'name': 'X'}], 'scheduling': []}), encoding='utf-8')
+    settings = SimpleNamespace(connections_file=cf, scheduling=[])
+
+    _save_scheduling(settings, [_sched('A.sql')])
+    data = json.loads(cf.read_text(encoding='utf-8'))
+    assert data['connections'] == [{'name': 'X'}]
+    assert data['scheduling'] == [_sched('A.sql')]
+    assert settings.scheduling == [_sched('A.sql')]
+
+    inode, mtime = cf.stat().st_ino, cf.stat().st_mtime_ns
+    _save_scheduling(settings, [_sched('A.sql')])
+    assert (cf.stat().st_ino, cf.stat().st_mtime_ns) == (inode, mtime)
+    assert not list(tmp_path.glob('*.tmp'))
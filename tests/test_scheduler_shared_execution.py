@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+import app.services.scheduler_service as scheduler_module
+from app.services.scheduler_service import SchedulerService
+
+
+class DummyResult:
+    def __init__(self, rows=3):
+        self.success = True
+        self.row_count = rows
+        self.column_names = ["id", "v"]
+        self.data = [{"id": i, "v": i * 2} for i in range(rows)]
+        self.error_message = None
+
+
+def _sched(tmp_path, **extra):
+    sched = {
+        'query': 'SHARED.sql',
+        'connection': 'SHARED_CONN',
+        'scheduling_mode': 'cron',
+        'cron_expression': '* * * * *',
+        'output_dir': str(tmp_path),
+    }
+    sched.update(extra)
+    return sched
+
+
+def _service(monkeypatch, tmp_path, scheduling, query_service):
+    svc = SchedulerService()
+    monkeypatch.setattr(svc, 'export_dir', tmp_path)
+    monkeypatch.setattr(svc, 'query_service', query_service)
+    monkeypatch.setattr(svc.settings, 'scheduling', scheduling)
+    return svc
+
+
+@pytest.mark.asyncio
+async def test_identical_schedules_stream_query_once(monkeypatch, tmp_path):
+    """Due export filesystem/email della stessa query nello stesso minuto: una sola esecuzione, due file"""
+    calls = []
+
+    def fake_export(query_service, request, target, output_format):
+        calls.append(target)
+        target.write_bytes(b"shared-content")
+        return DummyResult(), 0.1
+
+    monkeypatch.setattr(scheduler_module, 'export_query_to_file', fake_export)
+    scheduling = [
+        _sched(tmp_path, output_filename_template='first_{date}.xlsx'),
+        _sched(tmp_path, output_filename_template='second_{date}.xlsx', sharing_mode='email'),
+    ]
+    query_service = type('QS', (), {'stream_query': staticmethod(lambda *a, **k: None)})()
+    svc = _service(monkeypatch, tmp_path, scheduling, query_service)
+    monkeypatch.setattr(svc, '_send_email_with_attachment', lambda *a, **k: None)
+
+    await asyncio.gather(*(svc.run_scheduled_query(s) for s in scheduling))
+
+    assert len(calls) == 1
+    outputs = sorted(p.name.split('_')[0] for p in tmp_path.glob('*.xlsx'))
+    assert outputs == ['first', 'second']
+    assert all(p.read_bytes() == b"shared-content" for p in tmp_path.glob('*.xlsx'))
+    assert [h['status'] for h in svc.execution_history] == ['success', 'success']
+    # File condiviso eliminato dall'ultimo partecipante
+    assert not list((tmp_path / '_tmp').glob('shared_*'))
+    assert svc._shared_runs == {}
+    # Query condivisa e due copie, tutte sull'esecutore dello scheduler (non sul pool del loop)
+    assert svc.executor.get_stats()['completed'] == 3
+    svc.executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_kafka_and_file_share_in_memory_result(monkeypatch, tmp_path):
+    """Con un sink Kafka il risultato unico resta in memoria ed è distribuito a tutti i sink"""
+    executed = []
+    sent = []
+
+    def execute_query(request):
+        executed.append(request.query_filename)
+        return DummyResult(rows=5)
+
+    async def fake_kafka_export(**kwargs):
+        sent.append(len(kwargs['result_data']))
+
+    scheduling = [
+        _sched(tmp_path, output_filename_template='report_{date}.xlsx'),
+        _sched(tmp_path, output_filename_template='kafka_{date}.xlsx', sharing_mode='kafka', kafka_topic='t'),
+    ]
+    query_service = type('QS', (), {'execute_query': staticmethod(execute_query)})()
+    svc = _service(monkeypatch, tmp_path, scheduling, query_service)
+    monkeypatch.setattr(svc, '_execute_kafka_export', fake_kafka_export)
+
+    await asyncio.gather(*(svc.run_scheduled_query(s) for s in scheduling))
+
+    assert executed == ['SHARED.sql']
+    assert sent == [5]
+    assert list(tmp_path.glob('report_*.xlsx'))
+    assert [h['row_count'] for h in svc.execution_history] == [5, 5]
+    # Query e le due scritture dal risultato in memoria sull'esecutore dello scheduler
+    assert svc.executor.get_stats()['completed'] == 3
+    svc.executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_shared_run_released_when_query_raises(monkeypatch, tmp_path):
+    """Errore non di timeout nella query condivisa: tutti i partecipanti rilasciano esecuzione e file temporaneo"""
+    def fake_export(query_service, request, target, output_format):
+        target.write_bytes(b"partial")
+        raise RuntimeError("ORA-03113: end-of-file on communication channel")
+
+    monkeypatch.setattr(scheduler_module, 'export_query_to_file', fake_export)
+    scheduling = [
+        _sched(tmp_path, output_filename_template='first_{date}.xlsx'),
+        _sched(tmp_path, output_filename_template='second_{date}.xlsx'),
+    ]
+    query_service = type('QS', (), {'stream_query': staticmethod(lambda *a, **k: None)})()
+    svc = _service(monkeypatch, tmp_path, scheduling, query_service)
+    monkeypatch.setattr(svc.settings, 'scheduler_retry_enabled', False)
+
+    await asyncio.gather(*(svc.run_scheduled_query(s) for s in scheduling))
+
+    assert svc._shared_runs == {}
+    assert not list((tmp_path / '_tmp').glob('shared_*'))
+    assert not list(tmp_path.glob('*.xlsx'))
+    svc.executor.shutdown()
@@ -0,0 +1,73 @@
+"""
+Test unitari per il governatore connessioni (budget e code eque)
+"""
+import threading
+import time
+
+import pytest
+
+from app.services.connection_governor import ConnectionBudgetTimeout, ConnectionGovernor, run_as_workload
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+class TestConnectionGovernor:
+    """Test per budget per connessione/ambiente, turni e metriche"""
+
+    def test_connection_and_environment_budgets(self):
+        """Budget da connections.json: per connessione e per ambiente, 0 = illimitato"""
+        budgets = {"default_connection": 2, "environments": {"produzione": 3}, "connections": {"UNLIMITED": 0}}
+        governor = ConnectionGovernor(budget_provider=lambda: budgets, wait_timeout_sec=0.05)
+
+        governor.acquire("P1", "produzione")
+        governor.acquire("P1", "produzione")
+        with pytest.raises(ConnectionBudgetTimeout):
+            governor.acquire("P1", "produzione")
+        governor.acquire("P2", "produzione")
+        # Budget dell'ambiente esaurito anche se P2 ha ancora posto
+        with pytest.raises(ConnectionBudgetTimeout):
+            governor.acquire("P2", "produzione")
+        for _ in range(5):
+            governor.acquire("UNLIMITED", "collaudo")
+
+        stats = governor.get_stats()
+        assert stats["connections"]["P1"]["checked_out"] == 2
+        assert stats["connections"]["P1"]["budget"] == 2
+        assert stats["environments"]["produzione"]["checked_out"] == 3
+        assert stats["environments"]["produzione"]["budget"] == 3
+        assert stats["connections"]["P1"]["timeouts"] == 1
+
+        governor.release("P1", "produzione")
+        assert governor.acquire("P2", "produzione") == 0.0
+
+    def test_fair_turns_between_interactive_and_scheduled(self):
+        """Con entrambe le code piene: due concessioni interattive per una schedulata"""
+        governor = ConnectionGovernor(budget_provider=lambda: {"default_connection": 1}, interactive_weight=2)
+        governor.acquire("DB", "collaudo")
+        order = []
+
+        def worker(label, workload):
+            def _use():
+                with governor.lease("DB", "collaudo"):
+                    order.append(label)
+            threading.Thread(target=run_as_workload, args=(workload, _use)).start()
+
+        for i in range(3):
+            worker(f"s{i}", "scheduled")
+            _wait_for(lambda: governor.get_stats()["workloads"]["scheduled"]["waiting"] == i + 1)
+        for i in range(3):
+            worker(f"i{i}", "interactive")
+            _wait_for(lambda: governor.get_stats()["workloads"]["interactive"]["waiting"] == i + 1)
+
+        governor.release("DB", "collaudo")
+        _wait_for(lambda: len(order) == 6)
+        assert order == ["i0", "i1", "s0", "i2", "s1", "s2"]
+        stats = governor.get_stats()
+        assert stats["checked_out"] == 0 and stats["waiting"] == 0
+        assert stats["workloads"]["scheduled"]["granted"] == 3
+        assert stats["workloads"]["scheduled"]["max_wait_ms"] > 0
@@ -0,0 +1,281 @@
+"""
+Test unitari per il registro engine condiviso e l'indice connessioni del ConnectionService
+"""
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.services.connection_service import (
+    ConnectionDirectory,
+    ConnectionService,
+    EngineRegistry,
+    get_connection_health,
+)
+
+
+class TestEngineRegistry:
+    """Test per il registro engine process-wide"""
+
+    def test_get_or_create_reuses_engine(self):
+        """La factory viene invocata una sola volta per connessione"""
+        registry = EngineRegistry()
+        engine = Mock()
+        factory = Mock(return_value=engine)
+
+        assert registry.get_or_create("CONN", factory) is engine
+        assert registry.get_or_create("CONN", factory) is engine
+        assert factory.call_count == 1
+        assert "CONN" in registry
+
+    def test_get_or_create_concurrent_single_creation(self):
+        """Richieste concorrenti sulla stessa connessione creano un solo engine"""
+        registry = EngineRegistry()
+        created = []
+        gate = threading.Event()
+
+        def factory():
+            gate.wait(1)
+            engine = Mock()
+            created.append(engine)
+            return engine
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.get_or_create("CONN", factory))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        gate.set()
+        for t in threads:
+            t.join()
+
+        assert len(created) == 1
+        assert all(r is created[0] for r in results)
+
+    def test_failed_creation_is_not_cached(self):
+        """Se la factory fallisce (None) il tentativo successivo riprova"""
+        registry = EngineRegistry()
+        engine = Mock()
+        factory = Mock(side_effect=[None, engine])
+
+        assert registry.get_or_create("CONN", factory) is None
+        assert registry.get_or_create("CONN", factory) is engine
+
+    def test_dispose_releases_engine(self):
+        """dispose chiude il pool e rimuove l'engine dal registro"""
+        registry = EngineRegistry()
+        engine = Mock()
+        registry.get_or_create("CONN", lambda: engine)
+
+        assert registry.dispose("CONN") is True
+        engine.dispose.assert_called_once()
+        assert "CONN" not in registry
+        assert registry.dispose("CONN") is False
+
+    def test_services_share_registry(self):
+        """Due ConnectionService sullo stesso registro vedono lo stesso engine"""
+        registry = EngineRegistry()
+        engine = Mock()
+        first = ConnectionService(engine_registry=registry)
+        second = ConnectionService(engine_registry=registry)
+        first._create_engine = Mock(return_value=engine)
+        second._create_engine = Mock(return_value=Mock())
+
+        assert first.get_engine("CONN") is engine
+        assert second.get_engine("CONN") is engine
+        second._create_engine.assert_not_called()
+
+
+class TestConnectionDirectory:
+    """Test per l'indice dei descrittori di connessione"""
+
+    def _write(self, path, host="db1", extra=None):
+        import json
+        connections = [
+            {"name": "A", "environment": "collaudo", "db_type": "oracle", "description": "",
+             "params": {"host": host, "port": 1521, "service_name": "S", "username": "u", "password": "p"}},
+            {"name": "B", "environment": "collaudo", "db_type": "postgresql", "description": "",
+             "params": {"host": "pg", "port": 5432, "service_name": "d", "username": "u", "password": "p"}},
+        ] + (extra or [])
+        path.write_text(json.dumps({
+            "default_environment": "collaudo", "default_connection": "A",
+            "environments": ["collaudo"], "connections": connections,
+        }), encoding="utf-8")
+
+    def test_rebuilt_only_when_file_changes(self, tmp_path):
+        """Lookup per nome senza ricaricare il file; rebuild e rilascio engine solo se il file cambia"""
+        import os
+        from app.core.config import load_connections_config
+        path = tmp_path / "connections.json"
+        self._write(path)
+        loader = Mock(side_effect=load_connections_config)
+        registry = EngineRegistry()
+        directory = ConnectionDirectory(path, loader=loader, check_interval_sec=0, registry=registry)
+        service = ConnectionService(engine_registry=registry, directory=directory)
+
+        assert service.get_descriptor("A").test_query == "SELECT 1 FROM DUAL"
+        assert service.get_connection("B").db_type == "postgresql"
+        assert service.get_connection("X") is None
+        assert list(service.get_connections()) == ["A", "B"]
+        assert loader.call_count == 1
+        with pytest.raises(AttributeError):
+            service.get_descriptor("A").db_type = "postgresql"
+
+        engine_a, engine_b = Mock(), Mock()
+        registry.get_or_create("A", lambda: engine_a)
+        registry.get_or_create("B", lambda: engine_b)
+        # Lo stato deriva dalle verifiche reali, non dalla sola presenza dell'engine
+        assert service.get_connection("A").status == "disconnected"
+        health = get_connection_health()
+        try:
+            health.record("A", True, 3.0)
+            assert service.get_connection("A").status == "connected"
+            health.record("A", False, 5.0, "ORA-12541")
+            connection = service.get_connection("A")
+            assert connection.status == "error" and connection.last_error == "ORA-12541"
+            assert connection.last_connected is not None and connection.response_time_ms == 5.0
+        finally:
+            health.forget("A")
+
+        # Parametri di A modificati: nuovo snapshot, engine di A rilasciato, B invariato
+        self._write(path, host="db2")
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 2_000_000_000))
+        assert service.get_descriptor("A").params["host"] == "db2"
+        assert loader.call_count == 2 and directory.version == 2
+        engine_a.dispose.assert_called_once()
+        engine_b.dispose.assert_not_called()
+        assert "B" in registry
+
+        # File non valido: resta lo snapshot precedente
+        path.write_text("{", encoding="utf-8")
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 4_000_000_000))
+        assert service.get_descriptor("A").params["host"] == "db2"
+
+
+class TestOraclePool:
+    """Test per l'engine Oracle basato sul pool nativo oracledb"""
+
+    def test_native_engine_with_drcp(self):
+        """create_pool riceve DRCP, ping_interval e statement cache; dispose chiude il pool"""
+        from app.services.oracle_pool import create_native_engine, native_pool, oracle_pool_options
+        oracledb = Mock(POOL_GETMODE_TIMEDWAIT=3, PURITY_SELF=2, PURITY_NEW=1)
+        options = oracle_pool_options({
+            "mode": "native", "max": 4, "ping_interval": 120, "stmtcachesize": 80,
+            "drcp": True, "cclass": "PSTT", "purity": "self",
+            "session_statements": "ALTER SESSION SET NLS_DATE_FORMAT='YYYY-MM-DD';|ALTER SESSION SET TIME_ZONE='Europe/Rome'",
+        })
+        engine = create_native_engine(
+            oracledb, {"user": "u", "password": "p", "host": "h", "port": 1521, "service_name": "s"}, options, "CONN"
+        )
+        kwargs = oracledb.create_pool.call_args.kwargs
+        assert (kwargs["max"], kwargs["ping_interval"], kwargs["stmtcachesize"]) == (4, 120, 80)
+        assert (kwargs["server_type"], kwargs["cclass"], kwargs["purity"]) == ("pooled", "PSTT", 2)
+        oracledb.connect.assert_not_called()
+        pool = oracledb.create_pool.return_value
+        assert native_pool(engine) is pool
+
+        # La callback di sessione esegue le istruzioni configurate
+        connection = Mock()
+        kwargs["session_callback"](connection, None)
+        executed = [c.args[0] for c in connection.cursor.return_value.execute.call_args_list]
+        assert executed == ["ALTER SESSION SET NLS_DATE_FORMAT='YYYY-MM-DD'", "ALTER SESSION SET TIME_ZONE='Europe/Rome'"]
+
+        # dispose non interrompe le sessioni in uso: il pool si chiude quando l'ultima rientra
+        closed = threading.Event()
+        pool.busy = 1
+
+        def close():
+            if pool.close.call_count == 1:
+                raise RuntimeError("DPY-1005: pool has busy connections")
+            closed.set()
+
+        pool.close.side_effect = close
+        with patch("app.services.oracle_pool.RETIRE_POLL_SEC", 0.01):
+            engine.dispose()
+            assert closed.wait(2)
+        assert [c.kwargs for c in pool.close.call_args_list] == [{}, {}]
+
+
+class TestConnectionProber:
+    """Test per warm-up e verifica periodica delle connessioni"""
+
+    def test_warm_up_opens_pool_and_records_health(self, tmp_path):
+        """Il warm-up apre pool_size connessioni in parallelo solo per l'ambiente di default"""
+        from contextlib import nullcontext
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import QueuePool
+        from app.services.connection_prober import ConnectionProber
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'warm.db'}", poolclass=QueuePool, pool_size=3,
+                               max_overflow=0, connect_args={"check_same_thread": False})
+        descriptors = {
+            "WARM-COLL": Mock(environment="collaudo", test_query="SELECT 1"),
+            "WARM-PROD": Mock(environment="produzione", test_query="SELECT 1"),
+        }
+        service = Mock()
+        service.get_default_environment.return_value = "collaudo"
+        service.get_descriptors.return_value = descriptors
+        service.get_descriptor.side_effect = descriptors.get
+        service.get_engine.side_effect = lambda name: engine if name == "WARM-COLL" else None
+        service.get_connection_budget.return_value = 0
+        service.lease.side_effect = lambda name, timeout=None: nullcontext()
+        service.get_active_connections.return_value = ["WARM-COLL"]
+        health = get_connection_health()
+        try:
+            prober = ConnectionProber(service, interval_sec=0, timeout_sec=5)
+            assert prober.warm_up_targets() == ["WARM-COLL"]
+            prober.warm_up()
+            assert engine.pool.checkedin() == 3
+            assert service.lease.call_count == 3
+            record = health.runtime("WARM-COLL", has_engine=True)
+            assert record["status"] == "connected" and record["response_time_ms"] is not None
+
+            # Verifica periodica fallita: stato error con l'ultimo errore
+            descriptors["WARM-COLL"].test_query = "SELECT * FROM tabella_inesistente"
+            prober.probe_once()
+            record = health.runtime("WARM-COLL", has_engine=True)
+            assert record["status"] == "error" and "tabella_inesistente" in record["last_error"]
+            assert record["last_connected"] is not None
+        finally:
+            health.forget("WARM-COLL")
+            engine.dispose()
+
+    def test_probe_once_runs_in_parallel_with_driver_call_timeout(self):
+        """Le verifiche girano in parallelo e la query Oracle è limitata da call_timeout, poi ripristinato"""
+        from contextlib import nullcontext
+        from app.services.connection_prober import ConnectionProber
+
+        both_running = threading.Barrier(2, timeout=5)
+        seen = {}
+
+        def make_engine(name):
+            driver_connection = Mock(call_timeout=0)
+            conn = Mock()
+            conn.dialect.name = "oracle"
+            conn.connection.driver_connection = driver_connection
+
+            def execute(statement):
+                seen[name] = driver_connection.call_timeout
+                both_running.wait()  # sequenziale: la prima verifica resterebbe bloccata
+                return Mock()
+
+            conn.execute.side_effect = execute
+            engine = Mock()
+            engine.connect.return_value = nullcontext(conn)
+            return engine, driver_connection
+
+        engines = {name: make_engine(name) for name in ("PROBE-A", "PROBE-B")}
+        service = Mock()
+        service.get_active_connections.return_value = list(engines)
+        service.get_engine.side_effect = lambda name: engines[name][0]
+        service.get_descriptor.return_value = Mock(test_query="SELECT 1 FROM DUAL")
+        service.lease.side_effect = lambda name, timeout=None: nullcontext()
+        health = get_connection_health()
+        try:
+            ConnectionProber(service, interval_sec=0, timeout_sec=3).probe_once()
+            assert seen == {"PROBE-A": 3000, "PROBE-B": 3000}
+            assert all(d.call_timeout == 0 for _, d in engines.values())
+            assert all(health.runtime(name, has_engine=True)["status"] == "connected" for name in engines)
+        finally:
+            for name in engines:
+                health.forget(name)
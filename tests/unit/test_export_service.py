@@ -0,0 +1,263 @@
+"""
+Test unitari per l'export XLSX, Parquet/Arrow a memoria costante e CSV in streaming
+"""
+import asyncio
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from openpyxl import load_workbook
+
+from app.models.queries import QueryExecutionRequest
+from app.services.export_service import (
+    CSV_END,
+    CsvChunkChannel,
+    ArrowStreamWriter,
+    ExportAborted,
+    XlsxStreamWriter,
+    export_query_to_file,
+    iter_csv_chunks,
+    stream_csv_export,
+    write_records,
+)
+from app.services.query_service import QueryExecutionError, QueryStream
+
+
+class FakeResult:
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def fetchmany(self, size):
+        return self.batches.pop(0) if self.batches else []
+
+    def close(self):
+        pass
+
+
+class FakeQueryService:
+    def __init__(self, batches=None, error=None):
+        self.batches = batches or []
+        self.error = error
+
+    @contextmanager
+    def stream_query(self, request, batch_size=None, on_connection=None):
+        if self.error:
+            raise self.error
+        yield QueryStream(FakeResult(self.batches), ["ID", "NOME"], batch_size=2)
+
+
+class TestXlsxStreamWriter:
+    """Test per celle tipizzate, cambio foglio ed export in streaming"""
+
+    def test_typed_cells(self, tmp_path):
+        """Numeri, Decimal e date restano celle tipizzate; gli interi lunghi diventano testo"""
+        path = tmp_path / "typed.xlsx"
+        writer = XlsxStreamWriter(path, ["N", "DEC", "BIG", "DT", "D", "S", "NULL"])
+        writer.write_rows([(
+            42, Decimal("12.50"), 123456789012345678, datetime(2024, 1, 2, 3, 4, 5), date(2024, 1, 2), "testo", None
+        )])
+        writer.close()
+
+        ws = load_workbook(path).active
+        assert [c.value for c in ws[1]] == ["N", "DEC", "BIG", "DT", "D", "S", "NULL"]
+        row = [c.value for c in ws[2]]
+        assert row[0] == 42
+        assert row[1] == 12.5
+        assert row[2] == "123456789012345678"
+        assert row[3] == datetime(2024, 1, 2, 3, 4, 5)
+        assert row[4] == datetime(2024, 1, 2)
+        assert row[5] == "testo"
+        assert row[6] is None
+
+    def test_sheet_rollover(self, tmp_path):
+        """Oltre il limite di righe si apre un nuovo foglio con la stessa intestazione"""
+        path = tmp_path / "rollover.xlsx"
+        writer = write_records(path, ["ID"], [{"ID": i} for i in range(5)], max_rows_per_sheet=3)
+
+        assert writer.rows_written == 5
+        assert writer.sheet_count == 3
+        wb = load_workbook(path)
+        assert wb.sheetnames == ["Sheet1", "Sheet2", "Sheet3"]
+        assert [c.value for c in wb["Sheet1"]["A"]] == ["ID", 0, 1]
+        assert [c.value for c in wb["Sheet3"]["A"]] == ["ID", 4]
+
+    def test_export_query_streams_to_file(self, tmp_path):
+        """export_query_to_file scrive tutte le righe del cursore senza restituire dati"""
+        path = tmp_path / "export.xlsx"
+        service = FakeQueryService([[(1, "a"), (2, "b")], [(3, "c")]])
+        request = QueryExecutionRequest(query_filename="q.sql", connection_name="CONN")
+
+        result, _ = export_query_to_file(service, request, path)
+        assert result.success
+        assert result.row_count == 3
+        assert result.data == []
+        ws = load_workbook(path).active
+        assert [c.value for c in ws["B"]] == ["NOME", "a", "b", "c"]
+
+    def test_export_query_failure_removes_file(self, tmp_path):
+        """In caso di errore il risultato riporta il messaggio e non resta un file parziale"""
+        path = tmp_path / "export.xlsx"
+        service = FakeQueryService(error=QueryExecutionError("Query non trovata: q.sql"))
+        request = QueryExecutionRequest(query_filename="q.sql", connection_name="CONN")
+
+        result, _ = export_query_to_file(service, request, path)
+        assert not result.success
+        assert result.error_message == "Query non trovata: q.sql"
+        assert not path.exists()
+
+
+class TestCsvExport:
+    """Test per il CSV in streaming con gzip incrementale"""
+
+    def test_csv_chunks_gzip_roundtrip(self):
+        """Lo stream gzip incrementale decomprime nello stesso CSV non compresso"""
+        import gzip
+        batches = [[(1, "a;b"), (2, None)], [(3, datetime(2024, 1, 2, 3, 4, 5))]]
+        plain = b"".join(iter_csv_chunks(["ID", "V"], batches))
+        assert plain == b'ID;V\n1;"a;b"\n2;\n3;2024-01-02T03:04:05\n'
+        assert gzip.decompress(b"".join(iter_csv_chunks(["ID", "V"], batches, compress=True))) == plain
+
+    def test_stream_csv_export_to_channel_and_disk(self, tmp_path):
+        """Il canale riceve colonne, blocchi e fine stream; la copia su disco ha gli stessi byte"""
+        service = FakeQueryService([[(1, "a"), (2, "b")], [(3, "c")]])
+        request = QueryExecutionRequest(query_filename="q.sql", connection_name="CONN")
+        tmp_file, final_file = tmp_path / "q.csv.tmp", tmp_path / "q.csv"
+
+        async def scenario():
+            channel = CsvChunkChannel(asyncio.get_running_loop(), maxsize=1)
+            loop = asyncio.get_running_loop()
+            task = loop.run_in_executor(None, stream_csv_export, service, request, channel, False, tmp_file, final_file)
+            items = []
+            while True:
+                item = await channel.get()
+                if item is CSV_END:
+                    break
+                items.append(item)
+            return items, await task
+
+        items, rows = asyncio.run(scenario())
+        assert rows == 3
+        assert items[0] == ["ID", "NOME"]
+        assert b"".join(items[1:]) == b"ID;NOME\n1;a\n2;b\n3;c\n"
+        assert final_file.read_bytes() == b"".join(items[1:])
+        assert not tmp_file.exists()
+
+    def test_stream_csv_export_client_abort(self, tmp_path):
+        """Se il client chiude il canale la lettura si interrompe e non resta il file temporaneo"""
+        service = FakeQueryService([[(1, "a")], [(2, "b")], [(3, "c")]])
+        request = QueryExecutionRequest(query_filename="q.sql", connection_name="CONN")
+        tmp_file = tmp_path / "q.csv.tmp"
+
+        async def scenario():
+            channel = CsvChunkChannel(asyncio.get_running_loop(), maxsize=1)
+            task = asyncio.get_running_loop().run_in_executor(
+                None, stream_csv_export, service, request, channel, False, tmp_file, tmp_path / "q.csv"
+            )
+            await channel.get()
+            channel.close()
+            with pytest.raises(ExportAborted):
+                await task
+
+        asyncio.run(scenario())
+        assert not tmp_file.exists()
+        assert not (tmp_path / "q.csv").exists()
+
+    def test_stream_csv_export_consumer_never_reads(self, tmp_path):
+        """Client disconnesso prima della risposta: nessuno legge, la put si interrompe dopo stall_timeout"""
+        service = FakeQueryService([[(1, "a")], [(2, "b")], [(3, "c")]])
+        request = QueryExecutionRequest(query_filename="q.sql", connection_name="CONN")
+
+        async def scenario():
+            channel = CsvChunkChannel(asyncio.get_running_loop(), maxsize=1, stall_timeout=0.2)
+            task = asyncio.get_running_loop().run_in_executor(
+                None, stream_csv_export, service, request, channel, False, None, tmp_path / "q.csv"
+            )
+            with pytest.raises(ExportAborted):
+                await asyncio.wait_for(task, timeout=5)
+            assert channel.closed
+
+        asyncio.run(scenario())
+
+
+class FakeDbType:
+    """Tipo colonna come esposto da oracledb in cursor.description"""
+
+    def __init__(self, name):
+        self.name = name
+
+
+class TestArrowExport:
+    """Test per l'export Parquet / Arrow IPC a record batch"""
+
+    def test_parquet_types_from_oracle_description(self, tmp_path):
+        """NUMBER, DATE e VARCHAR2 Oracle diventano colonne Arrow tipizzate"""
+        pa = pytest.importorskip("pyarrow")
+        import pyarrow.parquet as pq
+        description = [
+            ("ID", FakeDbType("DB_TYPE_NUMBER"), None, None, 10, 0, True),
+            ("IMPORTO", FakeDbType("DB_TYPE_NUMBER"), None, None, 12, 2, True),
+            ("BARCODE", FakeDbType("DB_TYPE_NUMBER"), None, None, 25, 0, True),
+            ("DATA", FakeDbType("DB_TYPE_DATE"), None, None, None, None, True),
+            ("NOTE", FakeDbType("DB_TYPE_VARCHAR"), None, None, None, None, True),
+        ]
+        path = tmp_path / "out.parquet"
+        writer = ArrowStreamWriter(path, [d[0] for d in description], "parquet", description=description)
+        writer.write_rows([(1, 12.5, 1234567890123456789012, datetime(2024, 1, 2, 3, 4, 5), "a")])
+        writer.write_rows([(2, None, None, None, None)])
+        writer.close()
+
+        table = pq.read_table(path)
+        assert table.schema.field("ID").type == pa.int64()
+        assert table.schema.field("IMPORTO").type == pa.decimal128(12, 2)
+        assert table.column("IMPORTO")[0].as_py() == Decimal("12.50")
+        assert table.schema.field("BARCODE").type == pa.decimal128(25, 0)
+        # Parquet non ha l'unità secondi: la colonna DATE viene letta come timestamp[ms]
+        assert pa.types.is_timestamp(table.schema.field("DATA").type)
+        assert table.column("DATA")[0].as_py() == datetime(2024, 1, 2, 3, 4, 5)
+        assert table.column("BARCODE")[0].as_py() == Decimal("1234567890123456789012")
+        assert table.column("ID").to_pylist() == [1, 2]
+        assert table.num_rows == 2
+
+    def test_unconstrained_numbers_keep_exact_values(self, tmp_path):
+        """NUMBER senza precisione e numeric PostgreSQL: int64 o decimal dal primo blocco, mai float64"""
+        pa = pytest.importorskip("pyarrow")
+        import pyarrow.parquet as pq
+        description = [
+            ("ID", FakeDbType("DB_TYPE_NUMBER"), None, None, 0, -127, True),
+            ("VALORE", FakeDbType("DB_TYPE_NUMBER"), None, None, 0, -127, True),
+            ("HUGE", FakeDbType("DB_TYPE_NUMBER"), None, None, 0, -127, True),
+            ("PG_NUMERIC", 1700, None, None, None, None, True),
+        ]
+        path = tmp_path / "numbers.parquet"
+        writer = ArrowStreamWriter(path, [d[0] for d in description], "parquet", description=description)
+        writer.write_rows([
+            (1234567890123456789, 0.1, 10 ** 40, Decimal("19.99")),
+            (2, Decimal("12345678901234567890.125"), 1, 2),
+        ])
+        writer.close()
+
+        table = pq.read_table(path)
+        assert table.schema.field("ID").type == pa.int64()
+        assert table.column("ID").to_pylist() == [1234567890123456789, 2]
+        assert table.schema.field("VALORE").type == pa.decimal128(38, 3)
+        assert table.column("VALORE").to_pylist() == [Decimal("0.1"), Decimal("12345678901234567890.125")]
+        assert table.schema.field("HUGE").type == pa.string()
+        assert table.column("HUGE").to_pylist() == [str(10 ** 40), "1"]
+        assert table.schema.field("PG_NUMERIC").type == pa.decimal128(38, 2)
+        assert table.column("PG_NUMERIC").to_pylist() == [Decimal("19.99"), Decimal("2")]
+
+    def test_arrow_ipc_types_from_values(self, tmp_path):
+        """Senza tipi nella description lo schema viene dedotto dal primo blocco"""
+        pa = pytest.importorskip("pyarrow")
+        service = FakeQueryService([[(1, "a"), (2.5, "b")], [(3, None)]])
+        request = QueryExecutionRequest(query_filename="q.sql", connection_name="CONN")
+        path = tmp_path / "out.arrow"
+
+        result, _ = export_query_to_file(service, request, path, "arrow")
+        assert result.success
+        assert result.row_count == 3
+        with pa.ipc.open_file(path) as reader:
+            table = reader.read_all()
+        assert table.schema.field("ID").type == pa.float64()
+        assert table.column("NOME").to_pylist() == ["a", "b", None]
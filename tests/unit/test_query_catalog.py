@@ -0,0 +1,140 @@
+"""
+Test unitari per il catalogo dei file query
+"""
+import os
+import struct
+import time
+from pathlib import Path
+
+import pytest
+
+from app.models.queries import QueryInfo
+from app.services.query_catalog import QueryCatalog, read_shell_link
+from app.services.query_watcher import QueryCatalogWatcher
+
+
+def _parser(path: Path) -> QueryInfo:
+    return QueryInfo(filename=path.name, full_path=str(path), sql_content=path.read_text(encoding="utf-8"))
+
+
+class TestQueryCatalog:
+    """Test per indice, cache del parsing e invalidazione"""
+
+    @pytest.fixture
+    def query_dir(self, tmp_path):
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "tmp").mkdir()
+        (tmp_path / "A.sql").write_text("SELECT 1 FROM dual", encoding="utf-8")
+        (tmp_path / "sub" / "B.sql").write_text("SELECT 2 FROM dual", encoding="utf-8")
+        (tmp_path / "tmp" / "C.sql").write_text("SELECT 3 FROM dual", encoding="utf-8")
+        return tmp_path
+
+    def test_list_and_lookup_without_reparsing(self, query_dir):
+        """I file invariati vengono parsati una sola volta; le cartelle tmp sono escluse"""
+        catalog = QueryCatalog(_parser, rescan_interval_sec=0)
+
+        assert [q.filename for q in catalog.list(query_dir)] == ["A.sql", "B.sql"]
+        assert catalog.get(query_dir, "b.sql").subdirectory == "sub"
+        catalog.list(query_dir)
+        assert catalog.parse_count == 2
+        assert catalog.get(query_dir, "C.sql") is None
+
+    def test_changed_file_is_reparsed(self, query_dir):
+        """Una modifica (mtime/dimensione) fa rileggere solo quel file"""
+        catalog = QueryCatalog(_parser, rescan_interval_sec=3600)
+        catalog.list(query_dir)
+
+        target = query_dir / "A.sql"
+        target.write_text("SELECT 10 FROM dual", encoding="utf-8")
+        st = target.stat()
+        os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+        assert catalog.get(query_dir, "A.sql").sql_content == "SELECT 10 FROM dual"
+        assert catalog.parse_count == 3
+
+    def test_new_and_removed_files(self, query_dir):
+        """Un nome sconosciuto forza la riscansione; i file rimossi escono dall'indice"""
+        catalog = QueryCatalog(_parser, rescan_interval_sec=3600)
+        catalog.list(query_dir)
+
+        (query_dir / "D.sql").write_text("SELECT 4 FROM dual", encoding="utf-8")
+        assert catalog.get(query_dir, "D.sql") is not None
+
+        (query_dir / "A.sql").unlink()
+        assert catalog.get(query_dir, "A.sql") is None
+        assert [q.filename for q in catalog.list(query_dir)] == ["B.sql", "D.sql"]
+
+
+def _shell_link(local_path: str, relative_path: str) -> bytes:
+    """Collegamento .lnk minimo: LinkInfo con percorso locale e percorso relativo Unicode"""
+    header = struct.pack("<I16sI", 0x4C, b"\x00" * 16, 0x02 | 0x08 | 0x80).ljust(0x4C, b"\x00")
+    base = local_path.encode("cp1252") + b"\x00"
+    link_info = struct.pack("<7I", 0x1C + len(base) + 1, 0x1C, 0x01, 0, 0x1C, 0, 0x1C + len(base)) + base + b"\x00"
+    relative = struct.pack("<H", len(relative_path)) + relative_path.encode("utf-16-le")
+    return header + link_info + relative
+
+
+class TestQueryCatalogAliases:
+    """Test per collegamenti .lnk, notifiche e aggiornamento incrementale con watcher"""
+
+    def test_shell_link_resolved_to_moved_target(self, tmp_path):
+        """Il .lnk con destinazione spostata viene risolto per nome e indicizzato senza riparsare"""
+        (tmp_path / "Report").mkdir()
+        (tmp_path / "Schedulazioni").mkdir()
+        (tmp_path / "Report" / "CDG-001--Esiti.sql").write_text("SELECT 1 FROM dual", encoding="utf-8")
+        (tmp_path / "Schedulazioni" / "CDG-001--Esiti.sql - collegamento.lnk").write_bytes(
+            _shell_link(r"C:\App\PSTT_TOOL\Query\CDG-001--Esiti.sql", r"..\CDG-001--Esiti.sql")
+        )
+        assert read_shell_link(tmp_path / "Schedulazioni" / "CDG-001--Esiti.sql - collegamento.lnk") == (
+            r"C:\App\PSTT_TOOL\Query\CDG-001--Esiti.sql", r"..\CDG-001--Esiti.sql"
+        )
+
+        catalog = QueryCatalog(_parser, rescan_interval_sec=3600)
+        assert [q.subdirectory for q in catalog.list(tmp_path)] == ["Report"]
+        aliases = [q for q in catalog.list(tmp_path, include_aliases=True) if q.subdirectory == "Schedulazioni"]
+        assert len(aliases) == 1
+        assert aliases[0].full_path == str(tmp_path / "Report" / "CDG-001--Esiti.sql")
+        assert catalog.find_path(tmp_path, "CDG-001--Esiti.sql - collegamento") == tmp_path / "Report" / "CDG-001--Esiti.sql"
+        assert catalog.parse_count == 1
+
+    def test_watched_refresh_notifies_changes(self, tmp_path):
+        """Con il watcher attivo l'indice si aggiorna solo sui percorsi notificati"""
+        (tmp_path / "A.sql").write_text("SELECT 1 FROM dual", encoding="utf-8")
+        catalog = QueryCatalog(_parser, rescan_interval_sec=0)
+        changes = []
+        catalog.add_listener(changes.append)
+        catalog.refresh(tmp_path)
+        catalog.watched = True
+        assert changes[-1].version == 1
+
+        (tmp_path / "B.sql").write_text("SELECT 2 FROM dual", encoding="utf-8")
+        catalog.list(tmp_path)
+        assert catalog.get(tmp_path, "B.sql") is None
+        scans = catalog.scan_count
+
+        catalog.refresh(tmp_path, [tmp_path / "B.sql"])
+        (tmp_path / "A.sql").unlink()
+        catalog.refresh(tmp_path, [tmp_path / "A.sql"])
+        assert catalog.scan_count == scans
+        assert [q.filename for q in catalog.list(tmp_path)] == ["B.sql"]
+        assert [c.to_dict()["upserted"][0]["filename"] for c in changes[1:2]] == ["B.sql"]
+        assert changes[2].to_dict()["removed"] == [{"filename": "A.sql", "subdirectory": ""}]
+        assert catalog.version == 3
+
+    def test_watcher_polling_fallback(self, tmp_path):
+        """In polling il watcher rileva i file nuovi senza accessi al catalogo"""
+        catalog = QueryCatalog(_parser, rescan_interval_sec=3600)
+        changes = []
+        catalog.add_listener(changes.append)
+        watcher = QueryCatalogWatcher(catalog, tmp_path, poll_interval_sec=0.1, force_polling=True)
+        watcher.start()
+        try:
+            (tmp_path / "N.sql").write_text("SELECT 1 FROM dual", encoding="utf-8")
+            deadline = time.time() + 5
+            while not changes and time.time() < deadline:
+                time.sleep(0.05)
+            assert watcher.mode == "polling"
+            assert changes and changes[0].upserted[0].filename == "N.sql"
+        finally:
+            watcher.stop()
+        assert not catalog.watched
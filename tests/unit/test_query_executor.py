@@ -0,0 +1,66 @@
+"""
+Test unitari per il pool di esecuzione query
+"""
+import asyncio
+import threading
+
+import pytest
+
+from app.services.query_executor import QueryExecutor, QueryQueueFullError
+
+
+class TestQueryExecutor:
+    """Test per limiti per connessione, coda e metriche"""
+
+    @pytest.fixture
+    def executor(self):
+        executor = QueryExecutor(max_workers=4, per_connection_limit=1, max_queue_per_connection=1)
+        yield executor
+        executor.shutdown(wait=True)
+
+    def test_per_connection_limit_and_queue(self, executor):
+        """Oltre il limite le richieste vanno in coda, oltre la coda vengono rifiutate"""
+        gate = threading.Event()
+        first = executor.submit("CONN", gate.wait, 5)
+        second = executor.submit("CONN", lambda: "second")
+
+        stats = executor.get_stats()["connections"]["CONN"]
+        assert stats["running"] == 1
+        assert stats["queued"] == 1
+        with pytest.raises(QueryQueueFullError):
+            executor.submit("CONN", lambda: "third")
+
+        # Un'altra connessione non è bloccata dalla prima
+        assert executor.submit("OTHER", lambda: "other").result(timeout=5) == "other"
+
+        gate.set()
+        assert first.result(timeout=5) is True
+        assert second.result(timeout=5) == "second"
+        stats = executor.get_stats()["connections"]["CONN"]
+        assert stats["completed"] == 2
+        assert stats["rejected"] == 1
+        assert stats["running"] == 0
+
+    def test_failure_releases_slot(self, executor):
+        """Un errore nella funzione libera lo slot e viene propagato"""
+        def boom():
+            raise ValueError("errore")
+
+        with pytest.raises(ValueError):
+            executor.submit("CONN", boom).result(timeout=5)
+        assert executor.submit("CONN", lambda: 1).result(timeout=5) == 1
+        assert executor.get_stats()["connections"]["CONN"]["failed"] == 1
+
+    def test_run_does_not_block_event_loop(self, executor):
+        """run() attende il risultato lasciando libero l'event loop"""
+        gate = threading.Event()
+
+        async def scenario():
+            task = asyncio.ensure_future(executor.run("CONN", gate.wait, 5))
+            await asyncio.sleep(0.05)
+            # L'event loop continua a servire altro mentre la query è in corso
+            assert not task.done()
+            gate.set()
+            return await task
+
+        assert asyncio.run(scenario()) is True
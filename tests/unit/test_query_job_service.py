@@ -0,0 +1,176 @@
+"""
+Test unitari per i job query asincroni
+"""
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import Mock
+
+import pytest
+
+from app.models.queries import QueryExecutionRequest, ResultFormat
+from app.services.query_executor import QueryExecutor
+from app.services.query_job_service import QueryJobService
+from app.services.query_service import QueryExecutionError, QueryStream
+
+
+class FakeResult:
+    """Cursore finto: restituisce blocchi predefiniti, opzionalmente attendendo un evento"""
+
+    def __init__(self, batches, gate=None):
+        self.batches = list(batches)
+        self.gate = gate
+
+    def fetchmany(self, size):
+        if self.gate is not None and len(self.batches) == 1:
+            self.gate.wait(5)
+        return self.batches.pop(0) if self.batches else []
+
+    def close(self):
+        pass
+
+
+class FakeQueryService:
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.connection = Mock()
+
+    @contextmanager
+    def stream_query(self, request, batch_size=None, on_connection=None):
+        if self.error:
+            raise self.error
+        if on_connection:
+            on_connection(self.connection)
+        yield QueryStream(self.result, ["ID"], batch_size=2)
+
+
+def _wait_finished(service, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = service.get_status(job_id)
+        if status.status in ("completed", "failed", "cancelled"):
+            return status
+        time.sleep(0.01)
+    raise AssertionError("job non terminato")
+
+
+class TestQueryJobService:
+    """Test per submit, polling, paginazione e annullamento"""
+
+    @pytest.fixture
+    def executor(self):
+        executor = QueryExecutor(max_workers=2, per_connection_limit=1, max_queue_per_connection=5)
+        yield executor
+        executor.shutdown(wait=True)
+
+    @pytest.fixture
+    def request_obj(self):
+        return QueryExecutionRequest(query_filename="q.sql", connection_name="CONN")
+
+    def test_job_completes_and_pages(self, executor, request_obj):
+        """Il job termina con tutte le righe, leggibili a pagine"""
+        query_service = FakeQueryService(FakeResult([[(1,), (2,)], [(3,)]]))
+        service = QueryJobService(query_service=query_service, executor=executor, ttl_sec=60)
+
+        job_id = service.submit(request_obj).job_id
+        status = _wait_finished(service, job_id)
+        assert status.status == "completed"
+        assert status.row_count == 3
+        assert status.column_names == ["ID"]
+        assert status.expires_at is not None
+
+        page = service.get_page(job_id, offset=1, limit=1)
+        assert page.total_rows == 3
+        assert page.data == [{"ID": 2}]
+
+    def test_page_result_formats(self, executor, request_obj):
+        """Le pagine sono disponibili anche come array per riga o per colonna"""
+        query_service = FakeQueryService(FakeResult([[(1,), (2,)], [(3,)]]))
+        service = QueryJobService(query_service=query_service, executor=executor, ttl_sec=60)
+        job_id = service.submit(request_obj).job_id
+        _wait_finished(service, job_id)
+
+        rows_page = service.get_page(job_id, offset=0, limit=2, result_format=ResultFormat.ROWS)
+        assert rows_page.rows == [[1], [2]]
+        assert rows_page.data == []
+        columns_page = service.get_page(job_id, offset=1, limit=5, result_format=ResultFormat.COLUMNS)
+        assert columns_page.columns == {"ID": [2, 3]}
+
+    def test_job_failure_reports_error(self, executor, request_obj):
+        """Gli errori di esecuzione finiscono nello stato del job"""
+        query_service = FakeQueryService(error=QueryExecutionError("Query non trovata: q.sql"))
+        service = QueryJobService(query_service=query_service, executor=executor, ttl_sec=60)
+
+        status = _wait_finished(service, service.submit(request_obj).job_id)
+        assert status.status == "failed"
+        assert status.error_message == "Query non trovata: q.sql"
+
+    def test_cancel_running_job_interrupts_connection(self, executor, request_obj):
+        """L'annullamento invia cancel() alla connessione DBAPI e chiude il job"""
+        gate = threading.Event()
+        query_service = FakeQueryService(FakeResult([[(1,), (2,)], [(3,)]], gate=gate))
+        driver_connection = query_service.connection.connection.driver_connection
+        driver_connection.cancel.side_effect = gate.set
+        service = QueryJobService(query_service=query_service, executor=executor, ttl_sec=60)
+
+        job_id = service.submit(request_obj).job_id
+        deadline = time.time() + 5
+        while service.get_status(job_id).row_count < 2 and time.time() < deadline:
+            time.sleep(0.01)
+
+        service.cancel(job_id)
+        status = _wait_finished(service, job_id)
+        driver_connection.cancel.assert_called_once()
+        assert status.status == "cancelled"
+
+    def test_expired_jobs_are_purged(self, executor, request_obj):
+        """I job terminati oltre la TTL non sono più consultabili"""
+        query_service = FakeQueryService(FakeResult([[(1,)]]))
+        service = QueryJobService(query_service=query_service, executor=executor, ttl_sec=60)
+
+        job_id = service.submit(request_obj).job_id
+        _wait_finished(service, job_id)
+        service.ttl_sec = 0
+        time.sleep(0.01)
+        assert service.get_status(job_id) is None
+
+    def test_row_cap_and_release_after_last_page(self, executor, request_obj):
+        """Oltre max_rows il risultato è troncato con has_more; letta l'ultima pagina le righe sono rilasciate"""
+        from app.services.query_job_service import QueryJobResultsReleased
+        query_service = FakeQueryService(FakeResult([[(1,), (2,)], [(3,), (4,)], [(5,)]]))
+        service = QueryJobService(query_service=query_service, executor=executor, ttl_sec=60, max_rows=3)
+
+        job_id = service.submit(request_obj).job_id
+        status = _wait_finished(service, job_id)
+        assert (status.status, status.row_count, status.has_more) == ("completed", 3, True)
+
+        assert service.get_page(job_id, offset=0, limit=2).data == [{"ID": 1}, {"ID": 2}]
+        assert service.get_page(job_id, offset=2, limit=2).data == [{"ID": 3}]
+        with pytest.raises(QueryJobResultsReleased):
+            service.get_page(job_id, offset=0, limit=2)
+        assert service.get_status(job_id).row_count == 3
+
+    def test_cancel_while_waiting_for_connection(self, executor, request_obj):
+        """Annullamento durante lease/connessione: la query non viene eseguita"""
+        leased = threading.Event()
+        proceed = threading.Event()
+        result = Mock()
+
+        class WaitingQueryService(FakeQueryService):
+            @contextmanager
+            def stream_query(self, request, batch_size=None, on_connection=None):
+                leased.set()
+                proceed.wait(5)
+                on_connection(self.connection)
+                yield QueryStream(result, ["ID"], batch_size=2)
+
+        service = QueryJobService(query_service=WaitingQueryService(), executor=executor, ttl_sec=60)
+        job_id = service.submit(request_obj).job_id
+        assert leased.wait(5)
+        service.cancel(job_id)
+        proceed.set()
+
+        status = _wait_finished(service, job_id)
+        assert status.status == "cancelled"
+        result.fetchmany.assert_not_called()
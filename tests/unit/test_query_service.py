@@ -5,13 +5,22 @@ import pytest
 from pathlib import Path
 from unittest.mock import Mock, patch
 
-from app.services.query_service import QueryService
+from app.services.query_service import QueryService, QueryStream
 from app.models.queries import (
     QueryInfo,
     QueryParameter, 
     ParameterType,
-    QueryExecutionRequest
+    QueryExecutionRequest,
+    ResultFormat
 )
+from app.services.query_compiler import compile_query
+
+
+def _bound_sql(query_service, sql_content, parameters, query_params, db_type):
+    """Testo e bind dell'unico statement del file, composti come in esecuzione"""
+    request = QueryExecutionRequest(query_filename="t.sql", connection_name="CONN", parameters=parameters)
+    [entry] = query_service._prepare_statements(compile_query(sql_content), request, query_params, db_type)
+    return entry["sql"], entry["params"]
 
 
 class TestQueryService:
@@ -154,6 +163,257 @@ class TestQueryService:
         assert "define DATAINIZIO" not in result
         assert "define STATUS" not in result
     
+    def test_bind_parameters(self, query_service):
+        """Parametri come bind variable: testo costante, valori tipizzati, liste e identificatori letterali"""
+        sql_content = """
+        define DATAINIZIO='17/06/2022'   --Obbligatorio
+        SELECT * FROM &SCHEMA.spedizioni -- schema &SCHEMA
+        WHERE data >= TO_DATE('&DATAINIZIO', 'dd/mm/yyyy')
+        AND nome like upper('%&NOME%')
+        AND office_id = &OFFICE_ID
+        AND barcode IN (&BARCODE_LIST)
+        """
+        query_params = [
+            QueryParameter(name="DATAINIZIO", parameter_type=ParameterType.DATE, default_value="17/06/2022"),
+            QueryParameter(name="SCHEMA"),
+            QueryParameter(name="NOME"),
+            QueryParameter(name="OFFICE_ID", parameter_type=ParameterType.INTEGER),
+            QueryParameter(name="BARCODE_LIST"),
+        ]
+        provided = {"SCHEMA": "starown", "NOME": "Rossi", "OFFICE_ID": "77001", "BARCODE_LIST": "A1,B2"}
+
+        sql, binds = _bound_sql(query_service, sql_content, provided, query_params, "sqlite")
+        assert "define" not in sql
+        assert "FROM starown.spedizioni -- schema starown" in sql
+        assert "TO_DATE(:p_datainizio, 'dd/mm/yyyy')" in sql
+        assert "upper(('%' || :p_nome || '%'))" in sql
+        assert "office_id = :p_office_id_v" in sql
+        assert "IN ('A1','B2')" in sql
+        assert binds == {"p_datainizio": "17/06/2022", "p_nome": "Rossi", "p_office_id_v": 77001}
+
+        # Valori diversi, stesso testo SQL (un solo cursore per file)
+        other_sql, other_binds = _bound_sql(
+            query_service, sql_content, dict(provided, NOME="Bianchi", OFFICE_ID="1"), query_params, "sqlite"
+        )
+        assert other_sql == sql
+        assert other_binds["p_office_id_v"] == 1
+
+    def test_typed_literals_stay_literal(self, query_service):
+        """DATE/TIMESTAMP/INTERVAL '...' richiedono una costante: il valore resta nel testo"""
+        sql_content = (
+            "SELECT * FROM t WHERE d >= DATE '&DT' AND ts < timestamp '&DT 00:00:00'\n"
+            "AND d > SYSDATE - INTERVAL  '&N' DAY AND note = '&DT'"
+        )
+        query_params = [QueryParameter(name="DT"), QueryParameter(name="N")]
+        sql, binds = _bound_sql(query_service, sql_content, {"DT": "2024-01-31", "N": "3"}, query_params, "oracle")
+        assert "d >= DATE '2024-01-31'" in sql
+        assert "ts < timestamp '2024-01-31 00:00:00'" in sql
+        assert "INTERVAL  '3' DAY" in sql
+        # Letterale ordinario: bind come prima
+        assert sql.endswith("note = :p_dt")
+        assert binds == {"p_dt": "2024-01-31"}
+
+    def test_bind_large_list_parameters(self, query_service):
+        """Liste in IN (&LISTA) legate come array senza troncamento: TABLE(:arr) su Oracle, ANY su PostgreSQL"""
+        from app.services.sql_binding import ListBind
+        sql_content = "SELECT * FROM t WHERE barcode IN (&BARCODE_LIST) AND id NOT IN ( &IDS ) AND x = &CODES"
+        query_params = [QueryParameter(name=n) for n in ("BARCODE_LIST", "IDS", "CODES")]
+        barcodes = [f"BC{i}" for i in range(50000)]
+        provided = {"BARCODE_LIST": "\n".join(barcodes), "IDS": "1,2", "CODES": "A"}
+
+        sql, binds = _bound_sql(query_service, sql_content, provided, query_params, "oracle")
+        assert "barcode IN (SELECT column_value FROM TABLE(:p_barcode_list) UNION ALL " \
+               "SELECT column_value FROM TABLE(:p_barcode_list_2))" in sql
+        assert "id NOT IN (SELECT column_value FROM TABLE(:p_ids))" in sql
+        assert "x = 'A'" in sql
+        assert len(binds["p_barcode_list"].values) + len(binds["p_barcode_list_2"].values) == 50000
+        assert binds["p_ids"] == ListBind(["1", "2"])
+
+        sql, binds = _bound_sql(query_service, sql_content, provided, query_params, "postgresql")
+        assert "barcode = ANY(:p_barcode_list) AND id <> ALL(:p_ids)" in sql
+        assert binds["p_barcode_list"] == barcodes
+
+        # PostgreSQL: array tipizzato dal parametro (int per IDS numerico), altrimenti IN letterale
+        compiled = compile_query("SELECT * FROM t WHERE id IN (&IDS)")
+        int_params = [QueryParameter(name="IDS", parameter_type=ParameterType.INTEGER)]
+        request = QueryExecutionRequest(query_filename="t.sql", connection_name="PG", parameters={"IDS": "1, 2\n3"})
+        [entry] = query_service._prepare_statements(compiled, request, int_params, "postgresql")
+        assert entry["sql"] == "SELECT * FROM t WHERE id = ANY(:p_ids)"
+        assert entry["params"] == {"p_ids": [1, 2, 3]}
+        request.parameters = {"IDS": "1,A2"}
+        [entry] = query_service._prepare_statements(compiled, request, int_params, "postgresql")
+        assert entry["sql"] == "SELECT * FROM t WHERE id IN ('1','A2')"
+        assert entry["params"] == {}
+
+        # Le collezioni Oracle vengono create con la connessione del driver
+        conn = Mock()
+        collection_type = conn.connection.driver_connection.gettype.return_value
+        collection_type.newobject.side_effect = lambda values: ("OBJ", tuple(values))
+        resolved = query_service._resolve_list_binds(conn, {"p_ids": ListBind(["1", "2"]), "p_x": 1})
+        assert resolved == {"p_ids": ("OBJ", ("1", "2")), "p_x": 1}
+        # Tipo collezione letto una sola volta per sessione (anche con un nuovo oggetto Connection)
+        same_session = Mock()
+        same_session.connection.driver_connection._impl = conn.connection.driver_connection._impl
+        query_service._resolve_list_binds(same_session, {"p_ids": ListBind(["3"])})
+        assert conn.connection.driver_connection.gettype.call_count == 1
+        assert same_session.connection.driver_connection.gettype.call_count == 0
+        other_session = Mock()
+        query_service._resolve_list_binds(other_session, {"p_ids": ListBind(["3"])})
+        assert other_session.connection.driver_connection.gettype.call_count == 1
+
+        # Limite delle collezioni Oracle anche con QUERY_LIST_COLLECTION_MAX fuori scala
+        query_service.settings.query_list_collection_max = 100000
+        assert query_service._list_collection_max() == 32767
+
+    def test_stream_query_with_bind_variables(self, tmp_path):
+        """Su sqlite le bind variable vengono passate al driver con i valori forniti"""
+        from sqlalchemy import create_engine
+        (tmp_path / "bind.sql").write_text(
+            "define NUM='1'\nSELECT 'a' || '&TESTO' AS t, &NUM + 1 AS n\n", encoding="utf-8"
+        )
+        with patch('app.services.query_service.get_settings') as mock_settings:
+            mock_settings.return_value.query_dir = tmp_path
+            mock_settings.return_value.query_fetch_arraysize = 10
+            service = QueryService(connection_service=Mock())
+        service.connection_service.get_engine.return_value = create_engine("sqlite://")
+        service.connection_service.get_connection.return_value = Mock(db_type="sqlite")
+
+        result = service.execute_query(QueryExecutionRequest(
+            query_filename="bind.sql", connection_name="CONN", parameters={"TESTO": "x'y", "NUM": "41"}
+        ))
+        assert result.success is True
+        assert result.data == [{"t": "ax'y", "n": 42}]
+
+    def test_compiled_query_cached_per_file(self, tmp_path):
+        """Step, statement e segnaposto compilati una volta per (file, mtime) e riusati"""
+        import os
+        from sqlalchemy import create_engine
+        sql_file = tmp_path / "steps.sql"
+        sql_file.write_text(
+            "define N='1'\n--$STEP 1$ -> prepara\nCREATE TABLE t (id INTEGER);\nINSERT INTO t VALUES (&N);\n"
+            "--$STEP 2$ -> estrai\n-- commento\nSELECT id FROM t;\n",
+            encoding="utf-8",
+        )
+        with patch('app.services.query_service.get_settings') as mock_settings:
+            mock_settings.return_value.query_dir = tmp_path
+            mock_settings.return_value.query_fetch_arraysize = 10
+            service = QueryService(connection_service=Mock())
+        service.connection_service.get_connection.return_value = Mock(db_type="oracle")
+
+        compiled = service.compiler.get(service.get_query("steps.sql"), "oracle")
+        assert compiled.multi_step is True
+        assert [(s.step, s.is_select) for s in compiled.statements] == [(1, False), (1, False), (2, True)]
+        assert compiled.statements[-1].template.text == "-- commento\nSELECT id FROM t"
+        assert compiled.placeholders == ("N",)
+        assert compiled.last_select == 2
+
+        service.connection_service.get_connection.return_value = Mock(db_type="sqlite")
+        for value in ("5", "7"):
+            service.connection_service.get_engine.return_value = create_engine("sqlite://")
+            result = service.execute_query(QueryExecutionRequest(
+                query_filename="steps.sql", connection_name="CONN", parameters={"N": value}
+            ))
+            assert result.data == [{"id": int(value)}]
+        assert service.compiler.compile_count == 2  # oracle + sqlite
+
+        # File modificato: nuova compilazione
+        sql_file.write_text("SELECT 2 AS id FROM (SELECT 1)\n", encoding="utf-8")
+        st = sql_file.stat()
+        os.utime(sql_file, ns=(st.st_atime_ns, st.st_mtime_ns + 2_000_000_000))
+        service.connection_service.get_engine.return_value = create_engine("sqlite://")
+        result = service.execute_query(QueryExecutionRequest(query_filename="steps.sql", connection_name="CONN"))
+        assert result.data == [{"id": 2}]
+        assert service.compiler.compile_count == 3
+
+    def test_execution_traces(self, tmp_path):
+        """Statement eseguiti registrati in memoria per request id, senza file in Query/tmp"""
+        from sqlalchemy import create_engine
+        from app.services.execution_trace import ExecutionTraceBuffer
+        (tmp_path / "trace.sql").write_text(
+            "CREATE TABLE t (id INTEGER);\nINSERT INTO t VALUES (&N);\nSELECT id FROM t;\n", encoding="utf-8"
+        )
+        with patch('app.services.query_service.get_settings') as mock_settings:
+            mock_settings.return_value.query_dir = tmp_path
+            mock_settings.return_value.query_fetch_arraysize = 10
+            service = QueryService(connection_service=Mock())
+        service.traces = ExecutionTraceBuffer(max_entries=2, enabled=True, debug_dir=tmp_path / "traces")
+        service.connection_service.get_connection.return_value = Mock(db_type="sqlite")
+
+        service.connection_service.get_engine.return_value = create_engine("sqlite://")
+        result = service.execute_query(QueryExecutionRequest(
+            query_filename="trace.sql", connection_name="CONN", parameters={"N": "4"}, request_id="req-1"
+        ))
+        assert result.success is True and result.request_id == "req-1"
+        trace = service.traces.get("req-1").to_dict()
+        assert trace["status"] == "success"
+        assert [s["status"] for s in trace["statements"]] == ["executed"] * 3
+        assert "req-1.txt" in [p.name for p in (tmp_path / "traces").iterdir()]
+        assert not (tmp_path / "tmp").exists()
+
+        # Errore: la traccia riporta lo statement fallito; id generato se assente
+        result = service.execute_query(QueryExecutionRequest(
+            query_filename="trace.sql", connection_name="CONN", parameters={"N": "5"}
+        ))
+        assert result.success is False and result.request_id
+        failed = service.traces.get(result.request_id).to_dict()
+        assert failed["status"] == "failed"
+        assert failed["statements"][-1]["status"] == "failed"
+
+        service.connection_service.get_engine.return_value = create_engine("sqlite://")
+        service.execute_query(QueryExecutionRequest(query_filename="trace.sql", connection_name="CONN", parameters={"N": "6"}))
+        assert service.traces.get("req-1") is None  # buffer circolare
+        assert len(service.traces.recent()) == 2
+
+    def test_split_statements(self):
+        """Il lexer ignora i ; in stringhe, q-quote e commenti e mantiene interi i blocchi PL/SQL"""
+        from app.services.query_compiler import compile_query
+        from app.services.sql_lexer import split_statements
+        script = (
+            "/* intestazione; */\n-- nota; \n"
+            "SELECT 'a;b', q'[it's;]' FROM dual;\n"
+            "INSERT INTO log VALUES ('x'';y');\n"
+            "BEGIN\n  IF v THEN NULL; END IF;\n  v := CASE WHEN 1 = 1 THEN 1 END;\nEND;\n/\n"
+            "CREATE OR REPLACE PACKAGE BODY p AS PROCEDURE a IS BEGIN NULL; END; END p;\n/\n"
+            "SELECT a / b FROM t\n/\n-- solo commento\n"
+        )
+        statements = split_statements(script)
+        assert [(s.keyword, s.plsql) for s in statements] == [
+            ("SELECT", False), ("INSERT", False), ("BEGIN", True), ("CREATE", True), ("SELECT", False)
+        ]
+        assert statements[0].text.endswith("SELECT 'a;b', q'[it's;]' FROM dual")
+        assert statements[2].text.endswith("END;")
+        assert statements[4].text == "SELECT a / b FROM t"
+
+        compiled = compile_query(script, oracle=True)
+        assert [s.is_select for s in compiled.statements] == [True, False, False, False, True]
+        assert compiled.statements[2].template.text.endswith("END;")
+        assert compiled.last_select == 4
+
+        # Costo lineare anche con letterali molto lunghi
+        big = "SELECT * FROM t WHERE id IN (" + ",".join(f"'{i};'" for i in range(50000)) + ");\nSELECT 1 FROM dual"
+        assert [s.keyword for s in split_statements(big)] == ["SELECT", "SELECT"]
+
+    def test_split_statements_nested_subprograms(self):
+        """END nome; di un sottoprogramma dichiarato nel DECLARE non chiude il blocco esterno"""
+        from app.services.sql_lexer import split_statements
+        nested = "DECLARE PROCEDURE p IS BEGIN NULL; END p; BEGIN p; END;"
+        script = (
+            f"{nested}\n/\n"
+            "DECLARE\n  FUNCTION f(x NUMBER) RETURN NUMBER;\n"
+            "  FUNCTION f(x NUMBER) RETURN NUMBER AS\n    PROCEDURE g IS BEGIN NULL; END;\n"
+            "  BEGIN\n    CASE WHEN x > 0 THEN g; END CASE;\n    RETURN x;\n  END f;\n"
+            "BEGIN\n  IF f(1) = 1 THEN NULL; END IF;\nEND;\n"
+            "SELECT 1 FROM dual;\n"
+            f"{nested}\nSELECT 2 FROM dual"
+        )
+        statements = split_statements(script)
+        assert [(s.keyword, s.plsql) for s in statements] == [
+            ("DECLARE", True), ("DECLARE", True), ("SELECT", False), ("DECLARE", True), ("SELECT", False)
+        ]
+        assert statements[0].text == nested
+        assert statements[1].text.endswith("END IF;\nEND;")
+        assert statements[3].text == nested
+
     def test_validate_parameters(self, query_service):
         """Test validazione parametri obbligatori"""
         query_params = [
@@ -175,6 +435,87 @@ class TestQueryService:
         })
         assert len(complete) == 0
     
+    def test_add_limit_clause_oracle(self, query_service):
+        """Test limite server-side per Oracle con FETCH FIRST"""
+        query_service.connection_service.get_connection = Mock(return_value=Mock(db_type="oracle"))
+
+        limited = query_service._add_limit_clause("SELECT * FROM t -- fine", 1001, "CONN")
+        assert limited.endswith("\nFETCH FIRST 1001 ROWS ONLY")
+
+        # Query già limitate restano invariate
+        sql = "SELECT * FROM t WHERE ROWNUM <= 10"
+        assert query_service._add_limit_clause(sql, 1001, "CONN") == sql
+        assert query_service._add_limit_clause("SELECT * FROM t", None, "CONN") == "SELECT * FROM t"
+
+    def test_fetch_first_fallback_only_on_syntax_errors(self, query_service):
+        """Senza limite si riesegue solo se Oracle non supporta FETCH FIRST, non per errori reali"""
+        from app.services.query_service import QueryExecutionError
+        query_service.connection_service.get_connection = Mock(return_value=Mock(db_type="oracle"))
+        entry = {"sql": "SELECT * FROM t", "params": {}, "is_select": True}
+
+        conn = Mock()
+        conn.execute.side_effect = [Exception("ORA-00933: SQL command not properly ended"), "RESULT"]
+        assert query_service._execute_statement(conn, entry, "CONN", "oracle", 1000) == "RESULT"
+        assert [str(c.args[0]) for c in conn.execute.call_args_list] == [
+            "SELECT * FROM t\nFETCH FIRST 1001 ROWS ONLY", "SELECT * FROM t"
+        ]
+
+        conn = Mock()
+        conn.execute.side_effect = Exception("ORA-00942: table or view does not exist")
+        with pytest.raises(QueryExecutionError):
+            query_service._execute_statement(conn, entry, "CONN", "oracle", 1000)
+        assert conn.execute.call_count == 1
+
+    def test_query_stream_stops_at_limit(self):
+        """Test lettura a blocchi del cursore con indicazione has_more"""
+        result = Mock()
+        result.fetchmany.side_effect = [[(1,), (2,)], [(3,)]]
+
+        stream = QueryStream(result, ["ID"], batch_size=2, limit=2)
+        batches = list(stream.iter_batches())
+        assert batches == [[(1,), (2,)]]
+        assert stream.has_more is True
+        assert stream.row_count == 2
+        # Dopo il limite viene chiesta una sola riga per sapere se il risultato prosegue
+        assert [c.args[0] for c in result.fetchmany.call_args_list] == [2, 1]
+        result.close.assert_called_once()
+
+    def test_stream_query_multi_statement(self, tmp_path):
+        """Test streaming sull'ultimo SELECT di uno script multi-statement"""
+        from sqlalchemy import create_engine
+        (tmp_path / "stream.sql").write_text(
+            "CREATE TABLE t (id INTEGER);\n"
+            "INSERT INTO t VALUES (1);\nINSERT INTO t VALUES (2);\nINSERT INTO t VALUES (3);\n"
+            "SELECT id FROM t ORDER BY id;\n",
+            encoding="utf-8",
+        )
+        with patch('app.services.query_service.get_settings') as mock_settings:
+            mock_settings.return_value.query_dir = tmp_path
+            mock_settings.return_value.query_fetch_arraysize = 2
+            service = QueryService(connection_service=Mock())
+        service.connection_service.get_engine.return_value = create_engine("sqlite://")
+        service.connection_service.get_connection.return_value = Mock(db_type="sqlite")
+        request = QueryExecutionRequest(query_filename="stream.sql", connection_name="CONN")
+
+        with service.stream_query(request) as stream:
+            assert stream.column_names == ["id"]
+            batches = list(stream.iter_batches())
+        assert [len(b) for b in batches] == [2, 1]
+
+        request.limit = 2
+        service.connection_service.get_engine.return_value = create_engine("sqlite://")
+        result = service.execute_query(request)
+        assert result.success is True
+        assert result.data == [{"id": 1}, {"id": 2}]
+        assert result.has_more is True
+
+        request.result_format = ResultFormat.ROWS
+        service.connection_service.get_engine.return_value = create_engine("sqlite://")
+        result = service.execute_query(request)
+        assert result.column_names == ["id"]
+        assert result.rows == [[1], [2]]
+        assert result.data == []
+
     @pytest.mark.asyncio
     async def test_parse_sql_file(self, query_service, sample_query_file):
         """Test parsing completo di un file SQL"""
@@ -0,0 +1,41 @@
+"""
+Test unitari per l'esecutore dei job schedulati (worker, slot per connessione, priorità)
+"""
+import threading
+
+from app.services.scheduler_executor import SchedulerExecutor
+
+
+class TestSchedulerExecutor:
+    """Test per code a priorità e slot per connessione"""
+
+    def test_priority_and_connection_slots(self):
+        """Un job su una connessione libera non attende quelli bloccati; in coda vince la priorità"""
+        executor = SchedulerExecutor(max_workers=2, connection_slots=1)
+        gate = threading.Event()
+        order = []
+
+        def job(label):
+            gate.wait(2)
+            order.append(label)
+            return label
+
+        try:
+            blocker = executor.submit("DB1", job, "blocker", label="blocker")
+            low = executor.submit("DB1", job, "low", priority="low", label="low")
+            high = executor.submit("DB1", job, "high", priority="high", label="high")
+            other = executor.submit("DB2", job, "other", label="other")
+
+            assert blocker.started.done() and other.started.done()
+            stats = executor.get_stats()
+            assert stats["running_count"] == 2 and stats["connections"] == {"DB1": 1, "DB2": 1}
+            assert [t["label"] for t in stats["queued"]] == ["high", "low"]
+            assert "waiting_sec" in stats["queued"][0]
+
+            gate.set()
+            assert [t.future.result(2) for t in (blocker, other, high, low)] == ["blocker", "other", "high", "low"]
+            assert order.index("high") < order.index("low")
+            stats = executor.get_stats()
+            assert stats["completed"] == 4 and stats["queued_count"] == 0 and stats["running_count"] == 0
+        finally:
+            executor.shutdown()
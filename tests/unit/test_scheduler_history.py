@@ -0,0 +1,45 @@
+"""
+Test unitari per lo storico esecuzioni dello scheduler (SQLite)
+"""
+import json
+from datetime import datetime, timedelta
+
+from app.services.scheduler_history import SchedulerHistoryStore
+
+
+class TestSchedulerHistoryStore:
+    """Test per import legacy, letture indicizzate e retention"""
+
+    def test_append_update_query_and_compact(self, tmp_path):
+        """Import da scheduler_history.json, aggiornamento per id, filtri e retention"""
+        now = datetime(2026, 3, 10, 12, 0, 0)
+        legacy = [
+            {"query": "OLD.sql", "connection": "C", "timestamp": (now - timedelta(days=120)).isoformat(), "status": "success"},
+            {"query": "test_q.sql", "connection": "C", "timestamp": (now - timedelta(days=2)).isoformat(), "status": "fail"},
+            {"query": "NODATE.sql", "connection": "C", "status": "success"},
+        ]
+        (tmp_path / "scheduler_history.json").write_text(json.dumps(legacy), encoding="utf-8")
+        store = SchedulerHistoryStore(tmp_path / "scheduler_history.db", retention_days=90)
+        try:
+            assert store.count() == 3
+            assert not (tmp_path / "scheduler_history.json").exists()
+            assert (tmp_path / "scheduler_history.json.migrated").exists()
+
+            entry = {"query": "A.sql", "connection": "C", "timestamp": now.isoformat(), "status": "success",
+                     "duration_sec": 1.5, "row_count": 10}
+            entry_id = store.append(entry)
+            entry.update(status="fail", error="Kafka export failed", duration_sec=None)
+            assert store.update(entry_id, entry)
+
+            recent = store.query(since=now - timedelta(days=30))
+            assert [h["query"] for h in recent] == ["test_q.sql", "A.sql"]
+            assert recent[-1]["error"] == "Kafka export failed" and recent[-1]["id"] == entry_id
+            assert len(store.query(since=now - timedelta(days=30), include_undated=True)) == 3
+            assert [h["query"] for h in store.query(status="fail")] == ["test_q.sql", "A.sql"]
+            assert [h["query"] for h in store.query(limit=1)] == ["A.sql"]
+
+            assert store.compact(now) == 1
+            assert store.delete_matching(r"^test_") == 1
+            assert sorted(h["query"] for h in store.query()) == ["A.sql", "NODATE.sql"]
+        finally:
+            store.close()
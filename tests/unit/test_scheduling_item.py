@@ -39,3 +39,16 @@ def test_render_filename_timestamp_append():
     fname = s.render_filename(datetime(2025,1,2,9,5))
     assert '20250102' in fname
     assert '_' in fname
+
+
+def test_render_output_filename_extension_follows_format():
+    s = SchedulingItem(
+        query='RPT.sql',
+        connection='A00',
+        output_filename_template='{query_name}_{date}.xlsx',
+        output_format='parquet'
+    )
+    assert s.render_output_filename(datetime(2025,1,2,9,5)) == 'RPT_2025-01-02.parquet'
+    s.output_format = 'xlsx'
+    s.output_filename_template = '{query_name}_{date}'
+    assert s.render_output_filename(datetime(2025,1,2,9,5)) == 'RPT_2025-01-02.xlsx'
@@ -1,15 +1,20 @@
 from app.services.query_service import QueryService
+from app.services.connection_service import ConnectionService, get_engine_registry
 from app.models.queries import QueryExecutionRequest
 
 if __name__ == '__main__':
-    qs = QueryService()
+    registry = get_engine_registry()
+    qs = QueryService(connection_service=ConnectionService(engine_registry=registry))
     req = QueryExecutionRequest(
         query_filename='CDG-SPOT-001--Estrai ultimo stato - A2A.sql',
         connection_name='A00-CDG-Collaudo',
         parameters={},
         limit=None
     )
-    res = qs.execute_query(req)
+    try:
+        res = qs.execute_query(req)
+    finally:
+        registry.dispose_all()
     print('Success:', res.success)
     print('Row count:', res.row_count)
     if res.error_message:
@@ -9,13 +9,15 @@ from datetime import datetime
 
 from app.core.config import get_settings, get_connections_config
 from app.services.query_service import QueryService
-from app.services.connection_service import ConnectionService
+from app.services.connection_service import ConnectionService, get_engine_registry
 from app.models.queries import QueryExecutionRequest
 
 
 def main():
     settings = get_settings()
-    qs = QueryService()
+    # Un solo registro engine per l'intera batteria: ogni connessione apre il pool una sola volta
+    registry = get_engine_registry()
+    qs = QueryService(connection_service=ConnectionService(engine_registry=registry))
     query_dir = Path(settings.query_dir)
     out_file = Path(__file__).parent / "regression_results.json"
 
@@ -108,4 +110,7 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    finally:
+        get_engine_registry().dispose_all()